@@ -8,7 +8,7 @@ import sys
 # Add the backend directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
 
-from backend.database import Base
+from backend.database import Base, get_database_url
 from backend.models import Session, Interruption
 
 # this is the Alembic Config object, which provides
@@ -20,6 +20,11 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# The alembic CLI migrates DATABASE_URL when it is set; the app passes its URL
+# explicitly and loads no ini file
+if config.config_file_name is not None and os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", get_database_url().replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 target_metadata = Base.metadata
@@ -0,0 +1,62 @@
+"""Denormalized interruption counter and duration columns on sessions
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('sessions', sa.Column('interruption_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('sessions', sa.Column('last_pause_time', sa.DateTime(), nullable=True))
+    op.add_column('sessions', sa.Column('actual_duration_minutes', sa.Float(), nullable=True))
+    
+    # Backfill the counters from the existing interruptions
+    op.execute("""
+        UPDATE sessions SET
+            interruption_count = (
+                SELECT COUNT(*) FROM interruptions WHERE interruptions.session_id = sessions.id
+            ),
+            last_pause_time = (
+                SELECT MAX(pause_time) FROM interruptions WHERE interruptions.session_id = sessions.id
+            )
+    """)
+    
+    # Durations are computed in Python to stay independent of date functions
+    sessions = sa.table('sessions',
+        sa.column('id', sa.Integer),
+        sa.column('start_time', sa.DateTime),
+        sa.column('end_time', sa.DateTime),
+        sa.column('actual_duration_minutes', sa.Float),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(sessions.c.id, sessions.c.start_time, sessions.c.end_time)
+        .where(sessions.c.start_time.isnot(None), sessions.c.end_time.isnot(None))
+    ).all()
+    if rows:
+        bind.execute(
+            sessions.update()
+            .where(sessions.c.id == sa.bindparam('session_id'))
+            .values(actual_duration_minutes=sa.bindparam('duration')),
+            [
+                {'session_id': row.id, 'duration': (row.end_time - row.start_time).total_seconds() / 60}
+                for row in rows
+            ],
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('actual_duration_minutes')
+        batch_op.drop_column('last_pause_time')
+        batch_op.drop_column('interruption_count')
@@ -0,0 +1,28 @@
+"""Indexes backing the session listing filters and sort keys
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_sessions_status_created_at', 'sessions', ['status', 'created_at'])
+    op.create_index('ix_sessions_created_at', 'sessions', ['created_at'])
+    op.create_index('ix_sessions_title', 'sessions', ['title'])
+    op.create_index('ix_sessions_actual_duration_minutes', 'sessions', ['actual_duration_minutes'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sessions_actual_duration_minutes', table_name='sessions')
+    op.drop_index('ix_sessions_title', table_name='sessions')
+    op.drop_index('ix_sessions_created_at', table_name='sessions')
+    op.drop_index('ix_sessions_status_created_at', table_name='sessions')
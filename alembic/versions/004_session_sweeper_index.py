@@ -0,0 +1,22 @@
+"""Index for the stale session sweeper
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_sessions_status_start_time', 'sessions', ['status', 'start_time'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sessions_status_start_time', table_name='sessions')
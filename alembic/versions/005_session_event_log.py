@@ -0,0 +1,134 @@
+"""Append-only session event log, projection checkpoints and daily rollups
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('session_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(length=20), nullable=False),
+        sa.Column('occurred_at', sa.DateTime(), nullable=False),
+        sa.Column('reason', sa.Text(), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True
+    )
+    op.create_index('ix_session_events_session_id', 'session_events', ['session_id', 'id'])
+    op.create_table('projection_checkpoints',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('last_event_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('session_daily_rollups',
+        sa.Column('day', sa.String(length=10), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('sessions', sa.Integer(), nullable=False),
+        sa.Column('interruptions', sa.Integer(), nullable=False),
+        sa.Column('productive_minutes', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'status')
+    )
+    op.add_column('sessions', sa.Column('last_event_id', sa.Integer(), nullable=True))
+
+    # Synthesize a log for existing sessions. Resumes were never recorded, so
+    # one is assumed right before every pause after the first and, for
+    # sessions that are active again, at their last pause.
+    bind = op.get_bind()
+    sessions = sa.table('sessions',
+        sa.column('id', sa.Integer),
+        sa.column('title', sa.String),
+        sa.column('goal', sa.Text),
+        sa.column('scheduled_duration', sa.Float),
+        sa.column('start_time', sa.DateTime),
+        sa.column('end_time', sa.DateTime),
+        sa.column('status', sa.String),
+        sa.column('created_at', sa.DateTime),
+        sa.column('interruption_count', sa.Integer),
+        sa.column('actual_duration_minutes', sa.Float),
+        sa.column('last_event_id', sa.Integer),
+    )
+    interruptions = sa.table('interruptions',
+        sa.column('id', sa.Integer),
+        sa.column('session_id', sa.Integer),
+        sa.column('reason', sa.Text),
+        sa.column('pause_time', sa.DateTime),
+    )
+    events = sa.table('session_events',
+        sa.column('id', sa.Integer),
+        sa.column('session_id', sa.Integer),
+        sa.column('event_type', sa.String),
+        sa.column('occurred_at', sa.DateTime),
+        sa.column('reason', sa.Text),
+        sa.column('payload', sa.JSON),
+    )
+
+    pauses = {}
+    for row in bind.execute(sa.select(interruptions).order_by(interruptions.c.pause_time, interruptions.c.id)):
+        pauses.setdefault(row.session_id, []).append(row)
+
+    rows = []
+    last_event_ids = []
+    for session in bind.execute(sa.select(sessions).order_by(sessions.c.created_at, sessions.c.id)):
+        log = [("created", session.created_at, None, {
+            "title": session.title,
+            "goal": session.goal,
+            "scheduled_duration": session.scheduled_duration,
+        })]
+        if session.start_time is not None:
+            log.append(("started", session.start_time, None, None))
+        for i, pause in enumerate(pauses.get(session.id, [])):
+            if i:
+                log.append(("resumed", pause.pause_time, None, {"backfilled": True}))
+            log.append(("paused", pause.pause_time, pause.reason, {"interruption_id": pause.id}))
+        if session.status == "active" and session.id in pauses:
+            log.append(("resumed", pauses[session.id][-1].pause_time, None, {"backfilled": True}))
+        if session.end_time is not None:
+            log.append(("completed", session.end_time, None, {
+                "status": session.status,
+                "duration_minutes": session.actual_duration_minutes,
+                "interruption_count": session.interruption_count,
+            }))
+
+        for event_type, occurred_at, reason, payload in log:
+            rows.append({
+                "id": len(rows) + 1,
+                "session_id": session.id,
+                "event_type": event_type,
+                "occurred_at": occurred_at,
+                "reason": reason,
+                "payload": payload,
+            })
+        last_event_ids.append({"session_id": session.id, "event_id": len(rows)})
+
+    if rows:
+        op.bulk_insert(events, rows)
+        if bind.dialect.name == 'postgresql':
+            # The ids above were explicit; move the sequence past them
+            op.execute("SELECT setval(pg_get_serial_sequence('session_events', 'id'), (SELECT max(id) FROM session_events))")
+        bind.execute(
+            sessions.update()
+            .where(sessions.c.id == sa.bindparam('session_id'))
+            .values(last_event_id=sa.bindparam('event_id')),
+            last_event_ids
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('last_event_id')
+    op.drop_table('session_daily_rollups')
+    op.drop_table('projection_checkpoints')
+    op.drop_index('ix_session_events_session_id', table_name='session_events')
+    op.drop_table('session_events')
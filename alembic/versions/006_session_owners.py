@@ -0,0 +1,66 @@
+"""Session ownership with owner-leading indexes
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+LISTING_INDEXES = [
+    ('status_created_at', ['status', 'created_at']),
+    ('created_at', ['created_at']),
+    ('title', ['title']),
+    ('actual_duration_minutes', ['actual_duration_minutes']),
+]
+
+
+def _create_rollups(owned):
+    columns = [
+        sa.Column('day', sa.String(length=10), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('sessions', sa.Integer(), nullable=False),
+        sa.Column('interruptions', sa.Integer(), nullable=False),
+        sa.Column('productive_minutes', sa.Float(), nullable=False),
+    ]
+    key = ['day', 'status']
+    if owned:
+        columns.insert(0, sa.Column('owner_id', sa.Integer(), nullable=False))
+        key.insert(0, 'owner_id')
+    op.create_table('session_daily_rollups', *columns, sa.PrimaryKeyConstraint(*key))
+    # The projector rebuilds the rollups from the event log on next catch-up
+    op.execute("DELETE FROM projection_checkpoints WHERE name = 'rollups'")
+
+
+def upgrade() -> None:
+    for table in ('sessions', 'interruptions', 'session_events'):
+        op.add_column(table, sa.Column('owner_id', sa.Integer(), nullable=False, server_default='0'))
+
+    for name, columns in LISTING_INDEXES:
+        op.drop_index(f'ix_sessions_{name}', table_name='sessions')
+        op.create_index(f'ix_sessions_owner_{name}', 'sessions', ['owner_id'] + columns)
+    op.create_index('ix_interruptions_owner_session_id', 'interruptions', ['owner_id', 'session_id'])
+
+    op.drop_table('session_daily_rollups')
+    _create_rollups(owned=True)
+
+
+def downgrade() -> None:
+    op.drop_table('session_daily_rollups')
+    _create_rollups(owned=False)
+
+    op.drop_index('ix_interruptions_owner_session_id', table_name='interruptions')
+    for name, columns in LISTING_INDEXES:
+        op.drop_index(f'ix_sessions_owner_{name}', table_name='sessions')
+        op.create_index(f'ix_sessions_{name}', 'sessions', columns)
+
+    for table in ('session_events', 'interruptions', 'sessions'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('owner_id')
@@ -0,0 +1,35 @@
+"""Compressed monthly archives of finished sessions
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('session_archives',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.String(length=7), nullable=False),
+        sa.Column('session_count', sa.Integer(), nullable=False),
+        sa.Column('completed_sessions', sa.Integer(), nullable=False),
+        sa.Column('interrupted_sessions', sa.Integer(), nullable=False),
+        sa.Column('overdue_sessions', sa.Integer(), nullable=False),
+        sa.Column('abandoned_sessions', sa.Integer(), nullable=False),
+        sa.Column('total_interruptions', sa.Integer(), nullable=False),
+        sa.Column('productive_minutes', sa.Float(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('owner_id', 'month')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('session_archives')
@@ -0,0 +1,42 @@
+"""Materialized view of per-owner history statistics on PostgreSQL
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # SQLite aggregates the sessions table directly
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("""
+        CREATE MATERIALIZED VIEW session_history_stats AS
+        SELECT
+            owner_id,
+            count(*) AS total_sessions,
+            count(*) FILTER (WHERE status = 'completed') AS completed_sessions,
+            count(*) FILTER (WHERE status = 'interrupted') AS interrupted_sessions,
+            count(*) FILTER (WHERE status = 'overdue') AS overdue_sessions,
+            count(*) FILTER (WHERE status = 'abandoned') AS abandoned_sessions,
+            coalesce(sum(actual_duration_minutes) FILTER (WHERE status = 'completed'), 0) AS total_productive_time,
+            coalesce(sum(interruption_count), 0) AS total_interruptions
+        FROM sessions
+        GROUP BY owner_id
+    """)
+    # Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.execute("CREATE UNIQUE INDEX ix_session_history_stats_owner_id ON session_history_stats (owner_id)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP MATERIALIZED VIEW session_history_stats")
@@ -0,0 +1,32 @@
+"""Checkpoints of resumable bulk imports
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('import_checkpoints',
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('rows_read', sa.Integer(), nullable=False),
+        sa.Column('sessions_imported', sa.Integer(), nullable=False),
+        sa.Column('interruptions_imported', sa.Integer(), nullable=False),
+        sa.Column('rows_rejected', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('owner_id', 'name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_checkpoints')
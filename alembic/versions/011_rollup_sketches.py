@@ -0,0 +1,28 @@
+"""Quantile sketches in the daily rollups
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Filled by the rollups projection; `python -m backend.projector rebuild rollups` fills them for past days
+    for column in ('duration_sketch', 'overrun_sketch', 'interruptions_sketch'):
+        op.add_column('session_daily_rollups', sa.Column(column, sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('session_daily_rollups') as batch_op:
+        batch_op.drop_column('interruptions_sketch')
+        batch_op.drop_column('overrun_sketch')
+        batch_op.drop_column('duration_sketch')
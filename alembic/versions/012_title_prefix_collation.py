@@ -0,0 +1,27 @@
+"""Code point ordered title index for prefix filters on PostgreSQL
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # SQLite's BINARY collation already orders titles by code point
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE INDEX ix_sessions_owner_title_c ON sessions (owner_id, title COLLATE "C")')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_sessions_owner_title_c', table_name='sessions')
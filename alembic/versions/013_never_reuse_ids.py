@@ -0,0 +1,64 @@
+"""Never hand out the ids of archived sessions and interruptions again
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+TABLES = ('sessions', 'interruptions')
+
+
+def _archived_max_ids(bind):
+    """Largest session and interruption ids in the archives, whose hot rows are gone"""
+    largest = dict.fromkeys(TABLES, 0)
+    for (payload,) in bind.execute(sa.text("SELECT payload FROM session_archives")):
+        for session in json.loads(zlib.decompress(payload)):
+            largest['sessions'] = max(largest['sessions'], session['id'])
+            for interruption in session.get('interruptions') or []:
+                largest['interruptions'] = max(largest['interruptions'], interruption['id'])
+    return largest
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    archived = _archived_max_ids(bind)
+    if bind.dialect.name == 'sqlite':
+        # AUTOINCREMENT can only be set by recreating the table; the copy sets sqlite_sequence to max(id)
+        for name in TABLES:
+            with op.batch_alter_table(name, recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+                pass
+        for name in TABLES:
+            bind.execute(sa.text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"
+            ), {'name': name})
+            bind.execute(sa.text("UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = :name"),
+                         {'name': name, 'seq': archived[name]})
+    elif bind.dialect.name == 'postgresql':
+        # Earlier projection rebuilds could move a sequence back to the largest hot id
+        for name in TABLES:
+            sequence = f"pg_get_serial_sequence('{name}', 'id')"
+            bind.execute(sa.text(
+                f"SELECT setval({sequence}, greatest(coalesce((SELECT max(id) FROM {name}), 0), :seq, "
+                f"coalesce(pg_sequence_last_value({sequence}::regclass), 0)) + 1, false)"
+            ), {'seq': archived[name]})
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in TABLES:
+        with op.batch_alter_table(name, recreate='always'):
+            pass
@@ -0,0 +1,91 @@
+"""One archive chunk per batch, and an index of archived session ids
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+TOTALS = ('session_count', 'completed_sessions', 'interrupted_sessions', 'overdue_sessions',
+          'abandoned_sessions', 'total_interruptions', 'productive_minutes')
+
+
+def _unpack(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+def _recreate_archives(chunked):
+    """Copy session_archives into a table keyed with or without seq; existing rows become chunk 0"""
+    key = ['owner_id', 'month'] + (['seq'] if chunked else [])
+    columns = [
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.String(length=7), nullable=False),
+        sa.Column('session_count', sa.Integer(), nullable=False),
+        sa.Column('completed_sessions', sa.Integer(), nullable=False),
+        sa.Column('interrupted_sessions', sa.Integer(), nullable=False),
+        sa.Column('overdue_sessions', sa.Integer(), nullable=False),
+        sa.Column('abandoned_sessions', sa.Integer(), nullable=False),
+        sa.Column('total_interruptions', sa.Integer(), nullable=False),
+        sa.Column('productive_minutes', sa.Float(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+    ]
+    if chunked:
+        columns.insert(2, sa.Column('seq', sa.Integer(), nullable=False))
+    op.create_table('_session_archives', *columns, sa.PrimaryKeyConstraint(*key))
+    copied = ', '.join(['owner_id', 'month', *TOTALS, 'payload'])
+    op.execute(
+        f"INSERT INTO _session_archives ({copied}{', seq' if chunked else ''}) "
+        f"SELECT {copied}{', 0' if chunked else ''} FROM session_archives"
+    )
+    op.drop_table('session_archives')
+    op.rename_table('_session_archives', 'session_archives')
+
+
+def upgrade() -> None:
+    _recreate_archives(chunked=True)
+
+    archived = op.create_table('archived_sessions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.String(length=7), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    bind = op.get_bind()
+    for owner_id, month, payload in bind.execute(sa.text("SELECT owner_id, month, payload FROM session_archives")):
+        rows = [{'id': session['id'], 'owner_id': owner_id, 'month': month, 'seq': 0} for session in _unpack(payload)]
+        if rows:
+            op.bulk_insert(archived, rows)
+
+
+def downgrade() -> None:
+    op.drop_table('archived_sessions')
+
+    # Fold each owner's month back into a single chunk
+    bind = op.get_bind()
+    chunks = {}
+    for row in bind.execute(sa.text(
+            f"SELECT owner_id, month, {', '.join(TOTALS)}, payload FROM session_archives ORDER BY owner_id, month, seq")).mappings():
+        merged = chunks.setdefault((row['owner_id'], row['month']), dict.fromkeys(TOTALS, 0) | {'payload': []})
+        for name in TOTALS:
+            merged[name] += row[name]
+        merged['payload'].extend(_unpack(row['payload']))
+    bind.execute(sa.text("DELETE FROM session_archives"))
+    _recreate_archives(chunked=False)
+    for (owner_id, month), merged in chunks.items():
+        merged['payload'] = zlib.compress(json.dumps(merged['payload'], separators=(',', ':')).encode())
+        bind.execute(sa.text(
+            f"INSERT INTO session_archives (owner_id, month, {', '.join(TOTALS)}, payload) "
+            f"VALUES (:owner_id, :month, {', '.join(':' + name for name in TOTALS)}, :payload)"
+        ), {'owner_id': owner_id, 'month': month, **merged})
@@ -0,0 +1,197 @@
+"""
+Columnar Parquet cache for the e-commerce datasets.
+
+The CSVs are parsed once (in chunks, via :mod:`analytics.ingest`) and written
+to a Parquet dataset partitioned by ``Purchase Date`` month, with the dtypes
+fixed by an explicit Arrow schema. Analyses then read only the columns and
+month partitions they need through memory-mapped Arrow files.
+
+A manifest next to the data records the source file's size, mtime and SHA-256.
+An unchanged mtime is trusted; a changed mtime triggers a re-hash, and the
+cache is rebuilt only when the content hash differs.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from .ingest import ALL_COLUMNS, DEFAULT_CHUNKSIZE, iter_chunks
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = ".analytics_cache"
+PARTITION_COLUMN = "month"
+MANIFEST_NAME = "_manifest.json"
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+ARROW_SCHEMA = pa.schema([
+    ("Customer ID", pa.int64()),
+    ("Purchase Date", pa.timestamp("us")),
+    ("Product Category", _CATEGORY),
+    ("Product Price", pa.int32()),
+    ("Quantity", pa.int16()),
+    ("Total Purchase Amount", pa.int32()),
+    ("Payment Method", _CATEGORY),
+    ("Customer Age", pa.int16()),
+    ("Returns", pa.float32()),
+    ("Customer Name", pa.string()),
+    ("Age", pa.int16()),
+    ("Gender", _CATEGORY),
+    ("Churn", pa.int8()),
+    (PARTITION_COLUMN, pa.string()),
+])
+
+# Columns each notebook analysis actually touches
+ANALYSIS_COLUMNS = {
+    "data_quality": ALL_COLUMNS,
+    "clv": ["Product Category", "Gender", "Total Purchase Amount", "Returns", "Churn"],
+    "category_churn": ["Product Category", "Total Purchase Amount", "Returns", "Quantity", "Churn"],
+    "lagged_returns": ["Customer ID", "Purchase Date", "Returns", "Churn"],
+}
+
+
+def file_sha256(path, block_size: int = 1 << 20) -> str:
+    """Hash a file in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+
+
+class ParquetCache:
+    """Month-partitioned Parquet copies of CSV datasets, keyed by file name"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, chunksize: int = DEFAULT_CHUNKSIZE):
+        self.cache_dir = Path(cache_dir)
+        self.chunksize = chunksize
+
+    def dataset_dir(self, source) -> Path:
+        return self.cache_dir / Path(source).stem
+
+    def _read_manifest(self, source) -> Optional[dict]:
+        try:
+            with open(self.dataset_dir(source) / MANIFEST_NAME) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, source) -> bool:
+        """Check whether the cached copy still matches the source file"""
+        manifest = self._read_manifest(source)
+        if not manifest or manifest.get("version") != CACHE_VERSION:
+            return False
+
+        stat = os.stat(source)
+        if stat.st_size != manifest["size"]:
+            return False
+        if stat.st_mtime_ns == manifest["mtime_ns"]:
+            return True
+
+        # Touched but maybe not modified: fall back to the content hash
+        if file_sha256(source) != manifest["sha256"]:
+            return False
+        manifest["mtime_ns"] = stat.st_mtime_ns
+        self._write_manifest(self.dataset_dir(source), manifest)
+        return True
+
+    def build(self, source) -> Path:
+        """Convert a CSV into the partitioned Parquet cache"""
+        target = self.dataset_dir(source)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        stat = os.stat(source)
+        sha256 = file_sha256(source)
+
+        # Write into a scratch directory and swap it in, so readers never see
+        # a half-written dataset
+        scratch = Path(tempfile.mkdtemp(prefix=f".{target.name}-", dir=self.cache_dir))
+        try:
+            rows = 0
+            months = set()
+            for i, chunk in enumerate(iter_chunks(source, chunksize=self.chunksize)):
+                chunk[PARTITION_COLUMN] = chunk["Purchase Date"].dt.strftime("%Y-%m")
+                table = pa.Table.from_pandas(chunk, schema=ARROW_SCHEMA, preserve_index=False)
+                pq.write_to_dataset(
+                    table,
+                    root_path=str(scratch),
+                    partitioning=_partitioning(),
+                    basename_template=f"chunk-{i:06d}-{{i}}.parquet",
+                )
+                rows += len(chunk)
+                months.update(chunk[PARTITION_COLUMN].dropna().unique())
+
+            self._write_manifest(scratch, {
+                "version": CACHE_VERSION,
+                "source": str(Path(source).resolve()),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256,
+                "rows": rows,
+                "months": sorted(months),
+            })
+            if target.exists():
+                shutil.rmtree(target)
+            os.replace(scratch, target)
+        except BaseException:
+            shutil.rmtree(scratch, ignore_errors=True)
+            raise
+        return target
+
+    def ensure(self, source) -> Path:
+        """Return the cache directory for a source, rebuilding it if stale"""
+        if not self.is_fresh(source):
+            self.build(source)
+        return self.dataset_dir(source)
+
+    def months(self, source) -> List[str]:
+        """List the month partitions present in the cache"""
+        self.ensure(source)
+        return self._read_manifest(source)["months"]
+
+    def dataset(self, source) -> ds.Dataset:
+        """Open the cached copy as a memory-mapped Arrow dataset"""
+        root = self.ensure(source)
+        return ds.dataset(
+            str(root),
+            schema=ARROW_SCHEMA,
+            format="parquet",
+            partitioning=_partitioning(),
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+        )
+
+    def read_table(self, source, columns: Optional[List[str]] = None,
+                   months: Optional[Iterable[str]] = None) -> pa.Table:
+        """Read selected columns from selected month partitions"""
+        filter_ = None
+        if months is not None:
+            filter_ = ds.field(PARTITION_COLUMN).isin(sorted(set(months)))
+        return self.dataset(source).to_table(columns=columns, filter=filter_)
+
+    def read(self, source, columns: Optional[List[str]] = None,
+             months: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Like :meth:`read_table` but returns a DataFrame"""
+        return self.read_table(source, columns=columns, months=months).to_pandas()
+
+    def read_for(self, source, analysis: str, months: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Read just the columns a named notebook analysis needs"""
+        return self.read(source, columns=ANALYSIS_COLUMNS[analysis], months=months)
+
+    @staticmethod
+    def _write_manifest(directory: Path, manifest: dict):
+        tmp = directory / (MANIFEST_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, directory / MANIFEST_NAME)
@@ -0,0 +1,401 @@
+"""
+Churn prediction: feature building, training and streaming batch scoring.
+
+Implements the plan from the notebook's Q7 section:
+
+* features: Customer Age, Total Purchase Amount, Product Price, Quantity and
+  Returns (missing returns count as 0), standardised, plus one-hot
+  Product Category, Gender and Payment Method;
+* a class-weighted scikit-learn Logistic Regression trained on CPU;
+* evaluation by Recall and F1 (plus precision, accuracy and ROC AUC), on
+  customers held out whole: every purchase of a customer lands on the same
+  side of the split, since churn is a property of the customer.
+
+Feature matrices are float32 CSR and are cached on disk under a key made from
+``FEATURE_VERSION`` and the source file's SHA-256, which is only recomputed
+when the file's size or mtime changes. Both feature building and scoring read
+the CSV in chunks, so the full customer table is never held in memory. Every
+stage records its wall time, CPU time and its own peak RSS (on Linux; other
+platforms report the process's peak so far).
+
+Usage::
+
+    python -m analytics.churn_model train ecommerce_customer_data_large.csv --model churn.joblib
+    python -m analytics.churn_model score ecommerce_customer_data_large.csv --model churn.joblib --output scores.csv
+"""
+import argparse
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import (
+    accuracy_score, f1_score, precision_score, recall_score, roc_auc_score,
+)
+from sklearn.model_selection import GroupShuffleSplit
+
+from .cache import file_sha256
+from .ingest import DEFAULT_CHUNKSIZE, iter_chunks
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Bump whenever build_features changes, so stale cached matrices are ignored
+FEATURE_VERSION = 1
+
+NUMERIC_FEATURES = ["Customer Age", "Total Purchase Amount", "Product Price", "Quantity", "Returns"]
+CATEGORICAL_FEATURES = ["Product Category", "Gender", "Payment Method"]
+TARGET = "Churn"
+ID_COLUMN = "Customer ID"
+DEFAULT_FEATURE_CACHE = ".analytics_cache/features"
+
+
+def _reset_peak_rss() -> bool:
+    """Restart the kernel's RSS high-water mark (Linux), so the next reading covers one stage"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """VmHWM since the last reset, or without one the process's ru_maxrss"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; only Linux gets here with a reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class StageMetrics:
+    """Wall time, CPU time and peak RSS recorded per pipeline stage.
+
+    Where the high-water mark can be reset, ``peak_rss_mb`` is the stage's
+    own peak. Elsewhere only the process's peak so far is known, and it is
+    recorded as ``process_peak_rss_mb`` so it is not mistaken for the stage's.
+    """
+    stages: Dict[str, dict] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str, **info):
+        per_stage = _reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        record = dict(info)
+        try:
+            yield record
+        finally:
+            record.update(
+                wall_seconds=time.perf_counter() - wall,
+                cpu_seconds=time.process_time() - cpu,
+            )
+            record["peak_rss_mb" if per_stage else "process_peak_rss_mb"] = _peak_rss_mb()
+            self.stages[name] = record
+
+
+@dataclass
+class FeatureSpec:
+    """Everything needed to turn raw rows into the model's feature columns"""
+    means: Dict[str, float]
+    scales: Dict[str, float]
+    vocabularies: Dict[str, List[str]]
+    version: int = FEATURE_VERSION
+
+    @property
+    def feature_names(self) -> List[str]:
+        names = list(NUMERIC_FEATURES)
+        for column in CATEGORICAL_FEATURES:
+            names += [f"{column}={value}" for value in self.vocabularies[column]]
+        return names
+
+    @classmethod
+    def fit(cls, chunks) -> "FeatureSpec":
+        """Learn scaling and vocabularies in one streaming pass"""
+        count = np.zeros(len(NUMERIC_FEATURES))
+        total = np.zeros(len(NUMERIC_FEATURES))
+        total_sq = np.zeros(len(NUMERIC_FEATURES))
+        vocabularies = {column: set() for column in CATEGORICAL_FEATURES}
+        for chunk in chunks:
+            values = _numeric(chunk)
+            count += len(values)
+            total += values.sum(axis=0)
+            total_sq += (values ** 2).sum(axis=0)
+            for column in CATEGORICAL_FEATURES:
+                vocabularies[column].update(chunk[column].dropna().unique())
+
+        means = total / np.maximum(count, 1)
+        variance = total_sq / np.maximum(count, 1) - means ** 2
+        scales = np.where(variance > 0, np.sqrt(np.clip(variance, 0, None)), 1.0)
+        return cls(
+            means=dict(zip(NUMERIC_FEATURES, means.tolist())),
+            scales=dict(zip(NUMERIC_FEATURES, scales.tolist())),
+            vocabularies={c: sorted(map(str, v)) for c, v in vocabularies.items()},
+        )
+
+
+def _numeric(chunk: pd.DataFrame) -> np.ndarray:
+    values = chunk[NUMERIC_FEATURES].astype("float64")
+    values["Returns"] = values["Returns"].fillna(0)
+    return values.to_numpy()
+
+
+def build_features(chunk: pd.DataFrame, spec: FeatureSpec) -> sparse.csr_matrix:
+    """Float32 CSR features: scaled numerics followed by one-hot categoricals.
+
+    Categories missing from the spec's vocabulary encode as all zeros.
+    """
+    n = len(chunk)
+    means = np.array([spec.means[c] for c in NUMERIC_FEATURES])
+    scales = np.array([spec.scales[c] for c in NUMERIC_FEATURES])
+    blocks = [sparse.csr_matrix(((_numeric(chunk) - means) / scales).astype(np.float32))]
+
+    rows = np.arange(n)
+    for column in CATEGORICAL_FEATURES:
+        vocabulary = spec.vocabularies[column]
+        codes = pd.Categorical(chunk[column].astype("string"), categories=vocabulary).codes
+        known = codes >= 0
+        blocks.append(sparse.csr_matrix(
+            (np.ones(known.sum(), dtype=np.float32), (rows[known], codes[known])),
+            shape=(n, len(vocabulary)),
+        ))
+    return sparse.hstack(blocks, format="csr", dtype=np.float32)
+
+
+def _usecols(with_target: bool) -> List[str]:
+    columns = [ID_COLUMN] + NUMERIC_FEATURES + CATEGORICAL_FEATURES
+    return columns + [TARGET] if with_target else columns
+
+
+class FeatureStore:
+    """Versioned on-disk cache of training feature matrices"""
+
+    def __init__(self, cache_dir=DEFAULT_FEATURE_CACHE):
+        self.cache_dir = Path(cache_dir)
+
+    @property
+    def _sources_path(self) -> Path:
+        return self.cache_dir / "sources.json"
+
+    def _read_sources(self) -> dict:
+        try:
+            with open(self._sources_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def source_sha256(self, source) -> str:
+        """The file's SHA-256, reused while its size and mtime are unchanged"""
+        path = str(Path(source).resolve())
+        stat = os.stat(path)
+        sources = self._read_sources()
+        known = sources.get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        sources[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(path)}
+        # Write aside and swap in, so a concurrent reader never sees half a file
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        scratch = self._sources_path.with_name(f".sources-{os.getpid()}.json")
+        with open(scratch, "w") as f:
+            json.dump(sources, f)
+        os.replace(scratch, self._sources_path)
+        return sources[path]["sha256"]
+
+    def key(self, source) -> str:
+        return f"v{FEATURE_VERSION}-{self.source_sha256(source)[:16]}"
+
+    def _paths(self, key: str):
+        return (self.cache_dir / f"{key}.npz", self.cache_dir / f"{key}.labels.npy",
+                self.cache_dir / f"{key}.groups.npy", self.cache_dir / f"{key}.spec.json")
+
+    def load(self, source):
+        """Return ``(X, y, groups, spec)`` if a current matrix is cached, else ``None``"""
+        matrix_path, labels_path, groups_path, spec_path = self._paths(self.key(source))
+        if not all(path.exists() for path in (matrix_path, labels_path, groups_path, spec_path)):
+            return None
+        with open(spec_path) as f:
+            spec = FeatureSpec(**json.load(f))
+        return sparse.load_npz(matrix_path), np.load(labels_path), np.load(groups_path), spec
+
+    def build(self, source, chunksize: int = DEFAULT_CHUNKSIZE):
+        """Build and cache ``(X, y, groups, spec)`` with two streaming passes; groups are customer ids"""
+        spec = FeatureSpec.fit(iter_chunks(source, chunksize=chunksize, usecols=_usecols(True)))
+        blocks, labels, groups = [], [], []
+        for chunk in iter_chunks(source, chunksize=chunksize, usecols=_usecols(True)):
+            blocks.append(build_features(chunk, spec))
+            labels.append(chunk[TARGET].to_numpy(dtype=np.int8))
+            groups.append(chunk[ID_COLUMN].to_numpy(dtype=np.int64))
+        X = sparse.vstack(blocks, format="csr", dtype=np.float32)
+        y = np.concatenate(labels)
+        customers = np.concatenate(groups)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        matrix_path, labels_path, groups_path, spec_path = self._paths(self.key(source))
+        sparse.save_npz(matrix_path, X, compressed=False)
+        np.save(labels_path, y)
+        np.save(groups_path, customers)
+        with open(spec_path, "w") as f:
+            json.dump(asdict(spec), f)
+        return X, y, customers, spec
+
+    def get(self, source, chunksize: int = DEFAULT_CHUNKSIZE):
+        """Return ``(X, y, groups, spec, cached)``, building the matrix on a miss"""
+        cached = self.load(source)
+        if cached is not None:
+            return (*cached, True)
+        return (*self.build(source, chunksize=chunksize), False)
+
+
+@dataclass
+class ChurnModel:
+    """A fitted classifier together with the spec that produced its inputs"""
+    classifier: LogisticRegression
+    spec: FeatureSpec
+    threshold: float = 0.5
+
+    def predict_proba(self, chunk: pd.DataFrame) -> np.ndarray:
+        return self.classifier.predict_proba(build_features(chunk, self.spec))[:, 1]
+
+    def save(self, path):
+        joblib.dump({"classifier": self.classifier, "spec": asdict(self.spec),
+                     "threshold": self.threshold}, path)
+
+    @classmethod
+    def load(cls, path) -> "ChurnModel":
+        data = joblib.load(path)
+        spec = FeatureSpec(**data["spec"])
+        if spec.version != FEATURE_VERSION:
+            raise ValueError(f"Model was trained on feature version {spec.version}, "
+                             f"this code builds version {FEATURE_VERSION}")
+        return cls(data["classifier"], spec, data["threshold"])
+
+
+@dataclass
+class TrainingResult:
+    model: ChurnModel
+    metrics: Dict[str, float]
+    stages: Dict[str, dict]
+
+
+def evaluate(y_true: np.ndarray, probabilities: np.ndarray, threshold: float = 0.5) -> Dict[str, float]:
+    """Recall and F1 first, as argued in the Q7 plan"""
+    predicted = (probabilities >= threshold).astype(np.int8)
+    metrics = {
+        "recall": recall_score(y_true, predicted, zero_division=0),
+        "f1": f1_score(y_true, predicted, zero_division=0),
+        "precision": precision_score(y_true, predicted, zero_division=0),
+        "accuracy": accuracy_score(y_true, predicted),
+    }
+    if len(np.unique(y_true)) > 1:
+        metrics["roc_auc"] = roc_auc_score(y_true, probabilities)
+    return {name: float(value) for name, value in metrics.items()}
+
+
+def split_by_customer(groups: np.ndarray, test_size: float = 0.2, random_state: int = 0):
+    """Train and test row indices with each customer's purchases all on one side.
+
+    A per-row split puts other purchases of a test customer, with the same
+    churn label, into training, which inflates the test metrics.
+    """
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    return next(splitter.split(np.zeros(len(groups)), groups=groups))
+
+
+def train_churn_model(source, feature_cache=DEFAULT_FEATURE_CACHE, chunksize: int = DEFAULT_CHUNKSIZE,
+                      test_size: float = 0.2, random_state: int = 0,
+                      classifier: Optional[LogisticRegression] = None) -> TrainingResult:
+    """Build (or load) cached features, fit the model and evaluate it"""
+    metrics = StageMetrics()
+    with metrics.stage("features") as record:
+        X, y, groups, spec, cached = FeatureStore(feature_cache).get(source, chunksize=chunksize)
+        record.update(rows=X.shape[0], columns=X.shape[1], cached=cached)
+
+    with metrics.stage("split") as record:
+        train, test = split_by_customer(groups, test_size, random_state)
+        X_train, X_test, y_train, y_test = X[train], X[test], y[train], y[test]
+        record.update(train_customers=len(np.unique(groups[train])), test_customers=len(np.unique(groups[test])))
+
+    if classifier is None:
+        # Missing a churner costs more than a wasted offer: weight the classes
+        classifier = LogisticRegression(class_weight="balanced", max_iter=500)
+    with metrics.stage("train", rows=X_train.shape[0]):
+        classifier.fit(X_train, y_train)
+
+    model = ChurnModel(classifier, spec)
+    with metrics.stage("evaluate", rows=X_test.shape[0]):
+        scores = evaluate(y_test, classifier.predict_proba(X_test)[:, 1], model.threshold)
+    return TrainingResult(model, scores, metrics.stages)
+
+
+def score_csv(source, model: ChurnModel, output, chunksize: int = DEFAULT_CHUNKSIZE,
+              metrics: Optional[StageMetrics] = None) -> int:
+    """Stream a customer CSV through the model and write scores to ``output``.
+
+    Writes ``Customer ID``, ``churn_probability`` and ``churn_prediction``
+    one chunk at a time and returns the number of rows scored.
+    """
+    metrics = metrics or StageMetrics()
+    scored = 0
+    with metrics.stage("score") as record:
+        tmp = f"{output}.part"
+        with open(tmp, "w", newline="") as f:
+            for i, chunk in enumerate(iter_chunks(source, chunksize=chunksize, usecols=_usecols(False))):
+                probabilities = model.predict_proba(chunk)
+                pd.DataFrame({
+                    ID_COLUMN: chunk[ID_COLUMN].to_numpy(),
+                    "churn_probability": probabilities.astype(np.float32),
+                    "churn_prediction": (probabilities >= model.threshold).astype(np.int8),
+                }).to_csv(f, header=(i == 0), index=False)
+                scored += len(chunk)
+        os.replace(tmp, output)
+        record.update(rows=scored)
+    return scored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Churn model training and batch scoring")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="Train on a labelled CSV")
+    train.add_argument("source")
+    train.add_argument("--model", required=True, help="Where to save the fitted model")
+    train.add_argument("--feature-cache", default=DEFAULT_FEATURE_CACHE)
+    train.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+
+    score = commands.add_parser("score", help="Batch-score a CSV")
+    score.add_argument("source")
+    score.add_argument("--model", required=True)
+    score.add_argument("--output", required=True)
+    score.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+
+    args = parser.parse_args(argv)
+    if args.command == "train":
+        result = train_churn_model(args.source, args.feature_cache, args.chunksize)
+        result.model.save(args.model)
+        print(json.dumps({"metrics": result.metrics, "stages": result.stages}, indent=2))
+    else:
+        metrics = StageMetrics()
+        rows = score_csv(args.source, ChurnModel.load(args.model), args.output, args.chunksize, metrics)
+        print(json.dumps({"rows": rows, "stages": metrics.stages}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
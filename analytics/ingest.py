@@ -0,0 +1,265 @@
+"""
+Chunked (out-of-core) ingestion of the e-commerce customer datasets.
+
+The notebook loads ``ecommerce_customer_data_large.csv`` and
+``ecommerce_customer_data_custom_ratios.csv`` whole with ``pd.read_csv``.
+This module streams them in fixed-size chunks with explicit dtypes and folds
+every chunk into a mergeable partial state, so peak memory is bounded by the
+chunk size instead of the file size.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DATE_COLUMNS = ["Purchase Date"]
+
+# Explicit dtypes for every column of the datasets. Narrow integer types keep
+# chunks small; low-cardinality strings are read as categoricals.
+COLUMN_DTYPES = {
+    "Customer ID": "int64",
+    "Product Category": "category",
+    "Product Price": "int32",
+    "Quantity": "int16",
+    "Total Purchase Amount": "int32",
+    "Payment Method": "category",
+    "Customer Age": "int16",
+    "Returns": "float32",
+    "Customer Name": "string",
+    "Age": "int16",
+    "Gender": "category",
+    "Churn": "int8",
+}
+
+ALL_COLUMNS = [
+    "Customer ID", "Purchase Date", "Product Category", "Product Price",
+    "Quantity", "Total Purchase Amount", "Payment Method", "Customer Age",
+    "Returns", "Customer Name", "Age", "Gender", "Churn",
+]
+
+# Columns needed by the aggregates below (duplicates are counted over the
+# columns that were read, so pass ALL_COLUMNS to match ``df.duplicated()``).
+AGGREGATE_COLUMNS = [
+    "Product Category", "Quantity", "Total Purchase Amount", "Returns",
+    "Gender", "Churn",
+]
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def read_dataset(path, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a whole dataset in memory with the fixed dtypes"""
+    return pd.read_csv(path, **_read_csv_options(usecols))
+
+
+def iter_chunks(path, chunksize: int = DEFAULT_CHUNKSIZE,
+                usecols: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Yield a dataset as DataFrame chunks of at most ``chunksize`` rows"""
+    with pd.read_csv(path, chunksize=chunksize, **_read_csv_options(usecols)) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def _read_csv_options(usecols: Optional[List[str]]) -> dict:
+    columns = list(usecols) if usecols is not None else ALL_COLUMNS
+    unknown = set(columns) - set(ALL_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown columns: {sorted(unknown)}")
+    return {
+        "usecols": columns,
+        "dtype": {c: COLUMN_DTYPES[c] for c in columns if c in COLUMN_DTYPES},
+        "parse_dates": [c for c in DATE_COLUMNS if c in columns],
+    }
+
+
+def _plain_index(obj):
+    """Replace categorical group keys with plain values so partials align"""
+    if isinstance(obj.index, pd.MultiIndex):
+        obj.index = pd.MultiIndex.from_tuples(list(obj.index), names=obj.index.names)
+    else:
+        obj.index = pd.Index(list(obj.index), name=obj.index.name, dtype=object)
+    return obj
+
+
+def _add(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return left.add(right, fill_value=0)
+
+
+def _prepared(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Widen the summed columns, with the same preprocessing as the notebook"""
+    # calculate_clv_metrics fills missing returns with 0 before any grouping
+    returns = chunk["Returns"].fillna(0).astype("float64")
+    frame = pd.DataFrame({"Returns": returns, "Count": np.ones(len(chunk), dtype="int64")}, index=chunk.index)
+    for column in ("Product Category", "Gender"):
+        if column in chunk:
+            frame[column] = chunk[column]
+    for column in ("Total Purchase Amount", "Quantity", "Churn"):
+        if column in chunk:
+            frame[column] = chunk[column].astype("int64")
+    if "Total Purchase Amount" in chunk:
+        frame["Net Profit"] = chunk["Total Purchase Amount"] - returns
+    return frame
+
+
+def category_sums(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Per-category partial sums behind ``analyze_category_churn``"""
+    sums = _prepared(chunk).groupby("Product Category", observed=True)[
+        ["Total Purchase Amount", "Returns", "Quantity", "Churn", "Count"]
+    ].sum()
+    return _plain_index(sums)
+
+
+def segment_sums(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Per (category, gender) partial sums behind ``calculate_clv_metrics``"""
+    sums = _prepared(chunk).groupby(["Product Category", "Gender"], observed=True)[
+        ["Net Profit", "Churn", "Count"]
+    ].sum()
+    return _plain_index(sums)
+
+
+def category_comparison(sums: pd.DataFrame) -> pd.DataFrame:
+    """Mean purchase amount, returns, quantity and churn per category"""
+    sums = sums.sort_index()
+    return pd.DataFrame({
+        "Total Purchase Amount": sums["Total Purchase Amount"] / sums["Count"],
+        "Returns": sums["Returns"] / sums["Count"],
+        "Quantity": sums["Quantity"] / sums["Count"],
+        "Churn": sums["Churn"] / sums["Count"],
+    })
+
+
+def clv_metrics(sums: pd.DataFrame) -> pd.DataFrame:
+    """Net profit, churn rate and CLV per (category, gender) segment"""
+    sums = sums.sort_index()
+    metrics = pd.DataFrame({
+        "Total Net Profit": sums["Net Profit"],
+        "Average Net Profit": sums["Net Profit"] / sums["Count"],
+        "Churn Rate": sums["Churn"] / sums["Count"],
+    })
+    churn_rate = metrics["Churn Rate"]
+    metrics["CLV"] = (metrics["Average Net Profit"] / churn_rate).where(churn_rate > 0, np.nan)
+    return metrics
+
+
+class RowHashSet:
+    """Distinct 64-bit row hashes, used to count duplicate rows across chunks"""
+
+    def __init__(self):
+        self._unique = np.empty(0, dtype=np.uint64)
+        self._pending: List[np.ndarray] = []
+        self._pending_size = 0
+
+    def add_frame(self, chunk: pd.DataFrame):
+        self.add(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+
+    def add(self, hashes: np.ndarray):
+        self._pending.append(hashes)
+        self._pending_size += len(hashes)
+        # Compact geometrically so the total work stays O(n log n)
+        if self._pending_size > max(len(self._unique), DEFAULT_CHUNKSIZE):
+            self._compact()
+
+    def update(self, other: "RowHashSet"):
+        self.add(other._unique)
+        for hashes in other._pending:
+            self.add(hashes)
+
+    def _compact(self):
+        if self._pending:
+            self._unique = np.unique(np.concatenate([self._unique, *self._pending]))
+            self._pending = []
+            self._pending_size = 0
+
+    def __len__(self):
+        self._compact()
+        return len(self._unique)
+
+
+@dataclass
+class DatasetSummary:
+    """Final aggregates of a dataset, as produced by the notebook analyses"""
+    rows: int
+    null_counts: pd.Series
+    duplicate_rows: int
+    churn_rate: float
+    category_revenue: pd.Series
+    category_comparison: pd.DataFrame
+    clv_metrics: pd.DataFrame
+
+
+@dataclass
+class PartialAggregates:
+    """Mergeable partial state of the dataset aggregates.
+
+    Every field is a sum (or a set of row hashes), so partial states built from
+    disjoint chunks can be combined in any order with :meth:`merge`. Duplicate
+    detection keeps one 64-bit hash per distinct row; everything else is
+    bounded by the number of groups.
+    """
+    rows: int = 0
+    churned: int = 0
+    null_counts: Optional[pd.Series] = None
+    category_sums: Optional[pd.DataFrame] = None
+    segment_sums: Optional[pd.DataFrame] = None
+    row_hashes: RowHashSet = field(default_factory=RowHashSet)
+
+    def update(self, chunk: pd.DataFrame) -> "PartialAggregates":
+        """Fold a chunk of rows into the partial state"""
+        self.rows += len(chunk)
+        self.churned += int(chunk["Churn"].sum())
+        self.null_counts = _add(self.null_counts, chunk.isnull().sum().astype("int64"))
+        self.row_hashes.add_frame(chunk)
+        self.category_sums = _add(self.category_sums, category_sums(chunk))
+        self.segment_sums = _add(self.segment_sums, segment_sums(chunk))
+        return self
+
+    def merge(self, other: "PartialAggregates") -> "PartialAggregates":
+        """Combine two partial states built from disjoint rows"""
+        self.rows += other.rows
+        self.churned += other.churned
+        self.null_counts = _add(self.null_counts, other.null_counts)
+        self.category_sums = _add(self.category_sums, other.category_sums)
+        self.segment_sums = _add(self.segment_sums, other.segment_sums)
+        self.row_hashes.update(other.row_hashes)
+        return self
+
+    def finalize(self) -> DatasetSummary:
+        """Turn the partial state into the final aggregates"""
+        return DatasetSummary(
+            rows=self.rows,
+            null_counts=self.null_counts.astype("int64"),
+            duplicate_rows=self.rows - len(self.row_hashes),
+            churn_rate=self.churned / self.rows if self.rows else float("nan"),
+            category_revenue=self.category_sums["Total Purchase Amount"].sort_index().astype("int64"),
+            category_comparison=category_comparison(self.category_sums),
+            clv_metrics=clv_metrics(self.segment_sums),
+        )
+
+
+def aggregate_chunks(chunks: Iterable[pd.DataFrame]) -> DatasetSummary:
+    """Aggregate an iterable of chunks into a :class:`DatasetSummary`"""
+    state = PartialAggregates()
+    for chunk in chunks:
+        state.update(chunk)
+    return state.finalize()
+
+
+def aggregate_csv(path, chunksize: int = DEFAULT_CHUNKSIZE,
+                  usecols: Optional[List[str]] = None) -> DatasetSummary:
+    """Stream a dataset from disk and compute its aggregates"""
+    return aggregate_chunks(iter_chunks(path, chunksize=chunksize, usecols=usecols))
+
+
+def aggregate_frame(df: pd.DataFrame) -> DatasetSummary:
+    """In-memory path: aggregate a fully loaded DataFrame"""
+    return PartialAggregates().update(df).finalize()
+
+
+def summarize_datasets(paths: Dict[str, str], chunksize: int = DEFAULT_CHUNKSIZE) -> Dict[str, DatasetSummary]:
+    """Aggregate several named datasets one chunk at a time"""
+    return {name: aggregate_csv(path, chunksize=chunksize) for name, path in paths.items()}
@@ -0,0 +1,194 @@
+"""
+Per-customer lag and rolling-window features over purchase sequences.
+
+The notebook's Q9 analysis sorts each DataFrame by ``['Customer ID',
+'Purchase Date']`` and calls ``groupby('Customer ID')['Returns'].shift(1)`` once
+per lag. Here the rows are ordered once and every lag and window is derived in
+a single vectorised pass over the sorted NumPy arrays. Customer segments come
+from ``np.flatnonzero(np.diff(keys))`` and rolling windows from prefix sums.
+
+Features only look at *previous* purchases: ``<col>_lag1`` equals the
+notebook's ``Previous_Return``, and ``<col>_roll<w>_mean`` averages the
+previous ``w`` purchases while skipping missing values, like
+``shift(1).rolling(w, min_periods=1).mean()``.
+
+:class:`LagFeatureEngine` also has an incremental mode. It keeps the last few
+purchases per customer, so new purchases can be appended without re-sorting
+the history.
+"""
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def segment_starts(keys: np.ndarray) -> np.ndarray:
+    """Index of the first row of each row's segment in a key-sorted array"""
+    starts = np.zeros(len(keys), dtype=np.int64)
+    if len(keys):
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        starts[boundaries] = boundaries
+        np.maximum.accumulate(starts, out=starts)
+    return starts
+
+
+def segment_ends(keys: np.ndarray) -> np.ndarray:
+    """Index one past the last row of each row's segment"""
+    n = len(keys)
+    ends = np.full(n, n, dtype=np.int64)
+    if n:
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        ends[boundaries - 1] = boundaries
+        ends = np.minimum.accumulate(ends[::-1])[::-1]
+    return ends
+
+
+def sorted_features(keys: np.ndarray, values: Dict[str, np.ndarray], lags: Sequence[int],
+                    windows: Sequence[int], history: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Compute lag and window features over key-sorted (then time-sorted) rows.
+
+    ``history`` optionally gives, per row, how many earlier purchases of the
+    same customer are not present in the arrays (used by incremental mode).
+    """
+    n = len(keys)
+    index = np.arange(n)
+    starts = segment_starts(keys)
+    position = index - starts
+
+    features = {"n_previous": position + (history if history is not None else 0)}
+    for name, column in values.items():
+        column = np.asarray(column, dtype=np.float64)
+        for lag in lags:
+            lagged = np.full(n, np.nan)
+            if lag < n:
+                lagged[lag:] = column[:n - lag]
+                lagged[position < lag] = np.nan
+            features[f"{name}_lag{lag}"] = lagged
+
+        if windows:
+            valid = ~np.isnan(column)
+            sums = np.concatenate([[0.0], np.cumsum(np.where(valid, column, 0.0))])
+            counts = np.concatenate([[0], np.cumsum(valid)])
+            for window in windows:
+                # Previous `window` rows of the same customer: [lo, i)
+                lo = np.maximum(index - window, starts)
+                total = sums[index] - sums[lo]
+                count = counts[index] - counts[lo]
+                features[f"{name}_roll{window}_sum"] = np.where(count > 0, total, np.nan)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    features[f"{name}_roll{window}_mean"] = np.where(count > 0, total / count, np.nan)
+    return features
+
+
+def _lookup(sorted_keys: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Position of each key in a sorted unique array, and whether it is there"""
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    idx = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return idx, sorted_keys[idx] == keys
+
+
+class LagFeatureEngine:
+    """Builds per-customer lag/rolling features in batch or incrementally"""
+
+    def __init__(self, lags: Iterable[int] = (1,), windows: Iterable[int] = (),
+                 value_columns: Iterable[str] = ("Returns",), key_column: str = "Customer ID",
+                 time_column: str = "Purchase Date"):
+        self.lags = sorted(set(lags))
+        self.windows = sorted(set(windows))
+        if any(lag < 1 for lag in self.lags) or any(w < 1 for w in self.windows):
+            raise ValueError("Lags and windows must be positive")
+        self.value_columns = list(value_columns)
+        self.key_column = key_column
+        self.time_column = time_column
+        # Rows of history each customer needs to keep for incremental updates
+        self.depth = max(self.lags + self.windows + [1])
+        self.reset()
+
+    def reset(self):
+        """Forget the incremental state"""
+        self._tail_keys = np.empty(0, dtype=np.int64)
+        self._tail_times = np.empty(0, dtype="datetime64[ns]")
+        self._tail_values = {c: np.empty(0, dtype=np.float64) for c in self.value_columns}
+        self._customers = np.empty(0, dtype=np.int64)
+        self._totals = np.empty(0, dtype=np.int64)
+
+    def _arrays(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        keys = df[self.key_column].to_numpy(dtype=np.int64)
+        times = pd.to_datetime(df[self.time_column]).to_numpy(dtype="datetime64[ns]")
+        values = {c: df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in self.value_columns}
+        return keys, times, values
+
+    def _frame(self, features: Dict[str, np.ndarray], order: np.ndarray, index) -> pd.DataFrame:
+        # Scatter back from sorted order to the caller's row order
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        return pd.DataFrame({name: column[inverse] for name, column in features.items()}, index=index)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Features for a full purchase table, aligned with ``df``'s rows"""
+        keys, times, values = self._arrays(df)
+        order = np.lexsort((times, keys))
+        features = sorted_features(keys[order], {c: v[order] for c, v in values.items()},
+                                   self.lags, self.windows)
+        return self._frame(features, order, df.index)
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Append new purchases and return their features.
+
+        Only the new batch is sorted; history is represented by the last
+        ``depth`` purchases of each customer kept from earlier calls. New
+        purchases must not predate a customer's latest known purchase.
+        """
+        keys, times, values = self._arrays(df)
+        order = np.lexsort((times, keys))
+        keys, times = keys[order], times[order]
+        values = {c: v[order] for c, v in values.items()}
+
+        # Purchases of customers already seen must come after their history
+        _, seen = _lookup(self._customers, keys)
+        if seen.any():
+            tail_end = np.searchsorted(self._tail_keys, keys[seen], side="right") - 1
+            if (times[seen] < self._tail_times[tail_end]).any():
+                raise ValueError("Incremental purchases must not predate a customer's history")
+
+        # History rows of the customers in this batch, followed by the batch
+        in_batch = np.isin(self._tail_keys, keys)
+        n_tail = int(in_batch.sum())
+        all_keys = np.concatenate([self._tail_keys[in_batch], keys])
+        merge = np.argsort(all_keys, kind="stable")
+        all_keys = all_keys[merge]
+        all_times = np.concatenate([self._tail_times[in_batch], times])[merge]
+        all_values = {c: np.concatenate([self._tail_values[c][in_batch], values[c]])[merge]
+                      for c in self.value_columns}
+        is_new = merge >= n_tail
+
+        # Purchases older than the kept tail still count towards n_previous
+        tail_counts = np.bincount(np.searchsorted(self._customers, self._tail_keys[in_batch]),
+                                  minlength=len(self._customers))
+        dropped = np.zeros(len(all_keys), dtype=np.int64)
+        idx, match = _lookup(self._customers, all_keys)
+        dropped[match] = (self._totals - tail_counts)[idx[match]]
+
+        features = sorted_features(all_keys, all_values, self.lags, self.windows, history=dropped)
+        result = {name: column[is_new] for name, column in features.items()}
+
+        # Keep the last `depth` purchases of every touched customer
+        keep = (segment_ends(all_keys) - np.arange(len(all_keys))) <= self.depth
+        tail_keys = np.concatenate([self._tail_keys[~in_batch], all_keys[keep]])
+        tail_order = np.argsort(tail_keys, kind="stable")
+        self._tail_keys = tail_keys[tail_order]
+        self._tail_times = np.concatenate([self._tail_times[~in_batch], all_times[keep]])[tail_order]
+        self._tail_values = {
+            c: np.concatenate([self._tail_values[c][~in_batch], all_values[c][keep]])[tail_order]
+            for c in self.value_columns
+        }
+
+        batch_customers, batch_counts = np.unique(keys, return_counts=True)
+        customers = np.union1d(self._customers, batch_customers)
+        totals = np.zeros(len(customers), dtype=np.int64)
+        totals[np.searchsorted(customers, self._customers)] += self._totals
+        totals[np.searchsorted(customers, batch_customers)] += batch_counts
+        self._customers, self._totals = customers, totals
+
+        return self._frame(result, order, df.index)
@@ -0,0 +1,298 @@
+"""
+Multi-process runner for the per-dataset notebook analyses.
+
+The notebook runs ``assess_data_quality``, ``calculate_clv_metrics`` and
+``analyze_category_churn`` one after another for every dataset. Here each
+(dataset, analysis, Product Category, row slice) combination becomes an
+independent job on a :class:`~concurrent.futures.ProcessPoolExecutor`.
+
+Frames are never pickled to the workers. Every dataset is written once to an
+uncompressed Arrow IPC file, and workers memory-map it and read only the
+columns their analysis needs. Workers return small mergeable partials, which
+are combined in sorted job order so the result does not depend on scheduling.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .cache import ANALYSIS_COLUMNS
+from .ingest import (
+    ALL_COLUMNS, RowHashSet, _add, category_comparison, category_sums,
+    clv_metrics, segment_sums,
+)
+
+DESCRIBE_COLUMNS = ["Total Purchase Amount", "Customer Age", "Returns"]
+
+DEFAULT_ANALYSES = ("data_quality", "clv", "category_churn")
+
+
+@dataclass
+class QualityReport:
+    """Mergeable equivalent of ``assess_data_quality``.
+
+    ``describe`` holds count, mean, std, min and max; quantiles are left out
+    because they cannot be merged exactly from partitions.
+    """
+    rows: int
+    null_counts: pd.Series
+    duplicate_rows: int
+    describe: pd.DataFrame
+    genders: List[str]
+    categories: List[str]
+
+
+@dataclass
+class QualityPartial:
+    rows: int = 0
+    null_counts: Optional[pd.Series] = None
+    moments: Optional[pd.DataFrame] = None
+    genders: set = field(default_factory=set)
+    categories: set = field(default_factory=set)
+    row_hashes: RowHashSet = field(default_factory=RowHashSet)
+
+    def update(self, frame: pd.DataFrame) -> "QualityPartial":
+        self.rows += len(frame)
+        self.null_counts = _add(self.null_counts, frame.isnull().sum().astype("int64"))
+        self.row_hashes.add_frame(frame)
+        self.genders.update(frame["Gender"].dropna().unique())
+        self.categories.update(frame["Product Category"].dropna().unique())
+
+        values = frame[DESCRIBE_COLUMNS].astype("float64")
+        mean = values.mean()
+        moments = pd.DataFrame({
+            "count": values.count(),
+            "mean": mean.fillna(0.0),
+            "m2": ((values - mean) ** 2).sum(),
+            "min": values.min(),
+            "max": values.max(),
+        })
+        self.moments = _merge_moments(self.moments, moments)
+        return self
+
+    def merge(self, other: "QualityPartial") -> "QualityPartial":
+        self.rows += other.rows
+        self.null_counts = _add(self.null_counts, other.null_counts)
+        self.row_hashes.update(other.row_hashes)
+        self.genders |= other.genders
+        self.categories |= other.categories
+        self.moments = _merge_moments(self.moments, other.moments)
+        return self
+
+    def finalize(self) -> QualityReport:
+        m = self.moments
+        describe = pd.DataFrame({
+            "count": m["count"],
+            "mean": m["mean"].where(m["count"] > 0),
+            "std": np.sqrt(m["m2"] / (m["count"] - 1)).where(m["count"] > 1),
+            "min": m["min"],
+            "max": m["max"],
+        }).T[DESCRIBE_COLUMNS]
+        return QualityReport(
+            rows=self.rows,
+            null_counts=self.null_counts.astype("int64"),
+            duplicate_rows=self.rows - len(self.row_hashes),
+            describe=describe,
+            genders=sorted(self.genders),
+            categories=sorted(self.categories),
+        )
+
+
+def _merge_moments(left, right):
+    """Combine per-column (count, mean, M2) with Chan et al.'s parallel update.
+
+    M2 is the sum of squared deviations from the mean. Unlike a sum of
+    squares, it does not cancel catastrophically when the mean is large
+    relative to the spread.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    count = left["count"] + right["count"]
+    share = (right["count"] / count).fillna(0.0)  # 0 while both sides are empty
+    delta = right["mean"] - left["mean"]
+    merged = pd.DataFrame({
+        "count": count,
+        "mean": left["mean"] + delta * share,
+        "m2": left["m2"] + right["m2"] + delta ** 2 * left["count"] * share,
+    })
+    merged["min"] = np.fmin(left["min"], right["min"])
+    merged["max"] = np.fmax(left["max"], right["max"])
+    return merged
+
+
+@dataclass
+class SumsPartial:
+    """Group sums for the CLV and category-churn analyses"""
+    analysis: str
+    sums: Optional[pd.DataFrame] = None
+
+    def update(self, frame: pd.DataFrame) -> "SumsPartial":
+        partial = segment_sums(frame) if self.analysis == "clv" else category_sums(frame)
+        self.sums = _add(self.sums, partial)
+        return self
+
+    def merge(self, other: "SumsPartial") -> "SumsPartial":
+        self.sums = _add(self.sums, other.sums)
+        return self
+
+    def finalize(self) -> pd.DataFrame:
+        return clv_metrics(self.sums) if self.analysis == "clv" else category_comparison(self.sums)
+
+
+def _new_partial(analysis: str):
+    if analysis == "data_quality":
+        return QualityPartial()
+    return SumsPartial(analysis)
+
+
+@dataclass(frozen=True)
+class Job:
+    dataset: str
+    analysis: str
+    category: Optional[str]  # None for the rows with no Product Category
+    part: int
+    start: int
+    stop: int
+
+    @property
+    def sort_key(self):
+        return (self.dataset, self.analysis, self.category is None, self.category or "", self.part)
+
+    def __lt__(self, other: "Job") -> bool:
+        return self.sort_key < other.sort_key
+
+
+def _worker_init():
+    # One process per core already; keep Arrow from spawning its own pools
+    pa.set_cpu_count(1)
+    pa.set_io_thread_count(1)
+
+
+def _run_job(ipc_path: str, job: Job):
+    """Worker entry point: memory-map the dataset and build one partial"""
+    with pa.memory_map(ipc_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        # Rows are grouped by category, so this is a zero-copy slice
+        table = table.slice(job.start, job.stop - job.start).select(ANALYSIS_COLUMNS[job.analysis])
+        frame = table.to_pandas()
+    return job, _new_partial(job.analysis).update(frame)
+
+
+def _as_table(data) -> pa.Table:
+    if isinstance(data, pa.Table):
+        return data
+    if isinstance(data, pd.DataFrame):
+        return pa.Table.from_pandas(data, preserve_index=False)
+    # A CSV path: go through the columnar cache instead of re-parsing
+    from .cache import ParquetCache
+    return ParquetCache().read_table(data, columns=ALL_COLUMNS)
+
+
+def _group_by_category(table: pa.Table) -> Tuple[pa.Table, Dict[Optional[str], Tuple[int, int]]]:
+    """Sort rows by Product Category and return each category's row range, with rows lacking one under None"""
+    keys = pc.cast(table["Product Category"], pa.string())
+    order = pc.sort_indices(keys)  # nulls sort last
+    table = table.take(order)
+    keys = keys.take(order)
+
+    ranges = {}
+    counts = pc.value_counts(keys).to_pylist()
+    start = 0
+    for item in sorted((c for c in counts if c["values"] is not None), key=lambda c: c["values"]):
+        ranges[item["values"]] = (start, start + item["counts"])
+        start += item["counts"]
+    if start < len(table):
+        ranges[None] = (start, len(table))
+    return table, ranges
+
+
+def plan_jobs(ranges: Dict[str, Dict[Optional[str], Tuple[int, int]]], analyses: Iterable[str],
+              workers: int, splits: Optional[int] = None) -> List[Job]:
+    """Expand datasets x analyses x categories into row-sliced jobs.
+
+    Rows without a category only get data_quality jobs; the other analyses
+    group by category and would drop them anyway.
+    """
+    analyses = list(analyses)
+    if splits is None:
+        partitions = sum(len(r) for r in ranges.values()) * len(analyses)
+        # Enough slices to give every worker a couple of jobs
+        splits = max(1, -(-2 * workers // max(partitions, 1)))
+
+    jobs = []
+    for name, categories in ranges.items():
+        for category, (start, stop) in categories.items():
+            bounds = [start + (stop - start) * i // splits for i in range(splits + 1)]
+            for analysis in analyses:
+                if category is None and analysis != "data_quality":
+                    continue
+                for part in range(splits):
+                    jobs.append(Job(name, analysis, category, part, bounds[part], bounds[part + 1]))
+    return sorted(jobs)
+
+
+def run_analyses(datasets: Dict[str, object], analyses: Iterable[str] = DEFAULT_ANALYSES,
+                 max_workers: Optional[int] = None, splits: Optional[int] = None,
+                 mp_context=None) -> Dict[str, Dict[str, object]]:
+    """Run the notebook analyses for several datasets in parallel.
+
+    ``datasets`` maps a display name to a DataFrame, an Arrow table or a CSV
+    path. Returns ``{dataset: {analysis: result}}`` where results are a
+    :class:`QualityReport` for ``data_quality`` and DataFrames otherwise.
+
+    Rows with a missing Product Category form a partition of their own,
+    counted by ``data_quality`` and dropped by the other analyses, just as
+    the notebook's group-bys drop them.
+    """
+    analyses = list(analyses)
+    unknown = set(analyses) - set(DEFAULT_ANALYSES)
+    if unknown:
+        raise ValueError(f"Unknown analyses: {sorted(unknown)}")
+    workers = max_workers or os.cpu_count() or 1
+    if mp_context is None:
+        mp_context = multiprocessing.get_context("spawn")
+
+    scratch = tempfile.mkdtemp(prefix="analytics-ipc-")
+    try:
+        ipc_paths, ranges = {}, {}
+        for i, (name, data) in enumerate(datasets.items()):
+            table, ranges[name] = _group_by_category(_as_table(data))
+            ipc_paths[name] = os.path.join(scratch, f"dataset-{i}.arrow")
+            with pa.OSFile(ipc_paths[name], "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            del table
+        jobs = plan_jobs(ranges, analyses, workers, splits)
+
+        partials: Dict[Job, object] = {}
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                 initializer=_worker_init) as executor:
+            futures = [executor.submit(_run_job, ipc_paths[job.dataset], job) for job in jobs]
+            for future in futures:
+                job, partial = future.result()
+                partials[job] = partial
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    merged: Dict[Tuple[str, str], object] = {}
+    for job in sorted(partials):
+        key = (job.dataset, job.analysis)
+        if key in merged:
+            merged[key].merge(partials[job])
+        else:
+            merged[key] = partials[job]
+
+    return {
+        name: {analysis: merged[(name, analysis)].finalize() for analysis in analyses if (name, analysis) in merged}
+        for name in datasets
+    }
@@ -0,0 +1,39 @@
+"""
+Synthetic data shaped like the e-commerce customer datasets, for tests and
+benchmarks.
+"""
+import numpy as np
+import pandas as pd
+
+from .ingest import ALL_COLUMNS
+
+CATEGORIES = ["Electronics", "Home", "Clothing", "Books"]
+PAYMENT_METHODS = ["Credit Card", "PayPal", "Cash", "Crypto"]
+
+
+def make_dataset(rows=5000, customers=800, seed=0, duplicates=25):
+    """Build a synthetic frame with the columns of the e-commerce datasets"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365 * 86400, rows), unit="s")
+    price = rng.integers(10, 500, rows)
+    quantity = rng.integers(1, 6, rows)
+    returns = rng.integers(0, 2, rows).astype(float)
+    returns[rng.random(rows) < 0.2] = np.nan
+    age = rng.integers(18, 71, rows)
+    df = pd.DataFrame({
+        "Customer ID": rng.integers(1, customers + 1, rows),
+        "Purchase Date": dates.strftime("%Y-%m-%d %H:%M:%S"),
+        "Product Category": rng.choice(CATEGORIES, rows),
+        "Product Price": price,
+        "Quantity": quantity,
+        "Total Purchase Amount": rng.integers(100, 5350, rows),
+        "Payment Method": rng.choice(PAYMENT_METHODS, rows),
+        "Customer Age": age,
+        "Returns": returns,
+        "Customer Name": [f"Customer {i}" for i in rng.integers(0, customers, rows)],
+        "Age": age,
+        "Gender": rng.choice(["Male", "Female"], rows),
+        "Churn": rng.integers(0, 2, rows),
+    })
+    # A few exact duplicates, like a double-logged purchase
+    return pd.concat([df, df.iloc[:duplicates]], ignore_index=True)[ALL_COLUMNS]
@@ -0,0 +1,318 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from .. import churn_model
+from ..cache import ParquetCache
+from ..lags import LagFeatureEngine, segment_starts
+from ..parallel import QualityPartial, plan_jobs, run_analyses
+from ..synthetic import CATEGORIES, make_dataset
+from ..churn_model import (
+    ChurnModel, FeatureStore, build_features, score_csv, split_by_customer, train_churn_model,
+)
+from ..ingest import (
+    PartialAggregates, aggregate_csv, aggregate_frame,
+    iter_chunks, read_dataset,
+)
+
+@pytest.fixture
+def dataset_csv(tmp_path):
+    path = tmp_path / "ecommerce_customer_data_large.csv"
+    make_dataset().to_csv(path, index=False)
+    return path
+
+
+def notebook_clv_metrics(df):
+    """calculate_clv_metrics from the notebook, without display()"""
+    df = df.copy()
+    df['Returns'] = df['Returns'].fillna(0)
+    df['Net Profit'] = df['Total Purchase Amount'] - df['Returns']
+    segment_metrics = df.groupby(['Product Category', 'Gender'], observed=True).agg({
+        'Net Profit': ['sum', 'mean'],
+        'Churn': 'mean'
+    })
+    segment_metrics.columns = ['Total Net Profit', 'Average Net Profit', 'Churn Rate']
+    segment_metrics['CLV'] = segment_metrics.apply(
+        lambda x: x['Average Net Profit'] / x['Churn Rate'] if x['Churn Rate'] > 0 else np.nan,
+        axis=1
+    )
+    return segment_metrics
+
+
+class TestChunkedIngestion:
+    def test_chunks_use_fixed_dtypes(self, dataset_csv):
+        """Test chunks are bounded and typed explicitly"""
+        chunks = list(iter_chunks(dataset_csv, chunksize=1000))
+        assert all(len(chunk) <= 1000 for chunk in chunks)
+        assert chunks[0]["Churn"].dtype == np.int8
+        assert isinstance(chunks[0]["Gender"].dtype, pd.CategoricalDtype)
+        assert pd.api.types.is_datetime64_any_dtype(chunks[0]["Purchase Date"])
+
+    def test_usecols(self, dataset_csv):
+        """Test only the requested columns are parsed"""
+        chunk = next(iter_chunks(dataset_csv, chunksize=10, usecols=["Customer ID", "Churn"]))
+        assert list(chunk.columns) == ["Customer ID", "Churn"]
+        with pytest.raises(ValueError):
+            next(iter_chunks(dataset_csv, usecols=["Nope"]))
+
+    def test_chunked_matches_in_memory(self, dataset_csv):
+        """Test streaming aggregates are identical to the in-memory path"""
+        df = read_dataset(dataset_csv)
+        expected = aggregate_frame(df)
+        streamed = aggregate_csv(dataset_csv, chunksize=777)
+
+        assert streamed.rows == expected.rows == len(df)
+        assert streamed.duplicate_rows == expected.duplicate_rows == df.duplicated().sum()
+        assert streamed.churn_rate == df["Churn"].mean()
+        pd.testing.assert_series_equal(streamed.null_counts, df.isnull().sum(), check_names=False)
+        pd.testing.assert_frame_equal(streamed.clv_metrics, expected.clv_metrics)
+        pd.testing.assert_frame_equal(streamed.category_comparison, expected.category_comparison)
+        pd.testing.assert_series_equal(streamed.category_revenue, expected.category_revenue)
+
+    def test_matches_notebook_clv(self, dataset_csv):
+        """Test CLV metrics match the notebook's pandas implementation"""
+        df = read_dataset(dataset_csv)
+        expected = notebook_clv_metrics(df)
+        result = aggregate_csv(dataset_csv, chunksize=500).clv_metrics
+        np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+        assert list(result.index) == list(expected.index)
+
+    def test_merge_is_order_independent(self, dataset_csv):
+        """Test partial states merge to the same result in any order"""
+        chunks = list(iter_chunks(dataset_csv, chunksize=1200))
+        forward = PartialAggregates()
+        for chunk in chunks:
+            forward.merge(PartialAggregates().update(chunk))
+        backward = PartialAggregates()
+        for chunk in reversed(chunks):
+            backward.merge(PartialAggregates().update(chunk))
+
+        left, right = forward.finalize(), backward.finalize()
+        assert left.duplicate_rows == right.duplicate_rows == 25
+        pd.testing.assert_frame_equal(left.clv_metrics, right.clv_metrics)
+
+
+class TestParquetCache:
+    def test_round_trip_preserves_rows_and_dtypes(self, dataset_csv, tmp_path):
+        """Test the cache returns the same data with fixed dtypes"""
+        cache = ParquetCache(tmp_path / "cache", chunksize=1000)
+        df = read_dataset(dataset_csv)
+        cached = cache.read(dataset_csv, columns=list(df.columns))
+
+        assert len(cached) == len(df)
+        assert cached["Churn"].dtype == np.int8
+        assert isinstance(cached["Product Category"].dtype, pd.CategoricalDtype)
+        key = ["Customer ID", "Purchase Date", "Total Purchase Amount", "Customer Name"]
+        left = df.sort_values(key).reset_index(drop=True)
+        right = cached.sort_values(key).reset_index(drop=True)
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_categorical=False)
+
+    def test_reads_only_requested_columns_and_months(self, dataset_csv, tmp_path):
+        """Test column and partition pruning"""
+        cache = ParquetCache(tmp_path / "cache")
+        months = cache.months(dataset_csv)[:2]
+        result = cache.read_for(dataset_csv, "lagged_returns", months=months)
+
+        df = read_dataset(dataset_csv)
+        in_months = df["Purchase Date"].dt.strftime("%Y-%m").isin(months)
+        assert list(result.columns) == ["Customer ID", "Purchase Date", "Returns", "Churn"]
+        assert len(result) == in_months.sum()
+
+    def test_invalidation_by_mtime_and_hash(self, dataset_csv, tmp_path):
+        """Test a touched file is re-hashed and a modified file is rebuilt"""
+        cache = ParquetCache(tmp_path / "cache")
+        cache.ensure(dataset_csv)
+        assert cache.is_fresh(dataset_csv)
+
+        stat = os.stat(dataset_csv)
+        os.utime(dataset_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert cache.is_fresh(dataset_csv)
+
+        df = read_dataset(dataset_csv)
+        df.loc[0, "Total Purchase Amount"] = 1
+        df.to_csv(dataset_csv, index=False, date_format="%Y-%m-%d %H:%M:%S")
+        os.utime(dataset_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+        # Same size is possible, so this must go through the hash
+        assert not cache.is_fresh(dataset_csv)
+        assert cache.read(dataset_csv, columns=["Total Purchase Amount"])["Total Purchase Amount"].min() == 1
+
+
+class TestParallelRunner:
+    def test_results_match_sequential_analyses(self, dataset_csv):
+        """Test the process pool reproduces the sequential notebook results"""
+        df = read_dataset(dataset_csv)
+        ratios = df.sample(frac=0.5, random_state=1)
+        results = run_analyses({"Large Dataset": df, "Custom Ratios Dataset": ratios},
+                               max_workers=2, splits=3)
+
+        for name, frame in [("Large Dataset", df), ("Custom Ratios Dataset", ratios)]:
+            expected = aggregate_frame(frame)
+            pd.testing.assert_frame_equal(results[name]["clv"], expected.clv_metrics)
+            pd.testing.assert_frame_equal(results[name]["category_churn"], expected.category_comparison)
+
+            quality = results[name]["data_quality"]
+            assert quality.duplicate_rows == frame.duplicated().sum()
+            pd.testing.assert_series_equal(quality.null_counts, frame.isnull().sum(), check_names=False)
+            described = frame[["Total Purchase Amount", "Customer Age", "Returns"]].astype("float64").describe()
+            pd.testing.assert_frame_equal(quality.describe, described.loc[quality.describe.index], rtol=1e-9)
+            assert quality.categories == sorted(CATEGORIES)
+
+    def test_rows_without_category_are_counted(self, dataset_csv):
+        """Test data_quality sees rows with no Product Category, which the group-bys drop"""
+        df = read_dataset(dataset_csv)
+        df.loc[df.index[:40], "Product Category"] = None
+        df = pd.concat([df, df.iloc[:5]], ignore_index=True)  # duplicates among them
+        results = run_analyses({"Nulls": df}, max_workers=2, splits=2)["Nulls"]
+        quality = results["data_quality"]
+        assert quality.rows == len(df)
+        assert quality.duplicate_rows == df.duplicated().sum()
+        pd.testing.assert_series_equal(quality.null_counts, df.isnull().sum(), check_names=False)
+        pd.testing.assert_frame_equal(results["clv"], aggregate_frame(df).clv_metrics)
+
+    def test_moments_merge_without_cancellation(self, dataset_csv):
+        """Test merged partials keep the std exact when values sit far from zero"""
+        df = read_dataset(dataset_csv)
+        df["Total Purchase Amount"] = df["Total Purchase Amount"].astype("float64") / 1000 + 1e9
+        bounds = np.linspace(0, len(df), 8).astype(int)
+        partials = [QualityPartial().update(df.iloc[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+        quality = partials[0]
+        for partial in partials[1:]:
+            quality.merge(partial)
+        described = df[["Total Purchase Amount", "Customer Age", "Returns"]].astype("float64").describe()
+        pd.testing.assert_frame_equal(quality.finalize().describe, described.loc[["count", "mean", "std", "min", "max"]], rtol=1e-9)
+
+    def test_job_plan_is_deterministic(self):
+        """Test jobs are sliced contiguously and sorted"""
+        ranges = {"a": {"Books": (0, 10), "Home": (10, 25), None: (25, 30)}}
+        assert all(job.category is not None for job in plan_jobs(ranges, ["clv"], workers=4))
+        ranges["a"].pop(None)
+        jobs = plan_jobs(ranges, ["clv"], workers=4)
+        assert jobs == sorted(jobs)
+        home = [job for job in jobs if job.category == "Home"]
+        assert home[0].start == 10 and home[-1].stop == 25
+        assert sum(job.stop - job.start for job in jobs) == 25
+
+
+class TestLagFeatures:
+    def notebook_frame(self, dataset_csv):
+        df = read_dataset(dataset_csv, usecols=["Customer ID", "Purchase Date", "Returns", "Churn"])
+        # Unique timestamps per customer so the reference sort is unambiguous
+        return df.drop_duplicates(["Customer ID", "Purchase Date"]).sample(frac=1, random_state=3)
+
+    def test_segment_starts(self):
+        """Test segment boundaries come from key changes"""
+        starts = segment_starts(np.array([1, 1, 2, 2, 2, 5]))
+        assert starts.tolist() == [0, 0, 2, 2, 2, 5]
+
+    def test_matches_groupby_shift_and_rolling(self, dataset_csv):
+        """Test lags and windows equal the pandas groupby implementation"""
+        df = self.notebook_frame(dataset_csv)
+        features = LagFeatureEngine(lags=(1, 2), windows=(3,)).transform(df)
+
+        expected = df.sort_values(["Customer ID", "Purchase Date"])
+        groups = expected.groupby("Customer ID")["Returns"]
+        expected = expected.assign(
+            Previous_Return=groups.shift(1),
+            lag2=groups.shift(2),
+            roll3=groups.transform(lambda s: s.shift(1).rolling(3, min_periods=1).mean()),
+        ).loc[df.index]
+
+        np.testing.assert_array_equal(features["Returns_lag1"], expected["Previous_Return"])
+        np.testing.assert_array_equal(features["Returns_lag2"], expected["lag2"])
+        np.testing.assert_allclose(features["Returns_roll3_mean"], expected["roll3"])
+
+    def test_incremental_matches_batch(self, dataset_csv):
+        """Test appending batches in time order equals one batch transform"""
+        df = self.notebook_frame(dataset_csv).sort_values("Purchase Date")
+        engine = LagFeatureEngine(lags=(1, 2), windows=(2, 4))
+        expected = engine.transform(df)
+
+        bounds = np.linspace(0, len(df), 8).astype(int)
+        incremental = pd.concat([engine.update(df.iloc[a:b]) for a, b in zip(bounds[:-1], bounds[1:])])
+        pd.testing.assert_frame_equal(incremental.loc[df.index], expected)
+
+    def test_batch_shorter_than_largest_lag(self):
+        """Test lags longer than the batch come out missing instead of raising"""
+        df = pd.DataFrame({
+            "Customer ID": [7, 7, 7],
+            "Purchase Date": pd.to_datetime(["2023-01-01", "2023-01-02", "2023-01-03"]),
+            "Returns": [1.0, 0.0, 1.0],
+        })
+        engine = LagFeatureEngine(lags=(1, 4))
+        features = engine.transform(df)
+        assert features["Returns_lag1"].tolist()[1:] == [1.0, 0.0]
+        assert features["Returns_lag4"].isna().all()
+        assert engine.update(df)["Returns_lag4"].isna().all()
+
+    def test_incremental_rejects_backfill(self, dataset_csv):
+        """Test purchases older than a customer's history are rejected"""
+        df = self.notebook_frame(dataset_csv).sort_values("Purchase Date")
+        engine = LagFeatureEngine()
+        engine.update(df.iloc[len(df) // 2:])
+        with pytest.raises(ValueError):
+            engine.update(df.iloc[:len(df) // 2])
+
+
+class TestChurnModel:
+    def test_features_are_cached_float32_sparse(self, dataset_csv, tmp_path):
+        """Test the feature matrix is float32 CSR and reused on the next run"""
+        store = FeatureStore(tmp_path / "features")
+        X, y, groups, spec, cached = store.get(dataset_csv, chunksize=1000)
+        assert not cached
+        assert X.format == "csr" and X.dtype == np.float32
+        assert X.shape == (len(y), len(spec.feature_names)) and len(groups) == len(y)
+        # One-hot blocks: exactly one category per categorical column
+        assert (X[:, 5:].sum(axis=1) == 3).all()
+
+        X_again, _, groups_again, _, cached = store.get(dataset_csv)
+        assert cached
+        assert (X_again != X).nnz == 0
+        np.testing.assert_array_equal(groups_again, groups)
+
+    def test_cache_key_hashes_only_changed_files(self, dataset_csv, tmp_path, monkeypatch):
+        """Test a cache hit on an untouched file does not read it, and a touched one is rehashed"""
+        store = FeatureStore(tmp_path / "features")
+        key = store.key(dataset_csv)
+        hashed = []
+        monkeypatch.setattr(churn_model, "file_sha256", lambda path: hashed.append(path) or "0" * 64)
+        assert store.key(dataset_csv) == key and not hashed
+        stat = os.stat(dataset_csv)
+        os.utime(dataset_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert store.key(dataset_csv) != key and len(hashed) == 1
+
+    def test_split_keeps_customers_whole(self, dataset_csv, tmp_path):
+        """Test no customer has purchases on both sides of the train/test split"""
+        _, _, groups, _, _ = FeatureStore(tmp_path / "features").get(dataset_csv)
+        train, test = split_by_customer(groups, test_size=0.2)
+        assert len(train) + len(test) == len(groups)
+        assert not set(groups[train]) & set(groups[test])
+        assert 0.1 < len(np.unique(groups[test])) / len(np.unique(groups)) < 0.3
+
+    def test_train_records_stages_and_metrics(self, dataset_csv, tmp_path):
+        """Test training reports evaluation metrics and per-stage timings"""
+        result = train_churn_model(dataset_csv, tmp_path / "features", chunksize=1000)
+        assert {"recall", "f1", "precision", "accuracy"} <= set(result.metrics)
+        assert {"features", "split", "train", "evaluate"} <= set(result.stages)
+        assert result.stages["features"]["wall_seconds"] >= 0
+        features = result.stages["features"]
+        assert (features.get("peak_rss_mb") or features.get("process_peak_rss_mb")) > 0
+
+    def test_streaming_scores_match_in_memory(self, dataset_csv, tmp_path):
+        """Test chunked scoring equals scoring the whole table at once"""
+        model = train_churn_model(dataset_csv, tmp_path / "features").model
+        model.save(tmp_path / "churn.joblib")
+        model = ChurnModel.load(tmp_path / "churn.joblib")
+
+        output = tmp_path / "scores.csv"
+        assert score_csv(dataset_csv, model, output, chunksize=333) == 5025
+        scores = pd.read_csv(output)
+        df = read_dataset(dataset_csv)
+        expected = model.classifier.predict_proba(build_features(df, model.spec))[:, 1]
+        np.testing.assert_allclose(scores["churn_probability"], expected, rtol=1e-6)
+        assert (scores["Customer ID"] == df["Customer ID"]).all()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
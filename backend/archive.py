@@ -0,0 +1,152 @@
+import argparse
+import json
+import zlib
+from collections import Counter
+from datetime import datetime
+from itertools import groupby
+from typing import Iterator, List, Optional
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session, selectinload
+
+from . import models, schemas
+
+# Only sessions that can no longer change are archived
+FINISHED_STATUSES = ("completed", "interrupted", "overdue", "abandoned")
+
+def month_of(moment: datetime) -> str:
+    return moment.strftime("%Y-%m")
+
+def months_before(now: datetime, months: int) -> datetime:
+    """Start of the month `months` calendar months before now's month"""
+    index = now.year * 12 + now.month - 1 - months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def pack(sessions: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(sessions, separators=(",", ":")).encode())
+
+def unpack(payload: bytes) -> List[dict]:
+    return json.loads(zlib.decompress(payload))
+
+def archive_sessions(db: Session, before: datetime, batch_size: int = 500) -> Counter:
+    """Move finished sessions created before a cutoff into their monthly archives.
+
+    Each batch adds a chunk per owner and month, with its totals, records
+    the archived ids and deletes the hot rows, all in one transaction.
+    Earlier chunks are never rewritten. Returns the number of sessions
+    archived per month.
+    """
+    archived = Counter()
+    while True:
+        sessions = (
+            db.query(models.Session)
+            .options(selectinload(models.Session.interruptions))
+            .filter(models.Session.status.in_(FINISHED_STATUSES), models.Session.created_at < before)
+            .limit(batch_size)
+            .all()
+        )
+        groups = {}
+        for session in sessions:
+            groups.setdefault((session.owner_id, month_of(session.created_at)), []).append(session)
+        for (owner_id, month), group in groups.items():
+            seq = (
+                db.query(func.coalesce(func.max(models.SessionArchive.seq) + 1, 0))
+                .filter(models.SessionArchive.owner_id == owner_id, models.SessionArchive.month == month)
+                .scalar()
+            )
+            statuses = Counter(session.status for session in group)
+            db.add(models.SessionArchive(
+                owner_id=owner_id, month=month, seq=seq, session_count=len(group),
+                completed_sessions=statuses["completed"], interrupted_sessions=statuses["interrupted"],
+                overdue_sessions=statuses["overdue"], abandoned_sessions=statuses["abandoned"],
+                total_interruptions=sum(session.interruption_count or 0 for session in group),
+                productive_minutes=sum(session.actual_duration_minutes or 0.0 for session in group if session.status == "completed"),
+                payload=pack([schemas.Session.model_validate(session).model_dump(mode="json") for session in group]),
+            ))
+            db.execute(insert(models.ArchivedSession), [
+                {"id": session.id, "owner_id": owner_id, "month": month, "seq": seq} for session in group
+            ])
+            archived[month] += len(group)
+
+        ids = [session.id for session in sessions]
+        db.query(models.Interruption).filter(models.Interruption.session_id.in_(ids)).delete(synchronize_session=False)
+        db.query(models.Session).filter(models.Session.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        if len(sessions) < batch_size:
+            return archived
+
+def archived_totals(db: Session, owner_id: Optional[int] = None) -> dict:
+    """Sums of the archive totals, keyed like crud.get_history_stats"""
+    archive = models.SessionArchive
+    query = db.query(
+        func.coalesce(func.sum(archive.session_count), 0),
+        func.coalesce(func.sum(archive.completed_sessions), 0),
+        func.coalesce(func.sum(archive.interrupted_sessions), 0),
+        func.coalesce(func.sum(archive.overdue_sessions), 0),
+        func.coalesce(func.sum(archive.abandoned_sessions), 0),
+        func.coalesce(func.sum(archive.productive_minutes), 0.0),
+        func.coalesce(func.sum(archive.total_interruptions), 0),
+    )
+    if owner_id is not None:
+        query = query.filter(archive.owner_id == owner_id)
+    keys = ("total_sessions", "completed_sessions", "interrupted_sessions", "overdue_sessions",
+            "abandoned_sessions", "total_productive_time", "total_interruptions")
+    return dict(zip(keys, query.one()))
+
+def iter_archived(db: Session, owner_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> Iterator[schemas.Session]:
+    """Archived sessions in [created_from, created_to), oldest first within each owner's month.
+
+    Only the chunks of months the range overlaps are read and unpacked.
+    """
+    query = db.query(models.SessionArchive)
+    if owner_id is not None:
+        query = query.filter(models.SessionArchive.owner_id == owner_id)
+    if created_from is not None:
+        query = query.filter(models.SessionArchive.month >= month_of(created_from))
+    if created_to is not None:
+        query = query.filter(models.SessionArchive.month <= month_of(created_to))
+    chunks = query.order_by(models.SessionArchive.month, models.SessionArchive.owner_id, models.SessionArchive.seq).all()
+    for _, group in groupby(chunks, key=lambda chunk: (chunk.month, chunk.owner_id)):
+        sessions = [schemas.Session.model_validate(row) for chunk in group for row in unpack(chunk.payload)]
+        for session in sorted(sessions, key=lambda s: (s.created_at, s.id)):
+            if created_from is not None and session.created_at < created_from:
+                continue
+            if created_to is not None and session.created_at >= created_to:
+                continue
+            yield session
+
+def is_archived(db: Session, session_id: int) -> bool:
+    return db.get(models.ArchivedSession, session_id) is not None
+
+def main(argv: Optional[list] = None):
+    from .database import SessionLocal
+    from .sharding import ShardConfig, ShardRouter
+
+    parser = argparse.ArgumentParser(description="Archive finished sessions into compressed monthly archives")
+    parser.add_argument("--months", type=int, default=3,
+                        help="Keep sessions created in the current and this many previous months hot")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    before = months_before(datetime.now(), args.months)
+    config = ShardConfig.from_env()
+    shards = ShardRouter.from_config(config) if config.enabled else None
+    factories = shards.session_factories if shards else [SessionLocal]
+    archived = Counter()
+    try:
+        for factory in factories:
+            db = factory()
+            try:
+                archived.update(archive_sessions(db, before, args.batch_size))
+            finally:
+                db.close()
+    finally:
+        if shards:
+            shards.dispose()
+    for month in sorted(archived):
+        print(f"{month}: archived {archived[month]} sessions")
+    print(f"Archived {sum(archived.values())} sessions created before {before:%Y-%m-%d}")
+
+if __name__ == "__main__":
+    main()
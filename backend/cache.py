@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy.engine import Engine
+
+@dataclass
+class CacheConfig:
+    """In-process result cache settings"""
+    enabled: bool = True
+    max_entries: int = 4096
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from CACHE_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("CACHE_ENABLED", "1").lower() not in ("0", "false", "no"),
+            max_entries=int(os.getenv("CACHE_MAX_ENTRIES", defaults.max_entries)),
+        )
+
+@dataclass
+class CacheMetrics:
+    """Counters exposed on /metrics"""
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    uncacheable: int = 0
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "uncacheable": self.uncacheable,
+        }
+
+class DataVersionCache:
+    """LRU of computed results, invalidated by commits from any process.
+
+    Every cached value is tagged with the PRAGMA data_version of the database
+    files it was read from, taken on a private watch connection per file.
+    SQLite bumps that number whenever another connection, in this process or
+    any other worker, commits to the file, so a stale entry is detected with
+    one cheap PRAGMA and no broker. Databases that cannot be watched (not
+    SQLite, or in memory) are never cached.
+    """
+
+    def __init__(self, config: Optional[CacheConfig] = None):
+        self.config = config or CacheConfig()
+        self.metrics = CacheMetrics()
+        self._watchers: Dict[str, sqlite3.Connection] = {}
+        self._entries: "OrderedDict[Hashable, Tuple[tuple, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _watch(self, engine: Engine) -> Optional[sqlite3.Connection]:
+        path = engine.url.database
+        if engine.dialect.name != "sqlite" or not path or path == ":memory:":
+            return None
+        watcher = self._watchers.get(path)
+        if watcher is None:
+            # Autocommit, so the PRAGMA never holds a read transaction open;
+            # read-only engines name their file with a file: URI
+            uri = engine.url.query.get("uri") == "true"
+            watcher = sqlite3.connect(path, isolation_level=None, check_same_thread=False, uri=uri)
+            self._watchers[path] = watcher
+        return watcher
+
+    def generation(self, *engines: Engine) -> Optional[tuple]:
+        """Current data_version of each engine's file, or None if one cannot be watched"""
+        versions = []
+        with self._lock:
+            for engine in engines:
+                watcher = self._watch(engine)
+                if watcher is None:
+                    return None
+                versions.append((engine.url.database, watcher.execute("PRAGMA data_version").fetchone()[0]))
+        return tuple(versions)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object], *engines: Engine):
+        """Cached result of compute() for key, recomputed after any commit to the engines' files"""
+        generation = self.generation(*engines) if self.config.enabled else None
+        if generation is None:
+            self.metrics.uncacheable += 1
+            return compute()
+        # Files are part of the key, so the same query on another shard is a separate entry
+        key = (tuple(path for path, _ in generation), key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == generation:
+                    self._entries.move_to_end(key)
+                    self.metrics.hits += 1
+                    return entry[1]
+                self.metrics.invalidations += 1
+            self.metrics.misses += 1
+
+        # Tagged with the generation seen before computing, so a commit that
+        # lands meanwhile makes the entry stale rather than wrongly fresh
+        value = compute()
+        with self._lock:
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            for watcher in self._watchers.values():
+                watcher.close()
+            self._watchers.clear()
+
+def get_cache(request: Request) -> Optional[DataVersionCache]:
+    """Dependency returning the process-local result cache, or None when disabled"""
+    return getattr(request.app.state, "cache", None)
+
+def cached(cache: Optional[DataVersionCache], key: Hashable, compute: Callable[[], object], *engines: Engine):
+    """compute() through the cache when one is configured"""
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(key, compute, *engines)
@@ -1,126 +1,427 @@
-from sqlalchemy.orm import Session, joinedload
-from . import models, schemas
-from datetime import datetime
-from typing import List, Optional
+import sys
+from contextlib import contextmanager
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session, load_only, selectinload
+from . import archive, models, postgres, projector, schemas
+from .sketches import DDSketch, bucket_of, merged
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
-def create_session(db: Session, session: schemas.SessionCreate):
+def commit(db: Session):
+    """Commit, or only flush when a group-commit writer owns the transaction"""
+    if db.info.get("group_commit"):
+        db.flush()
+    else:
+        db.commit()
+
+@contextmanager
+def single_commit(db: Session):
+    """Run several crud writes as one transaction, committed once at the end of the block.
+    
+    Inside the block commit() only flushes. When a group-commit writer (or an
+    enclosing block) owns the transaction, the block leaves committing to it.
+    """
+    owner = db.info.get("group_commit", False)
+    db.info["group_commit"] = True
+    try:
+        yield
+    finally:
+        db.info["group_commit"] = owner
+    if not owner:
+        db.commit()
+
+def begin_write(db: Session):
+    """Open the transaction holding SQLite's write lock, for writes that read inside savepoints.
+    
+    pysqlite starts a transaction at the first SAVEPOINT, so the reads that
+    follow hold a shared lock. Two such transactions that both go on to write
+    deadlock, and SQLite fails one at once. Taking the write lock first makes
+    the second wait on the busy timeout instead. No-op on other databases or
+    inside a transaction already open (a group commit).
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    connection = db.connection().connection.driver_connection
+    if not connection.in_transaction:
+        connection.execute("BEGIN IMMEDIATE")
+
+def record_event(db: Session, session: models.Session, event_type: str, occurred_at: datetime, reason: Optional[str] = None, **payload):
+    """Append a transition to the session event log"""
+    event = models.SessionEvent(
+        session_id=session.id,
+        owner_id=session.owner_id,
+        event_type=event_type,
+        occurred_at=occurred_at,
+        reason=reason,
+        payload=payload or None
+    )
+    db.add(event)
+    db.flush()
+    session.last_event_id = event.id
+    return event
+
+def create_session(db: Session, session: schemas.SessionCreate, owner_id: int = 0):
     """Create a new session"""
     db_session = models.Session(
+        owner_id=owner_id,
         title=session.title,
         goal=session.goal,
         scheduled_duration=session.scheduled_duration
     )
     db.add(db_session)
-    db.commit()
+    db.flush()
+    db.refresh(db_session)  # created_at comes from the database
+    record_event(db, db_session, "created", db_session.created_at,
+                 title=session.title, goal=session.goal, scheduled_duration=session.scheduled_duration)
+    commit(db)
     db.refresh(db_session)
     return db_session
 
-def get_session(db: Session, session_id: int):
+def query_sessions(db: Session, fields: Optional[Tuple[str, ...]] = None, include_interruptions: bool = False, owner_id: Optional[int] = None):
+    """Session query loading only the requested columns.
+    
+    Interruptions are fetched with a separate IN query only when requested,
+    so list views never join or lazy-load them. With an owner_id, both
+    queries are scoped to that owner and served by the owner-leading indexes;
+    None is only for internal jobs that work across owners.
+    """
+    query = db.query(models.Session)
+    if owner_id is not None:
+        query = query.filter(models.Session.owner_id == owner_id)
+    if fields is not None:
+        query = query.options(load_only(*[getattr(models.Session, name) for name in fields]))
+    if include_interruptions:
+        interruptions = models.Session.interruptions
+        if owner_id is not None:
+            interruptions = interruptions.and_(models.Interruption.owner_id == owner_id)
+        query = query.options(selectinload(interruptions))
+    return query
+
+def get_session(db: Session, session_id: int, fields: Optional[Tuple[str, ...]] = None, include_interruptions: bool = False, owner_id: Optional[int] = None):
     """Get a session by ID"""
-    return db.query(models.Session).filter(models.Session.id == session_id).first()
+    return query_sessions(db, fields, include_interruptions, owner_id).filter(models.Session.id == session_id).first()
 
-def get_sessions(db: Session, skip: int = 0, limit: int = 100):
+def get_sessions(db: Session, skip: int = 0, limit: int = 100, fields: Optional[Tuple[str, ...]] = None, include_interruptions: bool = False, owner_id: Optional[int] = None):
     """Get all sessions with pagination"""
-    return db.query(models.Session).offset(skip).limit(limit).all()
+    return query_sessions(db, fields, include_interruptions, owner_id).order_by(models.Session.id).offset(skip).limit(limit).all()
+
+SESSION_STATUSES = ("planned", "active", "paused", "completed", "interrupted", "overdue", "abandoned")
 
-def update_session_status(db: Session, session_id: int, status: str, **kwargs):
+# Sort keys accepted by list_sessions; each one is backed by an index
+SORT_COLUMNS = {
+    "created_at": models.Session.created_at,
+    "title": models.Session.title,
+    "duration": models.Session.actual_duration_minutes,
+}
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater, in code point order, than every string starting with prefix; None when there is none"""
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return None
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000  # surrogates cannot appear in a stored title
+    return stem[:-1] + chr(following)
+
+def list_sessions(
+    db: Session,
+    statuses: Optional[List[str]] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    min_duration: Optional[float] = None,
+    title_prefix: Optional[str] = None,
+    sort: str = "-created_at",
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = None,
+    include_interruptions: bool = False,
+    owner_id: Optional[int] = None,
+):
+    """List sessions with filters that compile to index-friendly predicates"""
+    query = query_sessions(db, fields, include_interruptions, owner_id)
+    if statuses:
+        query = query.filter(models.Session.status.in_(statuses))
+    query = filter_created(query, created_from, created_to)
+    if min_duration is not None:
+        query = query.filter(models.Session.actual_duration_minutes >= min_duration)
+    if title_prefix:
+        # A range instead of LIKE, so the title index can be used. It only holds
+        # in code point order: SQLite's BINARY collation, and "C" on PostgreSQL,
+        # whose locale collations sort "ABC" between "Ab" and "Ac"
+        title = models.Session.title
+        if db.get_bind().dialect.name == "postgresql":
+            title = title.collate("C")
+        query = query.filter(title >= title_prefix)
+        upper = prefix_upper_bound(title_prefix)
+        if upper is not None:
+            query = query.filter(title < upper)
+    
+    # id breaks ties, which every index already carries as the rowid
+    order = [SORT_COLUMNS[sort.lstrip("-")], models.Session.id]
+    if sort.startswith("-"):
+        order = [column.desc() for column in order]
+    return query.order_by(*order).offset(skip).limit(limit).all()
+
+def update_session_status(db: Session, session_id: int, status: str, owner_id: Optional[int] = None, **kwargs):
     """Update session status and other fields"""
-    session = get_session(db, session_id)
+    session = get_session(db, session_id, owner_id=owner_id)
     if session:
         session.status = status
         for key, value in kwargs.items():
             setattr(session, key, value)
-        db.commit()
+        commit(db)
         db.refresh(session)
     return session
 
-def start_session(db: Session, session_id: int):
+def start_session(db: Session, session_id: int, owner_id: Optional[int] = None):
     """Start a session"""
-    return update_session_status(db, session_id, "active", start_time=datetime.now())
+    session = get_session(db, session_id, owner_id=owner_id)
+    if session:
+        session.status = "active"
+        session.start_time = datetime.now()
+        record_event(db, session, "started", session.start_time)
+        commit(db)
+        db.refresh(session)
+    return session
 
-def pause_session(db: Session, session_id: int, reason: str):
+def pause_session(db: Session, session_id: int, reason: str, owner_id: Optional[int] = None):
     """Pause a session and create interruption record"""
-    session = get_session(db, session_id)
+    session = get_session(db, session_id, owner_id=owner_id)
     if session and session.status == "active":
         # Create interruption record
         interruption = models.Interruption(
             session_id=session_id,
+            owner_id=session.owner_id,
             reason=reason
         )
         db.add(interruption)
+        db.flush()
+        
+        # Keep the denormalized counters in step, in the same transaction
+        session.interruption_count = models.Session.interruption_count + 1
+        session.last_pause_time = interruption.pause_time
         
         # Update session status
         session.status = "paused"
-        db.commit()
+        record_event(db, session, "paused", interruption.pause_time, reason=reason, interruption_id=interruption.id)
+        commit(db)
         db.refresh(session)
         return session
     return None
 
-def resume_session(db: Session, session_id: int):
+def resume_session(db: Session, session_id: int, owner_id: Optional[int] = None):
     """Resume a paused session"""
-    session = get_session(db, session_id)
+    session = get_session(db, session_id, owner_id=owner_id)
     if session and session.status == "paused":
         session.status = "active"
-        db.commit()
+        record_event(db, session, "resumed", datetime.now())
+        commit(db)
         db.refresh(session)
         return session
     return None
 
-def complete_session(db: Session, session_id: int):
+def finish_session(session: models.Session, end_time: datetime):
+    """Set end time, duration and final status of an active or paused session"""
+    session.end_time = end_time
+    
+    # Calculate actual duration
+    if session.start_time:
+        actual_duration = (session.end_time - session.start_time).total_seconds() / 60
+        session.actual_duration_minutes = actual_duration
+        
+        # Determine final status based on business rules
+        if session.interruption_count > 3:
+            session.status = "interrupted"
+        elif actual_duration > session.scheduled_duration * 1.1:
+            session.status = "overdue"
+        elif session.status == "paused" and not (session.last_pause_time and session.last_pause_time > session.start_time):
+            session.status = "abandoned"
+        else:
+            session.status = "completed"
+    return session
+
+def record_completion(db: Session, session: models.Session, end_time: datetime, status: Optional[str] = None, **payload):
+    """Finish a session, log the outcome and fold it into the daily rollups.
+
+    The rollups' checkpoint is locked before the event takes its id, so
+    completions reach the rollups in id order, in the same transaction.
+    Status overrides the business rules.
+    """
+    checkpoint = projector.lock_checkpoint(db, projector.ROLLUPS)
+    finish_session(session, end_time)
+    if status is not None:
+        session.status = status
+    record_event(db, session, "completed", end_time, status=session.status,
+                 duration_minutes=session.actual_duration_minutes,
+                 scheduled_duration=session.scheduled_duration,
+                 interruption_count=session.interruption_count, **payload)
+    projector.apply_pending(db, checkpoint)
+    return session
+
+def complete_session(db: Session, session_id: int, owner_id: Optional[int] = None):
     """Complete a session and determine final status"""
-    session = get_session(db, session_id)
+    session = get_session(db, session_id, owner_id=owner_id)
     if session and session.status in ["active", "paused"]:
-        session.end_time = datetime.now()
-        
-        # Calculate actual duration
-        if session.start_time:
-            actual_duration = (session.end_time - session.start_time).total_seconds() / 60
-            
-            # Count interruptions
-            interruption_count = len(session.interruptions)
-            
-            # Determine final status based on business rules
-            if interruption_count > 3:
-                session.status = "interrupted"
-            elif actual_duration > session.scheduled_duration * 1.1:
-                session.status = "overdue"
-            elif session.status == "paused" and not any(i.pause_time > session.start_time for i in session.interruptions):
-                session.status = "abandoned"
-            else:
-                session.status = "completed"
-        
-        db.commit()
+        record_completion(db, session, datetime.now())
+        commit(db)
         db.refresh(session)
         return session
     return None
 
-def get_session_history(db: Session):
-    """Get session history with statistics"""
-    sessions = db.query(models.Session).options(joinedload(models.Session.interruptions)).order_by(models.Session.created_at.desc()).all()
-    
-    total_sessions = len(sessions)
-    completed_sessions = len([s for s in sessions if s.status == "completed"])
-    interrupted_sessions = len([s for s in sessions if s.status == "interrupted"])
-    overdue_sessions = len([s for s in sessions if s.status == "overdue"])
-    abandoned_sessions = len([s for s in sessions if s.status == "abandoned"])
-    
-    # Calculate total productive time (only completed sessions)
-    total_productive_time = 0
-    total_interruptions = 0
-    
-    for session in sessions:
-        if session.status == "completed" and session.start_time and session.end_time:
-            actual_duration = (session.end_time - session.start_time).total_seconds() / 60
-            total_productive_time += actual_duration
-        total_interruptions += len(session.interruptions)
-    
-    return schemas.SessionHistory(
-        sessions=sessions,
-        total_sessions=total_sessions,
-        completed_sessions=completed_sessions,
-        interrupted_sessions=interrupted_sessions,
-        overdue_sessions=overdue_sessions,
-        abandoned_sessions=abandoned_sessions,
-        total_productive_time=total_productive_time,
-        total_interruptions=total_interruptions
+def status_stats(db: Session, owner_id: Optional[int] = None) -> dict:
+    """History statistics of the hot sessions in one scan, with a FILTER aggregate per status"""
+    status = models.Session.status
+    query = db.query(
+        func.count(models.Session.id),
+        *[func.count(models.Session.id).filter(status == name) for name in ("completed", "interrupted", "overdue", "abandoned")],
+        # Only completed sessions count as productive time
+        func.coalesce(func.sum(models.Session.actual_duration_minutes).filter(status == "completed"), 0.0),
+        func.coalesce(func.sum(models.Session.interruption_count), 0),
+    )
+    if owner_id is not None:
+        query = query.filter(models.Session.owner_id == owner_id)
+    row = query.one()
+    return {
+        name: float(value) if name == "total_productive_time" else int(value)
+        for name, value in zip(postgres.STATS_COLUMNS, row)
+    }
+
+def get_history_stats(db: Session, owner_id: Optional[int] = None):
+    """Aggregate history statistics from the denormalized session columns"""
+    # PostgreSQL keeps them per owner in a materialized view
+    hot = postgres.history_stats(db, owner_id) if postgres.is_postgres(db) else status_stats(db, owner_id)
+    # Archived sessions still count, through their per-month totals
+    archived = archive.archived_totals(db, owner_id)
+    return {name: hot[name] + archived[name] for name in postgres.STATS_COLUMNS}
+
+# Metrics of SessionDistribution and the rollup columns sketching them
+SKETCHED_METRICS = {
+    "duration_minutes": models.SessionDailyRollup.duration_sketch,
+    "overrun_ratio": models.SessionDailyRollup.overrun_sketch,
+    "interruptions": models.SessionDailyRollup.interruptions_sketch,
+}
+
+DaySketches = Dict[str, Dict[str, DDSketch]]
+
+def rollup_sketches(db: Session, owner_id: Optional[int] = None, statuses: Optional[List[str]] = None,
+                    completed_from: Optional[date] = None, completed_to: Optional[date] = None) -> DaySketches:
+    """Each metric's sketch per rollup day, merged over statuses and, without owner_id, over owners"""
+    rollup = models.SessionDailyRollup
+    query = db.query(rollup.day, *SKETCHED_METRICS.values())
+    if owner_id is not None:
+        query = query.filter(rollup.owner_id == owner_id)
+    if statuses:
+        query = query.filter(rollup.status.in_(statuses))
+    if completed_from is not None:
+        query = query.filter(rollup.day >= completed_from.isoformat())
+    if completed_to is not None:
+        query = query.filter(rollup.day < completed_to.isoformat())
+    days: DaySketches = {}
+    for day, *columns in query:
+        sketches = days.setdefault(day, {metric: DDSketch() for metric in SKETCHED_METRICS})
+        for metric, data in zip(SKETCHED_METRICS, columns):
+            if data:
+                sketches[metric].merge(DDSketch.from_dict(data))
+    return days
+
+def merge_day_sketches(parts: Sequence[DaySketches]) -> DaySketches:
+    """Combine rollup_sketches results, e.g. one per shard"""
+    days: DaySketches = {}
+    for part in parts:
+        for day, sketches in part.items():
+            if day in days:
+                for metric, sketch in sketches.items():
+                    days[day][metric].merge(sketch)
+            else:
+                days[day] = sketches
+    return days
+
+def _distribution_bucket(label: str, sketches: Dict[str, DDSketch]) -> schemas.DistributionBucket:
+    return schemas.DistributionBucket(
+        bucket=label,
+        sessions=sketches["interruptions"].count,  # every completion adds an interruption count
+        **{metric: schemas.Percentiles(
+            count=sketch.count, mean=sketch.mean,
+            p50=sketch.quantile(0.5), p90=sketch.quantile(0.9), p99=sketch.quantile(0.99),
+            max=sketch.max if sketch.count else None,
+        ) for metric, sketch in sketches.items()},
+    )
+
+def session_distribution(days: DaySketches, bucket: str = "day") -> schemas.SessionDistribution:
+    """Percentiles per day, ISO week or month and overall, by merging day sketches rather than sorting sessions"""
+    buckets: DaySketches = {}
+    for day in sorted(days):
+        label = bucket_of(day, bucket)
+        if label in buckets:
+            for metric, sketch in days[day].items():
+                buckets[label][metric].merge(sketch)
+        else:
+            buckets[label] = {metric: merged([sketch]) for metric, sketch in days[day].items()}
+    overall = {metric: merged(sketches[metric] for sketches in buckets.values()) for metric in SKETCHED_METRICS}
+    return schemas.SessionDistribution(
+        bucket=bucket,
+        overall=_distribution_bucket("all", overall),
+        buckets=[_distribution_bucket(label, sketches) for label, sketches in buckets.items()],
     )
+
+def bulk_insert(db: Session, model, rows: List[dict]):
+    """Insert many rows in the session's transaction: COPY on PostgreSQL, one executemany elsewhere"""
+    if not rows:
+        return
+    if postgres.is_postgres(db):
+        postgres.copy_rows(db, model.__table__, rows)
+    else:
+        # A Core insert on the table; the ORM bulk path splits rows whose None
+        # values differ into separate statements, often one per row
+        db.execute(insert(model.__table__), rows)
+
+def get_session_events(db: Session, session_id: int, owner_id: Optional[int] = None):
+    """Event log of one session in replay order"""
+    query = db.query(models.SessionEvent).filter(models.SessionEvent.session_id == session_id)
+    if owner_id is not None:
+        query = query.filter(models.SessionEvent.owner_id == owner_id)
+    return query.order_by(models.SessionEvent.id).all()
+
+def filter_created(query, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    """Restrict a session query to the half-open created_at range"""
+    if created_from is not None:
+        query = query.filter(models.Session.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(models.Session.created_at < created_to)
+    return query
+
+def get_session_history(db: Session, fields: Optional[Tuple[str, ...]] = None, include_interruptions: bool = True, owner_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, stats: Optional[dict] = None):
+    """Get session history with statistics (computed unless already cached by the caller)"""
+    # Statistics come from the session columns; interruptions are loaded only
+    # when the caller asks for their details
+    query = filter_created(query_sessions(db, fields, include_interruptions, owner_id), created_from, created_to)
+    sessions = query.order_by(models.Session.created_at.desc(), models.Session.id.desc()).all()
+    if created_from is not None:
+        # Archives are read only when the requested range starts far enough back to reach them
+        archived = list(archive.iter_archived(db, owner_id, created_from, created_to))
+        if archived:
+            sessions = sorted(sessions + archived, key=lambda s: (s.created_at, s.id), reverse=True)
+    
+    history_model = schemas.history_projection(schemas.session_projection(fields, include_interruptions))
+    if stats is None:
+        stats = get_history_stats(db, owner_id)
+    return history_model(sessions=sessions, **stats)
+
+def export_sessions(db: Session, owner_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, batch_size: int = 500) -> Iterator[schemas.Session]:
+    """Sessions in the created_at range with interruptions: archived months first, then hot rows, each oldest first"""
+    yield from archive.iter_archived(db, owner_id, created_from, created_to)
+    query = filter_created(query_sessions(db, include_interruptions=True, owner_id=owner_id), created_from, created_to)
+    query = query.order_by(models.Session.created_at, models.Session.id).yield_per(batch_size)
+    for session in query:
+        yield schemas.Session.model_validate(session)
+
+def export_session_lines(db: Session, owner_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> Iterator[str]:
+    """export_sessions as JSON lines; on PostgreSQL the hot rows are serialized by the database and streamed with COPY"""
+    if not postgres.is_postgres(db):
+        for session in export_sessions(db, owner_id, created_from, created_to):
+            yield session.model_dump_json() + "\n"
+        return
+    for session in archive.iter_archived(db, owner_id, created_from, created_to):
+        yield session.model_dump_json() + "\n"
+    yield from postgres.copy_sessions_out(db, owner_id, created_from, created_to)
@@ -1,24 +1,179 @@
+from dataclasses import dataclass
+from fastapi import Depends, Header, Request, Response
 from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import declarative_base, sessionmaker
+from typing import Callable, Optional
+import math
 import os
+import threading
+import time
 
-# Database URL - using SQLite for simplicity
-DATABASE_URL = "sqlite:///./deepwork.db"
+# Database URL - SQLite unless DATABASE_URL is set
+DEFAULT_DATABASE_URL = "sqlite:///./deepwork.db"
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Needed for SQLite
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Set on responses to mutations; until the time it holds, the client's reads go to the primary
+READ_PRIMARY_COOKIE = "deepwork_read_primary_until"
 
 Base = declarative_base()
 
-def get_db():
-    """Dependency to get database session"""
-    db = SessionLocal()
+_engine: Optional[Engine] = None
+_read_engine: Optional[Engine] = None
+_routing_config: Optional["ReadRoutingConfig"] = None
+
+@dataclass
+class ReadRoutingConfig:
+    """Where GET endpoints read from; enabled by default"""
+    enabled: bool = True
+    read_url: Optional[str] = None  # replica; SQLite files default to a read-only connection to the same file
+    read_your_writes_seconds: float = 5.0
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from DATABASE_READ_URL and READ_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("READ_ROUTING_ENABLED", "1").lower() not in ("0", "false", "no"),
+            read_url=os.getenv("DATABASE_READ_URL") or defaults.read_url,
+            read_your_writes_seconds=float(os.getenv("READ_YOUR_WRITES_SECONDS", defaults.read_your_writes_seconds)),
+        )
+
+@dataclass
+class ReadRoutingMetrics:
+    """Where GET endpoint sessions were opened"""
+    read_engine: int = 0
+    primary: int = 0  # right after the client wrote, or with routing off
+
+    def as_dict(self) -> dict:
+        return {"read_engine": self.read_engine, "primary": self.primary}
+
+read_routing_metrics = ReadRoutingMetrics()
+
+def normalize_url(url: str) -> str:
+    """Plain PostgreSQL URLs use psycopg 3, whose COPY API the bulk paths need"""
+    scheme, sep, rest = url.partition("://")
+    if scheme in ("postgres", "postgresql"):
+        return f"postgresql+psycopg://{rest}"
+    return url
+
+def get_database_url() -> str:
+    return normalize_url(os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL))
+
+def migrate_on_startup() -> bool:
+    """Whether the lifespan upgrades the schema; backend.serve does it once for all workers"""
+    return os.getenv("DB_MIGRATE_ON_STARTUP", "1").lower() not in ("0", "false", "no")
+
+def get_routing_config() -> "ReadRoutingConfig":
+    global _routing_config
+    if _routing_config is None:
+        _routing_config = ReadRoutingConfig.from_env()
+    return _routing_config
+
+def read_url_for(primary_url: str, config: ReadRoutingConfig) -> Optional[str]:
+    """URL of the read engine, or None when reads share the primary"""
+    if not config.enabled:
+        return None
+    if config.read_url:
+        return normalize_url(config.read_url)
+    url = make_url(primary_url)
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:" or url.query.get("uri"):
+        return None
+    return f"sqlite:///file:{os.path.abspath(url.database)}?mode=ro&uri=true"
+
+def make_engine(url: str) -> Engine:
+    """Engine for a database URL; creating it does not connect"""
+    url = normalize_url(url)
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})  # Needed for SQLite
+    # Server databases may close idle pooled connections; check before reuse
+    return create_engine(url, pool_pre_ping=True)
+
+def enable_wal(engine: Engine):
+    """Switch a SQLite file to write-ahead logging, so readers and the writer do not block each other"""
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+def get_engine() -> Engine:
+    """Engine for DATABASE_URL, created on first use rather than at import"""
+    global _engine
+    if _engine is None:
+        _engine = make_engine(get_database_url())
+    return _engine
+
+_read_engine_lock = threading.Lock()
+
+def get_read_engine() -> Engine:
+    """Engine for GET endpoints: the replica or read-only SQLite connection, else the primary"""
+    global _read_engine
+    with _read_engine_lock:
+        if _read_engine is None:
+            url = read_url_for(get_database_url(), get_routing_config())
+            if url is None:
+                _read_engine = get_engine()
+            else:
+                if url.startswith("sqlite:///file:"):
+                    # The journal mode is stored in the file; read-only connections cannot set it
+                    enable_wal(get_engine())
+                _read_engine = make_engine(url)
+    return _read_engine
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker that binds to its engine when the first session is made"""
+
+    def __init__(self, engine: Callable[[], Engine], **kw):
+        super().__init__(**kw)
+        self._get_engine = engine
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self._get_engine())
+        return super().__call__(**local_kw)
+
+SessionLocal = LazySessionmaker(get_engine, autocommit=False, autoflush=False)
+# Sessions that only read; anything that must run on the primary checks info["read_only"]
+ReadSessionLocal = LazySessionmaker(get_read_engine, autocommit=False, autoflush=False, info={"read_only": True})
+
+def get_owner_id(x_user_id: int = Header(0, ge=0, description="Id of the user whose sessions are read or written")) -> int:
+    """Owner every session query is scoped to"""
+    return x_user_id
+
+def get_db(request: Request, owner_id: int = Depends(get_owner_id)):
+    """Dependency to get database session; when sharded, on the shard the path's session id names, else the owner's"""
+    shards = getattr(request.app.state, "shards", None)
+    db = shards.session_for_request(request, owner_id) if shards else SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def wrote_recently(request: Request) -> bool:
+    """Whether the client made a mutation within the read-your-writes window"""
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_read_db(request: Request, owner_id: int = Depends(get_owner_id)):
+    """Dependency for GET endpoints: a read-only session, or the primary if the client just wrote"""
+    shards = getattr(request.app.state, "shards", None)
+    if shards:
+        db = shards.session_for_request(request, owner_id)
+    elif wrote_recently(request):
+        read_routing_metrics.primary += 1
+        db = SessionLocal()
+    else:
+        read_routing_metrics.read_engine += 1
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def mark_written(response: Response):
+    """Dependency for mutations: send the client's reads to the primary until a replica has its write"""
+    window = get_routing_config().read_your_writes_seconds
+    if window > 0:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, f"{time.time() + window:.3f}",
+            max_age=math.ceil(window), httponly=True, samesite="lax",
+        )
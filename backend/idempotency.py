@@ -0,0 +1,226 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Hashable, Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException, Request, Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import get_owner_id
+from .writer import GroupCommitWriter, run_mutation
+
+# Set on responses that were replayed rather than executed
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+@dataclass
+class IdempotencyConfig:
+    """Idempotency-Key handling for mutations; enabled by default"""
+    enabled: bool = True
+    ttl_seconds: float = 24 * 3600  # how long a key replays its response
+    max_entries: int = 4096  # responses kept in memory per process
+    prune_every: int = 100  # stored keys between deletions of expired rows
+    prune_batch: int = 1000  # expired rows deleted at a time
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from IDEMPOTENCY_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("IDEMPOTENCY_ENABLED", "1").lower() not in ("0", "false", "no"),
+            ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", defaults.ttl_seconds)),
+            max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", defaults.max_entries)),
+            prune_every=int(os.getenv("IDEMPOTENCY_PRUNE_EVERY", defaults.prune_every)),
+            prune_batch=int(os.getenv("IDEMPOTENCY_PRUNE_BATCH", defaults.prune_batch)),
+        )
+
+@dataclass
+class IdempotencyMetrics:
+    """Counters exposed on /metrics"""
+    stored: int = 0
+    memory_replays: int = 0
+    table_replays: int = 0
+    mismatches: int = 0  # key reused for a different request
+    pruned: int = 0
+
+    def as_dict(self):
+        return {
+            "stored": self.stored,
+            "memory_replays": self.memory_replays,
+            "table_replays": self.table_replays,
+            "mismatches": self.mismatches,
+            "pruned": self.pruned,
+        }
+
+class IdempotencyStore:
+    """Responses of keyed mutations: an LRU in front of the idempotency_keys table.
+
+    The table row is written in the mutation's own transaction, so a key is
+    recorded exactly when its effects are, and a retry after any failure either
+    replays the committed response or runs the mutation for the first time.
+    The LRU answers retries that reach the same process without touching the
+    database. Rows live for ttl_seconds; every prune_every stored keys, one
+    bounded DELETE removes expired ones, so the table holds about ttl_seconds
+    worth of keyed writes.
+    """
+
+    def __init__(self, config: Optional[IdempotencyConfig] = None):
+        self.config = config or IdempotencyConfig()
+        self.metrics = IdempotencyMetrics()
+        self._entries: "OrderedDict[Hashable, Tuple[str, str, datetime]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._since_prune = 0
+
+    def recall(self, scope: Hashable) -> Optional[Tuple[str, str]]:
+        """(fingerprint, response) remembered for a key, unless it expired"""
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None:
+                return None
+            if entry[2] <= datetime.now():
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            return entry[0], entry[1]
+
+    def remember(self, scope: Hashable, fingerprint: str, response: str, expires_at: datetime):
+        with self._lock:
+            self._entries[scope] = (fingerprint, response, expires_at)
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.config.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def prune(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Delete up to prune_batch expired keys in the session's transaction"""
+        key = models.IdempotencyKey
+        expired = (
+            select(key.owner_id, key.key)
+            .where(key.expires_at <= (now or datetime.now()))
+            .order_by(key.expires_at)
+            .limit(self.config.prune_batch)
+        )
+        deleted = db.execute(delete(key).where(tuple_(key.owner_id, key.key).in_(expired))).rowcount
+        self.metrics.pruned += deleted
+        return deleted
+
+    def record(self, db: Session, owner_id: int, key: str, fingerprint: str, response: str, now: datetime) -> datetime:
+        """Add a key's response to the session's transaction, pruning when due; returns its expiry"""
+        expires_at = now + timedelta(seconds=self.config.ttl_seconds)
+        db.add(models.IdempotencyKey(
+            owner_id=owner_id, key=key, fingerprint=fingerprint, response=response, expires_at=expires_at,
+        ))
+        db.flush()
+        with self._lock:
+            self._since_prune += 1
+            prune = self._since_prune >= self.config.prune_every
+            if prune:
+                self._since_prune = 0
+        if prune:
+            self.prune(db, now)
+        self.metrics.stored += 1
+        return expires_at
+
+class IdempotentRequest:
+    """A mutation request carrying an Idempotency-Key, scoped to its owner"""
+
+    def __init__(self, store: IdempotencyStore, owner_id: int, key: str, fingerprint: str):
+        self.store = store
+        self.owner_id = owner_id
+        self.key = key
+        self.fingerprint = fingerprint
+
+    def _replay(self, fingerprint: str, response: str) -> Response:
+        if fingerprint != self.fingerprint:
+            self.store.metrics.mismatches += 1
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        return Response(content=response, media_type="application/json", headers={REPLAYED_HEADER: "true"})
+
+    def _stored(self, db: Session, now: datetime) -> Optional[models.IdempotencyKey]:
+        row = db.get(models.IdempotencyKey, (self.owner_id, self.key))
+        if row is not None and row.expires_at <= now:
+            db.delete(row)
+            db.flush()
+            return None
+        return row
+
+    def lookup(self, db: Session) -> Optional[Response]:
+        """Stored response for this key from memory, else the table"""
+        remembered = self.store.recall((self.owner_id, self.key))
+        if remembered is not None:
+            self.store.metrics.memory_replays += 1
+            return self._replay(*remembered)
+        row = db.get(models.IdempotencyKey, (self.owner_id, self.key))
+        if row is None or row.expires_at <= datetime.now():
+            return None
+        self.store.metrics.table_replays += 1
+        self.store.remember((self.owner_id, self.key), row.fingerprint, row.response, row.expires_at)
+        return self._replay(row.fingerprint, row.response)
+
+    def recording(self, mutation: Callable[[Session], BaseModel]) -> Callable[[Session], object]:
+        """Mutation that stores its response under the key in its own transaction"""
+        def keyed(db: Session):
+            now = datetime.now()
+            # Checked again in the writing transaction: a retry may have been queued meanwhile
+            row = self._stored(db, now)
+            if row is not None:
+                self.store.metrics.table_replays += 1
+                return self._replay(row.fingerprint, row.response)
+
+            # The key commits together with the mutation's effects
+            with crud.single_commit(db):
+                result = mutation(db)
+                response = result.model_dump_json()
+                expires_at = self.store.record(db, self.owner_id, self.key, self.fingerprint, response, now)
+            return result, response, expires_at
+        return keyed
+
+    def run(self, db: Session, writer: Optional[GroupCommitWriter], mutation: Callable[[Session], BaseModel]):
+        """Replay the stored response for the key, or apply the mutation and store its response"""
+        replay = self.lookup(db)
+        if replay is not None:
+            return replay
+        # End the lookup's read transaction, which would otherwise hold up the writer
+        db.rollback()
+        try:
+            outcome = run_mutation(db, writer, self.recording(mutation))
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            db.rollback()
+            replay = self.lookup(db)
+            if replay is None:
+                raise
+            return replay
+        if isinstance(outcome, Response):
+            return outcome
+        result, response, expires_at = outcome
+        self.store.remember((self.owner_id, self.key), self.fingerprint, response, expires_at)
+        return result
+
+async def get_idempotency(
+    request: Request,
+    owner_id: int = Depends(get_owner_id),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255, description="Retries with the same key replay the first response instead of repeating the mutation"),
+) -> Optional[IdempotentRequest]:
+    """Dependency for mutations: the keyed request, or None without a key or with idempotency disabled"""
+    store = getattr(request.app.state, "idempotency", None)
+    if idempotency_key is None or store is None:
+        return None
+    digest = hashlib.sha256(f"{request.method} {request.url.path}\n".encode())
+    digest.update(await request.body())
+    return IdempotentRequest(store, owner_id, idempotency_key, digest.hexdigest())
+
+def run_idempotent(db: Session, writer: Optional[GroupCommitWriter], idempotency: Optional[IdempotentRequest], mutation: Callable[[Session], BaseModel]):
+    """run_mutation, replaying the stored response when the request carries a known Idempotency-Key"""
+    if idempotency is None:
+        return run_mutation(db, writer, mutation)
+    return idempotency.run(db, writer, mutation)
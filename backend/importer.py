@@ -0,0 +1,330 @@
+import argparse
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, Iterator, List, Optional, TextIO, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import crud, models, postgres, schemas, sharding
+
+FORMATS = ("csv", "ndjson")
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+# Tables an import writes, whose secondary indexes a bulk load defers
+IMPORTED_TABLES = (models.Session.__table__, models.Interruption.__table__, models.SessionEvent.__table__)
+
+# A record that could not be parsed; rejected with the message like an invalid one
+Unparsable = namedtuple("Unparsable", "message")
+
+_sessions = TypeAdapter(List[schemas.ImportedSession])
+
+class ImportConflict(RuntimeError):
+    """Another run of the same import committed a chunk meanwhile"""
+
+def format_for(path: str) -> str:
+    """Import format from a file name"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    raise ValueError(f"Cannot tell the format of {path}; pass csv or ndjson")
+
+def _csv_record(row: dict):
+    """Drop empty cells; interruptions hold a JSON list"""
+    record = {name: value for name, value in row.items() if name and value not in ("", None)}
+    if "interruptions" in record:
+        try:
+            record["interruptions"] = json.loads(record["interruptions"])
+        except ValueError as exc:
+            return Unparsable(f"interruptions: {exc}")
+    return record
+
+def iter_records(stream: TextIO, format: str, skip: int = 0) -> Iterator[object]:
+    """Records of a CSV or NDJSON stream, parsed one at a time; the first `skip` are passed over unparsed where possible"""
+    if format == "ndjson":
+        for line in stream:
+            if not line.strip():
+                continue
+            if skip:
+                skip -= 1
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield Unparsable(f"Invalid JSON: {exc}")
+    elif format == "csv":
+        for row in csv.DictReader(stream):
+            if skip:
+                skip -= 1
+                continue
+            yield _csv_record(row)
+    else:
+        raise ValueError(f"Unknown import format: {format}")
+
+def _error_message(error: dict) -> str:
+    field = ".".join(str(part) for part in error["loc"][1:])
+    return f"{field}: {error['msg']}" if field else error["msg"]
+
+def validate(chunk: List[Tuple[int, object]]) -> Tuple[List[Tuple[int, schemas.ImportedSession]], List[schemas.ImportRowError]]:
+    """Validate a chunk of (row number, record) in one pydantic call; returns the valid sessions and the errors"""
+    errors = []
+    candidates = []
+    for row, record in chunk:
+        if isinstance(record, Unparsable):
+            errors.append(schemas.ImportRowError(row=row, message=record.message))
+        elif not isinstance(record, dict):
+            errors.append(schemas.ImportRowError(row=row, message="Expected an object"))
+        else:
+            candidates.append((row, record))
+    try:
+        sessions = _sessions.validate_python([record for _, record in candidates])
+    except ValidationError as exc:
+        # Report the first problem of each invalid record, then validate the rest again
+        first = {}
+        for error in exc.errors():
+            first.setdefault(error["loc"][0], error)
+        errors.extend(schemas.ImportRowError(row=candidates[index][0], message=_error_message(error)) for index, error in first.items())
+        candidates = [candidate for index, candidate in enumerate(candidates) if index not in first]
+        sessions = _sessions.validate_python([record for _, record in candidates])
+    errors.sort(key=lambda error: error.row)
+    return [(row, session) for (row, _), session in zip(candidates, sessions)], errors
+
+def _reserve_ids(db: Session, target: Table, count: int) -> List[int]:
+    """Ids for rows that are linked to each other before they are inserted.
+
+    SQLite callers hold the write lock (crud.begin_write), so max(id) cannot move
+    underneath them; PostgreSQL draws from the sequence that other writers use.
+    """
+    if not count:
+        return []
+    shard = db.get_bind().get_execution_options().get("shard_id")
+    if shard is not None and target is not models.SessionEvent.__table__:
+        # Session and interruption ids encode their shard; events are numbered per shard file
+        if postgres.is_postgres(db):
+            return [sharding.encode_id(shard, 0) | local for local in postgres.next_ids(db, target, count)]
+        last = db.scalar(select(sharding.last_id(target, shard)))
+    elif postgres.is_postgres(db):
+        return postgres.next_ids(db, target, count)
+    else:
+        last = db.scalar(select(func.coalesce(func.max(target.c.id), 0)))
+        if target.dialect_options["sqlite"]["autoincrement"]:
+            # AUTOINCREMENT never reuses ids, even those of deleted rows
+            seq = db.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {"name": target.name}).scalar()
+            last = max(last, seq or 0)
+    return list(range(last + 1, last + 1 + count))
+
+def _timeline(session: schemas.ImportedSession):
+    """Final state of an imported session, by the same rules as a live completion"""
+    state = SimpleNamespace(
+        start_time=session.start_time, end_time=None, status="active" if session.start_time else "planned",
+        scheduled_duration=session.scheduled_duration, interruption_count=len(session.interruptions),
+        last_pause_time=max((i.pause_time for i in session.interruptions), default=None), actual_duration_minutes=None,
+    )
+    if session.end_time is not None:
+        crud.finish_session(state, session.end_time)
+    # The logged outcome wins, as it does when the event log is replayed
+    state.status = session.status or state.status
+    return state
+
+def build_rows(db: Session, sessions: List[schemas.ImportedSession], owner_id: int, name: str):
+    """Session, interruption and event rows of a chunk, with the event log a live session would have written"""
+    session_ids = _reserve_ids(db, models.Session.__table__, len(sessions))
+    interruption_ids = iter(_reserve_ids(db, models.Interruption.__table__, sum(len(s.interruptions) for s in sessions)))
+    session_rows, interruption_rows, events = [], [], []
+    for session_id, session in zip(session_ids, sessions):
+        state = _timeline(session)
+        owned = {"session_id": session_id, "owner_id": owner_id}
+        first_event = len(events)
+        events.append({**owned, "event_type": "created", "occurred_at": session.created_at, "reason": None, "payload": {
+            "title": session.title, "goal": session.goal, "scheduled_duration": session.scheduled_duration, "import_name": name,
+        }})
+        if session.start_time is not None:
+            events.append({**owned, "event_type": "started", "occurred_at": session.start_time, "reason": None, "payload": None})
+        for interruption in sorted(session.interruptions, key=lambda i: i.pause_time):
+            interruption_id = next(interruption_ids)
+            interruption_rows.append({"id": interruption_id, **owned, "reason": interruption.reason, "pause_time": interruption.pause_time})
+            events.append({**owned, "event_type": "paused", "occurred_at": interruption.pause_time, "reason": interruption.reason,
+                           "payload": {"interruption_id": interruption_id}})
+        if state.status == "active" and session.interruptions:
+            # Files carry no resume times; the last pause stands in, so a replay ends active too
+            events.append({**owned, "event_type": "resumed", "occurred_at": state.last_pause_time, "reason": None, "payload": None})
+        if session.end_time is not None:
+            events.append({**owned, "event_type": "completed", "occurred_at": session.end_time, "reason": None, "payload": {
+                "status": state.status, "duration_minutes": state.actual_duration_minutes,
+                "scheduled_duration": session.scheduled_duration, "interruption_count": state.interruption_count,
+            }})
+        session_rows.append((first_event, {
+            "id": session_id, "owner_id": owner_id, "title": session.title, "goal": session.goal,
+            "scheduled_duration": session.scheduled_duration, "start_time": session.start_time, "end_time": session.end_time,
+            "status": state.status, "created_at": session.created_at, "interruption_count": state.interruption_count,
+            "last_pause_time": state.last_pause_time, "actual_duration_minutes": state.actual_duration_minutes,
+        }))
+    for event_id, event in zip(_reserve_ids(db, models.SessionEvent.__table__, len(events)), events):
+        event["id"] = event_id
+    # Each session row records the last of its events, so replaying the log leaves it alone
+    for index, (first_event, row) in enumerate(session_rows):
+        following = session_rows[index + 1][0] if index + 1 < len(session_rows) else len(events)
+        row["last_event_id"] = events[following - 1]["id"]
+    return [row for _, row in session_rows], interruption_rows, events
+
+def commit_chunk(db: Session, owner_id: int, name: str, chunk: List[Tuple[int, object]], rows_read: int, bulk_load: bool = False) -> List[schemas.ImportRowError]:
+    """Insert a chunk's valid sessions and advance the import's checkpoint in one transaction; returns the rejected rows.
+
+    rows_read is where this run believes the checkpoint stands. If another run
+    has moved it, nothing is written and ImportConflict is raised.
+    """
+    crud.begin_write(db)
+    if bulk_load and postgres.is_postgres(db):
+        # The checkpoint commits with the rows, so a lost commit is simply imported again
+        db.execute(text("SET LOCAL synchronous_commit TO OFF"))
+    checkpoint = db.get(models.ImportCheckpoint, (owner_id, name), with_for_update=True, populate_existing=True)
+    if (checkpoint.rows_read if checkpoint else 0) != rows_read:
+        db.rollback()
+        raise ImportConflict(f"Import {name!r} was advanced by another run")
+    if checkpoint is None:
+        checkpoint = models.ImportCheckpoint(owner_id=owner_id, name=name, rows_read=0, sessions_imported=0,
+                                             interruptions_imported=0, rows_rejected=0, updated_at=datetime.now())
+        db.add(checkpoint)
+
+    valid, errors = validate(chunk)
+    session_rows, interruption_rows, event_rows = build_rows(db, [session for _, session in valid], owner_id, name)
+    crud.bulk_insert(db, models.Session, session_rows)
+    crud.bulk_insert(db, models.Interruption, interruption_rows)
+    crud.bulk_insert(db, models.SessionEvent, event_rows)
+
+    checkpoint.rows_read = rows_read + len(chunk)
+    checkpoint.sessions_imported += len(session_rows)
+    checkpoint.interruptions_imported += len(interruption_rows)
+    checkpoint.rows_rejected += len(errors)
+    checkpoint.updated_at = datetime.now()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Two first chunks of the same import raced to create the checkpoint
+        db.rollback()
+        raise ImportConflict(f"Import {name!r} was advanced by another run")
+    return errors
+
+def import_sessions(
+    db: Session,
+    stream: TextIO,
+    format: str,
+    owner_id: int,
+    name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    bulk_load: bool = False,
+    progress: Optional[Callable[[schemas.ImportReport], None]] = None,
+) -> schemas.ImportReport:
+    """Import sessions with their interruptions from a CSV or NDJSON stream, one transaction per chunk.
+
+    Progress is checkpointed under (owner_id, name) with every chunk, so
+    running the same import again after a crash skips what was committed.
+    Invalid records are rejected and reported without stopping the import.
+    """
+    started = time.perf_counter()
+    checkpoint = db.get(models.ImportCheckpoint, (owner_id, name))
+    resumed_from = checkpoint.rows_read if checkpoint else 0
+    db.rollback()  # no read transaction is held while the file is parsed
+    rows_read = resumed_from
+    errors: List[schemas.ImportRowError] = []
+
+    def flush(chunk):
+        nonlocal rows_read
+        rejected = commit_chunk(db, owner_id, name, chunk, rows_read, bulk_load)
+        rows_read += len(chunk)
+        errors.extend(rejected[:MAX_REPORTED_ERRORS - len(errors)])
+        chunk.clear()
+        if progress is not None:
+            progress(report())
+
+    def report():
+        checkpoint = db.get(models.ImportCheckpoint, (owner_id, name))
+        seconds = time.perf_counter() - started
+        return schemas.ImportReport(
+            name=name, rows_read=checkpoint.rows_read, sessions_imported=checkpoint.sessions_imported,
+            interruptions_imported=checkpoint.interruptions_imported, rows_rejected=checkpoint.rows_rejected,
+            resumed_from=resumed_from, seconds=seconds,
+            rows_per_second=(rows_read - resumed_from) / seconds if seconds else 0.0, errors=list(errors),
+        )
+
+    chunk = []
+    for row, record in enumerate(iter_records(stream, format, skip=resumed_from), start=resumed_from + 1):
+        chunk.append((row, record))
+        if len(chunk) == chunk_size:
+            flush(chunk)
+    if chunk or checkpoint is None:
+        flush(chunk)
+    return report()
+
+@contextmanager
+def deferred_indexes(engine: Engine):
+    """Drop the secondary indexes of the imported tables for the block, then build them again in one pass each"""
+    indexes = [index for table in IMPORTED_TABLES for index in table.indexes]
+    for index in indexes:
+        index.drop(engine, checkfirst=True)
+    try:
+        yield
+    finally:
+        restore_indexes(engine)
+
+def restore_indexes(engine: Engine):
+    """Create any secondary index of the imported tables that is missing, e.g. after a crashed bulk load"""
+    for table in IMPORTED_TABLES:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def main(argv: Optional[list] = None):
+    from .database import SessionLocal, get_engine
+
+    parser = argparse.ArgumentParser(description="Import historical sessions and interruptions from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--owner-id", type=int, default=0, help="Owner of the imported sessions")
+    parser.add_argument("--name", help="Checkpoint name; rerunning an import with it resumes (default: the file name)")
+    parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Records per transaction")
+    parser.add_argument("--bulk-load", action="store_true",
+                        help="Drop secondary indexes while loading and rebuild them at the end; "
+                             "on PostgreSQL, also commit chunks without waiting for the WAL flush")
+    args = parser.parse_args(argv)
+    format = args.format or format_for(args.path)
+    name = args.name or os.path.basename(args.path)
+
+    def progress(report: schemas.ImportReport):
+        print(f"{report.rows_read} rows read, {report.sessions_imported} sessions imported, {report.rows_per_second:.0f} rows/s")
+
+    config = sharding.ShardConfig.from_env()
+    shards = sharding.ShardRouter.from_config(config) if config.enabled else None
+    try:
+        # All of an owner's sessions live in one shard, so the whole file goes there
+        engine = shards.engines[shards.shard_for_owner(args.owner_id)] if shards else get_engine()
+        db = shards.session_for_owner(args.owner_id) if shards else SessionLocal()
+        try:
+            with open(args.path, newline="", encoding="utf-8") as stream, (deferred_indexes(engine) if args.bulk_load else nullcontext()):
+                report = import_sessions(db, stream, format, args.owner_id, name, args.chunk_size, args.bulk_load, progress)
+        finally:
+            db.close()
+        restore_indexes(engine)
+    finally:
+        if shards:
+            shards.dispose()
+    if report.resumed_from:
+        print(f"Resumed after row {report.resumed_from}")
+    for error in report.errors:
+        print(f"Row {error.row}: {error.message}")
+    print(f"Imported {report.sessions_imported} sessions and {report.interruptions_imported} interruptions "
+          f"({report.rows_rejected} rows rejected) in {report.seconds:.1f}s, {report.rows_per_second:.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
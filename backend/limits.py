@@ -0,0 +1,161 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+@dataclass
+class LimitConfig:
+    """Per-client rate limits and load shedding; off unless RATE_LIMIT_ENABLED is set"""
+    enabled: bool = False
+    rate_per_second: float = 20.0  # requests per client and route
+    burst: float = 40.0
+    heavy_rate_per_second: float = 1.0  # history, export and stats, on top of the above
+    heavy_burst: float = 10.0
+    heavy_max_concurrent: int = 4  # per heavy route and process
+    max_clients: int = 10_000  # buckets kept in memory per limit
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from RATE_LIMIT_* and HEAVY_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("RATE_LIMIT_ENABLED", "0").lower() not in ("0", "false", "no"),
+            rate_per_second=float(os.getenv("RATE_LIMIT_PER_SECOND", defaults.rate_per_second)),
+            burst=float(os.getenv("RATE_LIMIT_BURST", defaults.burst)),
+            heavy_rate_per_second=float(os.getenv("HEAVY_RATE_LIMIT_PER_SECOND", defaults.heavy_rate_per_second)),
+            heavy_burst=float(os.getenv("HEAVY_RATE_LIMIT_BURST", defaults.heavy_burst)),
+            heavy_max_concurrent=int(os.getenv("HEAVY_MAX_CONCURRENT", defaults.heavy_max_concurrent)),
+            max_clients=int(os.getenv("RATE_LIMIT_MAX_CLIENTS", defaults.max_clients)),
+        )
+
+@dataclass
+class LimitMetrics:
+    """Counters exposed on /metrics"""
+    throttled: int = 0  # 429s
+    shed: int = 0  # 503s
+    evicted: int = 0  # idle buckets dropped, and any past max_clients
+
+    def as_dict(self):
+        return {"throttled": self.throttled, "shed": self.shed, "evicted": self.evicted}
+
+class TokenBuckets:
+    """One token bucket per key, refilled lazily when the key is seen.
+
+    A bucket is its token count and the time it was last updated, kept in
+    an LRU, so a request costs one lookup and one move. Buckets idle long
+    enough to have refilled are the same as absent ones and are dropped from
+    the cold end; past max_keys the coldest bucket goes regardless.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Take a token for key; returns 0 if allowed, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            return wait
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop refilled buckets from the cold end, then any beyond max_keys"""
+        now = time.monotonic() if now is None else now
+        refill = self.burst / self.rate
+        evicted = 0
+        with self._lock:
+            while self._buckets:
+                key, (_, updated) = next(iter(self._buckets.items()))
+                if now - updated < refill and len(self._buckets) <= self.max_keys:
+                    break
+                del self._buckets[key]
+                evicted += 1
+        return evicted
+
+class RequestLimiter:
+    """Rate limits and concurrency slots for one process"""
+
+    def __init__(self, config: Optional[LimitConfig] = None):
+        self.config = config or LimitConfig()
+        self.metrics = LimitMetrics()
+        self.buckets = TokenBuckets(self.config.rate_per_second, self.config.burst, self.config.max_clients)
+        self.heavy_buckets = TokenBuckets(self.config.heavy_rate_per_second, self.config.heavy_burst, self.config.max_clients)
+        self._running: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def throttle(self, buckets: TokenBuckets, key: Hashable):
+        """Raise 429 with Retry-After when key's bucket is empty"""
+        wait = buckets.take(key)
+        # Stops at the first bucket still refilling, so this is O(1) amortized
+        self.metrics.evicted += buckets.evict_idle()
+        if wait:
+            self.metrics.throttled += 1
+            raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(math.ceil(wait))})
+
+    def acquire(self, route: str):
+        """Take a concurrency slot on a heavy route, or raise 503 with Retry-After"""
+        with self._lock:
+            running = self._running.get(route, 0)
+            if running >= self.config.heavy_max_concurrent:
+                self.metrics.shed += 1
+                raise HTTPException(status_code=503, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
+            self._running[route] = running + 1
+
+    def release(self, route: str):
+        with self._lock:
+            self._running[route] -= 1
+
+    def as_dict(self):
+        with self._lock:
+            running = {route: count for route, count in self._running.items() if count}
+        return {**self.metrics.as_dict(), "clients": len(self.buckets), "heavy_running": running}
+
+def _client_route(request: Request) -> Tuple[str, Tuple[str, str]]:
+    """The route template and the (address, route) key its buckets use.
+
+    X-User-Id is chosen by the client, so keying on it would let one client
+    claim a fresh bucket per request.
+    """
+    route = request.scope["route"].path  # /api/v1/sessions/{session_id} for every id
+    host = request.client.host if request.client else ""
+    return route, (host, route)
+
+def rate_limit(request: Request):
+    """Dependency for every session route: a token bucket per client and route"""
+    limiter: Optional[RequestLimiter] = getattr(request.app.state, "limits", None)
+    if limiter is None:
+        return
+    _, key = _client_route(request)
+    limiter.throttle(limiter.buckets, key)
+
+def shed_load(request: Request):
+    """Dependency for heavy routes: a slower bucket, then one of a few concurrency slots held until the response is sent"""
+    limiter: Optional[RequestLimiter] = getattr(request.app.state, "limits", None)
+    if limiter is None:
+        yield
+        return
+    route, key = _client_route(request)
+    limiter.throttle(limiter.heavy_buckets, key)
+    limiter.acquire(route)
+    try:
+        yield
+    finally:
+        limiter.release(route)
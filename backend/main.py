@@ -1,37 +1,149 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine
-from . import models
-from .routers import sessions
-
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="Deep Work Session Tracker",
-    description="A system to track focused work sessions with interruption management",
-    version="1.0.0"
-)
-
-# Configure CORS for frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # React dev server
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include routers
-app.include_router(sessions.router, prefix="/api/v1")
-
-@app.get("/")
-def read_root():
-    return {"message": "Deep Work Session Tracker API", "version": "1.0.0"}
-
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+from .cache import CacheConfig, DataVersionCache
+from .database import SessionLocal, migrate_on_startup, read_routing_metrics
+from .idempotency import IdempotencyConfig, IdempotencyStore
+from .limits import LimitConfig, RequestLimiter
+from .maintenance import MaintenanceConfig, Maintainer
+from .profiler import Profiler, ProfilerConfig
+from .projector import Projector, ProjectorConfig
+from . import schemas
+from .routers import admin, sessions
+from .sharding import ShardConfig, ShardRouter
+from .sweeper import Sweeper, SweeperConfig
+from .writer import GroupCommitWriter, WriterConfig
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Migrate the schema, open the result cache, idempotency store, rate limiter, admin profiler and optional shards, run the sweeper, rollup projector, scheduled maintenance and optional group-commit writer"""
+    cache_config = CacheConfig.from_env()
+    app.state.cache = DataVersionCache(cache_config) if cache_config.enabled else None
+    idempotency_config = IdempotencyConfig.from_env()
+    app.state.idempotency = IdempotencyStore(idempotency_config) if idempotency_config.enabled else None
+    limit_config = LimitConfig.from_env()
+    app.state.limits = RequestLimiter(limit_config) if limit_config.enabled else None
+    profiler_config = ProfilerConfig.from_env()
+    app.state.profiler = Profiler(profiler_config) if profiler_config.enabled else None
+
+    shard_config = ShardConfig.from_env()
+    if migrate_on_startup():
+        # Alembic is only imported when the schema is actually managed here
+        from . import migrations
+        migrations.upgrade_all()
+
+    session_factories = [SessionLocal]
+    if shard_config.enabled:
+        app.state.shards = ShardRouter.from_config(shard_config)
+        session_factories = app.state.shards.session_factories
+
+    writer_config = WriterConfig.from_env()
+    if writer_config.enabled:
+        # Each shard has its own write lock, so each gets its own writer
+        writers = [GroupCommitWriter(factory, writer_config) for factory in session_factories]
+        for writer in writers:
+            writer.start()
+        if shard_config.enabled:
+            app.state.shard_writers = writers
+        else:
+            app.state.writer = writers[0]
+    
+    sweeper = Sweeper(session_factories, SweeperConfig.from_env())
+    app.state.sweeper = sweeper
+    if sweeper.config.enabled:
+        sweeper.start()
+    projector = Projector(session_factories, ProjectorConfig.from_env())
+    app.state.projector = projector
+    if projector.config.enabled:
+        projector.start()
+    maintainer = Maintainer(session_factories, MaintenanceConfig.from_env())
+    app.state.maintainer = maintainer
+    if maintainer.config.enabled:
+        maintainer.start()
+    yield
+    await maintainer.stop()
+    await projector.stop()
+    await sweeper.stop()
+    
+    if writer_config.enabled:
+        for writer in writers:
+            writer.stop()
+        app.state.writer = app.state.shard_writers = None
+    if shard_config.enabled:
+        app.state.shards.dispose()
+        del app.state.shards
+    if app.state.cache is not None:
+        app.state.cache.close()
+        app.state.cache = None
+    if app.state.profiler is not None:
+        app.state.profiler.close()
+    app.state.idempotency = app.state.limits = app.state.profiler = None
+
+def create_app() -> FastAPI:
+    """Build the application; nothing touches the database until startup"""
+    app = FastAPI(
+        title="Deep Work Session Tracker",
+        description="A system to track focused work sessions with interruption management",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+
+    # Configure CORS for frontend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # React dev server
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Include routers
+    app.include_router(sessions.router, prefix="/api/v1")
+    app.include_router(admin.router, prefix="/api/v1")
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Deep Work Session Tracker API", "version": "1.0.0"}
+
+    @app.get("/health")
+    def health_check():
+        return {"status": "healthy"}
+
+    @app.get("/api/v1/capabilities", response_model=schemas.Capabilities)
+    def capabilities(request: Request):
+        """Optional features this server offers, so clients can pick the cheapest calls"""
+        state = request.app.state
+        return schemas.Capabilities(
+            version=app.version,
+            batch_max_operations=schemas.MAX_BATCH_OPERATIONS,
+            idempotency=getattr(state, "idempotency", None) is not None,
+            group_commit=bool(getattr(state, "writer", None) or getattr(state, "shard_writers", None)),
+        )
+
+    @app.get("/metrics")
+    def metrics(request: Request):
+        state = request.app.state
+        writer = getattr(state, "writer", None)
+        shard_writers = getattr(state, "shard_writers", None)
+        if shard_writers:
+            group_commit = [writer.metrics.as_dict() for writer in shard_writers]
+        else:
+            group_commit = writer.metrics.as_dict() if writer else None
+        return {
+            "sweeper": state.sweeper.metrics.as_dict(),
+            "projector": state.projector.metrics.as_dict(),
+            "maintenance": state.maintainer.metrics.as_dict(),
+            "group_commit": group_commit,
+            "cache": state.cache.metrics.as_dict() if state.cache else None,
+            "read_routing": read_routing_metrics.as_dict(),
+            "idempotency": state.idempotency.metrics.as_dict() if state.idempotency else None,
+            "limits": state.limits.as_dict() if state.limits else None,
+            "profiler": state.profiler.metrics.as_dict() if state.profiler else None,
+        }
+
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
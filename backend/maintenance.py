@@ -0,0 +1,412 @@
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Union
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .sweeper import LeaderLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKUP_PAGES = 1024  # pages copied per backup step
+DEFAULT_BACKUP_SLEEP = 0.005  # seconds between steps, when writers get the database
+DEFAULT_MAX_RESTARTS = 3
+DEFAULT_VACUUM_STEP = 1000  # freelist pages returned per incremental_vacuum transaction
+DEFAULT_ANALYSIS_LIMIT = 1000  # rows ANALYZE samples per index; 0 reads them all
+DEFAULT_BATCH_SIZE = 1000
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+class MaintenanceError(ValueError):
+    """The database cannot be maintained this way, e.g. it is not a SQLite file"""
+
+class _Restarting(Exception):
+    """Raised from the backup progress callback to give up on paged steps"""
+
+@dataclass
+class MaintenanceConfig:
+    """Schedule for ANALYZE and incremental vacuum in the API process"""
+    enabled: bool = True
+    interval_seconds: float = 3600.0
+    vacuum_pages: int = 10_000  # most freelist pages returned to the file system per run
+    lock_file: Optional[str] = None  # with several workers, only the holder of this lock runs maintenance
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from MAINTENANCE_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("MAINTENANCE_ENABLED", "1").lower() not in ("0", "false", "no"),
+            interval_seconds=float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", defaults.interval_seconds)),
+            vacuum_pages=int(os.getenv("MAINTENANCE_VACUUM_PAGES", defaults.vacuum_pages)),
+            lock_file=os.getenv("MAINTENANCE_LOCK_FILE") or None,
+        )
+
+@dataclass
+class MaintenanceMetrics:
+    """Counters exposed on /metrics"""
+    runs: int = 0
+    errors: int = 0
+    pages_reclaimed_total: int = 0
+    last_run_at: Optional[datetime] = None
+    last_run_seconds: float = 0.0
+    last_pages_reclaimed: int = 0
+    leader: bool = False
+
+    def as_dict(self):
+        return {
+            "leader": self.leader,
+            "runs": self.runs,
+            "errors": self.errors,
+            "pages_reclaimed_total": self.pages_reclaimed_total,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": self.last_run_seconds,
+            "last_pages_reclaimed": self.last_pages_reclaimed,
+        }
+
+@dataclass
+class Report:
+    """What one maintenance step did to one database"""
+    action: str
+    database: str
+    seconds: float
+    pages_reclaimed: int = 0
+    page_size: int = 4096
+    detail: str = ""
+
+    def __str__(self):
+        reclaimed = f"{self.pages_reclaimed} pages ({self.pages_reclaimed * self.page_size / 1e6:.1f} MB) reclaimed"
+        return f"{self.action} {self.database}: {self.seconds:.2f}s, {reclaimed}" + (f"; {self.detail}" if self.detail else "")
+
+def database_path(engine: Engine) -> str:
+    """The SQLite file behind an engine"""
+    url = engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:" or url.query.get("uri"):
+        raise MaintenanceError(
+            f"{url.render_as_string()} is not a SQLite database file; on PostgreSQL use pg_dump for backups "
+            "and leave VACUUM and ANALYZE to autovacuum"
+        )
+    return url.database
+
+def _connect(path: str) -> sqlite3.Connection:
+    """A connection of its own in autocommit mode, so each statement is its own short transaction"""
+    return sqlite3.connect(path, timeout=30, isolation_level=None)
+
+def _pragma(conn: sqlite3.Connection, name: str) -> int:
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+def _partial(destination: str) -> str:
+    """Where a copy is written before it is moved into place, so a failed run leaves no half a backup"""
+    partial = destination + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    return partial
+
+def backup(engine: Engine, destination: str, pages: int = DEFAULT_BACKUP_PAGES, sleep: float = DEFAULT_BACKUP_SLEEP,
+           max_restarts: int = DEFAULT_MAX_RESTARTS) -> Report:
+    """Copy a live database with SQLite's online backup API.
+
+    In rollback journal mode the copy is made `pages` at a time with a pause
+    between steps, so writers wait for one step rather than the whole copy.
+    A commit from another connection restarts a paged copy; after
+    max_restarts it is finished in a single step. In WAL mode a single step
+    is used from the start: it reads one snapshot and writers are never
+    blocked by it. The copy is checked with quick_check before it replaces
+    destination.
+    """
+    path = database_path(engine)
+    partial = _partial(destination)
+    started = time.perf_counter()
+    steps = restarts = 0
+    remaining = None
+
+    def progress(status, left, total):
+        nonlocal steps, restarts, remaining
+        steps += 1
+        if remaining is not None and left >= remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _Restarting
+        remaining = left
+        if left and pages != -1:
+            # backup() itself only sleeps when a step finds the database locked; without a pause
+            # here the next step starts at once and a waiting writer rarely gets in between
+            time.sleep(sleep)
+
+    with closing(_connect(path)) as source:
+        if _pragma(source, "journal_mode") == "wal":
+            pages = -1
+        with closing(sqlite3.connect(partial)) as target:
+            try:
+                source.backup(target, pages=pages, progress=progress, sleep=sleep)
+            except _Restarting:
+                pages = -1
+                source.backup(target, pages=-1, progress=progress)
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+            copied, page_size = _pragma(target, "page_count"), _pragma(target, "page_size")
+    if check != "ok":
+        os.remove(partial)
+        raise RuntimeError(f"Backup of {path} failed quick_check: {check}")
+    os.replace(partial, destination)
+    how = "in one step" if pages == -1 else f"{pages} at a time"
+    return Report("backup", path, time.perf_counter() - started, page_size=page_size,
+                  detail=f"copied {copied} pages {how} to {destination} in {steps} steps, {restarts} restarts")
+
+def snapshot(engine: Engine, destination: str) -> Report:
+    """A compacted copy with VACUUM INTO: one read transaction, free pages left out, indexes rebuilt"""
+    path = database_path(engine)
+    partial = _partial(destination)
+    started = time.perf_counter()
+    with closing(_connect(path)) as conn:
+        source_pages, page_size = _pragma(conn, "page_count"), _pragma(conn, "page_size")
+        conn.execute("VACUUM INTO ?", (partial,))
+    with closing(sqlite3.connect(partial)) as target:
+        copied = _pragma(target, "page_count")
+    os.replace(partial, destination)
+    return Report("snapshot", path, time.perf_counter() - started, source_pages - copied, page_size,
+                  detail=f"{copied} of {source_pages} pages written to {destination}")
+
+def auto_vacuum_mode(engine: Engine) -> str:
+    with closing(_connect(database_path(engine))) as conn:
+        return AUTO_VACUUM_MODES[_pragma(conn, "auto_vacuum")]
+
+def vacuum(engine: Engine, max_pages: Optional[int] = None, step: int = DEFAULT_VACUUM_STEP, enable: bool = False) -> Report:
+    """Return free pages to the file system with incremental_vacuum, `step` pages per transaction.
+
+    Writers only wait for one step at a time. This needs auto_vacuum=INCREMENTAL,
+    which new databases get from migrations.upgrade; `enable` switches an older
+    database over with a one-off full VACUUM, which does block writers.
+    """
+    path = database_path(engine)
+    started = time.perf_counter()
+    with closing(_connect(path)) as conn:
+        page_size, pages_before = _pragma(conn, "page_size"), _pragma(conn, "page_count")
+        freelist_before = _pragma(conn, "freelist_count")
+        mode = AUTO_VACUUM_MODES[_pragma(conn, "auto_vacuum")]
+        if mode != "incremental":
+            if not enable:
+                raise MaintenanceError(f"{path} has auto_vacuum={mode}; enable incremental vacuum once (a full VACUUM) first")
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            detail = f"switched from auto_vacuum={mode} with a full VACUUM"
+        else:
+            reclaimed = 0
+            while max_pages is None or reclaimed < max_pages:
+                free = _pragma(conn, "freelist_count")
+                count = min(step, free) if max_pages is None else min(step, free, max_pages - reclaimed)
+                if count <= 0:
+                    break
+                # Each step of the statement frees one page, and execute() stops stepping a
+                # statement without result columns after the first; executescript runs it to the end
+                conn.executescript(f"PRAGMA incremental_vacuum({int(count)})")
+                reclaimed += count
+            detail = f"{_pragma(conn, 'freelist_count')} of {freelist_before} free pages left"
+        if _pragma(conn, "journal_mode") == "wal":
+            # The file only shrinks once the WAL is checkpointed into it
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        pages_after = _pragma(conn, "page_count")
+    return Report("vacuum", path, time.perf_counter() - started, pages_before - pages_after, page_size, detail)
+
+def analyze(engine: Engine, analysis_limit: int = DEFAULT_ANALYSIS_LIMIT) -> Report:
+    """Refresh the query planner's statistics, sampling at most analysis_limit rows per index.
+
+    PRAGMA optimize would pick the tables itself, but before SQLite 3.46 it
+    only considers queries run on the connection it is called on, which for
+    a fresh one is none; a bounded ANALYZE costs about the same.
+    """
+    path = database_path(engine)
+    started = time.perf_counter()
+    with closing(_connect(path)) as conn:
+        conn.execute(f"PRAGMA analysis_limit={int(analysis_limit)}")
+        conn.execute("ANALYZE")
+        indexes = conn.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0]
+        page_size = _pragma(conn, "page_size")
+    return Report("analyze", path, time.perf_counter() - started, page_size=page_size,
+                  detail=f"statistics for {indexes} indexes" + (f", {analysis_limit} rows sampled per index" if analysis_limit else ""))
+
+def delete_untitled_sessions(db: Session, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Delete sessions with an empty title, their interruptions and their events.
+
+    Each batch is three set-based DELETEs over one list of ids, committed
+    on its own, so no transaction holds the writer for long. Such sessions
+    predate title validation; daily rollups keep any they were counted in.
+    """
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.query(models.Session.id).filter(models.Session.title == "").limit(batch_size)]
+        if not ids:
+            return deleted
+        db.query(models.Interruption).filter(models.Interruption.session_id.in_(ids)).delete(synchronize_session=False)
+        db.query(models.SessionEvent).filter(models.SessionEvent.session_id.in_(ids)).delete(synchronize_session=False)
+        db.query(models.Session).filter(models.Session.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+
+def _free_pages(path: str) -> int:
+    with closing(_connect(path)) as conn:
+        return _pragma(conn, "freelist_count")
+
+def cleanup(db: Session, batch_size: int = DEFAULT_BATCH_SIZE) -> Report:
+    """delete_untitled_sessions, reporting the pages it freed for vacuum to return"""
+    engine = db.get_bind()
+    try:
+        path = database_path(engine)
+    except MaintenanceError:
+        path = None  # PostgreSQL reuses the space once autovacuum has been
+    started = time.perf_counter()
+    free_before = _free_pages(path) if path else 0
+    deleted = delete_untitled_sessions(db, batch_size)
+    detail = f"deleted {deleted} sessions with empty titles"
+    if path:
+        detail += f", {_free_pages(path) - free_before} pages freed for vacuum"
+    return Report("cleanup", path or engine.url.render_as_string(), time.perf_counter() - started, detail=detail)
+
+def _engines(session_factories: Sequence[Callable[[], Session]]) -> List[Engine]:
+    engines = []
+    for factory in session_factories:
+        db = factory()
+        engines.append(db.get_bind())
+        db.close()
+    return engines
+
+def run_scheduled(session_factories: Sequence[Callable[[], Session]], config: MaintenanceConfig) -> int:
+    """ANALYZE and a bounded incremental vacuum of each SQLite database; returns pages reclaimed.
+
+    Other databases are skipped: PostgreSQL's autovacuum does both.
+    """
+    reclaimed = 0
+    for engine in _engines(session_factories):
+        try:
+            database_path(engine)
+        except MaintenanceError:
+            continue
+        analyze(engine)
+        if auto_vacuum_mode(engine) == "incremental":
+            reclaimed += vacuum(engine, max_pages=config.vacuum_pages).pages_reclaimed
+    return reclaimed
+
+class Maintainer:
+    """Runs run_scheduled periodically on the event loop's default executor"""
+
+    def __init__(self, session_factory: Union[Callable[[], Session], Sequence[Callable[[], Session]]], config: Optional[MaintenanceConfig] = None):
+        self.session_factories = list(session_factory) if isinstance(session_factory, (list, tuple)) else [session_factory]
+        self.config = config or MaintenanceConfig()
+        self.metrics = MaintenanceMetrics()
+        self._task: Optional[asyncio.Task] = None
+        self._leader = LeaderLock(self.config.lock_file)
+
+    async def run_once(self) -> int:
+        """Maintain the databases once off the event loop and record metrics"""
+        self.metrics.leader = self._leader.acquire()
+        if not self.metrics.leader:
+            return 0
+        started = time.perf_counter()
+        try:
+            reclaimed = await asyncio.get_running_loop().run_in_executor(
+                None, run_scheduled, self.session_factories, self.config
+            )
+        except Exception:
+            self.metrics.errors += 1
+            logger.exception("Scheduled database maintenance failed")
+            return 0
+        finally:
+            self.metrics.runs += 1
+            self.metrics.last_run_at = datetime.now()
+            self.metrics.last_run_seconds = time.perf_counter() - started
+
+        self.metrics.last_pages_reclaimed = reclaimed
+        self.metrics.pages_reclaimed_total += reclaimed
+        if reclaimed:
+            logger.info("Database maintenance reclaimed %d pages", reclaimed)
+        return reclaimed
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.config.interval_seconds)
+            await self.run_once()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader.release()
+
+def _destination(destination: str, shard: int, shards: int) -> str:
+    """One file per shard: backup.db becomes backup.0.db, backup.1.db, ..."""
+    if shards == 1:
+        return destination
+    root, extension = os.path.splitext(destination)
+    return f"{root}.{shard}{extension}"
+
+def main(argv: Optional[list] = None):
+    from sqlalchemy.orm import sessionmaker
+    from .database import get_database_url, make_engine
+    from .sharding import ShardConfig
+
+    parser = argparse.ArgumentParser(description="Back up, compact and clean up the SQLite database")
+    parser.add_argument("--url", action="append",
+                        help="Database to maintain, repeatable (default: every shard when sharded, otherwise DATABASE_URL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("backup", help="Copy the live database with the online backup API")
+    command.add_argument("destination")
+    command.add_argument("--pages", type=int, default=DEFAULT_BACKUP_PAGES, help="Pages per step in rollback journal mode")
+    command.add_argument("--sleep", type=float, default=DEFAULT_BACKUP_SLEEP, help="Seconds between steps")
+    command = commands.add_parser("snapshot", help="Write a compacted copy with VACUUM INTO")
+    command.add_argument("destination")
+    command = commands.add_parser("vacuum", help="Return free pages to the file system with incremental_vacuum")
+    command.add_argument("--max-pages", type=int, help="Stop after this many pages (default: all of them)")
+    command.add_argument("--step", type=int, default=DEFAULT_VACUUM_STEP, help="Pages per transaction")
+    command.add_argument("--enable-incremental", action="store_true",
+                         help="Switch a database without auto_vacuum=INCREMENTAL over, with a full VACUUM")
+    command = commands.add_parser("analyze", help="Refresh the query planner's statistics")
+    command.add_argument("--analysis-limit", type=int, default=DEFAULT_ANALYSIS_LIMIT,
+                         help="Rows sampled per index; 0 reads every row")
+    command = commands.add_parser("cleanup", help="Delete sessions with empty titles in batches")
+    command.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    shard_config = ShardConfig.from_env()
+    urls = args.url or (shard_config.urls() if shard_config.enabled else [get_database_url()])
+    for shard, url in enumerate(urls):
+        engine = make_engine(url)
+        try:
+            if args.command == "backup":
+                report = backup(engine, _destination(args.destination, shard, len(urls)), args.pages, args.sleep)
+            elif args.command == "snapshot":
+                report = snapshot(engine, _destination(args.destination, shard, len(urls)))
+            elif args.command == "vacuum":
+                report = vacuum(engine, args.max_pages, args.step, args.enable_incremental)
+            elif args.command == "analyze":
+                report = analyze(engine, args.analysis_limit)
+            else:
+                db = sessionmaker(bind=engine)()
+                try:
+                    report = cleanup(db, args.batch_size)
+                finally:
+                    db.close()
+        except MaintenanceError as error:
+            parser.error(str(error))
+        finally:
+            engine.dispose()
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import inspect, make_url, text
+
+from . import models
+from .database import get_database_url, make_engine, normalize_url
+from .sharding import ShardConfig
+
+try:
+    import fcntl
+except ImportError:  # Windows: migrations are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held while a database is migrated
+ADVISORY_LOCK_KEY = zlib.crc32(b"deepwork.migrations")
+
+# Tables of revision 001, which the first release built with create_all and no migration history
+BASELINE_SCHEMA = {
+    "sessions": {"id", "title", "goal", "scheduled_duration", "start_time", "end_time", "status", "created_at"},
+    "interruptions": {"id", "session_id", "reason", "pause_time"},
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def alembic_config(url: str) -> Config:
+    """Alembic config for a database URL.
+
+    No ini file is loaded, so running migrations inside the app does not
+    reconfigure the server's logging.
+    """
+    config = Config()
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    config.set_main_option("sqlalchemy.url", normalize_url(url).replace("%", "%%"))
+    return config
+
+def _declared(name, type_, parent_names) -> bool:
+    """Leave out of schema comparisons the indexes the models create with DDL rather than declare"""
+    return not (type_ == "index" and name in models.POSTGRES_ONLY_INDEXES)
+
+def _is_baseline(conn, tables: set) -> bool:
+    """Whether an unversioned database has exactly the tables and columns of revision 001"""
+    inspector = inspect(conn)
+    return tables == set(BASELINE_SCHEMA) and all(
+        {column["name"] for column in inspector.get_columns(table)} == columns
+        for table, columns in BASELINE_SCHEMA.items()
+    )
+
+@contextmanager
+def migration_lock(url: str):
+    """Hold a lock that serializes migrations of one database across processes.
+
+    PostgreSQL uses a session advisory lock, so processes on other hosts
+    wait too. A SQLite file uses an exclusive flock on a file next to it.
+    In-memory databases are not locked.
+    """
+    url = normalize_url(url)
+    if url.startswith("postgresql"):
+        engine = make_engine(url)
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                conn.commit()
+                try:
+                    yield
+                finally:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                    conn.commit()
+        finally:
+            engine.dispose()
+        return
+    database = make_url(url).database if url.startswith("sqlite") else None
+    if fcntl is None or not database or database == ":memory:" or database.startswith("file:"):
+        yield
+        return
+    with open(f"{database}.migrate.lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)  # blocks until the migrating process is done
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+def upgrade(url: str, revision: str = "head"):
+    """Migrate a database to the given revision.
+
+    Databases created by create_all before migrations ran at startup have no
+    alembic_version table. If their schema matches the models they are
+    stamped at head; if it is the first release's (revision 001) they are
+    stamped there and migrated, keeping their rows. New SQLite
+    files get auto_vacuum=INCREMENTAL, which can only be chosen before the
+    first table, so maintenance.vacuum can return free pages in small steps.
+    """
+    engine = make_engine(url)
+    try:
+        with engine.connect() as conn:
+            tables = set(inspect(conn).get_table_names())
+            if not tables and conn.dialect.name == "sqlite":
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            adopt = None
+            if tables and "alembic_version" not in tables:
+                if not compare_metadata(MigrationContext.configure(conn, opts={"include_name": _declared}), models.Base.metadata):
+                    adopt = "head"
+                elif _is_baseline(conn, tables):
+                    adopt = "001"
+                else:
+                    raise RuntimeError(
+                        f"{url} has tables but no migration history, and they differ from the models; "
+                        "run `alembic stamp <revision>` for the schema it has, then start again"
+                    )
+    finally:
+        engine.dispose()
+
+    config = alembic_config(url)
+    if adopt:
+        logger.warning("Stamping unversioned database %s at %s", url, adopt)
+        command.stamp(config, adopt)
+    if adopt != "head":
+        command.upgrade(config, revision)
+
+def upgrade_all(revision: str = "head"):
+    """Migrate every database the app uses: each shard when sharded, otherwise DATABASE_URL.
+
+    Each database is migrated under migration_lock, so workers that all
+    migrate on startup take turns, and the later ones find it at head.
+    """
+    shard_config = ShardConfig.from_env()
+    for url in shard_config.urls() if shard_config.enabled else [get_database_url()]:
+        with migration_lock(url):
+            upgrade(url, revision)
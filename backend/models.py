@@ -1,30 +1,181 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Text
+from sqlalchemy import DDL, Column, Integer, String, DateTime, Float, ForeignKey, Index, JSON, LargeBinary, Text, event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql.functions import FunctionElement
 from .database import Base
 
+# CURRENT_TIMESTAMP stores whole seconds; bind values in the same text format
+# so comparisons and replayed rows on SQLite match what the database wrote
+ServerTimestamp = DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
+
+class server_now(FunctionElement):
+    """The database's current time as SQLite's CURRENT_TIMESTAMP gives it: UTC, whole seconds"""
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(server_now)
+def _server_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+@compiles(server_now, "postgresql")
+def _server_now_postgresql(element, compiler, **kw):
+    # Same values on both backends, so status rules comparing them behave alike
+    return "date_trunc('second', now() AT TIME ZONE 'utc')"
+
 class Session(Base):
     __tablename__ = "sessions"
     
     id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, nullable=False, default=0, server_default="0")
     title = Column(String(255), nullable=False)
     goal = Column(Text, nullable=False)
     scheduled_duration = Column(Float, nullable=False)  # in minutes
     start_time = Column(DateTime, nullable=True)
     end_time = Column(DateTime, nullable=True)
     status = Column(String(50), default="planned")  # planned, active, paused, completed, interrupted, overdue, abandoned
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(ServerTimestamp, default=server_now())
+    
+    # Denormalized from interruptions, maintained by crud in the same transaction
+    interruption_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_pause_time = Column(ServerTimestamp, nullable=True)
+    actual_duration_minutes = Column(Float, nullable=True)  # set on completion
+    last_event_id = Column(Integer, nullable=True)  # newest session_events row applied to this row
     
     # Relationship to interruptions
     interruptions = relationship("Interruption", back_populates="session", cascade="all, delete-orphan")
+    
+    # Reads are scoped by owner, so every listing filter / sort key index
+    # (see crud.list_sessions) leads on owner_id
+    __table_args__ = (
+        Index("ix_sessions_owner_status_created_at", "owner_id", "status", "created_at"),
+        Index("ix_sessions_owner_created_at", "owner_id", "created_at"),
+        Index("ix_sessions_owner_title", "owner_id", "title"),
+        Index("ix_sessions_owner_actual_duration_minutes", "owner_id", "actual_duration_minutes"),
+        # Stale session lookups by the background sweeper, across owners
+        Index("ix_sessions_status_start_time", "status", "start_time"),
+        # Archiving deletes rows, whose ids must not be handed out again
+        {"sqlite_autoincrement": True},
+    )
+
+# Title prefixes are matched as ranges in code point order (crud.list_sessions),
+# which PostgreSQL only indexes with the "C" collation
+POSTGRES_ONLY_INDEXES = ("ix_sessions_owner_title_c",)
+event.listen(
+    Session.__table__,
+    "after_create",
+    DDL('CREATE INDEX ix_sessions_owner_title_c ON sessions (owner_id, title COLLATE "C")').execute_if(dialect="postgresql"),
+)
 
 class Interruption(Base):
     __tablename__ = "interruptions"
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False)
+    owner_id = Column(Integer, nullable=False, default=0, server_default="0")  # copied from the session
     reason = Column(Text, nullable=False)
-    pause_time = Column(DateTime, default=func.now())
+    pause_time = Column(ServerTimestamp, default=server_now())
     
     # Relationship back to session
     session = relationship("Session", back_populates="interruptions")
+    
+    __table_args__ = (
+        Index("ix_interruptions_owner_session_id", "owner_id", "session_id"),
+        {"sqlite_autoincrement": True},
+    )
+
+class SessionEvent(Base):
+    """Append-only log of session transitions; sessions can be rebuilt from it"""
+    __tablename__ = "session_events"
+    
+    id = Column(Integer, primary_key=True)  # global replay order
+    session_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, nullable=False, default=0, server_default="0")
+    event_type = Column(String(20), nullable=False)  # created, started, paused, resumed, completed
+    occurred_at = Column(DateTime, nullable=False)
+    reason = Column(Text, nullable=True)
+    payload = Column(JSON, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_session_events_session_id", "session_id", "id"),
+        # Ids are never reused, so checkpoints stay valid
+        {"sqlite_autoincrement": True},
+    )
+
+class ProjectionCheckpoint(Base):
+    """Last session_events id folded into a projection"""
+    __tablename__ = "projection_checkpoints"
+    
+    name = Column(String(50), primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+
+class SessionDailyRollup(Base):
+    """Per-owner, per-day, per-final-status totals projected from completed events"""
+    __tablename__ = "session_daily_rollups"
+    
+    owner_id = Column(Integer, primary_key=True, default=0)
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD of the completion
+    status = Column(String(50), primary_key=True)
+    sessions = Column(Integer, nullable=False, default=0)
+    interruptions = Column(Integer, nullable=False, default=0)
+    productive_minutes = Column(Float, nullable=False, default=0.0)
+    # sketches.DDSketch of each session's duration, overrun ratio and interruptions,
+    # merged across days, owners and shards for percentiles
+    duration_sketch = Column(JSON, nullable=True)
+    overrun_sketch = Column(JSON, nullable=True)
+    interruptions_sketch = Column(JSON, nullable=True)
+
+class SessionArchive(Base):
+    """Finished sessions of one owner and month, moved out of the hot tables by one archive batch"""
+    __tablename__ = "session_archives"
+    
+    owner_id = Column(Integer, primary_key=True, default=0)
+    month = Column(String(7), primary_key=True)  # YYYY-MM of created_at
+    seq = Column(Integer, primary_key=True, default=0)  # later batches add chunks rather than rewrite one
+    
+    # Totals of the archived sessions, so history statistics need not unpack them
+    session_count = Column(Integer, nullable=False, default=0)
+    completed_sessions = Column(Integer, nullable=False, default=0)
+    interrupted_sessions = Column(Integer, nullable=False, default=0)
+    overdue_sessions = Column(Integer, nullable=False, default=0)
+    abandoned_sessions = Column(Integer, nullable=False, default=0)
+    total_interruptions = Column(Integer, nullable=False, default=0)
+    productive_minutes = Column(Float, nullable=False, default=0.0)
+    
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON list of sessions with interruptions
+
+class ArchivedSession(Base):
+    """Archive chunk holding a session, so projections skip its logged events without unpacking archives"""
+    __tablename__ = "archived_sessions"
+    
+    id = Column(Integer, primary_key=True)  # the session's id
+    owner_id = Column(Integer, nullable=False, default=0)
+    month = Column(String(7), nullable=False)
+    seq = Column(Integer, nullable=False)
+
+class IdempotencyKey(Base):
+    """Response of a mutation sent with an Idempotency-Key, replayed when the client retries"""
+    __tablename__ = "idempotency_keys"
+    
+    owner_id = Column(Integer, primary_key=True, default=0)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of method, path and body
+    response = Column(Text, nullable=False)  # JSON body as first sent
+    expires_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        # Expired keys are deleted oldest first
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+class ImportCheckpoint(Base):
+    """Progress of a named bulk import, committed with each chunk so a rerun resumes after it"""
+    __tablename__ = "import_checkpoints"
+    
+    owner_id = Column(Integer, primary_key=True, default=0)
+    name = Column(String(255), primary_key=True)
+    rows_read = Column(Integer, nullable=False, default=0)  # input records consumed, rejected ones included
+    sessions_imported = Column(Integer, nullable=False, default=0)
+    interruptions_imported = Column(Integer, nullable=False, default=0)
+    rows_rejected = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import DDL, JSON, Table, column, event, func, select, table, text
+from sqlalchemy.orm import Session
+
+from .database import Base, get_engine
+
+# History statistics per owner, read instead of aggregating the sessions table
+STATS_VIEW = "session_history_stats"
+STATS_COLUMNS = (
+    "total_sessions",
+    "completed_sessions",
+    "interrupted_sessions",
+    "overdue_sessions",
+    "abandoned_sessions",
+    "total_productive_time",
+    "total_interruptions",
+)
+
+CREATE_STATS_VIEW = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS {STATS_VIEW} AS
+SELECT
+    owner_id,
+    count(*) AS total_sessions,
+    count(*) FILTER (WHERE status = 'completed') AS completed_sessions,
+    count(*) FILTER (WHERE status = 'interrupted') AS interrupted_sessions,
+    count(*) FILTER (WHERE status = 'overdue') AS overdue_sessions,
+    count(*) FILTER (WHERE status = 'abandoned') AS abandoned_sessions,
+    coalesce(sum(actual_duration_minutes) FILTER (WHERE status = 'completed'), 0) AS total_productive_time,
+    coalesce(sum(interruption_count), 0) AS total_interruptions
+FROM sessions
+GROUP BY owner_id
+"""
+# REFRESH ... CONCURRENTLY needs a unique index on the view
+CREATE_STATS_VIEW_INDEX = f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{STATS_VIEW}_owner_id ON {STATS_VIEW} (owner_id)"
+DROP_STATS_VIEW = f"DROP MATERIALIZED VIEW IF EXISTS {STATS_VIEW}"
+
+# Schemas made with create_all (tests, new shards) get the view too; migration 008 creates it otherwise
+for statement in (CREATE_STATS_VIEW, CREATE_STATS_VIEW_INDEX):
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+event.listen(Base.metadata, "before_drop", DDL(DROP_STATS_VIEW).execute_if(dialect="postgresql"))
+
+stats_view = table(STATS_VIEW, column("owner_id"), *[column(name) for name in STATS_COLUMNS])
+
+@dataclass
+class StatsViewConfig:
+    """How stale the history stats view may be before a read refreshes it"""
+    max_age_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from STATS_VIEW_* environment variables"""
+        defaults = cls()
+        return cls(max_age_seconds=float(os.getenv("STATS_VIEW_MAX_AGE_SECONDS", defaults.max_age_seconds)))
+
+_config: Optional[StatsViewConfig] = None
+_refreshed_at: Dict[str, float] = {}
+_refresh_lock = threading.Lock()
+
+def is_postgres(db) -> bool:
+    """Whether a session, connection or engine talks to PostgreSQL"""
+    bind = db.get_bind() if isinstance(db, Session) else db
+    return bind.dialect.name == "postgresql"
+
+def _driver_connection(db: Session):
+    """psycopg connection running the session's transaction"""
+    return db.connection().connection.driver_connection
+
+def refresh_stats_view(db: Session, max_age: Optional[float] = None):
+    """Refresh the stats view if this process has not done so within max_age seconds.
+
+    The refresh runs CONCURRENTLY, so readers keep using the old contents
+    meanwhile, and on its own autocommit connection, so it is kept even when
+    the caller's transaction is rolled back. Sessions on a read-only replica
+    refresh the primary's view and see the result once it has replicated.
+    """
+    global _config
+    if max_age is None:
+        _config = _config or StatsViewConfig.from_env()
+        max_age = _config.max_age_seconds
+    engine = get_engine() if db.info.get("read_only") else db.get_bind()
+    key = engine.url.render_as_string()
+    with _refresh_lock:
+        if time.monotonic() - _refreshed_at.get(key, float("-inf")) < max_age:
+            return
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {STATS_VIEW}"))
+        _refreshed_at[key] = time.monotonic()
+
+def history_stats(db: Session, owner_id: Optional[int] = None) -> dict:
+    """History statistics from the materialized view, summed over owners unless one is given"""
+    refresh_stats_view(db)
+    query = select(*[func.coalesce(func.sum(stats_view.c[name]), 0) for name in STATS_COLUMNS])
+    if owner_id is not None:
+        query = query.where(stats_view.c.owner_id == owner_id)
+    row = db.execute(query).one()
+    return {
+        name: float(value) if name == "total_productive_time" else int(value)
+        for name, value in zip(STATS_COLUMNS, row)
+    }
+
+def copy_rows(db: Session, target: Table, rows: List[dict]):
+    """Load rows with COPY FROM STDIN inside the session's transaction"""
+    columns = list(rows[0])
+    json_columns = {name for name in columns if isinstance(target.c[name].type, JSON)}
+    statement = f"COPY {target.name} ({', '.join(columns)}) FROM STDIN"
+    with _driver_connection(db).cursor() as cursor:
+        with cursor.copy(statement) as copy:
+            for row in rows:
+                copy.write_row([
+                    json.dumps(row[name]) if name in json_columns and row[name] is not None else row[name]
+                    for name in columns
+                ])
+
+def sync_sequences(db: Session, *tables: Table):
+    """Move id sequences past rows inserted with explicit ids (replays, projections).
+
+    Never moves one back: ids of archived, deleted rows stay used.
+    """
+    db.flush()
+    for target in tables:
+        sequence = f"pg_get_serial_sequence('{target.name}', 'id')"
+        db.execute(text(
+            f"SELECT setval({sequence}, greatest(coalesce((SELECT max(id) FROM {target.name}), 0), "
+            f"coalesce(pg_sequence_last_value({sequence}::regclass), 0)) + 1, false)"
+        ))
+
+def next_ids(db: Session, target: Table, count: int) -> List[int]:
+    """Draw ids from a table's sequence for rows that are linked before they are inserted"""
+    return list(db.execute(
+        text(f"SELECT nextval(pg_get_serial_sequence('{target.name}', 'id')) FROM generate_series(1, :count)"),
+        {"count": count},
+    ).scalars())
+
+def _iso(value: str) -> str:
+    """SQL rendering a timestamp the way pydantic does: ISO 8601, microseconds only when non-zero"""
+    return (
+        f"to_char({value}, CASE WHEN date_trunc('second', {value}) = {value} "
+        f"THEN 'YYYY-MM-DD\"T\"HH24:MI:SS' ELSE 'YYYY-MM-DD\"T\"HH24:MI:SS.US' END)"
+    )
+
+# Keys in schemas.Session / schemas.Interruption field order
+EXPORT_SESSIONS = f"""
+COPY (
+    SELECT json_build_object(
+        'title', s.title, 'goal', s.goal, 'scheduled_duration', s.scheduled_duration,
+        'id', s.id, 'owner_id', s.owner_id, 'start_time', {_iso("s.start_time")}, 'end_time', {_iso("s.end_time")},
+        'status', s.status, 'created_at', {_iso("s.created_at")}, 'interruption_count', s.interruption_count,
+        'last_pause_time', {_iso("s.last_pause_time")}, 'actual_duration_minutes', s.actual_duration_minutes,
+        'interruptions', coalesce((
+            SELECT json_agg(json_build_object(
+                'reason', i.reason, 'id', i.id, 'session_id', i.session_id, 'pause_time', {_iso("i.pause_time")}
+            ) ORDER BY i.id)
+            FROM interruptions i
+            WHERE i.owner_id = s.owner_id AND i.session_id = s.id
+        ), '[]')
+    )
+    FROM sessions s
+    WHERE {{where}}
+    ORDER BY s.created_at, s.id
+) TO STDOUT WITH (FORMAT csv, DELIMITER E'\\x02', QUOTE E'\\x01')
+"""
+# CSV with control characters as delimiter and quote writes each JSON document
+# verbatim: JSON escapes those characters, so no value ever needs quoting
+
+def copy_sessions_out(db: Session, owner_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> Iterator[str]:
+    """Hot sessions in the created_at range as JSON lines, oldest first, streamed with COPY TO STDOUT"""
+    where, params = ["true"], []
+    if owner_id is not None:
+        where.append("s.owner_id = %s")
+        params.append(owner_id)
+    if created_from is not None:
+        where.append("s.created_at >= %s")
+        params.append(created_from)
+    if created_to is not None:
+        where.append("s.created_at < %s")
+        params.append(created_to)
+    with _driver_connection(db).cursor() as cursor:
+        with cursor.copy(EXPORT_SESSIONS.format(where=" AND ".join(where)), params) as copy:
+            for data in copy:
+                yield bytes(data).decode()
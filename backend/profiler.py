@@ -0,0 +1,299 @@
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_INTERVAL = 0.01  # seconds between stack samples
+DEFAULT_TRACEMALLOC_FRAMES = 1  # enough for group_by=lineno; tracebacks need more, and cost more
+
+# Leaf frames of threads that are blocked waiting for work, not running
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+# tracemalloc's own bookkeeping and the import system are noise in a diff
+IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+class ProfilerError(RuntimeError):
+    """The profiler cannot do this now, e.g. a profile is already running"""
+
+@dataclass
+class ProfilerConfig:
+    """Admin-only sampling profiler and tracemalloc; disabled until ADMIN_TOKEN is set"""
+    admin_token: Optional[str] = None
+    max_seconds: float = 60.0  # longest profile one request may ask for
+    tracemalloc_frames: int = DEFAULT_TRACEMALLOC_FRAMES
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.admin_token)
+
+    @classmethod
+    def from_env(cls):
+        """Read ADMIN_TOKEN and overrides from PROFILER_* environment variables"""
+        defaults = cls()
+        return cls(
+            admin_token=os.getenv("ADMIN_TOKEN") or None,
+            max_seconds=float(os.getenv("PROFILER_MAX_SECONDS", defaults.max_seconds)),
+            tracemalloc_frames=int(os.getenv("PROFILER_TRACEMALLOC_FRAMES", defaults.tracemalloc_frames)),
+        )
+
+@dataclass
+class ProfilerMetrics:
+    """Counters exposed on /metrics"""
+    profiles: int = 0
+    samples: int = 0
+    sampling_seconds: float = 0.0  # time the sampler thread held the GIL walking stacks
+    rejected: int = 0  # profiles refused because another was running
+    snapshots: int = 0
+
+    def as_dict(self):
+        return {
+            "profiles": self.profiles,
+            "samples": self.samples,
+            "sampling_seconds": round(self.sampling_seconds, 3),
+            "rejected": self.rejected,
+            "snapshots": self.snapshots,
+            "tracing": tracemalloc.is_tracing(),
+        }
+
+@lru_cache(maxsize=4096)
+def short_path(filename: str) -> str:
+    """filename relative to the sys.path entry it was imported from"""
+    roots = sorted((os.path.join(path, "") for path in sys.path if path), key=len, reverse=True)
+    for root in roots:
+        if filename.startswith(root):
+            return filename[len(root):]
+    return filename
+
+Frame = Tuple[str, str, int]  # function, file, first line
+
+@dataclass
+class Profile:
+    """Sampled stacks of every thread, root frame first, with how often each was seen"""
+    interval: float
+    duration: float
+    samples: int
+    frames: List[Frame]
+    stacks: Counter = field(default_factory=Counter)  # (thread name, frame indexes) -> samples
+    sampling_seconds: float = 0.0
+
+    def collapsed(self) -> str:
+        """One `thread;outer;...;inner count` line per stack, as flamegraph.pl and speedscope read"""
+        lines = []
+        for (thread, stack), count in self.stacks.most_common():
+            names = [f"{name} ({path}:{line})" for name, path, line in (self.frames[i] for i in stack)]
+            lines.append(";".join([thread, *names]) + f" {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def speedscope(self, name: str = "deepwork") -> dict:
+        """Speedscope file format: one sampled profile per thread, weighted in milliseconds"""
+        threads: Dict[str, List[Tuple[Tuple[int, ...], int]]] = {}
+        for (thread, stack), count in self.stacks.items():
+            threads.setdefault(thread, []).append((stack, count))
+        interval_ms = self.interval * 1000
+        profiles = []
+        for thread, stacks in sorted(threads.items(), key=lambda item: -sum(count for _, count in item[1])):
+            weights = [count * interval_ms for _, count in stacks]
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [list(stack) for stack, _ in stacks],
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "deepwork-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": function, "file": path, "line": line} for function, path, line in self.frames]},
+            "profiles": profiles,
+        }
+
+class StackSampler:
+    """Samples the Python stack of every other thread on a timer, from a thread of its own.
+
+    sys._current_frames() is one dict copy under the GIL, so each sample
+    costs the stack walk and nothing in the sampled threads: no tracing hook
+    and no signal. Samples whose innermost frame is a wait for work are
+    dropped unless idle is set, so parked threadpool workers do not bury the
+    ones handling requests.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, idle: bool = False):
+        self.interval = interval
+        self.idle = idle
+        self.stacks: Counter = Counter()
+        self.frames: List[Frame] = []
+        self._frame_ids: Dict[object, int] = {}
+        self._idle_codes: Dict[object, bool] = {}
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler sampler", daemon=True)
+        self._started = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        self._thread.join()
+        return Profile(
+            interval=self.interval,
+            duration=time.perf_counter() - self._started,
+            samples=self.samples,
+            frames=self.frames,
+            stacks=self.stacks,
+            sampling_seconds=self.sampling_seconds,
+        )
+
+    def _frame_id(self, code) -> int:
+        frame_id = self._frame_ids.get(code)
+        if frame_id is None:
+            frame_id = self._frame_ids[code] = len(self.frames)
+            # co_qualname (Class.method) is new in Python 3.11
+            name = getattr(code, "co_qualname", code.co_name)
+            self.frames.append((name, short_path(code.co_filename), code.co_firstlineno))
+        return frame_id
+
+    def _is_idle(self, code) -> bool:
+        idle = self._idle_codes.get(code)
+        if idle is None:
+            idle = self._idle_codes[code] = (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+        return idle
+
+    def sample(self):
+        """Record the current stack of every thread but this one"""
+        started = time.perf_counter()
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (not self.idle and self._is_idle(frame.f_code)):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[(names.get(ident, f"thread {ident}"), tuple(stack))] += 1
+        self.samples += 1
+        self.sampling_seconds += time.perf_counter() - started
+
+    def _run(self):
+        next_at = time.perf_counter()
+        while not self._stop.wait(max(0.0, next_at - time.perf_counter())):
+            self.sample()
+            # After a stall, carry on from now rather than sampling in a burst
+            next_at = max(next_at + self.interval, time.perf_counter())
+
+class Profiler:
+    """One process's profiling state: a single running profile, and tracemalloc snapshots to diff against"""
+
+    def __init__(self, config: Optional[ProfilerConfig] = None):
+        self.config = config or ProfilerConfig()
+        self.metrics = ProfilerMetrics()
+        self._profiling = threading.Lock()
+        self._memory = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_at: Optional[float] = None
+        self._started_tracing = False
+
+    def authorize(self, token: Optional[str]) -> bool:
+        return self.config.enabled and hmac.compare_digest((token or "").encode(), self.config.admin_token.encode())
+
+    async def profile(self, seconds: float, interval: float = DEFAULT_INTERVAL, idle: bool = False) -> Profile:
+        """Sample every thread for seconds while the event loop keeps serving requests"""
+        if not self._profiling.acquire(blocking=False):
+            self.metrics.rejected += 1
+            raise ProfilerError("A profile is already running in this process")
+        try:
+            sampler = StackSampler(interval, idle)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile = sampler.stop()
+        finally:
+            self._profiling.release()
+        self.metrics.profiles += 1
+        self.metrics.samples += profile.samples
+        self.metrics.sampling_seconds += profile.sampling_seconds
+        return profile
+
+    def start_tracing(self, frames: Optional[int] = None) -> dict:
+        """Start tracemalloc if needed and take the baseline the next snapshot is compared with"""
+        with self._memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames or self.config.tracemalloc_frames)
+                self._started_tracing = True
+            self._set_baseline(tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES))
+            return self._usage()
+
+    def snapshot(self, limit: int = 20, group_by: str = "lineno") -> dict:
+        """Largest allocations now, or their change since the previous snapshot, which this one replaces"""
+        with self._memory:
+            if not tracemalloc.is_tracing():
+                raise ProfilerError("tracemalloc is not tracing; start it first")
+            snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+            since = time.monotonic() - self._baseline_at if self._baseline is not None else None
+            if self._baseline is not None:
+                statistics = snapshot.compare_to(self._baseline, group_by)
+            else:
+                statistics = snapshot.statistics(group_by)
+            self._set_baseline(snapshot)
+            self.metrics.snapshots += 1
+            top = [{
+                "traceback": [f"{short_path(frame.filename)}:{frame.lineno}" for frame in statistic.traceback],
+                "size_bytes": statistic.size,
+                "count": statistic.count,
+                "size_diff_bytes": getattr(statistic, "size_diff", None),
+                "count_diff": getattr(statistic, "count_diff", None),
+            } for statistic in statistics[:limit]]
+            return {**self._usage(), "seconds_since_previous": since, "group_by": group_by, "top": top}
+
+    def stop_tracing(self) -> dict:
+        """Drop the baseline, and stop tracemalloc if it was started here"""
+        with self._memory:
+            usage = self._usage()
+            self._baseline = self._baseline_at = None
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+            return usage
+
+    def close(self):
+        self.stop_tracing()
+
+    def _set_baseline(self, snapshot: tracemalloc.Snapshot):
+        self._baseline = snapshot
+        self._baseline_at = time.monotonic()
+
+    def _usage(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else 0,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "tracemalloc_bytes": tracemalloc.get_tracemalloc_memory(),
+        }
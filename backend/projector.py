@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Union
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import archive, crud, models, postgres, sweeper
+from .sketches import DDSketch
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = "sessions"
+ROLLUPS = "rollups"
+
+def get_checkpoint(db: Session, name: str) -> int:
+    checkpoint = db.get(models.ProjectionCheckpoint, name)
+    return checkpoint.last_event_id if checkpoint else 0
+
+def set_checkpoint(db: Session, name: str, last_event_id: int):
+    checkpoint = db.get(models.ProjectionCheckpoint, name)
+    if checkpoint is None:
+        checkpoint = models.ProjectionCheckpoint(name=name)
+        db.add(checkpoint)
+        db.flush()
+    checkpoint.last_event_id = last_event_id
+
+def lock_checkpoint(db: Session, name: str) -> models.ProjectionCheckpoint:
+    """The projection's checkpoint, read under the lock that serializes its catch-ups.
+
+    On SQLite that is the write lock (BEGIN IMMEDIATE), on PostgreSQL a row
+    lock on the checkpoint, which is created first if missing. Either is held
+    until the caller commits or rolls back.
+    """
+    crud.begin_write(db)
+    if postgres.is_postgres(db):
+        db.execute(pg_insert(models.ProjectionCheckpoint).values(name=name, last_event_id=0).on_conflict_do_nothing())
+    checkpoint = (
+        db.query(models.ProjectionCheckpoint)
+        .filter(models.ProjectionCheckpoint.name == name)
+        .with_for_update()
+        .populate_existing()
+        .one_or_none()
+    )
+    if checkpoint is None:
+        checkpoint = models.ProjectionCheckpoint(name=name, last_event_id=0)
+        db.add(checkpoint)
+        db.flush()
+    return checkpoint
+
+def iter_events(db: Session, after: int = 0, batch_size: int = 1000) -> Iterator[models.SessionEvent]:
+    """Events with id > after, in replay order, fetched in keyset pages"""
+    while True:
+        batch = (
+            db.query(models.SessionEvent)
+            .filter(models.SessionEvent.id > after)
+            .order_by(models.SessionEvent.id)
+            .limit(batch_size)
+            .all()
+        )
+        if len(batch) < batch_size:
+            yield from batch
+            return
+        after = batch[-1].id
+        yield from batch
+
+def apply_session_event(db: Session, event: models.SessionEvent):
+    """Fold one event into the sessions and interruptions tables.
+
+    Rows remember the last event applied to them, so replaying an event that
+    is already reflected is a no-op. Events of archived sessions are skipped:
+    the log keeps their history, but their rows stay in the archive.
+    """
+    session = db.get(models.Session, event.session_id)
+    if session is None and archive.is_archived(db, event.session_id):
+        return None
+    if session is not None and (session.last_event_id or 0) >= event.id:
+        return session
+    payload = event.payload or {}
+
+    if event.event_type == "created":
+        session = models.Session(
+            id=event.session_id,
+            owner_id=event.owner_id,
+            title=payload["title"],
+            goal=payload["goal"],
+            scheduled_duration=payload["scheduled_duration"],
+            status="planned",
+            created_at=event.occurred_at,
+            interruption_count=0
+        )
+        db.add(session)
+        db.flush()  # later events look the row up by primary key
+    elif session is None:
+        raise ValueError(f"Event {event.id} refers to unknown session {event.session_id}")
+    elif event.event_type == "started":
+        session.status = "active"
+        session.start_time = event.occurred_at
+    elif event.event_type == "paused":
+        db.add(models.Interruption(
+            id=payload.get("interruption_id"),
+            session_id=session.id,
+            owner_id=session.owner_id,
+            reason=event.reason,
+            pause_time=event.occurred_at
+        ))
+        session.interruption_count = (session.interruption_count or 0) + 1
+        session.last_pause_time = event.occurred_at
+        session.status = "paused"
+    elif event.event_type == "resumed":
+        session.status = "active"
+    elif event.event_type == "completed":
+        crud.finish_session(session, event.occurred_at)
+        # The logged outcome wins if the business rules have changed since
+        session.status = payload.get("status", session.status)
+    else:
+        raise ValueError(f"Unknown event type: {event.event_type}")
+
+    session.last_event_id = event.id
+    return session
+
+def completion_metrics(db: Session, event: models.SessionEvent) -> dict:
+    """Values a completed event adds to each rollup sketch column.
+
+    Events logged before completions carried scheduled_duration take it
+    from the session row, when that is still there.
+    """
+    payload = event.payload or {}
+    duration = payload.get("duration_minutes")
+    scheduled = payload.get("scheduled_duration")
+    if scheduled is None and duration is not None:
+        session = db.get(models.Session, event.session_id)
+        scheduled = session.scheduled_duration if session is not None else None
+    return {
+        "duration_sketch": duration,
+        "overrun_sketch": duration / scheduled if duration is not None and scheduled else None,
+        "interruptions_sketch": payload.get("interruption_count", 0),
+    }
+
+def apply_rollup_event(db: Session, event: models.SessionEvent):
+    """Add a completed event to the daily rollups and their sketches"""
+    if event.event_type != "completed":
+        return
+    payload = event.payload or {}
+    status = payload.get("status", "completed")
+    key = (event.owner_id, event.occurred_at.strftime("%Y-%m-%d"), status)
+    rollup = db.get(models.SessionDailyRollup, key)
+    if rollup is None:
+        rollup = models.SessionDailyRollup(owner_id=event.owner_id, day=key[1], status=status, sessions=0, interruptions=0, productive_minutes=0.0)
+        db.add(rollup)
+        db.flush()
+    rollup.sessions += 1
+    rollup.interruptions += payload.get("interruption_count", 0)
+    if status == "completed":
+        rollup.productive_minutes += payload.get("duration_minutes") or 0.0
+    for column, value in completion_metrics(db, event).items():
+        if value is not None:
+            sketch = DDSketch.from_dict(getattr(rollup, column))
+            sketch.add(value)
+            setattr(rollup, column, sketch.to_dict())
+
+PROJECTIONS = {
+    SESSIONS: apply_session_event,
+    ROLLUPS: apply_rollup_event,
+}
+
+def apply_pending(db: Session, checkpoint: models.ProjectionCheckpoint, limit: Optional[int] = None) -> int:
+    """Fold the events past a locked checkpoint into its projection and advance it; returns how many"""
+    query = (
+        db.query(models.SessionEvent)
+        .filter(models.SessionEvent.id > checkpoint.last_event_id)
+        .order_by(models.SessionEvent.id)
+    )
+    events = (query.limit(limit) if limit else query).all()
+    apply = PROJECTIONS[checkpoint.name]
+    for event in events:
+        apply(db, event)
+    if events:
+        checkpoint.last_event_id = events[-1].id
+    return len(events)
+
+def catch_up(db: Session, name: str, batch_size: int = 1000) -> int:
+    """Apply events past the projection's checkpoint; returns how many were read.
+
+    Each page of events is read after the checkpoint under lock_checkpoint and
+    committed together with the advanced checkpoint. Concurrent catch-ups
+    therefore take turns rather than folding the same events twice, and an
+    interrupted one resumes where it stopped. When nothing is pending, no
+    lock is taken.
+    """
+    pending = db.query(models.SessionEvent.id).filter(models.SessionEvent.id > get_checkpoint(db, name)).first()
+    applied = 0
+    while pending:
+        count = apply_pending(db, lock_checkpoint(db, name), batch_size)
+        applied += count
+        db.commit()
+        pending = count == batch_size
+    if name == SESSIONS and applied and postgres.is_postgres(db):
+        # Projected rows keep the ids from the log, bypassing the sequences
+        postgres.sync_sequences(db, models.Session.__table__, models.Interruption.__table__)
+    db.commit()
+    return applied
+
+def rebuild(db: Session, name: str, batch_size: int = 1000) -> int:
+    """Drop a projection's rows and replay the whole log into it"""
+    checkpoint = lock_checkpoint(db, name)
+    if name == SESSIONS:
+        db.query(models.Interruption).delete()
+        db.query(models.Session).delete()
+    else:
+        db.query(models.SessionDailyRollup).delete()
+    checkpoint.last_event_id = 0
+    db.flush()  # catch_up locks and re-reads the checkpoint
+    return catch_up(db, name, batch_size)
+
+def replay(db: Session, events: Iterable[dict], name: str = SESSIONS, batch_size: int = 1000) -> int:
+    """Append exported events to a database and project them"""
+    count = 0
+    batch = []
+    for event in events:
+        batch.append({**event, "occurred_at": datetime.fromisoformat(event["occurred_at"])})
+        count += 1
+        if len(batch) == batch_size:
+            crud.bulk_insert(db, models.SessionEvent, batch)
+            batch = []
+    crud.bulk_insert(db, models.SessionEvent, batch)
+    if postgres.is_postgres(db):
+        postgres.sync_sequences(db, models.SessionEvent.__table__)
+    db.commit()
+    catch_up(db, name, batch_size)
+    return count
+
+def export_events(db: Session, path: str, after: int = 0) -> int:
+    """Write the event log as JSON lines, a deterministic replay workload"""
+    count = 0
+    with open(path, "w") as f:
+        for event in iter_events(db, after=after):
+            f.write(json.dumps({
+                "id": event.id,
+                "session_id": event.session_id,
+                "owner_id": event.owner_id,
+                "event_type": event.event_type,
+                "occurred_at": event.occurred_at.isoformat(),
+                "reason": event.reason,
+                "payload": event.payload,
+            }) + "\n")
+            count += 1
+    return count
+
+def read_events(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+@dataclass
+class ProjectorConfig:
+    """Pacing of the background catch-up that keeps the rollups current"""
+    enabled: bool = True
+    interval_seconds: float = 5.0
+    batch_size: int = 1000  # events per transaction
+    lock_file: Optional[str] = None  # with several workers, only the holder of this lock projects
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from PROJECTOR_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("PROJECTOR_ENABLED", "1").lower() not in ("0", "false", "no"),
+            interval_seconds=float(os.getenv("PROJECTOR_INTERVAL_SECONDS", defaults.interval_seconds)),
+            batch_size=int(os.getenv("PROJECTOR_BATCH_SIZE", defaults.batch_size)),
+            lock_file=os.getenv("PROJECTOR_LOCK_FILE") or None,
+        )
+
+@dataclass
+class ProjectorMetrics:
+    """Counters exposed on /metrics"""
+    runs: int = 0
+    errors: int = 0
+    events_total: int = 0
+    last_run_at: Optional[datetime] = None
+    last_run_seconds: float = 0.0
+    last_events: int = 0
+    leader: bool = False
+
+    def as_dict(self):
+        return {
+            "leader": self.leader,
+            "runs": self.runs,
+            "errors": self.errors,
+            "events_total": self.events_total,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": self.last_run_seconds,
+            "last_events": self.last_events,
+        }
+
+def project_shards(session_factories: Sequence[Callable[[], Session]], name: str = ROLLUPS, batch_size: int = 1000) -> int:
+    """catch_up over each shard's database; returns the events applied"""
+    applied = 0
+    for session_factory in session_factories:
+        db = session_factory()
+        try:
+            applied += catch_up(db, name, batch_size)
+        finally:
+            db.close()
+    return applied
+
+class Projector:
+    """Catches the rollups up with the event log periodically on the event loop's default executor"""
+
+    def __init__(self, session_factory: Union[Callable[[], Session], Sequence[Callable[[], Session]]], config: Optional[ProjectorConfig] = None):
+        self.session_factories = list(session_factory) if isinstance(session_factory, (list, tuple)) else [session_factory]
+        self.config = config or ProjectorConfig()
+        self.metrics = ProjectorMetrics()
+        self._task: Optional[asyncio.Task] = None
+        self._leader = sweeper.LeaderLock(self.config.lock_file)
+
+    async def run_once(self) -> int:
+        """Catch up once off the event loop and record metrics"""
+        self.metrics.leader = self._leader.acquire()
+        if not self.metrics.leader:
+            return 0
+        started = time.perf_counter()
+        try:
+            applied = await asyncio.get_running_loop().run_in_executor(
+                None, project_shards, self.session_factories, ROLLUPS, self.config.batch_size
+            )
+        except Exception:
+            self.metrics.errors += 1
+            logger.exception("Rollup catch-up failed")
+            return 0
+        finally:
+            self.metrics.runs += 1
+            self.metrics.last_run_at = datetime.now()
+            self.metrics.last_run_seconds = time.perf_counter() - started
+
+        self.metrics.last_events = applied
+        self.metrics.events_total += applied
+        return applied
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.config.interval_seconds)
+            await self.run_once()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader.release()
+
+def main(argv: Optional[list] = None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Project the session event log")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ("catch-up", "rebuild"):
+        p = sub.add_parser(command)
+        p.add_argument("projection", choices=sorted(PROJECTIONS))
+    p = sub.add_parser("export")
+    p.add_argument("path")
+    p = sub.add_parser("replay")
+    p.add_argument("path")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "catch-up":
+            print(f"Applied {catch_up(db, args.projection)} events to {args.projection}")
+        elif args.command == "rebuild":
+            print(f"Rebuilt {args.projection} from {rebuild(db, args.projection)} events")
+        elif args.command == "export":
+            print(f"Exported {export_events(db, args.path)} events to {args.path}")
+        else:
+            print(f"Replayed {replay(db, read_events(args.path))} events")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from .. import schemas
+from ..profiler import Profiler, ProfilerError
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+def get_profiler(request: Request, token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER)) -> Profiler:
+    """The process's profiler, for requests carrying the admin token; 404 when ADMIN_TOKEN is unset"""
+    profiler: Optional[Profiler] = getattr(request.app.state, "profiler", None)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiler.authorize(token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    return profiler
+
+# Diagnostics are not part of the public API, so they stay out of the OpenAPI schema and the SDK
+router = APIRouter(prefix="/admin", tags=["admin"], include_in_schema=False)
+
+@router.get("/profile")
+async def get_profile(
+    seconds: float = Query(5.0, gt=0, description="How long to sample"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="Milliseconds between samples"),
+    format: Literal["speedscope", "collapsed"] = Query("speedscope"),
+    idle: bool = Query(False, description="Keep samples of threads waiting for work"),
+    profiler: Profiler = Depends(get_profiler),
+):
+    """Sample the stacks of every thread in this worker process, including the threadpool running sync routes"""
+    if seconds > profiler.config.max_seconds:
+        raise HTTPException(status_code=400, detail=f"Profiles are limited to {profiler.config.max_seconds:g} seconds")
+    try:
+        profile = await profiler.profile(seconds, interval_ms / 1000, idle)
+    except ProfilerError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    name = f"deepwork-{os.getpid()}"
+    headers = {"X-Profile-Samples": str(profile.samples), "X-Profile-Sampling-Seconds": f"{profile.sampling_seconds:.3f}"}
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed(), headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="{name}.speedscope.json"'
+    return JSONResponse(profile.speedscope(name), headers=headers)
+
+@router.post("/tracemalloc/start", response_model=schemas.MemoryUsage)
+def start_tracemalloc(
+    frames: Optional[int] = Query(None, ge=1, le=100, description="Stack frames kept per allocation (default PROFILER_TRACEMALLOC_FRAMES)"),
+    profiler: Profiler = Depends(get_profiler),
+):
+    """Start tracing allocations and take the baseline for the next snapshot"""
+    return profiler.start_tracing(frames)
+
+@router.get("/tracemalloc/snapshot", response_model=schemas.MemorySnapshot)
+def get_tracemalloc_snapshot(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: Literal["lineno", "filename", "traceback"] = Query("lineno"),
+    profiler: Profiler = Depends(get_profiler),
+):
+    """Top allocations by growth since the previous snapshot, which this one replaces"""
+    try:
+        return profiler.snapshot(limit, group_by)
+    except ProfilerError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/tracemalloc/stop", response_model=schemas.MemoryUsage)
+def stop_tracemalloc(profiler: Profiler = Depends(get_profiler)):
+    """Stop tracing and free the traces and the baseline"""
+    return profiler.stop_tracing()
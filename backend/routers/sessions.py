@@ -1,68 +1,320 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from .. import crud, schemas
-from ..database import get_db
+from datetime import date, datetime
+from typing import List, Literal, Optional, Tuple
+import io
+import tempfile
+from .. import crud, importer, models, schemas
+from ..cache import DataVersionCache, cached, get_cache
+from ..database import get_db, get_owner_id, get_read_db, mark_written
+from ..idempotency import IdempotentRequest, get_idempotency, run_idempotent
+from ..limits import rate_limit, shed_load
+from ..sharding import ShardRouter, get_shard_router, global_distribution, global_history_stats
+from ..writer import GroupCommitWriter, get_writer
 
-router = APIRouter(prefix="/sessions", tags=["sessions"])
+router = APIRouter(prefix="/sessions", tags=["sessions"], dependencies=[Depends(rate_limit)])
 
-@router.post("/", response_model=schemas.Session)
-def create_session(session: schemas.SessionCreate, db: Session = Depends(get_db)):
+FIELDS_DESCRIPTION = "Comma-separated session fields to return (id is always included)"
+INCLUDE_DESCRIPTION = "Comma-separated related data to embed; supported: interruptions"
+
+def parse_projection(fields: Optional[str], include: Optional[str], default_fields: Optional[Tuple[str, ...]] = None, default_include: bool = True):
+    """Turn ?fields= and ?include= into (fields, include_interruptions)"""
+    if fields is None and include is None:
+        return default_fields, default_include
+    
+    requested = None
+    if fields is not None:
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = names - set(schemas.SESSION_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        names.add("id")
+        requested = tuple(name for name in schemas.SESSION_FIELDS if name in names)
+    elif default_fields is not None:
+        requested = default_fields
+    
+    includes = {name.strip() for name in (include or "").split(",") if name.strip()}
+    if includes - {"interruptions"}:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(includes - {'interruptions'}))}")
+    return requested, "interruptions" in includes
+
+def _create(session: schemas.SessionCreate, owner_id: int):
+    return lambda db: schemas.Session.model_validate(crud.create_session(db=db, session=session, owner_id=owner_id))
+
+@router.post("/", response_model=schemas.Session, dependencies=[Depends(mark_written)])
+def create_session(session: schemas.SessionCreate, db: Session = Depends(get_db), writer: Optional[GroupCommitWriter] = Depends(get_writer), owner_id: int = Depends(get_owner_id), idempotency: Optional[IdempotentRequest] = Depends(get_idempotency)):
     """Create a new deep work session"""
-    return crud.create_session(db=db, session=session)
+    return run_idempotent(db, writer, idempotency, _create(session, owner_id))
 
-@router.get("/history", response_model=schemas.SessionHistory)
-def get_session_history(db: Session = Depends(get_db)):
+def parse_statuses(status_filter: Optional[str]) -> Optional[List[str]]:
+    """Turn ?status=a,b into a list of known statuses"""
+    if status_filter is None:
+        return None
+    statuses = [name.strip() for name in status_filter.split(",") if name.strip()]
+    unknown = set(statuses) - set(crud.SESSION_STATUSES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown status: {', '.join(sorted(unknown))}")
+    return statuses
+
+@router.get("/", response_model=None, responses={200: {"model": List[schemas.Session]}})
+def list_sessions(
+    status_filter: Optional[str] = Query(None, alias="status", description="Comma-separated statuses"),
+    created_from: Optional[datetime] = Query(None, description="Created at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Created before this time"),
+    min_duration: Optional[float] = Query(None, ge=0, description="Minimum actual duration in minutes"),
+    title_prefix: Optional[str] = Query(None, min_length=1, description="Case-sensitive title prefix"),
+    sort: str = Query("-created_at", description=f"One of {', '.join(crud.SORT_COLUMNS)}, prefixed with - for descending"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+    db: Session = Depends(get_read_db),
+    owner_id: int = Depends(get_owner_id),
+):
+    """List sessions; returns summary fields unless ?fields= or ?include= is given"""
+    # Only indexed sort keys are accepted, so a listing never sorts a full scan
+    if sort.lstrip("-") not in crud.SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort key: {sort}")
+    statuses = parse_statuses(status_filter)
+    requested, include_interruptions = parse_projection(fields, include, schemas.SUMMARY_FIELDS, False)
+    model = schemas.session_projection(requested, include_interruptions)
+    sessions = crud.list_sessions(
+        db=db,
+        statuses=statuses,
+        created_from=created_from,
+        created_to=created_to,
+        min_duration=min_duration,
+        title_prefix=title_prefix,
+        sort=sort,
+        skip=skip,
+        limit=limit,
+        fields=requested,
+        include_interruptions=include_interruptions,
+        owner_id=owner_id,
+    )
+    return [model.model_validate(session) for session in sessions]
+
+@router.get("/history", response_model=None, responses={200: {"model": schemas.SessionHistory}}, dependencies=[Depends(shed_load)])
+def get_session_history(
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+    created_from: Optional[datetime] = Query(None, description="Created at or after this time; reaches into archived months"),
+    created_to: Optional[datetime] = Query(None, description="Created before this time"),
+    db: Session = Depends(get_read_db),
+    owner_id: int = Depends(get_owner_id),
+    cache: Optional[DataVersionCache] = Depends(get_cache),
+):
     """Get session history with statistics"""
-    return crud.get_session_history(db=db)
+    requested, include_interruptions = parse_projection(fields, include)
+    stats = cached(cache, ("history_stats", owner_id), lambda: crud.get_history_stats(db, owner_id), db.get_bind())
+    return crud.get_session_history(
+        db=db,
+        fields=requested,
+        include_interruptions=include_interruptions,
+        owner_id=owner_id,
+        created_from=created_from,
+        created_to=created_to,
+        stats=stats,
+    )
+
+@router.get("/export", response_class=StreamingResponse, responses={200: {"content": {"application/x-ndjson": {}}}}, dependencies=[Depends(shed_load)])
+def export_sessions(
+    created_from: Optional[datetime] = Query(None, description="Created at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Created before this time"),
+    db: Session = Depends(get_read_db),
+    owner_id: int = Depends(get_owner_id),
+):
+    """Stream sessions with interruptions as JSON lines, including archived months in range"""
+    lines = crud.export_session_lines(db, owner_id=owner_id, created_from=created_from, created_to=created_to)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+# Import bodies larger than this are spooled to a temporary file rather than held in memory
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+@router.post("/import", response_model=schemas.ImportReport, dependencies=[Depends(mark_written), Depends(shed_load)])
+async def import_sessions(
+    request: Request,
+    name: str = Query(..., min_length=1, max_length=255, description="Checkpoint name; sending the same import again resumes it"),
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="Default: csv for a text/csv body, else ndjson"),
+    chunk_size: int = Query(importer.DEFAULT_CHUNK_SIZE, ge=1, le=50000, description="Records per transaction"),
+    db: Session = Depends(get_db),
+    owner_id: int = Depends(get_owner_id),
+):
+    """Import historical sessions with their interruptions from a CSV or NDJSON body, committed in chunks"""
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as spool:
+        async for data in request.stream():
+            spool.write(data)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+        try:
+            return await run_in_threadpool(importer.import_sessions, db, stream, format, owner_id, name, chunk_size)
+        except importer.ImportConflict as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Import body is not UTF-8; chunks before the bad bytes were committed")
+        finally:
+            stream.detach()
+
+@router.get("/rollups/daily", response_model=List[schemas.DailyRollup])
+def get_daily_rollups(db: Session = Depends(get_read_db), owner_id: int = Depends(get_owner_id)):
+    """Per-day totals by final status, as the background projector last folded them from the event log"""
+    return (
+        db.query(models.SessionDailyRollup)
+        .filter(models.SessionDailyRollup.owner_id == owner_id)
+        .order_by(models.SessionDailyRollup.day, models.SessionDailyRollup.status)
+        .all()
+    )
+
+BUCKET_DESCRIPTION = "Group percentiles by completion day, ISO week or month"
+
+@router.get("/rollups/distribution", response_model=schemas.SessionDistribution)
+def get_session_distribution(
+    bucket: Literal["day", "week", "month"] = Query("day", description=BUCKET_DESCRIPTION),
+    status_filter: Optional[str] = Query(None, alias="status", description="Comma-separated final statuses"),
+    completed_from: Optional[date] = Query(None, description="Completed on or after this day"),
+    completed_to: Optional[date] = Query(None, description="Completed before this day"),
+    db: Session = Depends(get_read_db),
+    owner_id: int = Depends(get_owner_id),
+):
+    """p50/p90/p99 of duration, overrun ratio and interruptions per bucket and overall, merged from the rollup sketches"""
+    statuses = parse_statuses(status_filter)
+    return crud.session_distribution(crud.rollup_sketches(db, owner_id, statuses, completed_from, completed_to), bucket)
+
+@router.get("/stats", response_model=schemas.HistoryStats, dependencies=[Depends(shed_load)])
+def get_global_stats(
+    db: Session = Depends(get_read_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+    cache: Optional[DataVersionCache] = Depends(get_cache),
+):
+    """History statistics across all owners, merged from every shard when sharded"""
+    if shards is not None:
+        return cached(cache, "global_stats", lambda: global_history_stats(shards), *shards.engines)
+    return cached(cache, "global_stats", lambda: crud.get_history_stats(db), db.get_bind())
+
+@router.get("/stats/distribution", response_model=schemas.SessionDistribution, dependencies=[Depends(shed_load)])
+def get_global_distribution(
+    bucket: Literal["day", "week", "month"] = Query("day", description=BUCKET_DESCRIPTION),
+    status_filter: Optional[str] = Query(None, alias="status", description="Comma-separated final statuses"),
+    completed_from: Optional[date] = Query(None, description="Completed on or after this day"),
+    completed_to: Optional[date] = Query(None, description="Completed before this day"),
+    db: Session = Depends(get_read_db),
+    shards: Optional[ShardRouter] = Depends(get_shard_router),
+    cache: Optional[DataVersionCache] = Depends(get_cache),
+):
+    """Session percentiles across all owners, merged from every shard when sharded"""
+    statuses = parse_statuses(status_filter)
+    key = ("global_distribution", bucket, tuple(statuses or ()), completed_from, completed_to)
+    if shards is not None:
+        return cached(cache, key, lambda: global_distribution(shards, bucket, statuses, completed_from, completed_to), *shards.engines)
+    return cached(cache, key, lambda: crud.session_distribution(crud.rollup_sketches(db, None, statuses, completed_from, completed_to), bucket), db.get_bind())
+
+@router.get("/{session_id}/events", response_model=List[schemas.SessionEvent])
+def get_session_events(session_id: int, db: Session = Depends(get_read_db), owner_id: int = Depends(get_owner_id)):
+    """Get the transition log of a session"""
+    events = crud.get_session_events(db=db, session_id=session_id, owner_id=owner_id)
+    if not events:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return events
 
-@router.get("/{session_id}", response_model=schemas.Session)
-def get_session(session_id: int, db: Session = Depends(get_db)):
+@router.get("/{session_id}", response_model=None, responses={200: {"model": schemas.Session}})
+def get_session(
+    session_id: int,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    include: Optional[str] = Query(None, description=INCLUDE_DESCRIPTION),
+    db: Session = Depends(get_read_db),
+    owner_id: int = Depends(get_owner_id),
+):
     """Get a specific session by ID"""
-    session = crud.get_session(db=db, session_id=session_id)
+    requested, include_interruptions = parse_projection(fields, include)
+    session = crud.get_session(db=db, session_id=session_id, fields=requested, include_interruptions=include_interruptions, owner_id=owner_id)
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return schemas.session_projection(requested, include_interruptions).model_validate(session)
 
-@router.patch("/{session_id}/start", response_model=schemas.Session)
-def start_session(session_id: int, db: Session = Depends(get_db)):
+def _transition(session_id: int, owner_id: int, allowed: Tuple[str, ...], error: str, apply):
+    """Mutation that checks the current status inside the writing transaction"""
+    def mutation(db: Session):
+        session = crud.get_session(db=db, session_id=session_id, owner_id=owner_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if session.status not in allowed:
+            raise HTTPException(status_code=400, detail=error)
+        return schemas.Session.model_validate(apply(db))
+    return mutation
+
+def _start(session_id: int, owner_id: int):
+    return _transition(
+        session_id, owner_id, ("planned",), "Session can only be started if it's in planned status",
+        lambda db: crud.start_session(db=db, session_id=session_id, owner_id=owner_id),
+    )
+
+def _pause(session_id: int, reason: str, owner_id: int):
+    return _transition(
+        session_id, owner_id, ("active",), "Session can only be paused if it's active",
+        lambda db: crud.pause_session(db=db, session_id=session_id, reason=reason, owner_id=owner_id),
+    )
+
+def _resume(session_id: int, owner_id: int):
+    return _transition(
+        session_id, owner_id, ("paused",), "Session can only be resumed if it's paused",
+        lambda db: crud.resume_session(db=db, session_id=session_id, owner_id=owner_id),
+    )
+
+def _complete(session_id: int, owner_id: int):
+    return _transition(
+        session_id, owner_id, ("active", "paused"), "Session can only be completed if it's active or paused",
+        lambda db: crud.complete_session(db=db, session_id=session_id, owner_id=owner_id),
+    )
+
+@router.patch("/{session_id}/start", response_model=schemas.Session, dependencies=[Depends(mark_written)])
+def start_session(session_id: int, db: Session = Depends(get_db), writer: Optional[GroupCommitWriter] = Depends(get_writer), owner_id: int = Depends(get_owner_id), idempotency: Optional[IdempotentRequest] = Depends(get_idempotency)):
     """Start a planned session"""
-    session = crud.get_session(db=db, session_id=session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.status != "planned":
-        raise HTTPException(status_code=400, detail="Session can only be started if it's in planned status")
-    
-    return crud.start_session(db=db, session_id=session_id)
+    return run_idempotent(db, writer, idempotency, _start(session_id, owner_id))
 
-@router.patch("/{session_id}/pause", response_model=schemas.Session)
-def pause_session(session_id: int, pause_data: schemas.SessionPause, db: Session = Depends(get_db)):
+@router.patch("/{session_id}/pause", response_model=schemas.Session, dependencies=[Depends(mark_written)])
+def pause_session(session_id: int, pause_data: schemas.SessionPause, db: Session = Depends(get_db), writer: Optional[GroupCommitWriter] = Depends(get_writer), owner_id: int = Depends(get_owner_id), idempotency: Optional[IdempotentRequest] = Depends(get_idempotency)):
     """Pause an active session"""
-    session = crud.get_session(db=db, session_id=session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.status != "active":
-        raise HTTPException(status_code=400, detail="Session can only be paused if it's active")
-    
-    return crud.pause_session(db=db, session_id=session_id, reason=pause_data.reason)
+    return run_idempotent(db, writer, idempotency, _pause(session_id, pause_data.reason, owner_id))
 
-@router.patch("/{session_id}/resume", response_model=schemas.Session)
-def resume_session(session_id: int, db: Session = Depends(get_db)):
+@router.patch("/{session_id}/resume", response_model=schemas.Session, dependencies=[Depends(mark_written)])
+def resume_session(session_id: int, db: Session = Depends(get_db), writer: Optional[GroupCommitWriter] = Depends(get_writer), owner_id: int = Depends(get_owner_id), idempotency: Optional[IdempotentRequest] = Depends(get_idempotency)):
     """Resume a paused session"""
-    session = crud.get_session(db=db, session_id=session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.status != "paused":
-        raise HTTPException(status_code=400, detail="Session can only be resumed if it's paused")
-    
-    return crud.resume_session(db=db, session_id=session_id)
+    return run_idempotent(db, writer, idempotency, _resume(session_id, owner_id))
 
-@router.patch("/{session_id}/complete", response_model=schemas.Session)
-def complete_session(session_id: int, db: Session = Depends(get_db)):
+@router.patch("/{session_id}/complete", response_model=schemas.Session, dependencies=[Depends(mark_written)])
+def complete_session(session_id: int, db: Session = Depends(get_db), writer: Optional[GroupCommitWriter] = Depends(get_writer), owner_id: int = Depends(get_owner_id), idempotency: Optional[IdempotentRequest] = Depends(get_idempotency)):
     """Complete a session (active or paused)"""
-    session = crud.get_session(db=db, session_id=session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    if session.status not in ["active", "paused"]:
-        raise HTTPException(status_code=400, detail="Session can only be completed if it's active or paused")
-    
-    return crud.complete_session(db=db, session_id=session_id)
+    return run_idempotent(db, writer, idempotency, _complete(session_id, owner_id))
+
+def _operation(operation: schemas.BatchOperation, owner_id: int):
+    """The mutation a single batch operation stands for"""
+    if operation.action == "create":
+        return _create(operation.session, owner_id)
+    if operation.action == "pause":
+        return _pause(operation.session_id, operation.reason, owner_id)
+    return {"start": _start, "resume": _resume, "complete": _complete}[operation.action](operation.session_id, owner_id)
+
+def _batch(operations: List[schemas.BatchOperation], owner_id: int):
+    """Mutation applying each operation in its own savepoint, committed once"""
+    mutations = [_operation(operation, owner_id) for operation in operations]
+    def mutation(db: Session):
+        results = []
+        crud.begin_write(db)
+        with crud.single_commit(db):
+            for apply in mutations:
+                try:
+                    with db.begin_nested():
+                        results.append(schemas.BatchResult(status_code=200, session=apply(db)))
+                except HTTPException as exc:
+                    results.append(schemas.BatchResult(status_code=exc.status_code, detail=exc.detail))
+        return schemas.BatchResponse(results=results)
+    return mutation
+
+@router.post("/batch", response_model=schemas.BatchResponse, dependencies=[Depends(mark_written)])
+def apply_batch(batch: schemas.BatchRequest, db: Session = Depends(get_db), writer: Optional[GroupCommitWriter] = Depends(get_writer), owner_id: int = Depends(get_owner_id), idempotency: Optional[IdempotentRequest] = Depends(get_idempotency)):
+    """Apply creates and transitions in order in one transaction; a rejected operation does not undo the others"""
+    return run_idempotent(db, writer, idempotency, _batch(batch.operations, owner_id))
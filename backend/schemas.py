@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, create_model, model_validator
 from datetime import datetime
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Literal, Optional, Tuple, Type
 
 class SessionBase(BaseModel):
     title: str = Field(..., min_length=1, description="Session title cannot be empty")
@@ -26,10 +27,14 @@ class Interruption(InterruptionBase):
 
 class Session(SessionBase):
     id: int
+    owner_id: int = 0
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
     status: str
     created_at: datetime
+    interruption_count: int = 0
+    last_pause_time: Optional[datetime] = None
+    actual_duration_minutes: Optional[float] = None
     interruptions: List[Interruption] = []
     
     class Config:
@@ -61,3 +66,183 @@ class SessionHistory(BaseModel):
     abandoned_sessions: int
     total_productive_time: float  # in minutes
     total_interruptions: int
+
+class HistoryStats(BaseModel):
+    total_sessions: int
+    completed_sessions: int
+    interrupted_sessions: int
+    overdue_sessions: int
+    abandoned_sessions: int
+    total_productive_time: float  # in minutes
+    total_interruptions: int
+
+class SessionEvent(BaseModel):
+    id: int
+    session_id: int
+    event_type: str
+    occurred_at: datetime
+    reason: Optional[str] = None
+    payload: Optional[dict] = None
+    
+    class Config:
+        from_attributes = True
+
+class DailyRollup(BaseModel):
+    day: str
+    status: str
+    sessions: int
+    interruptions: int
+    productive_minutes: float
+    
+    class Config:
+        from_attributes = True
+
+class Percentiles(BaseModel):
+    """One metric summarized from quantile sketches; percentiles are within 1% of a value in the data"""
+    count: int
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+    max: Optional[float] = None
+
+class DistributionBucket(BaseModel):
+    bucket: str  # YYYY-MM-DD, YYYY-Www or YYYY-MM; "all" for the overall summary
+    sessions: int
+    duration_minutes: Percentiles
+    overrun_ratio: Percentiles  # actual over scheduled duration
+    interruptions: Percentiles
+
+class SessionDistribution(BaseModel):
+    bucket: Literal["day", "week", "month"]
+    overall: DistributionBucket
+    buckets: List[DistributionBucket]
+
+# Operations accepted by one POST /sessions/batch request
+MAX_BATCH_OPERATIONS = 100
+
+class BatchOperation(BaseModel):
+    action: Literal["create", "start", "pause", "resume", "complete"]
+    session_id: Optional[int] = None  # every action but create
+    reason: Optional[str] = None  # pause
+    session: Optional[SessionCreate] = None  # create
+
+    @model_validator(mode="after")
+    def check_arguments(self):
+        if self.action == "create" and self.session is None:
+            raise ValueError("create needs session")
+        if self.action != "create" and self.session_id is None:
+            raise ValueError(f"{self.action} needs session_id")
+        if self.action == "pause" and self.reason is None:
+            raise ValueError("pause needs reason")
+        return self
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+
+class BatchResult(BaseModel):
+    status_code: int  # what the single-operation endpoint would have answered
+    session: Optional[Session] = None
+    detail: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+class Capabilities(BaseModel):
+    version: str
+    batch_max_operations: int  # 0 when POST /sessions/batch is unavailable
+    idempotency: bool  # Idempotency-Key is honored on mutations
+    group_commit: bool
+
+class ImportedInterruption(BaseModel):
+    reason: str = Field(..., min_length=1)
+    pause_time: datetime
+
+class ImportedSession(SessionBase):
+    """One session of a historical import; lines of GET /sessions/export are accepted as they are"""
+    created_at: datetime
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    # Derived from the times and the status rules when left out
+    status: Optional[Literal["planned", "active", "paused", "completed", "interrupted", "overdue", "abandoned"]] = None
+    interruptions: List[ImportedInterruption] = []
+
+    @model_validator(mode="after")
+    def check_timeline(self):
+        if self.start_time is None and (self.end_time is not None or self.interruptions):
+            raise ValueError("end_time and interruptions need start_time")
+        if self.end_time is not None and self.end_time < self.start_time:
+            raise ValueError("end_time is before start_time")
+        for interruption in self.interruptions:
+            if interruption.pause_time < self.start_time or (self.end_time is not None and interruption.pause_time > self.end_time):
+                raise ValueError("interruptions must fall between start_time and end_time")
+        if self.status == "planned" and self.start_time is not None:
+            raise ValueError("planned sessions have no start_time")
+        if self.status in ("active", "paused") and (self.start_time is None or self.end_time is not None):
+            raise ValueError(f"{self.status} sessions have a start_time and no end_time")
+        if self.status == "paused" and not self.interruptions:
+            raise ValueError("paused sessions need an interruption")
+        if self.status not in (None, "planned", "active", "paused") and self.end_time is None:
+            raise ValueError(f"{self.status} sessions need end_time")
+        return self
+
+class ImportRowError(BaseModel):
+    row: int  # 1-based record number in the file, not counting a CSV header
+    message: str
+
+class ImportReport(BaseModel):
+    name: str
+    rows_read: int  # records consumed so far, across resumed runs
+    sessions_imported: int
+    interruptions_imported: int
+    rows_rejected: int
+    resumed_from: int  # records skipped because an earlier run committed them
+    seconds: float
+    rows_per_second: float  # of this run
+    errors: List[ImportRowError] = []  # this run's first rejected rows
+
+class MemoryUsage(BaseModel):
+    tracing: bool
+    frames: int  # stack frames kept per allocation; 0 when not tracing
+    traced_bytes: int
+    peak_bytes: int
+    tracemalloc_bytes: int  # tracemalloc's own overhead
+
+class MemoryStat(BaseModel):
+    traceback: List[str]  # file:line, outermost first
+    size_bytes: int
+    count: int
+    size_diff_bytes: Optional[int] = None  # since the previous snapshot
+    count_diff: Optional[int] = None
+
+class MemorySnapshot(MemoryUsage):
+    seconds_since_previous: Optional[float]  # None when there is nothing to compare with
+    group_by: Literal["lineno", "filename", "traceback"]
+    top: List[MemoryStat]
+
+# Sparse fieldsets: every scalar field of Session can be requested with ?fields=
+SESSION_FIELDS = tuple(name for name in Session.model_fields if name != "interruptions")
+# What list views need when no fields are requested
+SUMMARY_FIELDS = ("id", "title", "status", "start_time", "end_time", "created_at")
+
+@lru_cache(maxsize=256)
+def session_projection(fields: Optional[Tuple[str, ...]] = None, include_interruptions: bool = True) -> Type[BaseModel]:
+    """Response model with only the requested session fields"""
+    if fields is None and include_interruptions:
+        return Session
+    names = [name for name in SESSION_FIELDS if fields is None or name in fields]
+    definitions = {name: (Session.model_fields[name].annotation, Session.model_fields[name]) for name in names}
+    if include_interruptions:
+        definitions["interruptions"] = (List[Interruption], [])
+    return create_model("SessionProjection", __config__=ConfigDict(from_attributes=True), **definitions)
+
+@lru_cache(maxsize=256)
+def history_projection(session_model: Type[BaseModel]) -> Type[BaseModel]:
+    """SessionHistory whose sessions use a projected session model"""
+    if session_model is Session:
+        return SessionHistory
+    definitions = {
+        name: (field.annotation, field)
+        for name, field in SessionHistory.model_fields.items() if name != "sessions"
+    }
+    return create_model("SessionHistoryProjection", sessions=(List[session_model], ...), **definitions)
@@ -0,0 +1,33 @@
+import argparse
+import os
+
+import uvicorn
+
+from . import migrations
+# Not backend.main: the parent only migrates, and building the app there would be wasted
+from .database import migrate_on_startup
+
+def main(argv=None):
+    """Run the API in several uvicorn worker processes"""
+    parser = argparse.ArgumentParser(description="Serve the Deep Work Session Tracker API")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+
+    # Migrate once, before forking, rather than in every worker's lifespan
+    if migrate_on_startup():
+        migrations.upgrade_all()
+        os.environ["DB_MIGRATE_ON_STARTUP"] = "0"
+
+    # Workers share the database, not memory: result caches are invalidated
+    # through SQLite's data_version, and lock files elect the worker that
+    # runs the stale session sweeper, the rollup projector and scheduled maintenance
+    os.environ.setdefault("SWEEPER_LOCK_FILE", os.path.abspath("deepwork.sweeper.lock"))
+    os.environ.setdefault("PROJECTOR_LOCK_FILE", os.path.abspath("deepwork.projector.lock"))
+    os.environ.setdefault("MAINTENANCE_LOCK_FILE", os.path.abspath("deepwork.maintenance.lock"))
+    uvicorn.run("backend.main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import argparse
+import os
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from sqlalchemy import column, event, func, literal, select, table
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import crud, models, projector, schemas
+from .database import Base, make_engine
+
+# Public ids carry their shard in the high bits: (shard << SHARD_ID_BITS) | local id.
+# Ids stay below 2**53 for fewer than 8192 shards, so JavaScript clients keep them exact.
+SHARD_ID_BITS = 40
+LOCAL_ID_MASK = (1 << SHARD_ID_BITS) - 1
+
+def encode_id(shard: int, local_id: int) -> int:
+    return (shard << SHARD_ID_BITS) | local_id
+
+def shard_of_id(public_id: int) -> int:
+    return public_id >> SHARD_ID_BITS
+
+def shard_for_owner(owner_id: int, shard_count: int) -> int:
+    """Stable shard of an owner; all of an owner's sessions live together"""
+    return zlib.crc32(str(owner_id).encode()) % shard_count
+
+def shard_for_request(request: Request, owner_id: int, shard_count: int) -> int:
+    """The shard a /sessions/{session_id} path's id names, else the owner's.
+
+    Ids naming no existing shard fall back to the owner's, where they are
+    not found either.
+    """
+    session_id = str(request.path_params.get("session_id", ""))
+    if session_id.isdigit() and shard_of_id(int(session_id)) < shard_count:
+        return shard_of_id(int(session_id))
+    return shard_for_owner(owner_id, shard_count)
+
+@dataclass
+class ShardConfig:
+    """Sharded storage settings; disabled (single database) by default"""
+    shard_count: int = 0
+    url_template: str = "sqlite:///./deepwork_shard{shard}.db"
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_count > 1
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from SHARD_* environment variables"""
+        defaults = cls()
+        return cls(
+            shard_count=int(os.getenv("SHARD_COUNT", defaults.shard_count)),
+            url_template=os.getenv("SHARD_URL_TEMPLATE", defaults.url_template),
+        )
+
+    def urls(self) -> List[str]:
+        return [self.url_template.format(shard=shard) for shard in range(self.shard_count)]
+
+class ShardRouter:
+    """One engine and session factory per shard file, plus a pool for fan-out reads"""
+
+    def __init__(self, urls: Sequence[str]):
+        self.engines = [
+            make_engine(url).execution_options(shard_id=shard)
+            for shard, url in enumerate(urls)
+        ]
+        self.session_factories = [
+            sessionmaker(autocommit=False, autoflush=False, bind=engine) for engine in self.engines
+        ]
+        self._pool = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="shard-fan-out")
+
+    @classmethod
+    def from_config(cls, config: ShardConfig):
+        return cls(config.urls())
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.engines)
+
+    def create_all(self):
+        for engine in self.engines:
+            Base.metadata.create_all(bind=engine)
+
+    def dispose(self):
+        self._pool.shutdown()
+        for engine in self.engines:
+            engine.dispose()
+
+    def shard_for_owner(self, owner_id: int) -> int:
+        return shard_for_owner(owner_id, self.shard_count)
+
+    def session_for_owner(self, owner_id: int) -> Session:
+        return self.session_factories[self.shard_for_owner(owner_id)]()
+
+    def session_for_id(self, public_id: int) -> Session:
+        return self.session_factories[shard_of_id(public_id)]()
+
+    def session_for_request(self, request: Request, owner_id: int) -> Session:
+        return self.session_factories[shard_for_request(request, owner_id, self.shard_count)]()
+
+    def fan_out(self, read: Callable[[Session], object]) -> list:
+        """Run a read on every shard concurrently; results are in shard order"""
+        def run(factory):
+            db = factory()
+            try:
+                return read(db)
+            finally:
+                db.close()
+        return list(self._pool.map(run, self.session_factories))
+
+sqlite_sequence = table("sqlite_sequence", column("name"), column("seq"))
+
+def last_id(target, shard: int):
+    """Highest id a shard's table ever handed out, at least the bottom of the shard's range.
+
+    A shard's database only holds ids in its own range. max(id) would hand
+    out the ids of archived, deleted rows again, so SQLite reads the
+    AUTOINCREMENT high-water mark in sqlite_sequence instead.
+    """
+    seq = select(sqlite_sequence.c.seq).where(sqlite_sequence.c.name == target.name).scalar_subquery()
+    return func.max(func.coalesce(seq, 0), encode_id(shard, 0))
+
+def _next_id(model, shard: int, dialect: str):
+    """The shard's next id, evaluated inside the INSERT"""
+    if dialect == "postgresql":
+        # The id sequence never goes back; OR-ing the shard bits is a no-op on ids already in range
+        return literal(encode_id(shard, 0)).op("|")(func.nextval(func.pg_get_serial_sequence(model.__tablename__, "id")))
+    return last_id(model.__table__, shard) + 1
+
+@event.listens_for(models.Session, "before_insert")
+@event.listens_for(models.Interruption, "before_insert")
+def assign_shard_id(mapper, connection, target):
+    """Give rows inserted through a shard engine an id in that shard's range"""
+    shard = connection.get_execution_options().get("shard_id")
+    if shard is not None and target.id is None:
+        target.id = _next_id(type(target), shard, connection.dialect.name)
+
+def get_shard_router(request: Request) -> Optional[ShardRouter]:
+    """Dependency returning the shard router, or None for single-database storage"""
+    return getattr(request.app.state, "shards", None)
+
+def merge_history_stats(parts: Sequence[dict]) -> dict:
+    """Sum per-shard crud.get_history_stats results"""
+    merged = Counter()
+    for part in parts:
+        merged.update(part)
+    return {key: merged[key] for key in parts[0]}
+
+def global_history_stats(shards: ShardRouter) -> dict:
+    """History statistics over every owner on every shard"""
+    return merge_history_stats(shards.fan_out(crud.get_history_stats))
+
+def global_distribution(shards: ShardRouter, bucket: str, statuses: Optional[List[str]] = None,
+                        completed_from: Optional[date] = None, completed_to: Optional[date] = None) -> schemas.SessionDistribution:
+    """Session percentiles over every owner, merged from each shard's rollup sketches"""
+    def read(db: Session):
+        return crud.rollup_sketches(db, None, statuses, completed_from, completed_to)
+    return crud.session_distribution(crud.merge_day_sketches(shards.fan_out(read)), bucket)
+
+def _flush_events(dbs: Sequence[Session], pending: List[list]):
+    """Bulk-insert and commit each shard's pending event rows, then clear them"""
+    for db, rows in zip(dbs, pending):
+        crud.bulk_insert(db, models.SessionEvent, rows)
+        db.commit()
+        rows.clear()
+
+def reshard(sources: Sequence[Callable[[], Session]], target: ShardRouter, batch_size: int = 1000) -> Dict[int, int]:
+    """Route the event logs of existing databases into empty shards and project them.
+
+    Sessions and interruptions get new public ids in their owner's shard; the
+    event log is the source of truth, so both projections are rebuilt from it.
+    Returns the number of sessions written to each shard.
+    """
+    dbs = [factory() for factory in target.session_factories]
+    try:
+        for shard, db in enumerate(dbs):
+            if db.query(models.SessionEvent.id).first() or db.query(models.Session.id).first():
+                raise ValueError(f"Target shard {shard} is not empty")
+
+        next_local = [[0, 0] for _ in dbs]  # per shard: last session, interruption local id
+        session_ids: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        written = Counter()
+        for source_index, factory in enumerate(sources):
+            source = factory()
+            try:
+                pending: List[list] = [[] for _ in dbs]  # event rows per shard
+                buffered = 0
+                for event in projector.iter_events(source, batch_size=batch_size):
+                    key = (source_index, event.session_id)
+                    payload = dict(event.payload or {})
+                    if event.event_type == "created":
+                        shard = target.shard_for_owner(event.owner_id)
+                        next_local[shard][0] += 1
+                        session_ids[key] = (shard, encode_id(shard, next_local[shard][0]))
+                        written[shard] += 1
+                    elif key not in session_ids:
+                        raise ValueError(f"Event {event.id} refers to unknown session {event.session_id}")
+                    shard, session_id = session_ids[key]
+                    if event.event_type == "paused":
+                        next_local[shard][1] += 1
+                        payload["interruption_id"] = encode_id(shard, next_local[shard][1])
+                    pending[shard].append({
+                        "session_id": session_id,
+                        "owner_id": event.owner_id,
+                        "event_type": event.event_type,
+                        "occurred_at": event.occurred_at,
+                        "reason": event.reason,
+                        "payload": payload or None,
+                    })
+                    source.expunge(event)
+                    buffered += 1
+                    if buffered == batch_size:
+                        _flush_events(dbs, pending)
+                        buffered = 0
+                _flush_events(dbs, pending)
+            finally:
+                source.close()
+
+        for db in dbs:
+            for name in projector.PROJECTIONS:
+                projector.catch_up(db, name, batch_size)
+        return {shard: written[shard] for shard in range(len(dbs))}
+    finally:
+        for db in dbs:
+            db.close()
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Manage sharded session storage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("reshard", help="Copy existing databases into a new set of shards")
+    p.add_argument("--from", dest="sources", action="append", required=True,
+                   help="Source database URL; repeat to merge an existing shard set")
+    p.add_argument("--shards", type=int, required=True, help="Number of target shards")
+    p.add_argument("--url-template", default=ShardConfig.url_template,
+                   help="Target URL with a {shard} placeholder")
+    args = parser.parse_args(argv)
+
+    config = ShardConfig(shard_count=args.shards, url_template=args.url_template)
+    if set(args.sources) & set(config.urls()):
+        parser.error("Target shards must differ from the sources")
+    engines = [make_engine(url) for url in args.sources]
+    target = ShardRouter.from_config(config)
+    try:
+        target.create_all()
+        written = reshard([sessionmaker(bind=engine) for engine in engines], target)
+    finally:
+        target.dispose()
+        for engine in engines:
+            engine.dispose()
+    for shard, url in enumerate(config.urls()):
+        print(f"Shard {shard}: {written[shard]} sessions -> {url}")
+
+if __name__ == "__main__":
+    main()
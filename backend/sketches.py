@@ -0,0 +1,131 @@
+import math
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+# Values at or below this are counted as zero; log() is undefined there
+MIN_INDEXABLE = 1e-9
+
+BUCKETS = ("day", "week", "month")
+
+class DDSketch:
+    """Mergeable quantile sketch of non-negative values (DDSketch, Masson et al. 2019).
+
+    A value x is counted in bin ceil(log_gamma(x)) with gamma = (1 + a) / (1 - a),
+    so every quantile is returned within relative error a of a real value of
+    the data. Sketches with the same accuracy merge exactly by adding their
+    bin counts, whatever the order or grouping, which lets day, owner and
+    shard sketches be combined. Past max_bins the lowest bins are folded
+    together, which only costs accuracy at the low end.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1):
+        if value < 0:
+            raise ValueError(f"DDSketch only holds non-negative values, got {value}")
+        if value <= MIN_INDEXABLE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "DDSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _collapse(self):
+        """Fold the lowest bins into the lowest one kept"""
+        indexes = sorted(self.bins)
+        excess = indexes[:len(indexes) - self.max_bins + 1]
+        self.bins[excess[-1]] = sum(self.bins.pop(index) for index in excess)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q in [0, 1], or None when the sketch is empty"""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Bin i holds (gamma^(i-1), gamma^i]; this point is within a of both ends
+                estimate = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form, as stored in session_daily_rollups"""
+        return {
+            "alpha": self.relative_accuracy,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "zero": self.zero_count,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], max_bins: int = DEFAULT_MAX_BINS) -> "DDSketch":
+        sketch = cls(data["alpha"], max_bins) if data else cls(max_bins=max_bins)
+        if data and data["count"]:
+            sketch.bins = {int(index): count for index, count in data["bins"].items()}
+            sketch.zero_count = data["zero"]
+            sketch.count = data["count"]
+            sketch.sum = data["sum"]
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+def merged(sketches: Iterable[DDSketch]) -> DDSketch:
+    total = DDSketch()
+    for sketch in sketches:
+        total.merge(sketch)
+    return total
+
+def bucket_of(day: str, bucket: str) -> str:
+    """Label of the day (YYYY-MM-DD), ISO week (YYYY-Www) or month (YYYY-MM) a rollup day belongs to"""
+    if bucket == "day":
+        return day
+    if bucket == "month":
+        return day[:7]
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
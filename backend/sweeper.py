@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Sequence, Union
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process sweeps
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SweeperConfig:
+    """Thresholds and pacing for the stale session sweeper"""
+    enabled: bool = True
+    interval_seconds: float = 60.0
+    active_stale_minutes: float = 24 * 60  # active this long after start_time
+    paused_stale_minutes: float = 4 * 60  # paused this long after start_time
+    overrun_grace: float = 1.5  # swept active sessions end at most this many scheduled durations after start
+    batch_size: int = 100
+    max_batches: int = 50  # per sweep, so one run cannot hold the writer for long
+    lock_file: Optional[str] = None  # with several workers, only the holder of this lock sweeps
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from SWEEPER_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("SWEEPER_ENABLED", "1").lower() not in ("0", "false", "no"),
+            interval_seconds=float(os.getenv("SWEEPER_INTERVAL_SECONDS", defaults.interval_seconds)),
+            active_stale_minutes=float(os.getenv("SWEEPER_ACTIVE_STALE_MINUTES", defaults.active_stale_minutes)),
+            paused_stale_minutes=float(os.getenv("SWEEPER_PAUSED_STALE_MINUTES", defaults.paused_stale_minutes)),
+            overrun_grace=float(os.getenv("SWEEPER_OVERRUN_GRACE", defaults.overrun_grace)),
+            batch_size=int(os.getenv("SWEEPER_BATCH_SIZE", defaults.batch_size)),
+            max_batches=int(os.getenv("SWEEPER_MAX_BATCHES", defaults.max_batches)),
+            lock_file=os.getenv("SWEEPER_LOCK_FILE") or None,
+        )
+
+@dataclass
+class SweeperMetrics:
+    """Counters exposed on /metrics"""
+    runs: int = 0
+    errors: int = 0
+    swept_total: int = 0
+    swept_by_status: Counter = field(default_factory=Counter)
+    last_run_at: Optional[datetime] = None
+    last_run_seconds: float = 0.0
+    last_swept: int = 0
+    leader: bool = False
+
+    def as_dict(self):
+        return {
+            "leader": self.leader,
+            "runs": self.runs,
+            "errors": self.errors,
+            "swept_total": self.swept_total,
+            "swept_by_status": dict(self.swept_by_status),
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": self.last_run_seconds,
+            "last_swept": self.last_swept,
+        }
+
+class LeaderLock:
+    """Elects one of several workers to run a periodic job, by holding an exclusive lock on a shared file"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._handle = None
+
+    def acquire(self) -> bool:
+        """Take the lock if it is free; kept until release(). Always held without a path, or on Windows"""
+        if self._handle is not None or not self.path or fcntl is None:
+            return True
+        handle = open(self.path, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._handle = handle
+        return True
+
+    def release(self):
+        if self._handle is not None:
+            self._handle.close()  # releases the lock for another worker
+            self._handle = None
+
+def find_stale_sessions(db: Session, now: datetime, config: SweeperConfig, limit: int):
+    """Active or paused sessions past their threshold, via the (status, start_time) index"""
+    return (
+        db.query(models.Session)
+        .filter(or_(
+            and_(models.Session.status == "active",
+                 models.Session.start_time < now - timedelta(minutes=config.active_stale_minutes)),
+            and_(models.Session.status == "paused",
+                 models.Session.start_time < now - timedelta(minutes=config.paused_stale_minutes)),
+        ))
+        .limit(limit)
+        .all()
+    )
+
+def sweep_end_time(session: models.Session, now: datetime, config: SweeperConfig) -> datetime:
+    """When a stale session is taken to have ended; never the time of the sweep itself.
+
+    A paused session ended when it was last paused. An active one is capped
+    at its scheduled duration times the grace factor.
+    """
+    end_time = min(now, session.start_time + timedelta(minutes=session.scheduled_duration * config.overrun_grace))
+    if session.status == "paused" and session.last_pause_time:
+        end_time = min(end_time, max(session.last_pause_time, session.start_time))
+    return end_time
+
+def sweep_once(session_factory: Callable[[], Session], config: SweeperConfig, now: Optional[datetime] = None) -> Counter:
+    """Finish stale sessions in bounded batches; returns final status counts"""
+    now = now or datetime.now()
+    swept = Counter()
+    for _ in range(config.max_batches):
+        db = session_factory()
+        try:
+            sessions = find_stale_sessions(db, now, config, config.batch_size)
+            for session in sessions:
+                # Same business rules as an explicit /complete, except that a paused session was abandoned
+                status = "abandoned" if session.status == "paused" else None
+                crud.record_completion(db, session, sweep_end_time(session, now, config), status=status, swept=True)
+                swept[session.status] += 1
+            db.commit()
+        finally:
+            db.close()
+        if len(sessions) < config.batch_size:
+            break
+    return swept
+
+def sweep_shards(session_factories: Sequence[Callable[[], Session]], config: SweeperConfig, now: Optional[datetime] = None) -> Counter:
+    """sweep_once over each shard's database, with the same cutoff"""
+    now = now or datetime.now()
+    swept = Counter()
+    for session_factory in session_factories:
+        swept.update(sweep_once(session_factory, config, now))
+    return swept
+
+class Sweeper:
+    """Runs sweep_once periodically on the event loop's default executor"""
+
+    def __init__(self, session_factory: Union[Callable[[], Session], Sequence[Callable[[], Session]]], config: Optional[SweeperConfig] = None):
+        # One factory per database; a sequence when storage is sharded
+        self.session_factories = list(session_factory) if isinstance(session_factory, (list, tuple)) else [session_factory]
+        self.config = config or SweeperConfig()
+        self.metrics = SweeperMetrics()
+        self._task: Optional[asyncio.Task] = None
+        self._leader = LeaderLock(self.config.lock_file)
+
+    async def run_once(self) -> Counter:
+        """Sweep once off the event loop and record metrics"""
+        self.metrics.leader = self._leader.acquire()
+        if not self.metrics.leader:
+            return Counter()
+        started = time.perf_counter()
+        try:
+            swept = await asyncio.get_running_loop().run_in_executor(
+                None, sweep_shards, self.session_factories, self.config
+            )
+        except Exception:
+            self.metrics.errors += 1
+            logger.exception("Session sweep failed")
+            return Counter()
+        finally:
+            self.metrics.runs += 1
+            self.metrics.last_run_at = datetime.now()
+            self.metrics.last_run_seconds = time.perf_counter() - started
+
+        self.metrics.last_swept = sum(swept.values())
+        self.metrics.swept_total += self.metrics.last_swept
+        self.metrics.swept_by_status.update(swept)
+        if swept:
+            logger.info("Swept %d stale sessions: %s", self.metrics.last_swept, dict(swept))
+        return swept
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.config.interval_seconds)
+            await self.run_once()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader.release()
@@ -1,16 +1,44 @@
+import httpx
 import pytest
+from alembic.script import ScriptDirectory
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, create_engine, event, func, insert, inspect, select
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
 
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+# The tests create their own schema; keep the app from migrating ./deepwork.db
+os.environ["DB_MIGRATE_ON_STARTUP"] = "0"
+# Statistics must reflect every write, so PostgreSQL refreshes its stats view on each read
+os.environ["STATS_VIEW_MAX_AGE_SECONDS"] = "0"
+# Tests send requests far faster than any client; TestRateLimits installs its own limiter
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+
 from ..main import app
-from ..database import get_db, Base
-from ..models import Session, Interruption
+from ..cache import CacheConfig, DataVersionCache
+from .. import archive, crud, database, importer, maintenance, migrations, postgres, projector, schemas, sharding, sketches
+from ..sweeper import Sweeper, SweeperConfig, find_stale_sessions, sweep_once
+from ..writer import GroupCommitWriter, WriterConfig, get_writer
+from ..database import get_db, get_read_db, make_engine, normalize_url, Base
+from deepwork_client import ApiError, AsyncClient, Client, Operation
+from ..idempotency import REPLAYED_HEADER
+from ..limits import LimitConfig, RequestLimiter, TokenBuckets
+from ..profiler import Profiler, ProfilerConfig, ProfilerError
+from ..models import ArchivedSession, IdempotencyKey, ImportCheckpoint, Session, Interruption, SessionArchive, SessionDailyRollup, SessionEvent
 
-# Create test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Create test database; CI also runs the suite with TEST_DATABASE_URL pointing at PostgreSQL
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL") or "sqlite:///./test.db"
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def override_get_db():
@@ -21,6 +49,14 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+requires_sqlite = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="inspects SQLite query plans or files")
+requires_postgres = pytest.mark.skipif(engine.dialect.name != "postgresql", reason="TEST_DATABASE_URL is not PostgreSQL")
+
+def project_rollups():
+    """Catch the rollups up, as the app's background projector does between requests"""
+    projector.project_shards([TestingSessionLocal])
 
 @pytest.fixture
 def client():
@@ -211,5 +247,1953 @@ class TestSessionHistory:
         response = client.get("/api/v1/sessions/999")
         assert response.status_code == 404
 
+class TestDenormalizedCounters:
+    def test_pause_maintains_counters(self, client, sample_session_data):
+        """Test pausing updates the interruption counter and last pause time"""
+        response = client.post("/api/v1/sessions/", json=sample_session_data)
+        session_id = response.json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        for i in range(2):
+            response = client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": f"Interruption {i+1}"})
+            client.patch(f"/api/v1/sessions/{session_id}/resume")
+        
+        data = response.json()
+        assert data["interruption_count"] == 2
+        assert data["last_pause_time"] == data["interruptions"][-1]["pause_time"]
+        
+        response = client.patch(f"/api/v1/sessions/{session_id}/complete")
+        assert response.json()["actual_duration_minutes"] is not None
+        
+        history = client.get("/api/v1/sessions/history").json()
+        assert history["total_interruptions"] == 2
+
+    def test_completion_does_not_load_interruptions(self, client, sample_session_data):
+        """Test completion logic reads only the sessions table"""
+        response = client.post("/api/v1/sessions/", json=sample_session_data)
+        session_id = response.json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"})
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", record)
+        db = TestingSessionLocal()
+        try:
+            session = crud.complete_session(db, session_id)
+            assert session.status == "abandoned"
+        finally:
+            db.close()
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert statements
+        assert not any("FROM interruptions" in statement for statement in statements)
+
+class TestSparseFieldsets:
+    def _paused_session(self, client, sample_session_data):
+        response = client.post("/api/v1/sessions/", json=sample_session_data)
+        session_id = response.json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"})
+        return session_id
+
+    def test_get_session_with_fields(self, client, sample_session_data):
+        """Test only the requested fields are returned"""
+        session_id = self._paused_session(client, sample_session_data)
+        response = client.get(f"/api/v1/sessions/{session_id}?fields=title,status")
+        assert response.status_code == 200
+        assert response.json() == {"id": session_id, "title": sample_session_data["title"], "status": "paused"}
+
+    def test_get_session_include_interruptions(self, client, sample_session_data):
+        """Test interruptions are embedded only on request"""
+        session_id = self._paused_session(client, sample_session_data)
+        data = client.get(f"/api/v1/sessions/{session_id}?fields=status&include=interruptions").json()
+        assert set(data) == {"id", "status", "interruptions"}
+        assert data["interruptions"][0]["reason"] == "Phone call"
+        
+        # Without parameters the full legacy shape is returned
+        data = client.get(f"/api/v1/sessions/{session_id}").json()
+        assert len(data["interruptions"]) == 1
+        assert data["goal"] == sample_session_data["goal"]
+
+    def test_unknown_field_or_include(self, client, sample_session_data):
+        """Test unknown fields and includes are rejected"""
+        session_id = self._paused_session(client, sample_session_data)
+        assert client.get(f"/api/v1/sessions/{session_id}?fields=title,secret").status_code == 400
+        assert client.get(f"/api/v1/sessions/{session_id}?include=owner").status_code == 400
+        assert client.get("/api/v1/sessions/history?fields=nope").status_code == 400
+
+    def test_list_sessions_summary(self, client, sample_session_data):
+        """Test the list endpoint returns summaries without touching interruptions"""
+        self._paused_session(client, sample_session_data)
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.get("/api/v1/sessions/")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 2
+        assert "interruptions" not in data[0] and "goal" not in data[0]
+        assert not any("FROM interruptions" in statement for statement in statements)
+        
+        data = client.get("/api/v1/sessions/?status=paused&include=interruptions").json()
+        assert len(data[0]["interruptions"]) == 1
+
+    def test_history_without_interruptions(self, client, sample_session_data):
+        """Test history statistics are unaffected by projections"""
+        self._paused_session(client, sample_session_data)
+        data = client.get("/api/v1/sessions/history?fields=title,status").json()
+        assert data["total_sessions"] == 1
+        assert data["total_interruptions"] == 1
+        assert set(data["sessions"][0]) == {"id", "title", "status"}
+
+class TestSessionListing:
+    def _create(self, client, title, duration=None):
+        response = client.post("/api/v1/sessions/", json={"title": title, "goal": "Listing", "scheduled_duration": 30.0})
+        session_id = response.json()["id"]
+        if duration is not None:
+            client.patch(f"/api/v1/sessions/{session_id}/start")
+            client.patch(f"/api/v1/sessions/{session_id}/complete")
+            db = TestingSessionLocal()
+            db.query(Session).filter(Session.id == session_id).update({"actual_duration_minutes": duration})
+            db.commit()
+            db.close()
+        return session_id
+
+    def test_filters(self, client):
+        """Test status, title prefix and duration filters"""
+        first = self._create(client, "Write report", duration=40)
+        second = self._create(client, "Write tests", duration=10)
+        third = self._create(client, "Review code")
+        
+        ids = lambda query: [s["id"] for s in client.get(f"/api/v1/sessions/?{query}").json()]
+        assert ids("status=planned") == [third]
+        assert set(ids("status=completed,planned")) == {first, second, third}
+        assert sorted(ids("title_prefix=Write")) == [first, second]
+        assert ids("title_prefix=Write%20t") == [second]
+        assert ids("min_duration=20") == [first]
+        assert ids("sort=duration&status=completed") == [second, first]
+        assert ids("sort=-title") == [second, first, third]
+
+    def test_title_prefix_in_code_point_order(self, client):
+        """Test prefixes match case-sensitively whatever the collation, including the last code point"""
+        top = chr(sys.maxunicode)
+        ids = {title: self._create(client, title) for title in ["Abc", "ABC", "Ac", f"Ab{top}", f"Ab{top}z"]}
+        matches = lambda prefix: sorted(s["title"] for s in client.get("/api/v1/sessions/", params={"title_prefix": prefix}).json())
+        assert matches("Ab") == ["Abc", f"Ab{top}", f"Ab{top}z"]
+        assert matches(f"Ab{top}") == [f"Ab{top}", f"Ab{top}z"]
+        assert crud.prefix_upper_bound(top) is None
+        assert crud.prefix_upper_bound("a\ud7ff") == "a\ue000"
+
+    @requires_postgres
+    def test_title_prefix_uses_c_collation_index(self, client):
+        """Test the prefix range is compared in "C" order and reaches its index on PostgreSQL"""
+        db = TestingSessionLocal()
+        try:
+            db.execute(insert(Session), [
+                {"owner_id": 0, "title": f"Block {i}", "goal": "Plan", "scheduled_duration": 30.0, "status": "planned"}
+                for i in range(5000)
+            ] + [{"owner_id": 0, "title": "Indexed", "goal": "Plan", "scheduled_duration": 30.0, "status": "planned"}])
+            db.commit()
+            db.connection().exec_driver_sql("ANALYZE sessions")
+            statements = []
+            def record(conn, cursor, statement, parameters, context, executemany):
+                statements.append((statement, parameters))
+            event.listen(engine, "before_cursor_execute", record)
+            try:
+                crud.list_sessions(db, owner_id=0, title_prefix="Ind")
+            finally:
+                event.remove(engine, "before_cursor_execute", record)
+            statement, parameters = statements[0]
+            assert 'COLLATE "C"' in statement
+            plan = [row[0].strip() for row in db.connection().exec_driver_sql("EXPLAIN " + statement, parameters)]
+            # In a "C" database the plain title index serves the range just as well
+            assert any(line.startswith("Index Cond") and "title" in line for line in plan), plan
+        finally:
+            db.rollback()
+            db.close()
+
+    def test_created_range(self, client):
+        """Test the created_at range is half-open"""
+        session_id = self._create(client, "Ranged")
+        created_at = client.get(f"/api/v1/sessions/{session_id}").json()["created_at"]
+        
+        assert client.get("/api/v1/sessions/", params={"created_from": created_at}).json()[0]["id"] == session_id
+        assert client.get("/api/v1/sessions/", params={"created_to": created_at}).json() == []
+
+    def test_rejects_unsupported_sort_and_status(self, client):
+        """Test unindexed sort keys and unknown statuses are rejected"""
+        assert client.get("/api/v1/sessions/?sort=goal").status_code == 400
+        assert client.get("/api/v1/sessions/?sort=-scheduled_duration").status_code == 400
+        assert client.get("/api/v1/sessions/?status=archived").status_code == 400
+
+    @requires_sqlite
+    def test_filters_use_indexes(self, client):
+        """Test each filter compiles to an indexed predicate"""
+        self._create(client, "Indexed", duration=5)
+        filters = [
+            dict(statuses=["completed"]),
+            dict(created_from=datetime(2020, 1, 1), created_to=datetime(2030, 1, 1)),
+            dict(min_duration=1, sort="-duration"),
+            dict(title_prefix="Ind", sort="title"),
+        ]
+        
+        db = TestingSessionLocal()
+        try:
+            for kwargs in filters:
+                statements = []
+                def record(conn, cursor, statement, parameters, context, executemany):
+                    statements.append((statement, parameters))
+                event.listen(engine, "before_cursor_execute", record)
+                try:
+                    crud.list_sessions(db, owner_id=0, **kwargs)
+                finally:
+                    event.remove(engine, "before_cursor_execute", record)
+                
+                statement, parameters = statements[0]
+                plan = " | ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+                assert "USING INDEX" in plan, (kwargs, plan)
+        finally:
+            db.close()
+
+class TestSweeper:
+    def _session(self, client, hours_ago, pause=False):
+        response = client.post("/api/v1/sessions/", json={"title": "Stale", "goal": "Sweep", "scheduled_duration": 30.0})
+        session_id = response.json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        if pause:
+            client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Left desk"})
+        db = TestingSessionLocal()
+        db.query(Session).filter(Session.id == session_id).update({"start_time": datetime.now() - timedelta(hours=hours_ago)})
+        db.commit()
+        db.close()
+        return session_id
+
+    def test_sweeps_only_stale_sessions(self, client):
+        """Test stale sessions are finished with the completion rules"""
+        stale_active = self._session(client, hours_ago=30)
+        stale_paused = self._session(client, hours_ago=5, pause=True)
+        fresh_paused = self._session(client, hours_ago=1, pause=True)
+        
+        swept = sweep_once(TestingSessionLocal, SweeperConfig())
+        assert swept == {"overdue": 1, "abandoned": 1}
+        
+        for session_id, expected in [(stale_active, "overdue"), (stale_paused, "abandoned"), (fresh_paused, "paused")]:
+            data = client.get(f"/api/v1/sessions/{session_id}").json()
+            assert data["status"] == expected
+        assert client.get(f"/api/v1/sessions/{stale_active}").json()["end_time"] is not None
+
+    def test_active_session_end_is_capped(self, client):
+        """Test a swept active session ends at its scheduled duration times the grace, not at the sweep"""
+        session_id = self._session(client, hours_ago=30)
+        sweep_once(TestingSessionLocal, SweeperConfig(overrun_grace=2.0))
+        
+        data = client.get(f"/api/v1/sessions/{session_id}").json()
+        assert data["status"] == "overdue"
+        assert data["actual_duration_minutes"] == pytest.approx(60.0)
+        assert datetime.fromisoformat(data["end_time"]) == datetime.fromisoformat(data["start_time"]) + timedelta(minutes=60)
+
+    def test_paused_session_ends_at_last_pause(self, client):
+        """Test a swept paused session is abandoned as of its last pause"""
+        session_id = self._session(client, hours_ago=5, pause=True)
+        db = TestingSessionLocal()
+        session = db.get(Session, session_id)
+        paused_at = (session.start_time + timedelta(minutes=20)).replace(microsecond=0)
+        session.last_pause_time = paused_at
+        db.commit()
+        db.close()
+        sweep_once(TestingSessionLocal, SweeperConfig())
+        
+        data = client.get(f"/api/v1/sessions/{session_id}").json()
+        assert data["status"] == "abandoned"
+        assert datetime.fromisoformat(data["end_time"]) == paused_at
+        assert data["actual_duration_minutes"] == pytest.approx(20.0, abs=0.1)
+        
+        # The logged outcome replays to the same row
+        db = TestingSessionLocal()
+        completed = db.query(SessionEvent).filter(SessionEvent.session_id == session_id, SessionEvent.event_type == "completed").one()
+        assert completed.occurred_at == paused_at and completed.payload["status"] == "abandoned"
+        db.close()
+
+    def test_sweeps_in_bounded_batches(self, client):
+        """Test a sweep stops after max_batches"""
+        for _ in range(3):
+            self._session(client, hours_ago=30)
+        
+        config = SweeperConfig(batch_size=1, max_batches=2)
+        assert sum(sweep_once(TestingSessionLocal, config).values()) == 2
+        assert sum(sweep_once(TestingSessionLocal, config).values()) == 1
+        assert sweep_once(TestingSessionLocal, config) == {}
+
+    @requires_sqlite
+    def test_stale_query_uses_index(self, client):
+        """Test the stale lookup is served by the (status, start_time) index"""
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+        
+        db = TestingSessionLocal()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            find_stale_sessions(db, datetime.now(), SweeperConfig(), 10)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        statement, parameters = statements[0]
+        plan = " | ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+        db.close()
+        assert "ix_sessions_status_start_time" in plan
+
+    def test_metrics(self, client):
+        """Test sweeper runs are counted and exposed on /metrics"""
+        self._session(client, hours_ago=30)
+        sweeper = Sweeper(TestingSessionLocal, SweeperConfig())
+        asyncio.run(sweeper.run_once())
+        
+        assert sweeper.metrics.runs == 1
+        assert sweeper.metrics.swept_total == 1
+        assert sweeper.metrics.swept_by_status == {"overdue": 1}
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert "swept_total" in response.json()["sweeper"]
+
+    def test_only_lock_holder_sweeps(self, client, tmp_path):
+        """Test workers sharing a lock file elect a single sweeper"""
+        self._session(client, hours_ago=30)
+        config = SweeperConfig(lock_file=str(tmp_path / "sweeper.lock"))
+        leader, standby = Sweeper(TestingSessionLocal, config), Sweeper(TestingSessionLocal, config)
+        
+        assert asyncio.run(leader.run_once()) == {"overdue": 1}
+        assert asyncio.run(standby.run_once()) == {}
+        assert leader.metrics.leader and not standby.metrics.leader
+        assert standby.metrics.runs == 0
+        
+        asyncio.run(leader.stop())
+        asyncio.run(standby.run_once())
+        assert standby.metrics.leader
+
+class TestGroupCommit:
+    @pytest.fixture
+    def writer(self, client):
+        writer = GroupCommitWriter(TestingSessionLocal, WriterConfig(enabled=True, max_delay_ms=20, max_batch=16))
+        writer.start()
+        app.dependency_overrides[get_writer] = lambda: writer
+        yield writer
+        del app.dependency_overrides[get_writer]
+        writer.stop()
+
+    def test_transitions_through_writer(self, client, writer, sample_session_data):
+        """Test the API behaves the same with group commits enabled"""
+        response = client.post("/api/v1/sessions/", json=sample_session_data)
+        session_id = response.json()["id"]
+        assert client.patch(f"/api/v1/sessions/{session_id}/start").json()["status"] == "active"
+        
+        response = client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"})
+        assert response.json()["interruption_count"] == 1
+        assert client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Again"}).status_code == 400
+        assert client.patch("/api/v1/sessions/99999/resume").status_code == 404
+        assert writer.metrics.failed_mutations == 2
+
+    def test_concurrent_mutations_share_commits(self, client, writer, sample_session_data):
+        """Test concurrent requests are coalesced and all acknowledged"""
+        ids = []
+        for _ in range(8):
+            session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+            client.patch(f"/api/v1/sessions/{session_id}/start")
+            ids.append(session_id)
+        groups_before = writer.metrics.groups
+        
+        def churn(session_id):
+            for _ in range(3):
+                client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Churn"})
+                client.patch(f"/api/v1/sessions/{session_id}/resume")
+        
+        threads = [threading.Thread(target=churn, args=(session_id,)) for session_id in ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        for session_id in ids:
+            data = client.get(f"/api/v1/sessions/{session_id}").json()
+            assert data["status"] == "active"
+            assert data["interruption_count"] == 3
+        assert writer.metrics.groups - groups_before < 8 * 6
+
+    def test_failed_mutation_does_not_affect_group(self, client, writer, sample_session_data):
+        """Test a failing mutation is rolled back on its own"""
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        
+        def fail(db):
+            db.query(Session).filter(Session.id == session_id).update({"title": "Lost"})
+            raise ValueError("boom")
+        
+        def rename(db):
+            db.query(Session).filter(Session.id == session_id).update({"goal": "Kept"})
+        
+        failing, succeeding = writer.submit(fail), writer.submit(rename)
+        with pytest.raises(ValueError):
+            failing.result()
+        succeeding.result()
+        
+        data = client.get(f"/api/v1/sessions/{session_id}").json()
+        assert data["title"] == sample_session_data["title"]
+        assert data["goal"] == "Kept"
+
+    def test_unavailable_database_fails_the_group_not_the_writer(self, client):
+        """Test a failing session factory resolves every queued future, and the writer carries on"""
+        available = threading.Event()
+        def session_factory():
+            if not available.is_set():
+                raise OperationalError("connect", {}, Exception("too many connections"))
+            return TestingSessionLocal()
+        writer = GroupCommitWriter(session_factory, WriterConfig(enabled=True, max_delay_ms=50, max_batch=16))
+        writer.start()
+        try:
+            futures = [writer.submit(lambda db: db.query(Session).count()) for _ in range(3)]
+            for future in futures:
+                with pytest.raises(OperationalError):
+                    future.result(timeout=5)
+            assert writer.metrics.failed_groups >= 1
+            available.set()
+            assert writer.execute(lambda db: db.query(Session).count()) == 0
+        finally:
+            writer.stop()
+
+class TestEventLog:
+    def _lifecycle(self, client, sample_session_data):
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"})
+        client.patch(f"/api/v1/sessions/{session_id}/resume")
+        client.patch(f"/api/v1/sessions/{session_id}/complete")
+        return session_id
+
+    def _snapshot(self):
+        with engine.connect() as conn:
+            sessions = conn.exec_driver_sql("SELECT * FROM sessions ORDER BY id").fetchall()
+            interruptions = conn.exec_driver_sql("SELECT * FROM interruptions ORDER BY id").fetchall()
+        return sessions, interruptions
+
+    def test_transitions_are_logged(self, client, sample_session_data):
+        """Test every transition appends an event, resumes included"""
+        session_id = self._lifecycle(client, sample_session_data)
+        response = client.get(f"/api/v1/sessions/{session_id}/events")
+        assert response.status_code == 200
+        events = response.json()
+        assert [e["event_type"] for e in events] == ["created", "started", "paused", "resumed", "completed"]
+        assert events[2]["reason"] == "Phone call"
+        assert events[4]["payload"]["status"] == "completed"
+        assert client.get("/api/v1/sessions/99999/events").status_code == 404
+
+    def test_rebuild_sessions_from_log(self, client, sample_session_data):
+        """Test replaying the log reproduces the sessions and interruptions tables"""
+        self._lifecycle(client, sample_session_data)
+        active = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        client.patch(f"/api/v1/sessions/{active}/start")
+        client.patch(f"/api/v1/sessions/{active}/pause", json={"reason": "Meeting"})
+        before = self._snapshot()
+        
+        db = TestingSessionLocal()
+        try:
+            assert projector.rebuild(db, projector.SESSIONS) == 8
+            # Everything is already applied, so catching up is a no-op
+            assert projector.catch_up(db, projector.SESSIONS) == 0
+        finally:
+            db.close()
+        assert self._snapshot() == before
+
+    def test_incremental_catch_up(self, client, sample_session_data):
+        """Test completions reach the rollups in their own transaction, and catch-ups only read events past the checkpoint"""
+        self._lifecycle(client, sample_session_data)
+        rollups = client.get("/api/v1/sessions/rollups/daily").json()
+        assert len(rollups) == 1
+        assert rollups[0]["sessions"] == 1 and rollups[0]["interruptions"] == 1
+        assert client.get("/api/v1/sessions/rollups/distribution").json()["overall"]["sessions"] == 1
+        
+        db = TestingSessionLocal()
+        checkpoint = projector.get_checkpoint(db, projector.ROLLUPS)
+        db.close()
+        assert checkpoint == 5
+        
+        # Events after the last completion wait for a catch-up
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        db = TestingSessionLocal()
+        try:
+            assert projector.catch_up(db, projector.ROLLUPS) == 2
+            assert projector.get_checkpoint(db, projector.ROLLUPS) == 7
+        finally:
+            db.close()
+        
+        client.patch(f"/api/v1/sessions/{session_id}/complete")
+        db = TestingSessionLocal()
+        try:
+            assert projector.get_checkpoint(db, projector.ROLLUPS) == 8
+            assert projector.catch_up(db, projector.ROLLUPS) == 0
+        finally:
+            db.close()
+        assert client.get("/api/v1/sessions/rollups/daily").json()[0]["sessions"] == 2
+
+    def test_concurrent_completions_each_reach_the_rollups(self, client, sample_session_data):
+        """Test completions committing in parallel are all folded into the rollups, none skipped by the checkpoint"""
+        ids = []
+        for _ in range(8):
+            session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+            client.patch(f"/api/v1/sessions/{session_id}/start")
+            ids.append(session_id)
+        barrier = threading.Barrier(len(ids))
+        errors = []
+        def run(session_id):
+            db = TestingSessionLocal()
+            try:
+                barrier.wait()
+                crud.complete_session(db, session_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+        threads = [threading.Thread(target=run, args=(session_id,)) for session_id in ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert sum(rollup["sessions"] for rollup in client.get("/api/v1/sessions/rollups/daily").json()) == len(ids)
+
+    def test_concurrent_catch_up_folds_each_event_once(self, client, sample_session_data):
+        """Test catch-ups racing from a fresh checkpoint take turns instead of folding the same events"""
+        for _ in range(3):
+            self._lifecycle(client, sample_session_data)
+        db = TestingSessionLocal()
+        db.query(SessionDailyRollup).delete()
+        projector.set_checkpoint(db, projector.ROLLUPS, 0)
+        db.commit()
+        db.close()
+        barrier = threading.Barrier(4)
+        applied, errors = [], []
+        def run():
+            db = TestingSessionLocal()
+            try:
+                barrier.wait()
+                applied.append(projector.catch_up(db, projector.ROLLUPS, batch_size=2))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert sum(applied) == 15
+        rollups = client.get("/api/v1/sessions/rollups/daily").json()
+        assert rollups[0]["sessions"] == 3 and rollups[0]["interruptions"] == 3
+
+    def test_export_and_replay(self, client, sample_session_data, tmp_path):
+        """Test an exported log replays into an identical database"""
+        self._lifecycle(client, sample_session_data)
+        path = str(tmp_path / "events.jsonl")
+        db = TestingSessionLocal()
+        try:
+            assert projector.export_events(db, path) == 5
+        finally:
+            db.close()
+        before = self._snapshot()
+        
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        db = TestingSessionLocal()
+        try:
+            assert projector.replay(db, projector.read_events(path)) == 5
+            assert db.query(SessionEvent).count() == 5
+        finally:
+            db.close()
+        assert self._snapshot() == before
+
+class TestOwnership:
+    def _create(self, client, user_id, sample_session_data, pause=False):
+        headers = {"X-User-Id": str(user_id)}
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers)
+        if pause:
+            client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"}, headers=headers)
+        client.patch(f"/api/v1/sessions/{session_id}/complete", headers=headers)
+        return session_id
+
+    def test_sessions_are_scoped_to_owner(self, client, sample_session_data):
+        """Test users only see and modify their own sessions"""
+        mine = self._create(client, 1, sample_session_data, pause=True)
+        theirs = self._create(client, 2, sample_session_data)
+        
+        response = client.get(f"/api/v1/sessions/{mine}", headers={"X-User-Id": "1"})
+        assert response.json()["owner_id"] == 1
+        assert response.json()["interruptions"][0]["reason"] == "Phone call"
+        assert client.get(f"/api/v1/sessions/{mine}", headers={"X-User-Id": "2"}).status_code == 404
+        assert client.get(f"/api/v1/sessions/{mine}").status_code == 404
+        assert client.get(f"/api/v1/sessions/{mine}/events", headers={"X-User-Id": "2"}).status_code == 404
+        assert client.patch(f"/api/v1/sessions/{theirs}/complete", headers={"X-User-Id": "1"}).status_code == 404
+        
+        listed = client.get("/api/v1/sessions/", headers={"X-User-Id": "2"}).json()
+        assert [s["id"] for s in listed] == [theirs]
+
+    def test_history_and_rollups_are_scoped(self, client, sample_session_data):
+        """Test aggregations only cover the requesting owner"""
+        self._create(client, 1, sample_session_data, pause=True)
+        self._create(client, 1, sample_session_data)
+        self._create(client, 2, sample_session_data)
+        
+        history = client.get("/api/v1/sessions/history", headers={"X-User-Id": "1"}).json()
+        assert history["total_sessions"] == 2
+        assert history["total_interruptions"] == 1
+        assert client.get("/api/v1/sessions/history", headers={"X-User-Id": "3"}).json()["total_sessions"] == 0
+        
+        project_rollups()
+        rollups = client.get("/api/v1/sessions/rollups/daily", headers={"X-User-Id": "2"}).json()
+        assert sum(r["sessions"] for r in rollups) == 1
+
+    @requires_sqlite
+    def test_history_queries_use_owner_indexes(self, client, sample_session_data):
+        """Test history and its interruptions are read through owner-leading indexes"""
+        self._create(client, 1, sample_session_data, pause=True)
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+        
+        db = TestingSessionLocal()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            crud.get_session_history(db, owner_id=1)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        for statement, parameters in statements:
+            plan = " | ".join(row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters))
+            assert "owner" in plan, (statement, plan)
+        db.close()
+
+class TestSharding:
+    @pytest.fixture
+    def shards(self, tmp_path):
+        router = sharding.ShardRouter([f"sqlite:///{tmp_path}/shard{i}.db" for i in range(3)])
+        router.create_all()
+        yield router
+        router.dispose()
+
+    @pytest.fixture
+    def sharded_client(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("SHARD_COUNT", "3")
+        monkeypatch.setenv("SHARD_URL_TEMPLATE", f"sqlite:///{tmp_path}/shard{{shard}}.db")
+        monkeypatch.setenv("SWEEPER_ENABLED", "0")
+        monkeypatch.setenv("PROJECTOR_ENABLED", "0")
+        monkeypatch.setenv("DB_MIGRATE_ON_STARTUP", "1")
+        monkeypatch.delitem(app.dependency_overrides, get_db)
+        monkeypatch.delitem(app.dependency_overrides, get_read_db)
+        with TestClient(app) as c:
+            yield c
+
+    def _owners_by_shard(self, shard_count):
+        owners = {}
+        for owner in range(100):
+            owners.setdefault(sharding.shard_for_owner(owner, shard_count), owner)
+        return [owners[shard] for shard in range(shard_count)]
+
+    def test_ids_encode_owner_shard(self, shards, sample_session_data):
+        """Test sessions and interruptions get ids in their owner's shard range"""
+        for shard, owner in enumerate(self._owners_by_shard(3)):
+            db = shards.session_for_owner(owner)
+            for _ in range(2):
+                session = crud.create_session(db, schemas.SessionCreate(**sample_session_data), owner_id=owner)
+                crud.start_session(db, session.id, owner_id=owner)
+                session = crud.pause_session(db, session.id, "Phone call", owner_id=owner)
+                assert sharding.shard_of_id(session.id) == shard
+                assert sharding.shard_of_id(session.interruptions[0].id) == shard
+            assert session.id & sharding.LOCAL_ID_MASK == 2
+            db.close()
+            
+            db = shards.session_for_id(session.id)
+            assert crud.get_session(db, session.id, owner_id=owner) is not None
+            db.close()
+
+    def test_deleted_ids_are_not_reused_in_a_shard(self, shards, sample_session_data):
+        """Test a shard hands out ids past archived, deleted rows, for live and imported sessions"""
+        owner = self._owners_by_shard(3)[1]
+        db = shards.session_for_owner(owner)
+        first = crud.create_session(db, schemas.SessionCreate(**sample_session_data), owner_id=owner).id
+        db.query(Session).filter(Session.id == first).delete()
+        db.commit()
+        second = crud.create_session(db, schemas.SessionCreate(**sample_session_data), owner_id=owner).id
+        record = {**sample_session_data, "created_at": "2025-03-01T09:00:00"}
+        importer.import_sessions(db, io.StringIO(json.dumps(record) + "\n"), "ndjson", owner, "history")
+        imported = db.query(Session.id).filter(Session.id > second).scalar()
+        db.close()
+        assert first < second < imported
+        assert {sharding.shard_of_id(i) for i in (first, second, imported)} == {1}
+
+    def test_api_routes_by_owner_and_fans_out_stats(self, sharded_client, sample_session_data):
+        """Test the API writes to the owner's shard and merges global stats"""
+        for shard, owner in enumerate(self._owners_by_shard(3)):
+            headers = {"X-User-Id": str(owner)}
+            for _ in range(shard + 1):
+                session_id = sharded_client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+                assert sharding.shard_of_id(session_id) == shard
+                sharded_client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers)
+                sharded_client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Email"}, headers=headers)
+            history = sharded_client.get("/api/v1/sessions/history", headers=headers).json()
+            assert history["total_sessions"] == shard + 1
+        
+        stats = sharded_client.get("/api/v1/sessions/stats").json()
+        assert stats["total_sessions"] == 6
+        assert stats["total_interruptions"] == 6
+
+    def test_session_routes_follow_the_id_shard(self, sharded_client, sample_session_data):
+        """Test /sessions/{id} reads and writes the shard its id names, not the one X-User-Id hashes to"""
+        owner, elsewhere = self._owners_by_shard(3)[:2]
+        # A session of this owner stored outside the owner's shard, e.g. written before SHARD_COUNT changed
+        db = app.state.shards.session_factories[1]()
+        session_id = crud.create_session(db, schemas.SessionCreate(**sample_session_data), owner_id=owner).id
+        db.close()
+        assert sharding.shard_of_id(session_id) == 1 != sharding.shard_for_owner(owner, 3)
+        
+        headers = {"X-User-Id": str(owner)}
+        assert sharded_client.get(f"/api/v1/sessions/{session_id}", headers=headers).json()["id"] == session_id
+        assert sharded_client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers).json()["status"] == "active"
+        assert [e["event_type"] for e in sharded_client.get(f"/api/v1/sessions/{session_id}/events", headers=headers).json()] == ["created", "started"]
+        # Ownership still applies on the id's shard
+        assert sharded_client.get(f"/api/v1/sessions/{session_id}", headers={"X-User-Id": str(elsewhere)}).status_code == 404
+        # Ids naming no shard are simply not found
+        assert sharded_client.get(f"/api/v1/sessions/{sharding.encode_id(7, 1)}", headers=headers).status_code == 404
+
+    def test_global_distribution_merges_shards(self, sharded_client, sample_session_data):
+        """Test session percentiles across owners merge every shard's sketches"""
+        for shard, owner in enumerate(self._owners_by_shard(3)):
+            headers = {"X-User-Id": str(owner)}
+            for _ in range(shard + 1):
+                session_id = sharded_client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+                sharded_client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers)
+                sharded_client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Email"}, headers=headers)
+                sharded_client.patch(f"/api/v1/sessions/{session_id}/complete", headers=headers)
+        # Completions update the sketches themselves; no projector runs here
+        overall = sharded_client.get("/api/v1/sessions/stats/distribution").json()["overall"]
+        assert overall["sessions"] == 6
+        assert overall["interruptions"]["p50"] == pytest.approx(1.0, rel=0.01)
+
+    def test_reshard_single_database(self, client, shards, sample_session_data):
+        """Test resharding keeps every owner's history and rollups"""
+        owners = [1, 2, 3, 4, 5]
+        for owner in owners:
+            headers = {"X-User-Id": str(owner)}
+            session_id = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+            client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers)
+            client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Call"}, headers=headers)
+            client.patch(f"/api/v1/sessions/{session_id}/resume", headers=headers)
+            client.patch(f"/api/v1/sessions/{session_id}/complete", headers=headers)
+        
+        written = sharding.reshard([TestingSessionLocal], shards)
+        assert sum(written.values()) == len(owners)
+        
+        source = TestingSessionLocal()
+        for owner in owners:
+            db = shards.session_for_owner(owner)
+            before = crud.get_history_stats(source, owner)
+            assert crud.get_history_stats(db, owner) == before
+            session = db.query(Session).filter(Session.owner_id == owner).one()
+            assert sharding.shard_of_id(session.id) == shards.shard_for_owner(owner)
+            assert sharding.shard_of_id(session.interruptions[0].id) == shards.shard_for_owner(owner)
+            assert session.last_event_id is not None
+            db.close()
+        assert sharding.merge_history_stats(shards.fan_out(crud.get_history_stats)) == pytest.approx(crud.get_history_stats(source))
+        source.close()
+        
+        with pytest.raises(ValueError):
+            sharding.reshard([TestingSessionLocal], shards)
+
+class TestArchive:
+    def _create(self, client, sample_session_data, created_at, pause=False, complete=True):
+        headers = {"X-User-Id": "1"}
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers)
+        if pause:
+            client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"}, headers=headers)
+        if complete:
+            client.patch(f"/api/v1/sessions/{session_id}/complete", headers=headers)
+        db = TestingSessionLocal()
+        db.query(Session).filter(Session.id == session_id).update({"created_at": created_at})
+        db.commit()
+        db.close()
+        return session_id
+
+    def _archive(self, before=datetime(2026, 6, 1)):
+        db = TestingSessionLocal()
+        try:
+            return archive.archive_sessions(db, before, batch_size=2)
+        finally:
+            db.close()
+
+    def _populate(self, client, sample_session_data):
+        old = [
+            self._create(client, sample_session_data, datetime(2026, 1, 10), pause=True),
+            self._create(client, sample_session_data, datetime(2026, 1, 20)),
+            self._create(client, sample_session_data, datetime(2026, 3, 5)),
+        ]
+        unfinished = self._create(client, sample_session_data, datetime(2026, 1, 15), complete=False)
+        recent = self._create(client, sample_session_data, datetime(2026, 9, 1))
+        return old, unfinished, recent
+
+    def test_archives_finished_sessions_by_month(self, client, sample_session_data):
+        """Test old finished sessions leave the hot tables and keep their totals"""
+        old, unfinished, recent = self._populate(client, sample_session_data)
+        stats_before = client.get("/api/v1/sessions/history", headers={"X-User-Id": "1"}).json()
+        
+        assert self._archive() == {"2026-01": 2, "2026-03": 1}
+        db = TestingSessionLocal()
+        assert sorted(s.id for s in db.query(Session).all()) == sorted([unfinished, recent])
+        assert db.query(Interruption).count() == 0
+        january = db.query(SessionArchive).filter(SessionArchive.owner_id == 1, SessionArchive.month == "2026-01").all()
+        assert sum(c.session_count for c in january) == 2 and sum(c.total_interruptions for c in january) == 1
+        payloads = {(c.month, c.seq): c.payload for c in db.query(SessionArchive)}
+        assert {a.id for a in db.query(ArchivedSession)} == set(old)
+        db.close()
+        
+        history = client.get("/api/v1/sessions/history", headers={"X-User-Id": "1"}).json()
+        assert [s["id"] for s in history["sessions"]] == [recent, unfinished]
+        for key in ("total_sessions", "completed_sessions", "total_interruptions", "total_productive_time"):
+            assert history[key] == pytest.approx(stats_before[key])
+        assert client.get(f"/api/v1/sessions/{old[0]}", headers={"X-User-Id": "1"}).status_code == 404
+        
+        # A later run adds a chunk to the month and leaves the earlier ones as they were
+        db = TestingSessionLocal()
+        db.query(Session).filter(Session.id == unfinished).update({"status": "completed"})
+        db.commit()
+        db.close()
+        assert self._archive() == {"2026-01": 1}
+        db = TestingSessionLocal()
+        chunks = {(c.month, c.seq): c.payload for c in db.query(SessionArchive)}
+        assert len(chunks) == len(payloads) + 1
+        assert {key: chunks[key] for key in payloads} == payloads
+        assert db.get(ArchivedSession, unfinished).month == "2026-01"
+        db.close()
+
+    def test_history_and_export_reach_into_archive(self, client, sample_session_data):
+        """Test archived sessions are read only when the requested range covers them"""
+        old, unfinished, recent = self._populate(client, sample_session_data)
+        self._archive()
+        headers = {"X-User-Id": "1"}
+        
+        history = client.get("/api/v1/sessions/history", params={"created_from": "2026-01-01T00:00:00"}, headers=headers).json()
+        assert [s["id"] for s in history["sessions"]] == [recent, old[2], old[1], unfinished, old[0]]
+        assert history["sessions"][-1]["interruptions"][0]["reason"] == "Phone call"
+        
+        history = client.get("/api/v1/sessions/history", params={
+            "created_from": "2026-01-15T00:00:00", "created_to": "2026-02-01T00:00:00", "fields": "title"
+        }, headers=headers).json()
+        assert [s["id"] for s in history["sessions"]] == [old[1], unfinished]
+        assert set(history["sessions"][0]) == {"id", "title"}
+        assert client.get("/api/v1/sessions/history", params={"created_from": "2026-01-01T00:00:00"}).json()["sessions"] == []
+        
+        response = client.get("/api/v1/sessions/export", headers=headers)
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [s["id"] for s in lines] == [old[0], old[1], old[2], unfinished, recent]
+        response = client.get("/api/v1/sessions/export", params={"created_from": "2026-03-01T00:00:00"}, headers=headers)
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [old[2], recent]
+
+    def test_rebuild_keeps_archived_sessions_cold(self, client, sample_session_data):
+        """Test replaying the event log does not bring archived sessions back"""
+        old, unfinished, recent = self._populate(client, sample_session_data)
+        self._archive()
+        db = TestingSessionLocal()
+        projector.rebuild(db, projector.SESSIONS)
+        assert sorted(s.id for s in db.query(Session).all()) == sorted([unfinished, recent])
+        db.close()
+
+    def test_new_sessions_never_take_archived_ids(self, client, sample_session_data):
+        """Test a session created after archiving keeps its own events, and survives a rebuild"""
+        old, unfinished, recent = self._populate(client, sample_session_data)
+        self._archive()
+        created = self._create(client, sample_session_data, datetime(2026, 9, 2), pause=True)
+        assert created > max(old + [unfinished, recent])
+        events = client.get(f"/api/v1/sessions/{created}/events", headers={"X-User-Id": "1"}).json()
+        assert [e["event_type"] for e in events] == ["created", "started", "paused", "completed"]
+
+        db = TestingSessionLocal()
+        try:
+            archived_interruptions = {i.id for s in archive.iter_archived(db) for i in s.interruptions}
+            projector.rebuild(db, projector.SESSIONS)
+            assert sorted(s.id for s in db.query(Session).all()) == sorted([unfinished, recent, created])
+            assert not archived_interruptions & {i.id for i in db.get(Session, created).interruptions}
+        finally:
+            db.close()
+
+    def test_catch_up_keeps_archived_sessions_cold(self, client, sample_session_data):
+        """Test catching the sessions projection up skips the logged events of archived sessions"""
+        old, unfinished, recent = self._populate(client, sample_session_data)
+        self._archive()
+        stats_before = client.get("/api/v1/sessions/history", headers={"X-User-Id": "1"}).json()
+        db = TestingSessionLocal()
+        try:
+            projector.catch_up(db, projector.SESSIONS)
+            assert sorted(s.id for s in db.query(Session).all()) == sorted([unfinished, recent])
+        finally:
+            db.close()
+        stats = client.get("/api/v1/sessions/history", headers={"X-User-Id": "1"}).json()
+        assert stats["total_sessions"] == stats_before["total_sessions"] == 5
+        assert stats["total_interruptions"] == stats_before["total_interruptions"]
+
+@requires_sqlite
+class TestResultCache:
+    def test_stats_are_cached_until_a_commit(self, client, sample_session_data):
+        """Test cached statistics are reused and invalidated by writes"""
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        assert client.get("/api/v1/sessions/stats").json()["total_sessions"] == 1
+        assert client.get("/api/v1/sessions/stats").json()["total_sessions"] == 1
+        assert client.get("/metrics").json()["cache"]["hits"] == 1
+        
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        assert client.get("/api/v1/sessions/stats").json()["total_sessions"] == 2
+        assert client.get("/api/v1/sessions/history").json()["total_sessions"] == 2
+        assert client.get("/metrics").json()["cache"]["invalidations"] == 1
+
+    def test_commit_from_another_process_invalidates(self, client, sample_session_data):
+        """Test a write by another worker process is seen without any broker"""
+        cache = DataVersionCache(CacheConfig())
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        count = lambda: cache.get_or_compute("count", lambda: TestingSessionLocal().query(Session).count(), engine)
+        assert count() == 1
+        
+        subprocess.run([sys.executable, "-c", (
+            "import sqlite3; db = sqlite3.connect('test.db'); "
+            "db.execute(\"insert into sessions (owner_id, title, goal, scheduled_duration, status, interruption_count) "
+            "values (0, 'Other worker', 'Write', 30, 'planned', 0)\"); db.commit()"
+        )], check=True)
+        assert count() == 2
+        assert cache.metrics.as_dict() == {"hits": 0, "misses": 2, "invalidations": 1, "uncacheable": 0}
+        cache.close()
+
+    def test_memory_database_is_not_cached(self):
+        """Test databases without a file to watch bypass the cache"""
+        cache = DataVersionCache()
+        memory = create_engine("sqlite://")
+        assert cache.get_or_compute("key", lambda: 1, memory) == 1
+        assert cache.get_or_compute("key", lambda: 2, memory) == 2
+        assert cache.metrics.uncacheable == 2
+
+class TestStartup:
+    def _version(self, engine):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT version_num FROM alembic_version").scalar()
+
+    def _head(self, url):
+        return ScriptDirectory.from_config(migrations.alembic_config(url)).get_current_head()
+
+    def test_import_has_no_side_effects(self, tmp_path):
+        """Test importing the app neither touches a database nor loads Alembic"""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = subprocess.run([sys.executable, "-c", (
+            "import sys, backend.main; "
+            "print('alembic' in sys.modules, backend.database._engine is None)"
+        )], cwd=tmp_path, env={**os.environ, "PYTHONPATH": root}, capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ["False", "True"]
+        assert list(tmp_path.iterdir()) == []
+
+    def test_serve_parent_does_not_build_the_app(self, tmp_path):
+        """Test the process that migrates before forking workers does not import the app"""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = subprocess.run([sys.executable, "-c", "import sys, backend.serve; print('backend.main' in sys.modules)"],
+                                cwd=tmp_path, env={**os.environ, "PYTHONPATH": root}, capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ["False"]
+
+    def test_workers_migrating_at_once_take_turns(self, tmp_path):
+        """Test several processes migrating one new database on startup all succeed, one after another"""
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        url = f"sqlite:///{tmp_path}/app.db"
+        env = {**os.environ, "PYTHONPATH": root, "DATABASE_URL": url}
+        env.pop("SHARD_COUNT", None)
+        workers = [
+            subprocess.Popen([sys.executable, "-c", "from backend import migrations; migrations.upgrade_all()"],
+                             cwd=tmp_path, env=env, stderr=subprocess.PIPE, text=True)
+            for _ in range(4)
+        ]
+        errors = [worker.communicate()[1] for worker in workers if worker.wait() != 0]
+        assert errors == []
+        migrated = create_engine(url)
+        assert self._version(migrated) == self._head(url)
+        migrated.dispose()
+
+    def test_lifespan_migrates_to_head(self, tmp_path, monkeypatch):
+        """Test startup brings the configured database to the latest revision"""
+        url = f"sqlite:///{tmp_path}/app.db"
+        monkeypatch.setenv("DATABASE_URL", url)
+        monkeypatch.setenv("DB_MIGRATE_ON_STARTUP", "1")
+        monkeypatch.setenv("SWEEPER_ENABLED", "0")
+        with TestClient(app) as c:
+            assert c.get("/health").status_code == 200
+        
+        migrated = create_engine(url)
+        assert self._version(migrated) == self._head(url)
+        with migrated.connect() as conn:
+            assert migrations.compare_metadata(migrations.MigrationContext.configure(conn), Base.metadata) == []
+        migrated.dispose()
+        migrations.upgrade(url)  # already at head: a no-op
+
+    def test_adopts_unversioned_database(self, tmp_path):
+        """Test a database made by create_all is stamped, and a mismatched one is refused"""
+        url = f"sqlite:///{tmp_path}/legacy.db"
+        legacy = create_engine(url)
+        Base.metadata.create_all(bind=legacy)
+        migrations.upgrade(url)
+        assert self._version(legacy) == self._head(url)
+        
+        url = f"sqlite:///{tmp_path}/drifted.db"
+        drifted = create_engine(url)
+        with drifted.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE sessions (id INTEGER PRIMARY KEY, title VARCHAR(255))")
+        with pytest.raises(RuntimeError):
+            migrations.upgrade(url)
+        legacy.dispose()
+        drifted.dispose()
+
+    def test_upgrades_baseline_database(self, tmp_path):
+        """Test a database the first release built with create_all is stamped at 001 and migrated with its rows"""
+        baseline = MetaData()
+        Table("sessions", baseline,
+              Column("id", Integer, primary_key=True, index=True),
+              Column("title", String(255), nullable=False),
+              Column("goal", Text, nullable=False),
+              Column("scheduled_duration", Float, nullable=False),
+              Column("start_time", DateTime),
+              Column("end_time", DateTime),
+              Column("status", String(50)),
+              Column("created_at", DateTime))
+        Table("interruptions", baseline,
+              Column("id", Integer, primary_key=True, index=True),
+              Column("session_id", Integer, ForeignKey("sessions.id"), nullable=False),
+              Column("reason", Text, nullable=False),
+              Column("pause_time", DateTime))
+        url = f"sqlite:///{tmp_path}/baseline.db"
+        legacy = create_engine(url)
+        baseline.create_all(bind=legacy)
+        with legacy.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO sessions (id, title, goal, scheduled_duration, start_time, status, created_at) "
+                "VALUES (1, 'Deep work', 'Ship', 45, '2026-01-05 09:00:00', 'paused', '2026-01-05 09:00:00')")
+            conn.exec_driver_sql("INSERT INTO interruptions (id, session_id, reason, pause_time) VALUES (1, 1, 'Phone', '2026-01-05 09:10:00')")
+
+        migrations.upgrade(url)
+        assert self._version(legacy) == self._head(url)
+        with legacy.connect() as conn:
+            assert migrations.compare_metadata(migrations.MigrationContext.configure(conn), Base.metadata) == []
+            assert conn.exec_driver_sql("SELECT title, interruption_count FROM sessions").fetchall() == [("Deep work", 1)]
+        legacy.dispose()
+
+class TestReadRouting:
+    @pytest.fixture
+    def routed(self, client, monkeypatch):
+        """App reads through a read-only connection to test.db, writes through the primary"""
+        read_engine = make_engine(database.read_url_for(SQLALCHEMY_DATABASE_URL, database.ReadRoutingConfig()))
+        monkeypatch.delitem(app.dependency_overrides, get_read_db)
+        monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=read_engine, info={"read_only": True}))
+        monkeypatch.setattr(database.read_routing_metrics, "read_engine", 0)
+        monkeypatch.setattr(database.read_routing_metrics, "primary", 0)
+        yield client
+        read_engine.dispose()
+
+    def test_sqlite_read_url(self, tmp_path):
+        """Test SQLite files get a read-only URI, and other databases need an explicit replica"""
+        config = database.ReadRoutingConfig()
+        url = database.read_url_for(f"sqlite:///{tmp_path}/app.db", config)
+        assert url == f"sqlite:///file:{tmp_path}/app.db?mode=ro&uri=true"
+        assert database.read_url_for("sqlite://", config) is None
+        assert database.read_url_for("postgresql://db/deepwork", config) is None
+        replica = database.ReadRoutingConfig(read_url="postgresql://replica/deepwork")
+        assert database.read_url_for("postgresql://db/deepwork", replica) == "postgresql+psycopg://replica/deepwork"
+        assert database.read_url_for(f"sqlite:///{tmp_path}/app.db", database.ReadRoutingConfig(enabled=False)) is None
+
+    def test_read_engine_cannot_write(self, tmp_path):
+        """Test the read-only connection sees committed rows in WAL mode and refuses writes"""
+        primary = make_engine(f"sqlite:///{tmp_path}/app.db")
+        Base.metadata.create_all(bind=primary)
+        database.enable_wal(primary)
+        reader = make_engine(database.read_url_for(f"sqlite:///{tmp_path}/app.db", database.ReadRoutingConfig()))
+        with primary.begin() as conn:
+            conn.exec_driver_sql("INSERT INTO sessions (owner_id, title, goal, scheduled_duration, status) VALUES (0, 'a', 'b', 30, 'planned')")
+        with reader.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("SELECT count(*) FROM sessions").scalar() == 1
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("DELETE FROM sessions")
+        primary.dispose()
+        reader.dispose()
+
+    @requires_sqlite
+    def test_client_reads_its_writes_from_primary(self, routed, sample_session_data):
+        """Test reads go to the read engine except right after the same client wrote"""
+        session_id = routed.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        assert database.READ_PRIMARY_COOKIE in routed.cookies
+        assert routed.get(f"/api/v1/sessions/{session_id}").json()["status"] == "planned"
+        assert database.read_routing_metrics.as_dict() == {"read_engine": 0, "primary": 1}
+        
+        other = TestClient(app)
+        assert other.get("/api/v1/sessions/history").json()["total_sessions"] == 1
+        assert database.read_routing_metrics.as_dict() == {"read_engine": 1, "primary": 1}
+        
+        routed.cookies.set(database.READ_PRIMARY_COOKIE, str(time.time() - 1))
+        routed.get("/api/v1/sessions/")
+        assert database.read_routing_metrics.as_dict() == {"read_engine": 2, "primary": 1}
+        assert routed.get("/metrics").json()["read_routing"] == {"read_engine": 2, "primary": 1}
+
+
+class TestStorageDialects:
+    def _finished(self, client, sample_session_data, owner_id=0):
+        headers = {"X-User-Id": str(owner_id)}
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start", headers=headers)
+        client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"}, headers=headers)
+        client.patch(f"/api/v1/sessions/{session_id}/resume", headers=headers)
+        client.patch(f"/api/v1/sessions/{session_id}/complete", headers=headers)
+        return session_id
+
+    def test_postgres_urls_use_psycopg(self):
+        """Test plain PostgreSQL URLs select the driver with a COPY API"""
+        assert normalize_url("postgresql://u:p@db/deepwork") == "postgresql+psycopg://u:p@db/deepwork"
+        assert normalize_url("postgres://db/deepwork") == "postgresql+psycopg://db/deepwork"
+        assert normalize_url("postgresql+psycopg://db/deepwork") == "postgresql+psycopg://db/deepwork"
+        assert normalize_url("sqlite:///./deepwork.db") == "sqlite:///./deepwork.db"
+
+    def test_status_counts_in_one_statement(self, client, sample_session_data):
+        """Test every status count and total comes from one FILTER aggregate query"""
+        self._finished(client, sample_session_data)
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        db = TestingSessionLocal()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            stats = crud.status_stats(db, owner_id=0)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+            db.close()
+        assert len(statements) == 1 and "FILTER (WHERE" in statements[0]
+        assert stats["total_sessions"] == 2 and stats["completed_sessions"] == 1
+        assert stats["total_interruptions"] == 1
+
+    def test_export_lines_match_sessions(self, client, sample_session_data):
+        """Test the NDJSON export carries the same documents as the session schema"""
+        self._finished(client, sample_session_data)
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        db = TestingSessionLocal()
+        try:
+            lines = list(crud.export_session_lines(db, owner_id=0))
+            expected = [session.model_dump(mode="json") for session in crud.export_sessions(db, owner_id=0)]
+        finally:
+            db.close()
+        assert all(line.endswith("\n") for line in lines)
+        assert [json.loads(line) for line in lines] == expected
+        assert len(expected[0]["interruptions"]) == 1
+
+    def test_ids_continue_after_rebuild(self, client, sample_session_data):
+        """Test rows projected with logged ids do not collide with new ones"""
+        first = self._finished(client, sample_session_data)
+        db = TestingSessionLocal()
+        try:
+            projector.rebuild(db, projector.SESSIONS)
+        finally:
+            db.close()
+        second = self._finished(client, sample_session_data)
+        assert second > first
+        assert client.get("/api/v1/sessions/history").json()["total_sessions"] == 2
+
+    @requires_postgres
+    def test_history_stats_view_refresh(self, client, sample_session_data):
+        """Test the stats view is read until it is older than the allowed age"""
+        self._finished(client, sample_session_data, owner_id=1)
+        db = TestingSessionLocal()
+        try:
+            postgres.refresh_stats_view(db, max_age=0)
+            self._finished(client, sample_session_data, owner_id=1)
+            postgres.refresh_stats_view(db, max_age=3600)
+            assert db.execute(select(postgres.stats_view.c.total_sessions)).scalar() == 1
+            assert crud.get_history_stats(db, owner_id=1) == crud.status_stats(db, owner_id=1)
+        finally:
+            db.close()
+
+    @requires_postgres
+    def test_bulk_insert_uses_sequence_ids(self, client):
+        """Test COPY-loaded rows get ids from the sequence in the caller's transaction"""
+        rows = [
+            {"session_id": 1, "owner_id": 0, "event_type": "created", "occurred_at": datetime(2026, 1, 1),
+             "reason": None, "payload": {"title": "Imported", "goal": "Copy", "scheduled_duration": 30}},
+            {"session_id": 1, "owner_id": 0, "event_type": "started", "occurred_at": datetime(2026, 1, 1, 0, 5),
+             "reason": "a\\b\ttab", "payload": None},
+        ]
+        db = TestingSessionLocal()
+        try:
+            crud.bulk_insert(db, SessionEvent, rows)
+            db.rollback()
+            assert db.query(SessionEvent).count() == 0
+            crud.bulk_insert(db, SessionEvent, rows)
+            db.commit()
+            events = db.query(SessionEvent).order_by(SessionEvent.id).all()
+            assert [e.event_type for e in events] == ["created", "started"]
+            assert events[0].payload["title"] == "Imported" and events[1].reason == "a\\b\ttab"
+        finally:
+            db.close()
+
+
+class TestIdempotency:
+    def _started(self, client, sample_session_data):
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        return session_id
+
+    def _stored_keys(self):
+        db = TestingSessionLocal()
+        try:
+            return db.query(IdempotencyKey).count()
+        finally:
+            db.close()
+
+    def test_retried_pause_records_one_interruption(self, client, sample_session_data):
+        """Test a retried pause replays its response instead of adding an interruption"""
+        session_id = self._started(client, sample_session_data)
+        headers = {"Idempotency-Key": "pause-1"}
+        first = client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"}, headers=headers)
+        retry = client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"}, headers=headers)
+        assert first.status_code == retry.status_code == 200
+        assert REPLAYED_HEADER not in first.headers and retry.headers[REPLAYED_HEADER] == "true"
+        assert retry.json() == first.json()
+        
+        data = client.get(f"/api/v1/sessions/{session_id}").json()
+        assert data["interruption_count"] == 1 and len(data["interruptions"]) == 1
+        assert client.get("/metrics").json()["idempotency"]["memory_replays"] == 1
+
+    def test_retry_reaching_another_process(self, client, sample_session_data):
+        """Test a key missing from memory is replayed from the table"""
+        headers = {"Idempotency-Key": "create-1"}
+        first = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()
+        client.app.state.idempotency.clear()
+        retry = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers)
+        assert retry.json() == first and retry.headers[REPLAYED_HEADER] == "true"
+        assert client.get("/api/v1/sessions/history").json()["total_sessions"] == 1
+        assert client.get("/metrics").json()["idempotency"]["table_replays"] == 1
+
+    def test_keys_are_scoped(self, client, sample_session_data):
+        """Test a key replays only the same request from the same owner"""
+        headers = {"Idempotency-Key": "shared"}
+        client.post("/api/v1/sessions/", json=sample_session_data, headers=headers)
+        other = client.post("/api/v1/sessions/", json={**sample_session_data, "title": "Other"}, headers=headers)
+        assert other.status_code == 422
+        
+        response = client.post("/api/v1/sessions/", json=sample_session_data, headers={**headers, "X-User-Id": "7"})
+        assert REPLAYED_HEADER not in response.headers and response.json()["owner_id"] == 7
+        assert self._stored_keys() == 2
+
+    def test_rejected_mutation_is_not_stored(self, client, sample_session_data):
+        """Test only successful responses are kept, so a rejected request can be retried later"""
+        session_id = self._started(client, sample_session_data)
+        headers = {"Idempotency-Key": "resume-1"}
+        assert client.patch(f"/api/v1/sessions/{session_id}/resume", headers=headers).status_code == 400
+        client.patch(f"/api/v1/sessions/{session_id}/pause", json={"reason": "Phone call"})
+        response = client.patch(f"/api/v1/sessions/{session_id}/resume", headers=headers)
+        assert response.status_code == 200 and response.json()["status"] == "active"
+        assert self._stored_keys() == 1
+
+    def test_expired_keys_are_pruned(self, client, sample_session_data):
+        """Test expired keys run again and are deleted as new keys are stored"""
+        store = client.app.state.idempotency
+        store.config.ttl_seconds = 0
+        store.config.prune_every = 2
+        for i in range(5):
+            client.post("/api/v1/sessions/", json=sample_session_data, headers={"Idempotency-Key": "same"})
+            client.post("/api/v1/sessions/", json=sample_session_data, headers={"Idempotency-Key": f"key-{i}"})
+        assert client.get("/api/v1/sessions/history").json()["total_sessions"] == 10
+        assert self._stored_keys() <= 2
+        assert store.metrics.pruned > 0
+
+    def test_concurrent_retries_through_group_commit(self, client, sample_session_data):
+        """Test duplicate requests queued together still apply once"""
+        session_id = self._started(client, sample_session_data)
+        writer = GroupCommitWriter(TestingSessionLocal, WriterConfig(enabled=True, max_delay_ms=50, max_batch=16))
+        writer.start()
+        app.dependency_overrides[get_writer] = lambda: writer
+        try:
+            responses = []
+            def pause():
+                responses.append(client.patch(
+                    f"/api/v1/sessions/{session_id}/pause", json={"reason": "Retry storm"}, headers={"Idempotency-Key": "storm"},
+                ))
+            threads = [threading.Thread(target=pause) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            del app.dependency_overrides[get_writer]
+            writer.stop()
+        assert [response.status_code for response in responses] == [200] * 4
+        assert len({response.text for response in responses}) == 1
+        assert client.get(f"/api/v1/sessions/{session_id}").json()["interruption_count"] == 1
+
+
+class TestRateLimits:
+    @pytest.fixture
+    def limiter(self, client):
+        limiter = RequestLimiter(LimitConfig(heavy_rate_per_second=0.5, heavy_burst=3, heavy_max_concurrent=1))
+        client.app.state.limits = limiter
+        return limiter
+
+    def test_off_by_default(self, monkeypatch):
+        """Test limits are only on when RATE_LIMIT_ENABLED asks for them"""
+        monkeypatch.delenv("RATE_LIMIT_ENABLED")
+        assert not LimitConfig.from_env().enabled
+        monkeypatch.setenv("RATE_LIMIT_ENABLED", "1")
+        assert LimitConfig.from_env().enabled
+
+    def test_token_bucket_refills(self):
+        """Test a bucket allows its burst, then one request per 1/rate seconds"""
+        buckets = TokenBuckets(rate=2, burst=2, max_keys=10)
+        assert buckets.take("a", now=0) == buckets.take("a", now=0) == 0
+        assert buckets.take("a", now=0) == pytest.approx(0.5)
+        assert buckets.take("a", now=0.5) == 0
+        assert buckets.take("b", now=0.5) == 0
+
+    def test_idle_buckets_are_evicted(self):
+        """Test refilled buckets are dropped, and memory stays within max_keys"""
+        buckets = TokenBuckets(rate=1, burst=2, max_keys=3)
+        buckets.take("a", now=0)
+        buckets.take("b", now=1)
+        assert buckets.evict_idle(now=1.5) == 0
+        assert buckets.evict_idle(now=2) == 1 and len(buckets) == 1
+        for key in "cdefg":
+            buckets.take(key, now=2)
+        assert buckets.evict_idle(now=2) == 3 and len(buckets) == 3
+
+    def test_history_loop_is_throttled(self, client, limiter, sample_session_data):
+        """Test a client looping on /history gets 429 with Retry-After, without affecting its other routes"""
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        assert [client.get("/api/v1/sessions/history").status_code for _ in range(3)] == [200] * 3
+        response = client.get("/api/v1/sessions/history")
+        assert response.status_code == 429 and response.headers["Retry-After"] == "2"
+        
+        # Buckets are keyed by address, so another X-User-Id is no way around the limit
+        assert client.get("/api/v1/sessions/history", headers={"X-User-Id": "1"}).status_code == 429
+        assert client.get("/api/v1/sessions/").status_code == 200
+        assert client.get("/metrics").json()["limits"]["throttled"] == 2
+
+    def test_heavy_routes_shed_load(self, client, limiter, sample_session_data):
+        """Test a heavy route past its concurrency limit answers 503 at once, and slots are released"""
+        client.post("/api/v1/sessions/", json=sample_session_data)
+        limiter.acquire("/api/v1/sessions/export")
+        response = client.get("/api/v1/sessions/export")
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        assert client.get("/api/v1/sessions/stats").status_code == 200
+        
+        limiter.release("/api/v1/sessions/export")
+        assert len(client.get("/api/v1/sessions/export").text.splitlines()) == 1
+        assert limiter.as_dict()["heavy_running"] == {} and limiter.metrics.shed == 1
+
+
+class TestPythonClient:
+    @pytest.fixture
+    def paths(self, client):
+        """Paths of the requests the client sends"""
+        sent = []
+        client.event_hooks = {"request": [lambda request: sent.append(request.url.path)], "response": []}
+        return sent
+
+    def _lifecycles(self, ids):
+        operations = []
+        for session_id in ids:
+            operations += [Operation.start(session_id), Operation.pause(session_id, "Phone call"), Operation.complete(session_id)]
+        return operations
+
+    def test_calls_parse_into_models(self, client, sample_session_data):
+        """Test the sync client's calls return typed models and raise ApiError on failures"""
+        api = Client(http=client, owner_id=3)
+        session = api.create_session(**sample_session_data)
+        assert session.owner_id == 3 and session.status == "planned"
+        assert api.pause(api.start(session.id).id, "Phone call").interruption_count == 1
+        assert api.list_sessions(status=["paused"], fields=["title"])[0].title == sample_session_data["title"]
+        assert api.history().total_sessions == 1 and api.stats().total_sessions == 1
+        assert [event.event_type for event in api.events(session.id)] == ["created", "started", "paused"]
+        assert [line["id"] for line in api.export()] == [session.id]
+        with pytest.raises(ApiError) as error:
+            api.resume(99999)
+        assert error.value.status_code == 404
+
+    def test_apply_uses_batches(self, client, paths, sample_session_data):
+        """Test operations are sent in batches, keeping each session's operations in order"""
+        api = Client(http=client)
+        ids = [api.create_session(**sample_session_data).id for _ in range(5)]
+        paths.clear()
+        results = api.apply(self._lifecycles(ids) + [Operation.resume(ids[0])], batch_size=4)
+        assert [result.status_code for result in results] == [200] * 15 + [400]
+        assert all(result.session.end_time is not None for result in results[2:15:3])
+        assert paths == ["/api/v1/capabilities"] + ["/api/v1/sessions/batch"] * 7
+        assert api.history().total_interruptions == 5
+
+    def test_apply_without_batches(self, client, paths, sample_session_data, monkeypatch):
+        """Test servers without batches get one request per operation, sessions in parallel"""
+        monkeypatch.setattr(schemas, "MAX_BATCH_OPERATIONS", 0)
+        api = Client(http=client)
+        ids = [api.create_session(**sample_session_data).id for _ in range(4)]
+        paths.clear()
+        results = api.apply(self._lifecycles(ids), concurrency=4)
+        assert all(result.ok for result in results)
+        assert len(paths) == 1 + 12 and "/api/v1/sessions/batch" not in paths
+
+    def test_async_client(self, client, sample_session_data):
+        """Test the asyncio client against the same app, batching concurrently"""
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with AsyncClient(http=httpx.AsyncClient(transport=transport, base_url="http://testserver")) as api:
+                created = await api.apply([Operation.create(**sample_session_data) for _ in range(6)], batch_size=2)
+                ids = [result.session.id for result in created]
+                results = await api.apply(self._lifecycles(ids), concurrency=3)
+                return results, await api.history(), [line async for line in api.export()]
+        results, history, exported = asyncio.run(run())
+        assert all(result.ok for result in results)
+        assert history.total_sessions == history.total_interruptions == 6
+        assert len(exported) == 6 and all(line["end_time"] for line in exported)
+
+    def test_retries_reuse_the_idempotency_key(self):
+        """Test 503s and dropped connections are retried with the same key"""
+        seen = []
+        def handler(request):
+            if request.url.path.endswith("/capabilities"):
+                return httpx.Response(200, json={"version": "1.0.0", "idempotency": True})
+            seen.append(request.headers["Idempotency-Key"])
+            if len(seen) == 1:
+                return httpx.Response(503, headers={"Retry-After": "0"})
+            if len(seen) == 2:
+                raise httpx.ConnectError("dropped")
+            return httpx.Response(200, json={"id": 1, "status": "active"})
+        api = Client(http=httpx.Client(transport=httpx.MockTransport(handler), base_url="http://testserver"), retries=2)
+        assert api.start(1).status == "active"
+        assert len(seen) == 3 and len(set(seen)) == 1
+
+
+class TestImport:
+    def _records(self, count, start=datetime(2025, 3, 1, 9)):
+        """Finished sessions, each with one interruption; every third one runs over"""
+        records = []
+        for i in range(count):
+            begin = start + timedelta(days=i)
+            records.append({
+                "title": f"Imported {i}", "goal": "History", "scheduled_duration": 30.0,
+                "created_at": begin.isoformat(), "start_time": begin.isoformat(),
+                "end_time": (begin + timedelta(minutes=50 if i % 3 == 0 else 25)).isoformat(),
+                "interruptions": [{"reason": "Phone call", "pause_time": (begin + timedelta(minutes=10)).isoformat()}],
+            })
+        return records
+
+    def _ndjson(self, records):
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def _import(self, body, name="history", chunk_size=2, crash_after=None, **kwargs):
+        """Run importer.import_sessions directly; crash_after raises once that many lines were read"""
+        lines = io.StringIO(body)
+        if crash_after is not None:
+            def crashing():
+                for number, line in enumerate(lines):
+                    if number == crash_after:
+                        raise RuntimeError("crash")
+                    yield line
+            stream = crashing()
+        else:
+            stream = lines
+        db = TestingSessionLocal()
+        try:
+            return importer.import_sessions(db, stream, kwargs.pop("format", "ndjson"), 1, name, chunk_size, **kwargs)
+        finally:
+            db.close()
+
+    def test_endpoint_imports_sessions_with_their_event_log(self, client, sample_session_data):
+        """Test imported sessions get statuses, counters and events, and survive a log replay"""
+        records = self._records(3) + [
+            {"title": "Planned", "goal": "Later", "scheduled_duration": 20, "created_at": "2025-04-01T08:00:00"},
+            {**self._records(1)[0], "title": "Still going", "end_time": None},
+        ]
+        headers = {"X-User-Id": "1"}
+        live = client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"]
+        response = client.post("/api/v1/sessions/import", params={"name": "team"}, content=self._ndjson(records), headers=headers)
+        assert response.status_code == 200
+        report = response.json()
+        assert (report["rows_read"], report["sessions_imported"], report["interruptions_imported"], report["rows_rejected"]) == (5, 5, 4, 0)
+
+        sessions = {s["title"]: s for s in client.get("/api/v1/sessions/history", headers=headers).json()["sessions"]}
+        assert [sessions[f"Imported {i}"]["status"] for i in range(3)] == ["overdue", "completed", "completed"]
+        assert sessions["Imported 1"]["actual_duration_minutes"] == 25.0 and sessions["Imported 1"]["interruption_count"] == 1
+        assert sessions["Planned"]["status"] == "planned" and sessions["Still going"]["status"] == "active"
+        events = client.get(f"/api/v1/sessions/{sessions['Imported 0']['id']}/events", headers=headers).json()
+        assert [e["event_type"] for e in events] == ["created", "started", "paused", "completed"]
+        assert events[2]["payload"]["interruption_id"] == sessions["Imported 0"]["interruptions"][0]["id"]
+        assert min(s["id"] for s in sessions.values() if s["id"] != live) > live
+
+        # New live rows continue after the imported ids
+        assert client.post("/api/v1/sessions/", json=sample_session_data, headers=headers).json()["id"] > max(s["id"] for s in sessions.values())
+        exported = client.get("/api/v1/sessions/export", headers=headers).text
+        db = TestingSessionLocal()
+        projector.rebuild(db, projector.SESSIONS)
+        db.close()
+        assert client.get("/api/v1/sessions/export", headers=headers).text == exported
+
+        # An export imports as it is
+        response = client.post("/api/v1/sessions/import", params={"name": "copy"}, content=exported, headers={"X-User-Id": "2"})
+        assert response.json()["sessions_imported"] == 7
+        copied = client.get("/api/v1/sessions/history", headers={"X-User-Id": "2"}).json()
+        original = client.get("/api/v1/sessions/history", headers=headers).json()
+        for key in ("total_sessions", "completed_sessions", "overdue_sessions", "total_interruptions", "total_productive_time"):
+            assert copied[key] == pytest.approx(original[key])
+
+    def test_csv_rows_are_validated_and_rejected_rows_reported(self, client):
+        """Test invalid CSV rows are reported by row number and the rest are imported"""
+        body = (
+            "title,goal,scheduled_duration,created_at,start_time,end_time,status,interruptions\n"
+            "Good,History,30,2025-03-01T09:00:00,2025-03-01T09:00:00,2025-03-01T09:20:00,,\n"
+            "Backwards,History,30,2025-03-01T09:00:00,2025-03-01T09:00:00,2025-03-01T08:00:00,,\n"
+            ",History,30,2025-03-01T09:00:00,,,,\n"
+            "Broken,History,30,2025-03-01T09:00:00,2025-03-01T09:00:00,,,[oops\n"
+            'Logged,History,30,2025-03-01T09:00:00,2025-03-01T09:00:00,2025-03-01T09:20:00,abandoned,"[{""reason"": ""Call"", ""pause_time"": ""2025-03-01T09:05:00""}]"\n'
+        )
+        response = client.post("/api/v1/sessions/import", params={"name": "csv", "chunk_size": 3}, content=body,
+                                headers={"Content-Type": "text/csv"})
+        report = response.json()
+        assert (report["sessions_imported"], report["rows_rejected"], report["interruptions_imported"]) == (2, 3, 1)
+        assert [error["row"] for error in report["errors"]] == [2, 3, 4]
+        assert "end_time is before start_time" in report["errors"][0]["message"]
+        assert report["errors"][1]["message"].startswith("title:")
+        statuses = {s["title"]: s["status"] for s in client.get("/api/v1/sessions/").json()}
+        assert statuses == {"Good": "completed", "Logged": "abandoned"}  # the logged outcome wins
+        assert client.post("/api/v1/sessions/import", params={"name": "bad"}, content=b"\xff\xfe").status_code == 400
+
+    def test_resumes_from_the_last_committed_chunk(self, client):
+        """Test a crashed import is resumed by name without duplicating or losing rows"""
+        body = self._ndjson(self._records(9))
+        with pytest.raises(RuntimeError):
+            self._import(body, crash_after=5)
+        db = TestingSessionLocal()
+        assert db.query(Session).count() == 4
+        assert db.get(ImportCheckpoint, (1, "history")).rows_read == 4
+        db.close()
+
+        report = self._import(body)
+        assert (report.resumed_from, report.rows_read, report.sessions_imported) == (4, 9, 9)
+        assert self._import(body).sessions_imported == 9  # a finished import is a no-op
+        db = TestingSessionLocal()
+        assert sorted(s.title for s in db.query(Session).all()) == sorted(f"Imported {i}" for i in range(9))
+        assert db.query(SessionEvent).count() == 9 * 4
+        db.close()
+
+    def test_concurrent_runs_of_one_import_conflict(self, client):
+        """Test a run whose checkpoint moved underneath it writes nothing"""
+        self._import(self._ndjson(self._records(2)))
+        db = TestingSessionLocal()
+        with pytest.raises(importer.ImportConflict):
+            importer.commit_chunk(db, 1, "history", [(3, self._records(1)[0])], rows_read=0)
+        db.close()
+        db = TestingSessionLocal()
+        assert db.query(Session).count() == 2
+        db.close()
+
+    def test_bulk_load_defers_indexes(self, client):
+        """Test the bulk-load mode drops secondary indexes and always builds them again"""
+        def index_names():
+            inspector = inspect(engine)
+            return {index["name"] for table in ("sessions", "interruptions", "session_events") for index in inspector.get_indexes(table)}
+        expected = {index.name for table in importer.IMPORTED_TABLES for index in table.indexes}
+        assert "ix_sessions_owner_created_at" in expected
+        with pytest.raises(RuntimeError):
+            with importer.deferred_indexes(engine):
+                assert not index_names() & expected
+                self._import(self._ndjson(self._records(5)), crash_after=3, bulk_load=True)
+        assert index_names() >= expected
+        assert self._import(self._ndjson(self._records(5)), bulk_load=True).sessions_imported == 5
+
+    def test_cli_writes_to_the_owners_shard(self, tmp_path, monkeypatch, capsys):
+        """Test the importer command routes the file to the owner's shard when storage is sharded"""
+        monkeypatch.setenv("SHARD_COUNT", "3")
+        monkeypatch.setenv("SHARD_URL_TEMPLATE", f"sqlite:///{tmp_path}/shard{{shard}}.db")
+        shards = sharding.ShardRouter.from_config(sharding.ShardConfig.from_env())
+        shards.create_all()
+        path = tmp_path / "history.ndjson"
+        path.write_text(self._ndjson(self._records(3)))
+        importer.main([str(path), "--owner-id", "7"])
+        assert "Imported 3 sessions" in capsys.readouterr().out
+
+        owner_shard = shards.shard_for_owner(7)
+        for shard, factory in enumerate(shards.session_factories):
+            db = factory()
+            ids = [session_id for session_id, in db.query(Session.id)]
+            db.close()
+            assert len(ids) == (3 if shard == owner_shard else 0)
+            assert all(sharding.shard_of_id(session_id) == owner_shard for session_id in ids)
+        shards.dispose()
+
+
+class TestMaintenance:
+    def _database(self, tmp_path, sessions=3000, name="maintained.db"):
+        """A migrated SQLite file; the older half of the sessions are untitled and sessions are padded to fill pages"""
+        url = f"sqlite:///{tmp_path / name}"
+        migrations.upgrade(url)
+        maintained = make_engine(url)
+        with maintained.begin() as conn:
+            conn.execute(Session.__table__.insert(), [
+                {"title": "" if i < sessions // 2 else f"Kept {i}", "goal": "x" * 500, "scheduled_duration": 30.0,
+                 "status": "planned", "created_at": datetime(2025, 1, 1)}
+                for i in range(sessions)
+            ])
+        return maintained
+
+    def _count(self, url):
+        counted = make_engine(url)
+        with counted.connect() as conn:
+            count = conn.execute(select(func.count()).select_from(Session.__table__)).scalar()
+        counted.dispose()
+        return count
+
+    def test_cleanup_deletes_in_set_based_batches(self, client, sample_session_data):
+        """Test untitled sessions go with their interruptions and events, a few DELETEs per batch"""
+        kept = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        db = TestingSessionLocal()
+        for _ in range(5):
+            untitled = Session(title="", goal="Legacy", scheduled_duration=30.0, status="planned")
+            db.add(untitled)
+            db.flush()
+            db.add(Interruption(session_id=untitled.id, reason="Call"))
+            db.add(SessionEvent(session_id=untitled.id, event_type="created", occurred_at=datetime.now()))
+        db.commit()
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            report = maintenance.cleanup(db, batch_size=2)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert "deleted 5 sessions" in report.detail
+        assert sum(statement.startswith("DELETE") for statement in statements) == 3 * 3  # three batches
+        assert [s.id for s in db.query(Session).all()] == [kept]
+        assert db.query(Interruption).count() == 0
+        assert {e.session_id for e in db.query(SessionEvent).all()} == {kept}
+        db.close()
+
+    def test_incremental_vacuum_returns_free_pages(self, tmp_path):
+        """Test new files vacuum incrementally, in bounded runs, down to an empty freelist"""
+        maintained = self._database(tmp_path)
+        path = maintenance.database_path(maintained)
+        assert maintenance.auto_vacuum_mode(maintained) == "incremental"
+        db = sessionmaker(bind=maintained)()
+        freed = maintenance.cleanup(db)
+        db.close()
+        size = os.path.getsize(path)
+
+        partial = maintenance.vacuum(maintained, max_pages=10, step=4)
+        assert partial.pages_reclaimed == 10
+        report = maintenance.vacuum(maintained)
+        assert report.pages_reclaimed > 100 and "0 of" in report.detail
+        assert f"{partial.pages_reclaimed + report.pages_reclaimed} pages freed" in freed.detail
+        assert os.path.getsize(path) == size - (partial.pages_reclaimed + report.pages_reclaimed) * report.page_size
+        assert self._count(str(maintained.url)) == 1500
+        maintained.dispose()
+
+    def test_vacuum_of_older_files_needs_enabling(self, tmp_path):
+        """Test a file created without incremental auto_vacuum is switched over only on request"""
+        url = f"sqlite:///{tmp_path / 'legacy.db'}"
+        legacy = make_engine(url)
+        Base.metadata.create_all(bind=legacy)
+        with pytest.raises(maintenance.MaintenanceError):
+            maintenance.vacuum(legacy)
+        assert "full VACUUM" in maintenance.vacuum(legacy, enable=True).detail
+        assert maintenance.auto_vacuum_mode(legacy) == "incremental"
+        with pytest.raises(maintenance.MaintenanceError):
+            maintenance.vacuum(make_engine("postgresql://localhost/deepwork"))
+        legacy.dispose()
+
+    def test_backup_while_written(self, tmp_path):
+        """Test a paged backup taken during writes is a consistent copy"""
+        maintained = self._database(tmp_path)
+        path = maintenance.database_path(maintained)
+        before = self._count(str(maintained.url))
+        stop = threading.Event()
+        def write():
+            with maintained.connect() as conn:
+                while not stop.is_set():
+                    conn.execute(Session.__table__.insert(), {"title": "Live", "goal": "Write", "scheduled_duration": 30.0})
+                    conn.commit()
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            report = maintenance.backup(maintained, str(tmp_path / "backup.db"), pages=16, sleep=0.001)
+        finally:
+            stop.set()
+            writer.join()
+        assert report.action == "backup" and "copied" in report.detail
+        assert before <= self._count(f"sqlite:///{tmp_path / 'backup.db'}") <= self._count(str(maintained.url))
+        assert not os.path.exists(str(tmp_path / "backup.db.partial"))
+
+        database.enable_wal(maintained)
+        report = maintenance.backup(maintained, str(tmp_path / "backup.db"))
+        assert "in one step" in report.detail
+        maintained.dispose()
+        assert os.path.exists(path)
+
+    def test_snapshot_and_analyze(self, tmp_path):
+        """Test VACUUM INTO leaves deleted rows' pages out and ANALYZE fills the planner statistics"""
+        maintained = self._database(tmp_path)
+        db = sessionmaker(bind=maintained)()
+        maintenance.cleanup(db)
+        db.close()
+        report = maintenance.snapshot(maintained, str(tmp_path / "snapshot.db"))
+        assert report.pages_reclaimed > 0
+        assert self._count(f"sqlite:///{tmp_path / 'snapshot.db'}") == 1500
+
+        assert "statistics for" in maintenance.analyze(maintained).detail
+        with maintained.connect() as conn:
+            analyzed = {row[0] for row in conn.exec_driver_sql("SELECT idx FROM sqlite_stat1")}
+        assert "ix_sessions_owner_created_at" in analyzed
+        maintained.dispose()
+
+    def test_cli(self, tmp_path, capsys):
+        """Test the maintenance CLI reports each step and rejects non-SQLite databases"""
+        maintained = self._database(tmp_path, sessions=100)
+        url = str(maintained.url)
+        maintained.dispose()
+        maintenance.main(["--url", url, "cleanup"])
+        maintenance.main(["--url", url, "vacuum"])
+        assert "deleted 50 sessions" in capsys.readouterr().out
+        with pytest.raises(SystemExit):
+            maintenance.main(["--url", "postgresql://localhost/deepwork", "analyze"])
+        assert "pg_dump" in capsys.readouterr().err
+
+    def test_scheduled_runs_on_the_lock_holder(self, client, tmp_path):
+        """Test scheduled maintenance runs on one worker and is exposed on /metrics"""
+        maintained = self._database(tmp_path)
+        db = sessionmaker(bind=maintained)()
+        maintenance.cleanup(db)
+        db.close()
+        factory = sessionmaker(bind=maintained)
+        config = maintenance.MaintenanceConfig(lock_file=str(tmp_path / "maintenance.lock"), vacuum_pages=5)
+        leader, standby = maintenance.Maintainer(factory, config), maintenance.Maintainer(factory, config)
+        assert asyncio.run(leader.run_once()) == 5
+        assert asyncio.run(standby.run_once()) == 0
+        assert leader.metrics.leader and not standby.metrics.leader and standby.metrics.runs == 0
+        assert leader.metrics.as_dict()["pages_reclaimed_total"] == 5
+        asyncio.run(leader.stop())
+        maintained.dispose()
+        assert "pages_reclaimed_total" in client.get("/metrics").json()["maintenance"]
+
+
+class TestDistribution:
+    def _records(self, durations, start=datetime(2025, 3, 1, 9), scheduled=30.0):
+        """Finished sessions a day apart with the given durations; the n-th has n % 3 interruptions"""
+        records = []
+        for i, minutes in enumerate(durations):
+            begin = start + timedelta(days=i)
+            records.append({
+                "title": f"Measured {i}", "goal": "Percentiles", "scheduled_duration": scheduled,
+                "created_at": begin.isoformat(), "start_time": begin.isoformat(),
+                "end_time": (begin + timedelta(minutes=minutes)).isoformat(),
+                "interruptions": [{"reason": "Call", "pause_time": (begin + timedelta(seconds=p + 1)).isoformat()} for p in range(i % 3)],
+            })
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def _exact(self, values, q):
+        ordered = sorted(values)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    def test_sketch_quantiles_merge_and_round_trip(self):
+        """Test DDSketch quantiles stay within the relative accuracy, and merging equals one sketch of everything"""
+        rng = random.Random(3)
+        values = [rng.lognormvariate(3.3, 0.7) for _ in range(20000)] + [0.0] * 500
+        whole, left, right = sketches.DDSketch(), sketches.DDSketch(), sketches.DDSketch()
+        for i, value in enumerate(values):
+            whole.add(value)
+            (left if i % 2 else right).add(value)
+        for q in (0.01, 0.5, 0.9, 0.99):
+            exact = self._exact(values, q)
+            assert whole.quantile(q) == pytest.approx(exact, rel=0.01, abs=1e-9)
+        restored = sketches.DDSketch.from_dict(json.loads(json.dumps(left.to_dict())))
+        combined, expected = restored.merge(right).to_dict(), whole.to_dict()
+        assert combined.pop("sum") == pytest.approx(expected.pop("sum"))
+        assert combined == expected
+        assert sketches.DDSketch().quantile(0.5) is None
+
+        bounded = sketches.DDSketch(max_bins=50)
+        for value in values:
+            bounded.add(value)
+        assert len(bounded.bins) <= 50
+        assert bounded.quantile(0.99) == pytest.approx(whole.quantile(0.99))
+        with pytest.raises(ValueError):
+            whole.merge(sketches.DDSketch(relative_accuracy=0.05))
+
+    def test_percentiles_per_bucket_and_overall(self, client):
+        """Test p50/p90/p99 of duration, overrun and interruptions come from the rollup sketches"""
+        durations = [10 + (i * 7) % 45 for i in range(60)]  # March and April
+        client.post("/api/v1/sessions/import", params={"name": "measured"}, content=self._records(durations), headers={"X-User-Id": "1"})
+        client.post("/api/v1/sessions/import", params={"name": "other"}, content=self._records([500]), headers={"X-User-Id": "2"})
+        project_rollups()
+
+        response = client.get("/api/v1/sessions/rollups/distribution", params={"bucket": "month"}, headers={"X-User-Id": "1"})
+        assert response.status_code == 200
+        distribution = response.json()
+        assert [b["bucket"] for b in distribution["buckets"]] == ["2025-03", "2025-04"]
+        assert [b["sessions"] for b in distribution["buckets"]] == [31, 29]
+        overall = distribution["overall"]
+        assert overall["sessions"] == 60
+        for q, key in ((0.5, "p50"), (0.9, "p90"), (0.99, "p99")):
+            assert overall["duration_minutes"][key] == pytest.approx(self._exact(durations, q), rel=0.01)
+            assert overall["overrun_ratio"][key] == pytest.approx(self._exact(durations, q) / 30.0, rel=0.01)
+        assert overall["duration_minutes"]["max"] == max(durations)
+        assert overall["duration_minutes"]["mean"] == pytest.approx(sum(durations) / 60)
+        assert overall["interruptions"]["p50"] == pytest.approx(1.0, rel=0.01)
+
+        weekly = client.get("/api/v1/sessions/rollups/distribution",
+                            params={"bucket": "week", "completed_from": "2025-03-03", "completed_to": "2025-03-10"},
+                            headers={"X-User-Id": "1"}).json()
+        assert [(b["bucket"], b["sessions"]) for b in weekly["buckets"]] == [("2025-W10", 7)]
+        overdue = client.get("/api/v1/sessions/rollups/distribution", params={"status": "overdue"}, headers={"X-User-Id": "1"}).json()
+        assert overdue["overall"]["sessions"] == sum(1 for d in durations if d > 33)
+        assert client.get("/api/v1/sessions/rollups/distribution", params={"bucket": "year"}).status_code == 422
+
+        everyone = client.get("/api/v1/sessions/stats/distribution").json()["overall"]
+        assert everyone["sessions"] == 61 and everyone["duration_minutes"]["max"] == 500
+
+    def test_rebuilt_and_older_events_give_the_same_sketches(self, client, sample_session_data):
+        """Test rebuilding the rollups reproduces the sketches, also from events without scheduled_duration"""
+        client.post("/api/v1/sessions/import", params={"name": "measured"}, content=self._records([20, 40, 60]))
+        session_id = client.post("/api/v1/sessions/", json=sample_session_data).json()["id"]
+        client.patch(f"/api/v1/sessions/{session_id}/start")
+        client.patch(f"/api/v1/sessions/{session_id}/complete")
+        project_rollups()
+        before = client.get("/api/v1/sessions/rollups/distribution").json()
+        assert before["overall"]["sessions"] == 4
+
+        db = TestingSessionLocal()
+        for event in db.query(SessionEvent).filter(SessionEvent.event_type == "completed"):
+            event.payload = {key: value for key, value in event.payload.items() if key != "scheduled_duration"}
+        db.commit()
+        projector.rebuild(db, projector.ROLLUPS)
+        db.close()
+        assert client.get("/api/v1/sessions/rollups/distribution").json() == before
+
+class TestProfiler:
+    ADMIN = {"X-Admin-Token": "secret"}
+
+    @pytest.fixture
+    def profiler(self, client):
+        profiler = Profiler(ProfilerConfig(admin_token="secret", max_seconds=5))
+        client.app.state.profiler = profiler
+        yield profiler
+        profiler.close()
+        client.app.state.profiler = None
+
+    def _history_load(self, client, sample_session_data):
+        """Loop on /history from a thread until the returned event is set"""
+        for _ in range(50):
+            client.post("/api/v1/sessions/", json=sample_session_data)
+        stop = threading.Event()
+        def load():
+            while not stop.is_set():
+                client.get("/api/v1/sessions/history")
+        thread = threading.Thread(target=load)
+        thread.start()
+        return stop, thread
+
+    def test_admin_routes_need_the_token(self, client):
+        """Test admin routes are hidden without ADMIN_TOKEN and refuse a wrong token"""
+        assert client.get("/api/v1/admin/profile?seconds=0.1", headers=self.ADMIN).status_code == 404
+        client.app.state.profiler = Profiler(ProfilerConfig(admin_token="secret"))
+        try:
+            assert client.get("/api/v1/admin/profile?seconds=0.1").status_code == 403
+            assert client.post("/api/v1/admin/tracemalloc/start", headers={"X-Admin-Token": "guess"}).status_code == 403
+            assert "/api/v1/admin/profile" not in client.get("/openapi.json").json()["paths"]
+        finally:
+            client.app.state.profiler = None
+
+    def test_collapsed_stacks_include_threadpool_handlers(self, client, profiler, sample_session_data):
+        """Test a profile catches sync routes running in the threadpool, and leaves parked threads out"""
+        stop, thread = self._history_load(client, sample_session_data)
+        try:
+            response = client.get("/api/v1/admin/profile?seconds=1&format=collapsed", headers=self.ADMIN)
+        finally:
+            stop.set()
+            thread.join()
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        handlers = [line for line in lines if "get_session_history (backend/routers/sessions.py" in line]
+        assert handlers and all(line.startswith("AnyIO worker thread;") for line in handlers)
+        assert not any(line.rsplit(" ", 1)[0].endswith("(queue.py:154)") for line in lines)
+        assert int(response.headers["X-Profile-Samples"]) > 10
+        metrics = client.get("/metrics").json()["profiler"]
+        assert metrics["profiles"] == 1 and metrics["samples"] == int(response.headers["X-Profile-Samples"])
+
+    def test_speedscope_profile(self, client, profiler):
+        """Test the speedscope export is one weighted, sampled profile per thread over shared frames"""
+        stop = threading.Event()
+        def spin():
+            while not stop.is_set():
+                sum(range(1000))
+        thread = threading.Thread(target=spin, name="busy")
+        thread.start()
+        try:
+            response = client.get("/api/v1/admin/profile?seconds=0.5&interval_ms=5", headers=self.ADMIN)
+        finally:
+            stop.set()
+            thread.join()
+        assert response.status_code == 200
+        assert response.headers["Content-Disposition"].endswith('.speedscope.json"')
+        data = response.json()
+        frames = data["shared"]["frames"]
+        busy = next(profile for profile in data["profiles"] if profile["name"] == "busy")
+        assert busy["type"] == "sampled" and busy["unit"] == "milliseconds"
+        assert len(busy["samples"]) == len(busy["weights"]) and busy["endValue"] == pytest.approx(sum(busy["weights"]))
+        assert all(0 <= index < len(frames) for sample in data["profiles"][0]["samples"] for index in sample)
+        assert all(any(frames[index]["name"].endswith("spin") for index in sample) for sample in busy["samples"])
+
+    def test_one_profile_at_a_time(self, client, profiler):
+        """Test a second concurrent profile is refused, and profiles are bounded"""
+        async def both():
+            return await asyncio.gather(profiler.profile(0.3), profiler.profile(0.3), return_exceptions=True)
+        results = asyncio.run(both())
+        assert sum(isinstance(result, ProfilerError) for result in results) == 1
+        assert profiler.metrics.rejected == 1
+        assert client.get("/api/v1/admin/profile?seconds=6", headers=self.ADMIN).status_code == 400
+
+    def test_tracemalloc_diff_points_at_growth(self, client, profiler, sample_session_data):
+        """Test a snapshot reports the lines that allocated since the previous one"""
+        assert client.get("/api/v1/admin/tracemalloc/snapshot", headers=self.ADMIN).status_code == 409
+        started = client.post("/api/v1/admin/tracemalloc/start?frames=5", headers=self.ADMIN).json()
+        assert started["tracing"] and started["frames"] == 5
+        held = [bytes(1000) + bytes([i % 256]) for i in range(3000)]
+        response = client.get("/api/v1/admin/tracemalloc/snapshot?limit=10", headers=self.ADMIN)
+        assert response.status_code == 200
+        top = response.json()["top"]
+        growth = next(stat for stat in top if "backend/tests/test_sessions.py" in stat["traceback"][-1])
+        assert growth["size_diff_bytes"] >= 3000 * 1000 and growth["count_diff"] >= 3000
+        # The next snapshot compares with this one, so the held list is no longer growth
+        again = client.get("/api/v1/admin/tracemalloc/snapshot?limit=10", headers=self.ADMIN).json()
+        assert all(stat["size_diff_bytes"] < 1_000_000 for stat in again["top"])
+        del held
+        stopped = client.post("/api/v1/admin/tracemalloc/stop", headers=self.ADMIN).json()
+        assert not client.get("/metrics").json()["profiler"]["tracing"]
+        assert stopped["traced_bytes"] > 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,169 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import Depends, Request
+from sqlalchemy.orm import Session
+
+from .database import get_owner_id
+from .sharding import shard_for_request
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+@dataclass
+class WriterConfig:
+    """Group commit settings; disabled by default"""
+    enabled: bool = False
+    max_delay_ms: float = 2.0  # how long a group waits for more work
+    max_batch: int = 64  # mutations per group commit
+
+    @classmethod
+    def from_env(cls):
+        """Read overrides from GROUP_COMMIT_* environment variables"""
+        defaults = cls()
+        return cls(
+            enabled=os.getenv("GROUP_COMMIT_ENABLED", "0").lower() in ("1", "true", "yes"),
+            max_delay_ms=float(os.getenv("GROUP_COMMIT_MAX_DELAY_MS", defaults.max_delay_ms)),
+            max_batch=int(os.getenv("GROUP_COMMIT_MAX_BATCH", defaults.max_batch)),
+        )
+
+@dataclass
+class WriterMetrics:
+    """Counters exposed on /metrics"""
+    groups: int = 0
+    mutations: int = 0
+    failed_mutations: int = 0
+    failed_groups: int = 0
+    largest_group: int = 0
+
+    def as_dict(self):
+        return {
+            "groups": self.groups,
+            "mutations": self.mutations,
+            "failed_mutations": self.failed_mutations,
+            "failed_groups": self.failed_groups,
+            "largest_group": self.largest_group,
+            "mean_group_size": self.mutations / self.groups if self.groups else 0.0,
+        }
+
+class GroupCommitWriter:
+    """Single writer thread that applies queued mutations in group commits.
+
+    A mutation is a callable taking a SQLAlchemy session. Each one runs in its
+    own SAVEPOINT, so a failing mutation is rolled back without affecting the
+    rest of its group. The group is committed once, and only then are the
+    callers' futures resolved, so nothing is acknowledged before it is durable.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], config: Optional[WriterConfig] = None):
+        self.session_factory = session_factory
+        self.config = config or WriterConfig(enabled=True)
+        self.metrics = WriterMetrics()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Flush queued mutations and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, mutation: Callable[[Session], object]) -> Future:
+        """Queue a mutation; the future resolves after its group commits"""
+        if self._thread is None:
+            raise RuntimeError("Group commit writer is not running")
+        future = Future()
+        self._queue.put((future, mutation))
+        return future
+
+    def execute(self, mutation: Callable[[Session], object]):
+        """Queue a mutation and wait for its durable result"""
+        return self.submit(mutation).result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.config.max_delay_ms / 1000
+            while len(batch) < self.config.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_group(batch)
+
+    def _commit_group(self, batch: List[Tuple[Future, Callable[[Session], object]]]):
+        outcomes = []
+        db = None
+        try:
+            # Inside the try: a pool timeout or refused connection fails this group, not the writer thread
+            db = self.session_factory()
+            db.info["group_commit"] = True
+            for future, mutation in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with db.begin_nested():
+                        outcomes.append((future, mutation(db), None))
+                except Exception as exc:
+                    outcomes.append((future, None, exc))
+            db.commit()
+        except Exception as exc:
+            logger.exception("Group commit of %d mutations failed", len(batch))
+            self.metrics.failed_groups += 1
+            if db is not None:
+                try:
+                    db.rollback()
+                except Exception:
+                    logger.exception("Rollback after a failed group commit failed")
+            # Every caller still waiting hears of it, including mutations the group never reached
+            for future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            if db is not None:
+                db.close()
+
+        self.metrics.groups += 1
+        self.metrics.mutations += len(outcomes)
+        self.metrics.largest_group = max(self.metrics.largest_group, len(outcomes))
+        for future, result, exc in outcomes:
+            if exc is not None:
+                self.metrics.failed_mutations += 1
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+def get_writer(request: Request, owner_id: int = Depends(get_owner_id)) -> Optional[GroupCommitWriter]:
+    """Dependency returning the running writer, or None for per-request commits"""
+    writers = getattr(request.app.state, "shard_writers", None)
+    if writers:
+        return writers[shard_for_request(request, owner_id, len(writers))]
+    return getattr(request.app.state, "writer", None)
+
+def run_mutation(db: Session, writer: Optional[GroupCommitWriter], mutation: Callable[[Session], object]):
+    """Apply a mutation through the writer when enabled, otherwise on the request session"""
+    if writer is None:
+        return mutation(db)
+    return writer.execute(mutation)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Time driving session lifecycles through the API four ways.
+
+Starts uvicorn against a scratch database, creates the sessions, then applies
+start, pause and complete to each one:
+
+- per-call: a new connection for every call, as the requests calls in test_api.py
+  make (httpx's module-level functions, which behave the same)
+- pooled: Client, one blocking call at a time over keep-alive connections
+- apply(): Client.apply, with concurrent POST /sessions/batch requests
+- async: AsyncClient.apply, with the same batches from one event loop
+
+Usage: python benchmarks/bench_client.py [sessions]
+"""
+import asyncio
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from deepwork_client import AsyncClient, Client, Operation
+
+SESSION = {"title": "Benchmark", "goal": "Lifecycle", "scheduled_duration": 30.0}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def lifecycles(ids):
+    operations = []
+    for session_id in ids:
+        operations += [Operation.start(session_id), Operation.pause(session_id, "Benchmark"), Operation.complete(session_id)]
+    return operations
+
+
+def per_call(base_url, sessions):
+    headers = {"X-User-Id": "1"}
+    ids = [httpx.post(f"{base_url}/api/v1/sessions/", json=SESSION, headers=headers).json()["id"] for _ in range(sessions)]
+    for session_id in ids:
+        httpx.patch(f"{base_url}/api/v1/sessions/{session_id}/start", headers=headers).raise_for_status()
+        httpx.patch(f"{base_url}/api/v1/sessions/{session_id}/pause", json={"reason": "Benchmark"}, headers=headers).raise_for_status()
+        httpx.patch(f"{base_url}/api/v1/sessions/{session_id}/complete", headers=headers).raise_for_status()
+
+
+def pooled(base_url, sessions):
+    with Client(base_url, owner_id=2) as api:
+        ids = [api.create_session(**SESSION).id for _ in range(sessions)]
+        for session_id in ids:
+            api.start(session_id)
+            api.pause(session_id, "Benchmark")
+            api.complete(session_id)
+
+
+def batched(base_url, sessions):
+    with Client(base_url, owner_id=3) as api:
+        created = api.apply([Operation.create(**SESSION) for _ in range(sessions)])
+        results = api.apply(lifecycles([result.session.id for result in created]))
+        assert all(result.ok for result in results)
+
+
+def async_batched(base_url, sessions):
+    async def run():
+        async with AsyncClient(base_url, owner_id=4) as api:
+            created = await api.apply([Operation.create(**SESSION) for _ in range(sessions)])
+            results = await api.apply(lifecycles([result.session.id for result in created]))
+            assert all(result.ok for result in results)
+    asyncio.run(run())
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as scratch:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {**os.environ, "PYTHONPATH": ROOT, "SWEEPER_ENABLED": "0", "RATE_LIMIT_ENABLED": "0"}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=scratch, env=env,
+        )
+        try:
+            while True:
+                try:
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                    conn.request("GET", "/health")
+                    conn.getresponse().read()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            print(f"{sessions} sessions created, started, paused and completed ({sessions * 4} operations), {os.cpu_count()} CPUs")
+            print(f"{'client':10} {'seconds':>8} {'ops/s':>8}")
+            for name, drive in (("per-call", per_call), ("pooled", pooled), ("apply()", batched), ("async", async_batched)):
+                started = time.perf_counter()
+                drive(base_url, sessions)
+                elapsed = time.perf_counter() - started
+                print(f"{name:10} {elapsed:8.2f} {sessions * 4 / elapsed:8.0f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Session percentiles from rollup sketches against sorting the sessions table.
+
+Imports finished sessions for one owner, spread over three years, into a
+scratch database and builds the rollups projection from the event log
+(timed, since each completed event now also updates three sketches). Then
+computes p50/p90/p99 of duration, overall and per month, two ways:
+
+- exact: read every session's duration ordered by value, as a SQL percentile
+  query must, and pick the ranks
+- sketch: GET /sessions/rollups/distribution's path, merging the day sketches
+
+and reports the time of each and the sketches' largest relative error.
+
+Usage: python benchmarks/bench_distribution.py [sessions] [database_url]
+"""
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from backend import crud, importer, migrations, models, projector
+from backend.database import Base, make_engine
+
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+REPEATS = 5
+
+
+def history(sessions):
+    rng = random.Random(11)
+    start = datetime(2022, 1, 1, 8)
+    lines = []
+    for i in range(sessions):
+        begin = start + timedelta(minutes=(3 * 365 * 24 * 60) * i // sessions)
+        minutes = rng.lognormvariate(3.4, 0.5)
+        lines.append(json.dumps({
+            "title": f"Focus block {i}", "goal": "Ship", "scheduled_duration": 45.0,
+            "created_at": begin.isoformat(), "start_time": begin.isoformat(),
+            "end_time": (begin + timedelta(minutes=minutes)).isoformat(),
+            "interruptions": [{"reason": "Slack", "pause_time": (begin + timedelta(minutes=1 + p)).isoformat()} for p in range(rng.randint(0, 3))],
+        }))
+    return "\n".join(lines) + "\n"
+
+
+def exact(db):
+    """Percentiles by sorting every session, overall and per completion month"""
+    durations = [row[0] for row in db.execute(text(
+        "SELECT actual_duration_minutes FROM sessions WHERE owner_id = 1 ORDER BY actual_duration_minutes"))]
+    by_month = defaultdict(list)
+    for month, minutes in db.execute(text(
+            "SELECT substr(CAST(end_time AS TEXT), 1, 7), actual_duration_minutes FROM sessions "
+            "WHERE owner_id = 1 ORDER BY actual_duration_minutes")):
+        by_month[month].append(minutes)
+
+    def ranks(values):
+        return {key: values[int(q * (len(values) - 1))] for key, q in QUANTILES.items()}
+    return ranks(durations), {month: ranks(values) for month, values in by_month.items()}
+
+
+def sketched(db):
+    distribution = crud.session_distribution(crud.rollup_sketches(db, 1), "month")
+    def ranks(bucket):
+        return {key: getattr(bucket.duration_minutes, key) for key in QUANTILES}
+    return ranks(distribution.overall), {bucket.bucket: ranks(bucket) for bucket in distribution.buckets}
+
+
+def timed(function, db):
+    best = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        result = function(db)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    database_url = sys.argv[2] if len(sys.argv) > 2 else "sqlite"
+    with tempfile.TemporaryDirectory() as scratch:
+        if database_url.startswith("postgresql"):
+            url = database_url
+            engine = make_engine(url)
+            with engine.begin() as conn:
+                conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+                conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS session_history_stats"))
+            Base.metadata.drop_all(engine)
+            engine.dispose()
+        else:
+            url = f"sqlite:///{scratch}/distribution.db"
+        migrations.upgrade(url)
+        engine = make_engine(url)
+        db = sessionmaker(bind=engine)()
+        importer.import_sessions(db, io.StringIO(history(sessions)), "ndjson", 1, "history", 10_000)
+        completed = db.query(models.SessionEvent).filter(models.SessionEvent.event_type == "completed").count()
+
+        started = time.perf_counter()
+        projector.rebuild(db, projector.ROLLUPS, batch_size=5000)
+        rebuild = time.perf_counter() - started
+        rows = db.query(models.SessionDailyRollup).count()
+        stored = sum(len(json.dumps(row.duration_sketch)) + len(json.dumps(row.overrun_sketch)) + len(json.dumps(row.interruptions_sketch))
+                     for row in db.query(models.SessionDailyRollup))
+        print(f"{sessions} sessions over 3 years, {database_url.split(':')[0]}, {os.cpu_count()} CPUs")
+        print(f"rollups rebuilt from {completed} completed events in {rebuild:.1f}s ({completed / rebuild:.0f} events/s); "
+              f"{rows} rollup rows, {stored / rows / 1024:.1f} KB of sketches per row")
+
+        (exact_overall, exact_months), exact_seconds = timed(exact, db)
+        (sketch_overall, sketch_months), sketch_seconds = timed(sketched, db)
+        assert exact_months.keys() == sketch_months.keys()
+        worst = max(
+            abs(sketch[key] - truth[key]) / truth[key]
+            for truth, sketch in [(exact_overall, sketch_overall)] + [(exact_months[m], sketch_months[m]) for m in exact_months]
+            for key in QUANTILES
+        )
+        print(f"{'method':8} {'ms':>8}  overall p50 / p90 / p99 minutes, plus {len(exact_months)} months")
+        for name, seconds, overall in (("exact", exact_seconds, exact_overall), ("sketch", sketch_seconds, sketch_overall)):
+            print(f"{name:8} {seconds * 1000:8.1f}  " + " / ".join(f"{overall[key]:.1f}" for key in QUANTILES))
+        print(f"largest relative error of a sketch percentile: {worst:.2%}")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Replay a session event log into a fresh database.
+
+Without a log file, a seeded workload is recorded through crud first and
+exported, so every run replays the same events. Reports replay throughput and
+checks the rebuilt sessions match the recorded database.
+
+Usage: python benchmarks/bench_event_replay.py [sessions | events.jsonl]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import crud, projector, schemas
+from backend.database import Base
+
+
+def open_db(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def record_workload(db, sessions, seed=0):
+    rng = random.Random(seed)
+    for i in range(sessions):
+        session = crud.create_session(db, schemas.SessionCreate(
+            title=f"Session {i}", goal="Replay", scheduled_duration=rng.choice([25.0, 50.0, 90.0])))
+        if rng.random() < 0.1:
+            continue
+        crud.start_session(db, session.id)
+        for _ in range(rng.randrange(5)):
+            crud.pause_session(db, session.id, rng.choice(["Phone call", "Meeting", "Slack"]))
+            if rng.random() < 0.8:
+                crud.resume_session(db, session.id)
+            else:
+                break
+        if rng.random() < 0.9:
+            crud.complete_session(db, session.id)
+
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        return (conn.exec_driver_sql("SELECT * FROM sessions ORDER BY id").fetchall(),
+                conn.exec_driver_sql("SELECT * FROM interruptions ORDER BY id").fetchall())
+
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else "2000"
+    with tempfile.TemporaryDirectory() as scratch:
+        expected = None
+        if arg.endswith(".jsonl"):
+            log = arg
+        else:
+            engine, db = open_db(os.path.join(scratch, "recorded.db"))
+            start = time.perf_counter()
+            record_workload(db, int(arg))
+            print(f"Recorded {int(arg):,} sessions through crud in {time.perf_counter() - start:.2f}s")
+            log = os.path.join(scratch, "events.jsonl")
+            projector.export_events(db, log)
+            expected = snapshot(engine)
+            db.close()
+            engine.dispose()
+
+        engine, db = open_db(os.path.join(scratch, "replayed.db"))
+        start = time.perf_counter()
+        events = projector.replay(db, projector.read_events(log))
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {events:,} events in {elapsed:.2f}s ({events / elapsed:,.0f} events/s)")
+
+        start = time.perf_counter()
+        projector.catch_up(db, projector.ROLLUPS)
+        print(f"Projected daily rollups in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        projector.rebuild(db, projector.SESSIONS)
+        print(f"Rebuilt sessions in place in {time.perf_counter() - start:.2f}s")
+
+        if expected is not None:
+            match = snapshot(engine) == expected
+            print(f"Rebuilt tables match the recorded database: {match}")
+        db.close()
+        engine.dispose()
+        if expected is not None and not match:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Load test pause/resume churn with per-request commits vs group commits.
+
+Each client thread owns one active session and pauses/resumes it in a loop,
+like the request threads of the API would. Per-request mode commits every
+mutation; group mode hands them to the GroupCommitWriter.
+
+Usage: python benchmarks/bench_group_commit.py [ops_per_client] [max_delay_ms]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import crud, models, schemas
+from backend.database import Base
+from backend.writer import GroupCommitWriter, WriterConfig, run_mutation
+
+CLIENTS = (1, 4, 16, 64)
+
+
+def setup(path, clients):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 60})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    ids = []
+    for _ in range(clients):
+        session = crud.create_session(db, schemas.SessionCreate(title="Load", goal="Churn", scheduled_duration=60))
+        crud.start_session(db, session.id)
+        ids.append(session.id)
+    db.close()
+    return engine, factory, ids
+
+
+def churn(factory, writer, session_id, ops):
+    for i in range(ops):
+        if i % 2 == 0:
+            mutation = lambda db: crud.pause_session(db, session_id, "Churn") and None
+        else:
+            mutation = lambda db: crud.resume_session(db, session_id) and None
+        db = factory()
+        try:
+            run_mutation(db, writer, mutation)
+        finally:
+            db.close()
+
+
+def run(clients, ops, group, max_delay_ms):
+    with tempfile.TemporaryDirectory() as scratch:
+        engine, factory, ids = setup(os.path.join(scratch, "bench.db"), clients)
+        writer = None
+        if group:
+            writer = GroupCommitWriter(factory, WriterConfig(enabled=True, max_delay_ms=max_delay_ms, max_batch=256))
+            writer.start()
+
+        threads = [threading.Thread(target=churn, args=(factory, writer, session_id, ops)) for session_id in ids]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if writer:
+            writer.stop()
+        db = factory()
+        interruptions = db.query(models.Interruption).count()
+        db.close()
+        engine.dispose()
+
+    expected = clients * ((ops + 1) // 2)
+    assert interruptions == expected, (interruptions, expected)
+    return clients * ops / elapsed, writer.metrics.as_dict()["mean_group_size"] if writer else 1.0
+
+
+def main():
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    max_delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    print(f"{'clients':>8} {'per-request ops/s':>18} {'group ops/s':>12} {'speedup':>8} {'mean group':>11}")
+    for clients in CLIENTS:
+        baseline, _ = run(clients, ops, group=False, max_delay_ms=max_delay_ms)
+        grouped, group_size = run(clients, ops, group=True, max_delay_ms=max_delay_ms)
+        print(f"{clients:8d} {baseline:18.0f} {grouped:12.0f} {grouped / baseline:7.1f}x {group_size:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
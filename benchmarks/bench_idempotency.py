@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Cost of Idempotency-Key handling: first execution versus replays, and table growth.
+
+Runs the app in process against a scratch SQLite file and times POST /sessions/:
+  - no key:          the plain mutation
+  - new key:         the mutation plus storing its response in the same transaction
+  - memory replay:   a retry answered from the per-process LRU
+  - table replay:    a retry after the LRU was cleared, as when it reaches another worker
+Then keeps writing keyed requests with a short TTL and reports how many rows the
+idempotency_keys table holds while expired ones are pruned.
+
+Usage: python benchmarks/bench_idempotency.py [requests]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+BODY = {"title": "Retry", "goal": "Idempotency", "scheduled_duration": 30}
+
+
+def timed_posts(client, keys):
+    latencies = []
+    for key in keys:
+        headers = {"Idempotency-Key": key} if key else {}
+        started = time.perf_counter()
+        response = client.post("/api/v1/sessions/", json=BODY, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    return latencies
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ.update(DATABASE_URL=f"sqlite:///{scratch}/deepwork.db", SWEEPER_ENABLED="0")
+        from fastapi.testclient import TestClient
+        from backend import models
+        from backend.database import SessionLocal
+        from backend.main import create_app
+
+        with TestClient(create_app()) as client:
+            store = client.app.state.idempotency
+            keys = [f"key-{i}" for i in range(requests)]
+            results = {
+                "no key": timed_posts(client, [None] * requests),
+                "new key": timed_posts(client, keys),
+                "memory replay": timed_posts(client, keys),
+            }
+            store.clear()
+            results["table replay"] = timed_posts(client, keys)
+
+            print(f"POST /sessions/ x {requests}, {os.cpu_count()} CPUs")
+            print(f"{'request':16} {'mean ms':>8} {'p99 ms':>8}")
+            for name, latencies in results.items():
+                latencies.sort()
+                print(f"{name:16} {statistics.mean(latencies) * 1000:8.2f} {latencies[int(len(latencies) * 0.99)] * 1000:8.2f}")
+
+            ttl, seconds = 1.0, 5.0
+            store.config.ttl_seconds = ttl
+            db = SessionLocal()
+            written, largest = 0, 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                timed_posts(client, [f"ttl-{written + i}" for i in range(100)])
+                written += 100
+                largest = max(largest, db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key.startswith("ttl-")).count())
+                db.rollback()
+            db.close()
+            print(f"{written} keyed writes in {seconds:.0f}s with a {ttl:.0f}s TTL: table peaked at {largest} rows, "
+                  f"{store.metrics.pruned} pruned")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Bulk import throughput, and resuming an import that was killed part way.
+
+Writes a file of finished sessions with zero to three interruptions each, then
+imports it into fresh scratch databases:
+
+- replayed: create, start, pause..., complete through the API, one call at a time
+  over a pooled connection (timed on a sample, as onboarding used to do it)
+- import: python -m backend.importer, chunked transactions with indexes in place
+- bulk load: the same with --bulk-load, indexes dropped and rebuilt at the end
+
+Finally the importer is killed with SIGKILL once a quarter of the file is
+in, run again with the same arguments, and the imported sessions are counted.
+
+Usage: python benchmarks/bench_import.py [sessions] [database_url]
+"""
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+REPLAYED_SESSIONS = 200
+
+
+def write_file(path, sessions):
+    rng = random.Random(7)
+    start = datetime(2023, 1, 1, 8)
+    interruptions = 0
+    with open(path, "w") as f:
+        for i in range(sessions):
+            begin = start + timedelta(minutes=90 * i)
+            pauses = [
+                {"reason": rng.choice(["Phone call", "Slack", "Meeting"]), "pause_time": (begin + timedelta(minutes=5 + 5 * p)).isoformat()}
+                for p in range(rng.randint(0, 3))
+            ]
+            interruptions += len(pauses)
+            f.write(json.dumps({
+                "title": f"Focus block {i}", "goal": "Ship the quarterly plan", "scheduled_duration": 45.0,
+                "created_at": begin.isoformat(), "start_time": begin.isoformat(),
+                "end_time": (begin + timedelta(minutes=rng.randint(20, 60))).isoformat(), "interruptions": pauses,
+            }) + "\n")
+    return interruptions
+
+
+def fresh_database(url, scratch, name):
+    from backend import migrations
+    if url.startswith("postgresql"):
+        from sqlalchemy import text
+        from backend.database import Base, make_engine
+        engine = make_engine(url)
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+    else:
+        url = f"sqlite:///{scratch}/{name}.db"
+    migrations.upgrade(url)
+    return url
+
+
+def run_import(url, path, *args):
+    env = {**os.environ, "PYTHONPATH": ROOT, "DATABASE_URL": url}
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "backend.importer", path, "--owner-id", "1", *args], env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def count_sessions(url):
+    from sqlalchemy import text
+    from backend.database import make_engine
+    engine = make_engine(url)
+    with engine.connect() as conn:
+        counts = conn.execute(text("SELECT count(*), count(DISTINCT title) FROM sessions")).one()
+    engine.dispose()
+    return counts
+
+
+def replayed_rate(url, scratch):
+    """Sessions per second when each one is replayed through single API calls"""
+    from deepwork_client import Client
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {**os.environ, "PYTHONPATH": ROOT, "DATABASE_URL": url, "SWEEPER_ENABLED": "0", "RATE_LIMIT_ENABLED": "0"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=scratch, env=env,
+    )
+    try:
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/health")
+                conn.getresponse().read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        with Client(f"http://127.0.0.1:{port}", owner_id=1) as api:
+            started = time.perf_counter()
+            for i in range(REPLAYED_SESSIONS):
+                session = api.create_session(f"Focus block {i}", "Ship the quarterly plan", 45.0)
+                api.start(session.id)
+                for _ in range(i % 4):
+                    api.pause(session.id, "Phone call")
+                    api.resume(session.id)
+                api.complete(session.id)
+            return REPLAYED_SESSIONS / (time.perf_counter() - started)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    database_url = sys.argv[2] if len(sys.argv) > 2 else "sqlite"
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "history.ndjson")
+        interruptions = write_file(path, sessions)
+        print(f"{sessions} sessions, {interruptions} interruptions, {os.path.getsize(path) / 1e6:.1f} MB of NDJSON, "
+              f"{database_url.split(':')[0]}, {os.cpu_count()} CPUs")
+        print(f"{'method':10} {'seconds':>8} {'sessions/s':>11}")
+        rate = replayed_rate(fresh_database(database_url, scratch, "replayed"), scratch)
+        print(f"{'replayed':10} {sessions / rate:8.1f} {rate:11.0f}   (timed on {REPLAYED_SESSIONS} sessions)")
+        for name, args in (("import", []), ("bulk load", ["--bulk-load"])):
+            url = fresh_database(database_url, scratch, name.replace(" ", "_"))
+            seconds = run_import(url, path, *args)
+            assert count_sessions(url) == (sessions, sessions)
+            print(f"{name:10} {seconds:8.1f} {sessions / seconds:11.0f}")
+
+        url = fresh_database(database_url, scratch, "resumed")
+        env = {**os.environ, "PYTHONPATH": ROOT, "DATABASE_URL": url}
+        proc = subprocess.Popen([sys.executable, "-m", "backend.importer", path, "--owner-id", "1"], env=env, stdout=subprocess.DEVNULL)
+        while count_sessions(url)[0] < sessions // 4:
+            time.sleep(0.1)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+        killed_at = count_sessions(url)[0]
+        run_import(url, path)
+        total, distinct = count_sessions(url)
+        print(f"Killed after {killed_at} sessions; the rerun resumed and left {total} sessions, {distinct} distinct")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Benchmark the lag-feature engine against the notebook's sort + groupby.shift.
+
+Usage: python benchmarks/bench_lag_features.py [rows]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.lags import LagFeatureEngine
+from analytics.synthetic import make_dataset
+
+LAGS = (1, 2, 3)
+WINDOWS = (3, 5)
+
+
+def notebook_path(df):
+    df = df.sort_values(by=['Customer ID', 'Purchase Date'])
+    groups = df.groupby('Customer ID')['Returns']
+    for lag in LAGS:
+        df[f'Returns_lag{lag}'] = groups.shift(lag)
+    for window in WINDOWS:
+        df[f'Returns_roll{window}_mean'] = groups.transform(lambda s: s.shift(1).rolling(window, min_periods=1).mean())
+    return df
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = make_dataset(rows=rows, customers=rows // 5)
+    df['Purchase Date'] = pd.to_datetime(df['Purchase Date'])
+
+    start = time.perf_counter()
+    notebook_path(df)
+    print(f"sort + groupby:    {time.perf_counter() - start:8.3f}s")
+
+    engine = LagFeatureEngine(lags=LAGS, windows=WINDOWS)
+    start = time.perf_counter()
+    engine.transform(df)
+    print(f"LagFeatureEngine:  {time.perf_counter() - start:8.3f}s")
+
+    df = df.sort_values('Purchase Date')
+    history, new = df.iloc[: rows * 9 // 10], df.iloc[rows * 9 // 10:]
+    engine.update(history)
+    start = time.perf_counter()
+    engine.update(new)
+    print(f"incremental append of {len(new):,} rows: {time.perf_counter() - start:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
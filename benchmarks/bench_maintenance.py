@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Online backups under write load, and cleaning up and compacting a database.
+
+Builds a migrated SQLite file of sessions with two interruptions each, then:
+
+- backup: a writer thread commits one small update at a time while
+  maintenance.backup copies the file, in rollback journal (DELETE) and WAL
+  mode. Reports the backup time and the writer's commit latency during it,
+  against a one-step copy and against no backup at all. Each backup runs
+  a few times: whether a paged copy restarts depends on when commits land.
+- cleanup: deletes the older half of the sessions (untitled) the way
+  cleanup_db.py used to, loading each one and deleting it through the ORM
+  (timed on a sample), and with maintenance.cleanup's batched DELETEs.
+- vacuum: incremental vacuum of the pages the cleanup freed, and a
+  VACUUM INTO snapshot of what is left.
+
+Usage: python benchmarks/bench_maintenance.py [sessions]
+"""
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from sqlalchemy.orm import sessionmaker
+
+from backend import maintenance, migrations, models
+from backend.database import make_engine
+
+WRITE_SECONDS = 2.0  # how long the writer runs without a backup
+REPEATS = 3
+ORM_SAMPLE = 5000
+
+
+def build(path, sessions):
+    migrations.upgrade(f"sqlite:///{path}")
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO sessions (id, owner_id, title, goal, scheduled_duration, status, created_at, interruption_count) "
+        "VALUES (?, 0, ?, ?, 45.0, 'completed', '2024-01-01 09:00:00', 2)",
+        ((i, "" if i <= sessions // 2 else f"Focus block {i}", "Ship the quarterly plan " * 8) for i in range(1, sessions + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO interruptions (session_id, owner_id, reason, pause_time) VALUES (?, 0, 'Phone call', '2024-01-01 09:10:00')",
+        ((i,) for i in range(1, sessions + 1) for _ in range(2)),
+    )
+    conn.commit()
+    conn.close()
+
+
+class Writer(threading.Thread):
+    """Commits one small update at a time and records how long each commit took"""
+
+    def __init__(self, path, sessions):
+        super().__init__()
+        self.path, self.sessions = path, sessions
+        self.latencies = []
+        self.done = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        i = 0
+        while not self.done.is_set():
+            i += 1
+            started = time.perf_counter()
+            conn.execute("UPDATE sessions SET goal = ? WHERE id = ?", (f"Revised {i}", self.sessions - i % 1000))
+            conn.commit()
+            self.latencies.append(time.perf_counter() - started)
+            time.sleep(0.002)
+        conn.close()
+
+
+def under_writes(path, sessions, work):
+    writer = Writer(path, sessions)
+    writer.start()
+    time.sleep(0.2)
+    writer.latencies.clear()
+    started = time.perf_counter()
+    result = work()
+    elapsed = time.perf_counter() - started
+    writer.done.set()
+    writer.join()
+    latencies = sorted(writer.latencies)
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    return result, elapsed, len(latencies), statistics.median(latencies) * 1000, p99, latencies[-1] * 1000
+
+
+def orm_cleanup(url):
+    """What cleanup_db.py did: load the untitled sessions and delete each one"""
+    engine = make_engine(url)
+    db = sessionmaker(bind=engine)()
+    for session in db.query(models.Session).filter(models.Session.title == "").limit(ORM_SAMPLE).all():
+        db.delete(session)
+    db.commit()
+    db.close()
+    engine.dispose()
+    return ORM_SAMPLE
+
+
+def batched_cleanup(url):
+    engine = make_engine(url)
+    db = sessionmaker(bind=engine)()
+    report = maintenance.cleanup(db)
+    db.close()
+    engine.dispose()
+    print(report)
+    return int(report.detail.split()[1])
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as scratch:
+        source = os.path.join(scratch, "source.db")
+        build(source, sessions)
+        print(f"{sessions} sessions, {sessions * 2} interruptions, {os.path.getsize(source) / 1e6:.1f} MB, "
+              f"SQLite {sqlite3.sqlite_version}, {os.cpu_count()} CPUs")
+
+        print(f"\n{'journal':8} {'backup':18} {'seconds':>8} {'commits':>8} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7}  detail")
+        for journal in ("delete", "wal"):
+            path = os.path.join(scratch, f"{journal}.db")
+            shutil.copy(source, path)
+            with sqlite3.connect(path) as conn:
+                conn.execute(f"PRAGMA journal_mode={journal}")
+            engine = make_engine(f"sqlite:///{path}")
+            target = os.path.join(scratch, "backup.db")
+            runs = [("none", lambda: time.sleep(WRITE_SECONDS))]
+            runs += [("one step", lambda: maintenance.backup(engine, target, pages=-1))] * REPEATS
+            runs += [("maintenance.backup", lambda: maintenance.backup(engine, target))] * REPEATS
+            for name, work in runs:
+                report, elapsed, commits, p50, p99, worst = under_writes(path, sessions, work)
+                detail = report.detail.split(" to ")[0] + ", " + report.detail.split(" in ")[-1] if report else ""
+                print(f"{journal:8} {name:18} {elapsed:8.2f} {commits:8} {p50:7.1f} {p99:7.1f} {worst:7.1f}  {detail}")
+            engine.dispose()
+
+        print()
+        for name, clean in (("ORM, row by row", orm_cleanup), ("maintenance", batched_cleanup)):
+            path = os.path.join(scratch, f"cleanup_{clean.__name__}.db")
+            shutil.copy(source, path)
+            started = time.perf_counter()
+            deleted = clean(f"sqlite:///{path}")
+            elapsed = time.perf_counter() - started
+            print(f"{name:18} {deleted} sessions in {elapsed:.2f}s, {deleted / elapsed:.0f} sessions/s")
+
+        engine = make_engine(f"sqlite:///{path}")
+        size = os.path.getsize(path)
+        vacuumed = maintenance.vacuum(engine)
+        print(vacuumed)
+        print(f"file: {size / 1e6:.1f} MB -> {os.path.getsize(path) / 1e6:.1f} MB")
+        snapshot = maintenance.snapshot(engine, os.path.join(scratch, "snapshot.db"))
+        print(snapshot)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
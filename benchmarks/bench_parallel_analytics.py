@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Benchmark the multi-process analytics runner against worker count.
+
+Usage: python benchmarks/bench_parallel_analytics.py [rows] [max_workers]
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from analytics.ingest import aggregate_frame
+from analytics.parallel import run_analyses
+from analytics.synthetic import make_dataset
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    print(f"Generating 2 datasets x {rows:,} rows...")
+    datasets = {
+        "Large Dataset": make_dataset(rows=rows, customers=rows // 5, seed=0),
+        "Custom Ratios Dataset": make_dataset(rows=rows, customers=rows // 5, seed=1),
+    }
+
+    start = time.perf_counter()
+    for df in datasets.values():
+        aggregate_frame(df)
+    sequential = time.perf_counter() - start
+    print(f"sequential in-process: {sequential:8.2f}s")
+
+    baseline = None
+    workers = 1
+    while workers <= max_workers:
+        start = time.perf_counter()
+        run_analyses(datasets, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"workers={workers:3d}: {elapsed:8.2f}s  speedup vs 1 worker: {baseline / elapsed:5.2f}x")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
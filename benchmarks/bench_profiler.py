@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+What the admin profiler costs a process that is serving requests.
+
+Four threads, like threadpool workers, load the history of 1000 sessions
+with crud.get_session_history in a loop for a few seconds. Throughput is
+measured with nothing attached, while a StackSampler samples every thread
+at 10 ms and 1 ms, and while tracemalloc traces allocations with 1 and 25
+frames. Also prints the sampler's time per sample and the hottest frames
+of the 10 ms profile, as the collapsed output reports them.
+
+Usage: python benchmarks/bench_profiler.py [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from sqlalchemy.orm import sessionmaker
+
+from backend import crud, migrations, schemas
+from backend.database import make_engine
+from backend.profiler import StackSampler
+
+WORKERS = 4
+SESSIONS = 1000
+
+
+def build(url):
+    migrations.upgrade(url)
+    engine = make_engine(url)
+    db = sessionmaker(bind=engine)()
+    for i in range(SESSIONS):
+        session = crud.create_session(db, schemas.SessionCreate(title=f"Block {i}", goal="Ship", scheduled_duration=45), owner_id=1)
+        crud.start_session(db, session.id)
+        crud.pause_session(db, session.id, "Slack")
+    db.commit()
+    db.close()
+    return engine
+
+
+def throughput(engine, seconds):
+    """History loads per second across the worker threads"""
+    factory = sessionmaker(bind=engine)
+    stop = threading.Event()
+    counts = [0] * WORKERS
+
+    def work(n):
+        db = factory()
+        while not stop.is_set():
+            crud.get_session_history(db, owner_id=1)
+            db.rollback()
+            counts[n] += 1
+        db.close()
+    threads = [threading.Thread(target=work, args=(n,), name="AnyIO worker thread") for n in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    with tempfile.TemporaryDirectory() as scratch:
+        engine = build(f"sqlite:///{scratch}/profiler.db")
+        throughput(engine, 1.0)  # warm up
+        print(f"{WORKERS} threads loading {SESSIONS} sessions' history for {seconds:g}s, {os.cpu_count()} CPUs")
+        print(f"{'attached':24} {'loads/s':>8} {'change':>7}  detail")
+        baseline = throughput(engine, seconds)
+        print(f"{'nothing':24} {baseline:8.2f} {'':>7}")
+
+        hottest = None
+        for interval in (0.01, 0.001):
+            sampler = StackSampler(interval)
+            sampler.start()
+            rate = throughput(engine, seconds)
+            profile = sampler.stop()
+            per_sample = profile.sampling_seconds / profile.samples * 1e6
+            print(f"{f'sampler, {interval * 1000:g} ms':24} {rate:8.2f} {rate / baseline - 1:+7.1%}  "
+                  f"{profile.samples} samples, {per_sample:.0f} us each")
+            hottest = hottest or profile
+
+        for frames in (1, 25):
+            tracemalloc.start(frames)
+            rate = throughput(engine, seconds)
+            traced, _ = tracemalloc.get_traced_memory()
+            overhead = tracemalloc.get_tracemalloc_memory()
+            tracemalloc.stop()
+            print(f"{f'tracemalloc, {frames} frames':24} {rate:8.2f} {rate / baseline - 1:+7.1%}  "
+                  f"{traced / 1e6:.1f} MB traced, {overhead / 1e6:.1f} MB of traces")
+
+        # Time each frame appears anywhere on a stack, as a flame graph's widest bars
+        inclusive = Counter()
+        for (_, stack), count in hottest.stacks.items():
+            for index in set(stack):
+                inclusive[hottest.frames[index]] += count
+        total = sum(hottest.stacks.values())
+        print(f"\nhottest frames of the 10 ms profile ({total} thread samples):")
+        ours = [(frame, count) for frame, count in inclusive.most_common() if frame[1].startswith("backend/")]
+        for (name, path, line), count in ours[:8]:
+            print(f"  {count / total:6.1%}  {name} ({path}:{line})")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
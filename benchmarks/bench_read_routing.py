@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Transition write latency while heavy history reads run, with and without read routing.
+
+One writer process creates, starts and completes sessions and times each
+commit, while reader processes load full histories with interruptions:
+  - shared primary: the default rollback journal, readers on the primary URL;
+    a commit waits for readers' shared locks to clear
+  - read routing: the file in WAL mode, readers on the read-only URI that
+    database.read_url_for derives; the writer never waits for readers
+
+Usage: python benchmarks/bench_read_routing.py [seconds] [readers]
+"""
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import crud, models, schemas
+from backend.database import Base, ReadRoutingConfig, enable_wal, make_engine, read_url_for
+
+HISTORY_SESSIONS = 3_000
+READ_OWNER = 1
+
+
+def seed(url):
+    engine = make_engine(url)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2026, 1, 1)
+    db = sessionmaker(bind=engine)()
+    crud.bulk_insert(db, models.Session, [{
+        "owner_id": READ_OWNER, "title": f"Session {i}", "goal": "History", "scheduled_duration": 30.0,
+        "start_time": start + timedelta(hours=i), "end_time": start + timedelta(hours=i, minutes=25),
+        "status": "completed", "created_at": start + timedelta(hours=i), "interruption_count": 1,
+        "actual_duration_minutes": 25.0,
+    } for i in range(HISTORY_SESSIONS)])
+    crud.bulk_insert(db, models.Interruption, [{
+        "session_id": i + 1, "owner_id": READ_OWNER, "reason": "Phone call", "pause_time": start + timedelta(hours=i),
+    } for i in range(HISTORY_SESSIONS)])
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+def reader(url, seconds, results):
+    engine = make_engine(url)
+    Session = sessionmaker(bind=engine)
+    done = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        db = Session()
+        crud.get_session_history(db, owner_id=READ_OWNER)
+        db.close()
+        done += 1
+    engine.dispose()
+    results.put(("reads", done))
+
+
+def writer(url, seconds, results):
+    engine = make_engine(url)
+    Session = sessionmaker(bind=engine)
+    body = schemas.SessionCreate(title="Write", goal="Latency", scheduled_duration=30)
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        db = Session()
+        started = time.perf_counter()
+        session = crud.create_session(db, body, owner_id=2)
+        latencies.append(time.perf_counter() - started)
+        for transition in (crud.start_session, crud.complete_session):
+            started = time.perf_counter()
+            transition(db, session.id, owner_id=2)
+            latencies.append(time.perf_counter() - started)
+        db.close()
+    engine.dispose()
+    results.put(("writes", latencies))
+
+
+def run(routed, seconds, readers):
+    with tempfile.TemporaryDirectory() as scratch:
+        url = f"sqlite:///{scratch}/deepwork.db"
+        seed(url)
+        read_url = url
+        if routed:
+            enable_wal(make_engine(url))
+            read_url = read_url_for(url, ReadRoutingConfig())
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=reader, args=(read_url, seconds, results)) for _ in range(readers)]
+        procs.append(multiprocessing.Process(target=writer, args=(url, seconds, results)))
+        for proc in procs:
+            proc.start()
+        collected = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    reads = sum(value for kind, value in collected if kind == "reads")
+    latencies = next(value for kind, value in collected if kind == "writes")
+    return reads / seconds, len(latencies) / seconds, latencies
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"{readers} reader processes loading {HISTORY_SESSIONS}-session histories, 1 writer, {seconds:.0f}s, {os.cpu_count()} CPUs")
+    print(f"{'mode':16} {'reads/s':>8} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, routed in (("shared primary", False), ("read routing", True)):
+        read_rate, write_rate, latencies = run(routed, seconds, readers)
+        latencies = sorted(latencies)
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print(f"{name:16} {read_rate:8.1f} {write_rate:9.1f} {statistics.median(latencies) * 1000:8.2f} "
+              f"{p99 * 1000:8.2f} {latencies[-1] * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
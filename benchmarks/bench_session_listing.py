@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Check that every session listing filter is served by an index.
+
+Builds a throwaway SQLite database, runs each supported filter through
+crud.list_sessions and prints the query plan and timing. Exits non-zero if a
+plan falls back to a full table scan.
+
+Usage: python benchmarks/bench_session_listing.py [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import crud
+from backend.database import Base
+
+STATUSES = ["planned", "active", "paused", "completed", "interrupted", "overdue", "abandoned"]
+WORDS = ["Write", "Review", "Plan", "Study", "Refactor", "Design", "Read", "Debug"]
+
+CASES = {
+    "status": dict(statuses=["overdue"]),
+    "status + created range": dict(statuses=["completed"], created_from=datetime(2026, 3, 1), created_to=datetime(2026, 3, 8)),
+    "created range": dict(created_from=datetime(2026, 6, 1), created_to=datetime(2026, 6, 2)),
+    "min_duration": dict(min_duration=170, sort="-duration"),
+    "title_prefix": dict(title_prefix="Refactor 12"),
+    "sort created_at": dict(sort="created_at"),
+    "sort title": dict(sort="title"),
+    "sort duration": dict(sort="duration"),
+}
+
+
+def populate(engine, rows):
+    rng = random.Random(0)
+    base = datetime(2026, 1, 1)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        batch = []
+        for i in range(rows):
+            created = base + timedelta(seconds=rng.randrange(365 * 86400))
+            status = rng.choice(STATUSES)
+            duration = rng.uniform(5, 180) if status in ("completed", "interrupted", "overdue", "abandoned") else None
+            batch.append((
+                f"{rng.choice(WORDS)} {rng.randrange(100000)}", "Benchmark goal", 30.0,
+                created, status, created, 0, duration,
+            ))
+            if len(batch) == 50_000:
+                cursor.executemany(INSERT, batch)
+                batch.clear()
+        cursor.executemany(INSERT, batch)
+        cursor.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+
+
+INSERT = """
+    INSERT INTO sessions (title, goal, scheduled_duration, start_time, status, created_at,
+                          interruption_count, actual_duration_minutes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as scratch:
+        engine = create_engine(f"sqlite:///{scratch}/bench.db")
+        Base.metadata.create_all(bind=engine)
+
+        start = time.perf_counter()
+        populate(engine, rows)
+        print(f"Inserted {rows:,} sessions in {time.perf_counter() - start:.1f}s\n")
+
+        statements = []
+        event.listen(engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, parameters, context, executemany:
+                     statements.append((statement, parameters)))
+        db = sessionmaker(bind=engine)()
+
+        full_scans = []
+        for name, filters in CASES.items():
+            statements.clear()
+            start = time.perf_counter()
+            result = crud.list_sessions(db, fields=("id", "title", "status"), owner_id=0, **filters)
+            elapsed = time.perf_counter() - start
+
+            statement, parameters = statements[0]
+            plan = [row[-1] for row in db.connection().exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + statement, parameters)]
+            if any(step.startswith("SCAN sessions") and "INDEX" not in step for step in plan):
+                full_scans.append(name)
+            print(f"{name:24s} {elapsed * 1000:8.2f} ms  {len(result):4d} rows  {' | '.join(plan)}")
+
+        db.close()
+        engine.dispose()
+
+    if full_scans:
+        print(f"\nFull table scans: {', '.join(full_scans)}")
+        sys.exit(1)
+    print("\nEvery filter is served by an index")
+
+
+if __name__ == "__main__":
+    main()
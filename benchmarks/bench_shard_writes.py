@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Write throughput of sharded session storage versus shard count.
+
+Worker processes stand in for uvicorn workers. Each one runs full session
+lifecycles (create, start, pause, resume, complete; one commit per request)
+for owners spread across the shards. With a single file every commit waits
+for the same writer lock; with N shard files N commits can proceed at once.
+
+Usage: python benchmarks/bench_shard_writes.py [workers] [sessions_per_worker]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import crud, schemas
+from backend.sharding import ShardRouter
+
+SHARD_COUNTS = (1, 2, 4, 8)
+REQUESTS_PER_SESSION = 5
+
+
+def urls(scratch, shards):
+    return [f"sqlite:///{scratch}/shard{shard}.db" for shard in range(shards)]
+
+
+def worker(scratch, shards, worker_id, sessions, start):
+    router = ShardRouter(urls(scratch, shards))
+    data = schemas.SessionCreate(title="Load", goal="Write throughput", scheduled_duration=30)
+    start.wait()
+    for i in range(sessions):
+        owner = worker_id * sessions + i
+        steps = (
+            lambda db: crud.create_session(db, data, owner_id=owner).id,
+            lambda db: crud.start_session(db, session_id, owner_id=owner),
+            lambda db: crud.pause_session(db, session_id, "Interrupted", owner_id=owner),
+            lambda db: crud.resume_session(db, session_id, owner_id=owner),
+            lambda db: crud.complete_session(db, session_id, owner_id=owner),
+        )
+        for step in steps:
+            db = router.session_for_owner(owner)
+            try:
+                result = step(db)
+            finally:
+                db.close()
+            if isinstance(result, int):
+                session_id = result
+    router.dispose()
+
+
+def run(shards, workers, sessions):
+    with tempfile.TemporaryDirectory() as scratch:
+        router = ShardRouter(urls(scratch, shards))
+        router.create_all()
+        router.dispose()
+
+        start = multiprocessing.Event()
+        procs = [
+            multiprocessing.Process(target=worker, args=(scratch, shards, w, sessions, start))
+            for w in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        time.sleep(0.5)  # let every worker import and connect
+        began = time.perf_counter()
+        start.set()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - began
+        if any(proc.exitcode for proc in procs):
+            raise SystemExit(f"A worker failed with {shards} shards")
+        return workers * sessions * REQUESTS_PER_SESSION / elapsed
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{workers} worker processes on {os.cpu_count()} CPUs, {sessions} sessions each, "
+          f"{REQUESTS_PER_SESSION} committed writes per session")
+    print(f"{'shards':>6} {'writes/s':>10} {'speedup':>8}")
+    baseline = None
+    for shards in SHARD_COUNTS:
+        rate = run(shards, workers, sessions)
+        baseline = baseline or rate
+        print(f"{shards:6d} {rate:10.0f} {rate / baseline:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
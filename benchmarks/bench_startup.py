@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Cold start of the API: import time and time from process start to first response.
+
+Each measurement runs a fresh interpreter in a scratch directory:
+  - import:          `import backend.main` (no database is touched)
+  - openapi:         import plus create_app().openapi(), what generate_sdk.py does
+  - first response:  `uvicorn backend.main:app` until /health answers, with the
+                     lifespan migrating a new database, checking one already at
+                     head, or skipping migrations (DB_MIGRATE_ON_STARTUP=0)
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def timed_python(code, cwd):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=cwd, env={**os.environ, "PYTHONPATH": ROOT}, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_response(cwd, **env):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, env={**os.environ, "PYTHONPATH": ROOT, "SWEEPER_ENABLED": "0", **env},
+    )
+    try:
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/health")
+                if conn.getresponse().status == 200:
+                    return (time.perf_counter() - started) * 1000
+            except OSError:
+                if server.poll() is not None:
+                    raise SystemExit("Server exited during startup")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        results["import backend.main"] = [timed_python("import backend.main", scratch) for _ in range(runs)]
+        results["openapi spec"] = [
+            timed_python("from backend.main import create_app; create_app().openapi()", scratch) for _ in range(runs)
+        ]
+        assert not os.listdir(scratch), "importing the app created files"
+
+        fresh = []
+        for _ in range(runs):
+            shutil.rmtree(os.path.join(scratch, "db"), ignore_errors=True)
+            os.mkdir(os.path.join(scratch, "db"))
+            fresh.append(first_response(os.path.join(scratch, "db")))
+        results["first response, new database"] = fresh
+        results["first response, database at head"] = [first_response(os.path.join(scratch, "db")) for _ in range(runs)]
+        results["first response, migrations off"] = [
+            first_response(os.path.join(scratch, "db"), DB_MIGRATE_ON_STARTUP="0") for _ in range(runs)
+        ]
+
+    print(f"Median of {runs} cold starts")
+    for name, samples in results.items():
+        print(f"{name:36} {statistics.median(samples):8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
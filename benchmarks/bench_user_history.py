@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Per-user /history latency as the number of users grows.
+
+Grows one SQLite database from 1 to 100k users, each with the same number of
+sessions, and times crud.get_session_history for random users at each step.
+Scoped history should stay flat; the unscoped statistics are timed for
+contrast.
+
+Usage: python benchmarks/bench_user_history.py [sessions_per_user]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import crud
+from backend.database import Base
+
+USER_STEPS = (1, 100, 1_000, 10_000, 100_000)
+STATUSES = ["completed", "completed", "interrupted", "overdue", "abandoned", "planned"]
+SAMPLES = 50
+
+INSERT_SESSION = """
+    INSERT INTO sessions (id, owner_id, title, goal, scheduled_duration, start_time, end_time, status,
+                          created_at, interruption_count, actual_duration_minutes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_INTERRUPTION = "INSERT INTO interruptions (session_id, owner_id, reason, pause_time) VALUES (?, ?, ?, ?)"
+
+
+def add_users(engine, first_user, last_user, per_user, rng, next_id):
+    base = datetime(2026, 1, 1)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        sessions, interruptions = [], []
+        for owner in range(first_user, last_user):
+            for _ in range(per_user):
+                created = base + timedelta(minutes=rng.randrange(500_000))
+                status = rng.choice(STATUSES)
+                pauses = rng.randrange(3) if status != "planned" else 0
+                duration = rng.uniform(10, 90) if status != "planned" else None
+                sessions.append((
+                    next_id, owner, "Focus", "Benchmark", 50.0,
+                    created if duration else None, created + timedelta(minutes=duration) if duration else None,
+                    status, created, pauses, duration,
+                ))
+                interruptions.extend((next_id, owner, "Meeting", created) for _ in range(pauses))
+                next_id += 1
+            if len(sessions) >= 100_000:
+                cursor.executemany(INSERT_SESSION, sessions)
+                cursor.executemany(INSERT_INTERRUPTION, interruptions)
+                sessions.clear()
+                interruptions.clear()
+        cursor.executemany(INSERT_SESSION, sessions)
+        cursor.executemany(INSERT_INTERRUPTION, interruptions)
+        cursor.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+    return next_id
+
+
+def timed(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    per_user = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as scratch:
+        engine = create_engine(f"sqlite:///{scratch}/bench.db")
+        Base.metadata.create_all(bind=engine)
+
+        print(f"{'users':>8} {'sessions':>10} {'user /history ms':>17} {'global stats ms':>16}")
+        users, next_id = 0, 1
+        for step in USER_STEPS:
+            next_id = add_users(engine, users, step, per_user, rng, next_id)
+            users = step
+            # SQLite connections keep the planner statistics they were opened
+            # with, so reconnect to pick up the ANALYZE run after the insert
+            engine.dispose()
+            db = sessionmaker(bind=engine)()
+
+            owners = [rng.randrange(users) for _ in range(SAMPLES)]
+            scoped = statistics.median(
+                timed(lambda: crud.get_session_history(db, owner_id=owner), 1) for owner in owners
+            )
+            unscoped = timed(lambda: crud.get_history_stats(db), 3)
+            db.close()
+            print(f"{users:8,d} {next_id - 1:10,d} {scoped:17.2f} {unscoped:16.2f}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Throughput of the API versus uvicorn worker count on one machine.
+
+Starts `python -m backend.serve --workers N` against a scratch database,
+seeds sessions for a set of owners, then drives it from client processes
+with keep-alive connections: mostly cached /history reads plus a share of
+writes, which invalidate every worker's cache through data_version.
+
+Usage: python benchmarks/bench_workers.py [seconds] [client_processes]
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+WORKER_COUNTS = (1, 2, 4)
+OWNERS = 50
+WRITE_SHARE = 0.05
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(conn, method, path, owner, body=None):
+    headers = {"X-User-Id": str(owner), "Content-Type": "application/json"}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            if request(conn, "GET", "/health", 0) == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("Server did not start")
+
+
+def client(port, seconds, seed, results):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    body = {"title": "Load", "goal": "Throughput", "scheduled_duration": 30}
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        owner = rng.randrange(OWNERS)
+        if rng.random() < WRITE_SHARE:
+            status = request(conn, "POST", "/api/v1/sessions/", owner, body)
+        else:
+            status = request(conn, "GET", "/api/v1/sessions/history?fields=title,status", owner)
+        done += 1
+        errors += status != 200
+    results.put((done, errors))
+
+
+def run(workers, seconds, clients):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as scratch:
+        env = {**os.environ, "PYTHONPATH": ROOT, "SWEEPER_ENABLED": "0"}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "backend.serve", "--workers", str(workers), "--port", str(port),
+             "--host", "127.0.0.1", "--log-level", "warning"],
+            cwd=scratch, env=env,
+        )
+        try:
+            wait_until_up(port)
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            for owner in range(OWNERS):
+                for _ in range(20):
+                    request(conn, "POST", "/api/v1/sessions/", owner, {"title": "Seed", "goal": "Seed", "scheduled_duration": 30})
+
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=client, args=(port, seconds, seed, results)) for seed in range(clients)]
+            for proc in procs:
+                proc.start()
+            totals = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+        finally:
+            server.terminate()
+            server.wait()
+    done = sum(t[0] for t in totals)
+    errors = sum(t[1] for t in totals)
+    return done / seconds, errors
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{clients} client processes for {seconds:.0f}s on {os.cpu_count()} CPUs, {WRITE_SHARE:.0%} writes")
+    print(f"{'workers':>7} {'req/s':>8} {'errors':>7} {'speedup':>8}")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        rate, errors = run(workers, seconds, clients)
+        baseline = baseline or rate
+        print(f"{workers:7d} {rate:8.0f} {errors:7d} {rate / baseline:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
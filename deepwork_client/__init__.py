@@ -0,0 +1,7 @@
+# Typed sync and asyncio clients for the Deep Work Session Tracker API
+from ._base import ApiError
+from .async_client import AsyncClient
+from .client import Client
+from .models import (
+    Capabilities, HistoryStats, Interruption, NewSession, Operation, OperationResult, Session, SessionEvent, SessionHistory,
+)
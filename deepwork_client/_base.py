@@ -0,0 +1,182 @@
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import httpx
+from pydantic import TypeAdapter
+
+from .models import (
+    Capabilities, HistoryStats, Operation, OperationResult, Session, SessionEvent, SessionHistory,
+)
+
+DEFAULT_BASE_URL = "http://localhost:8000"
+API_PREFIX = "/api/v1"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+_sessions = TypeAdapter(List[Session])
+_events = TypeAdapter(List[SessionEvent])
+_results = TypeAdapter(List[OperationResult])
+
+class ApiError(Exception):
+    """Non-2xx response from the API"""
+
+    def __init__(self, status_code: int, detail: Any, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after  # seconds, on 429 and 503
+
+@dataclass
+class Call:
+    """One API request and how to read its response"""
+    method: str
+    path: str
+    parse: Callable[[Any], Any] = lambda data: data
+    json: Optional[dict] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    mutation: bool = False  # sent with an Idempotency-Key, so a retry cannot apply it twice
+
+def query(**params) -> Dict[str, Any]:
+    """Drop unset parameters and render the rest as the API expects them"""
+    rendered = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = ",".join(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        rendered[name] = value
+    return rendered
+
+def capabilities() -> Call:
+    return Call("GET", f"{API_PREFIX}/capabilities", Capabilities.model_validate)
+
+def create_session(title: str, goal: str, scheduled_duration: float) -> Call:
+    body = {"title": title, "goal": goal, "scheduled_duration": scheduled_duration}
+    return Call("POST", f"{API_PREFIX}/sessions/", Session.model_validate, json=body, mutation=True)
+
+def get_session(session_id: int, fields: Optional[Sequence[str]] = None, include: Optional[Sequence[str]] = None) -> Call:
+    return Call("GET", f"{API_PREFIX}/sessions/{session_id}", Session.model_validate, params=query(fields=fields, include=include))
+
+def list_sessions(**filters) -> Call:
+    return Call("GET", f"{API_PREFIX}/sessions/", _sessions.validate_python, params=query(**filters))
+
+def history(**params) -> Call:
+    return Call("GET", f"{API_PREFIX}/sessions/history", SessionHistory.model_validate, params=query(**params))
+
+def stats() -> Call:
+    return Call("GET", f"{API_PREFIX}/sessions/stats", HistoryStats.model_validate)
+
+def events(session_id: int) -> Call:
+    return Call("GET", f"{API_PREFIX}/sessions/{session_id}/events", _events.validate_python)
+
+def transition(action: str, session_id: int, reason: Optional[str] = None) -> Call:
+    body = {"reason": reason} if action == "pause" else None
+    return Call("PATCH", f"{API_PREFIX}/sessions/{session_id}/{action}", Session.model_validate, json=body, mutation=True)
+
+def operation(op: Operation) -> Call:
+    """The single-operation request an Operation stands for"""
+    if op.action == "create":
+        return create_session(**op.session.model_dump())
+    return transition(op.action, op.session_id, op.reason)
+
+def batch(operations: Sequence[Operation]) -> Call:
+    body = {"operations": [op.model_dump(exclude_none=True) for op in operations]}
+    return Call("POST", f"{API_PREFIX}/sessions/batch", lambda data: _results.validate_python(data["results"]), json=body, mutation=True)
+
+def export(created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> Call:
+    """Streamed rather than sent; parse applies to each line"""
+    return Call("GET", f"{API_PREFIX}/sessions/export", json.loads, params=query(created_from=created_from, created_to=created_to))
+
+def lanes(operations: Sequence[Operation]) -> List[List[int]]:
+    """Indices of the operations grouped by session, in order; every create is a lane of its own"""
+    by_session: Dict[int, List[int]] = {}
+    result = []
+    for index, op in enumerate(operations):
+        if op.session_id is None:
+            result.append([index])
+        elif op.session_id in by_session:
+            by_session[op.session_id].append(index)
+        else:
+            by_session[op.session_id] = [index]
+            result.append(by_session[op.session_id])
+    return result
+
+def rounds(operations: Sequence[Operation], size: int) -> List[List[List[int]]]:
+    """Batches of at most size operations, grouped into rounds that must run one after another.
+
+    Round k holds the k-th operation of every lane, so the batches of one
+    round touch different sessions and can be sent concurrently.
+    """
+    plan = []
+    pending = lanes(operations)
+    depth = 0
+    while pending:
+        current = [lane[depth] for lane in pending]
+        plan.append([current[start:start + size] for start in range(0, len(current), size)])
+        depth += 1
+        pending = [lane for lane in pending if len(lane) > depth]
+    return plan
+
+def error_result(error: ApiError) -> OperationResult:
+    detail = error.detail if isinstance(error.detail, str) else str(error.detail)
+    return OperationResult(status_code=error.status_code, detail=detail)
+
+def retry_after(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying a 429/503: the server's Retry-After, else exponential backoff"""
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return backoff(attempt)
+
+def backoff(attempt: int) -> float:
+    return min(0.1 * 2 ** attempt, 5.0)
+
+class ClientBase:
+    """Settings and response handling shared by Client and AsyncClient"""
+
+    def __init__(self, owner_id: int, retries: int):
+        self.owner_id = owner_id
+        self.retries = retries
+        self._capabilities: Optional[Capabilities] = None
+
+    @staticmethod
+    def limits(max_connections: int) -> httpx.Limits:
+        """Pool of keep-alive connections, all of which may stay open between calls"""
+        return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+    def headers(self, key: Optional[str] = None) -> Dict[str, str]:
+        headers = {"X-User-Id": str(self.owner_id)}
+        if key is not None:
+            headers[IDEMPOTENCY_HEADER] = key
+        return headers
+
+    @staticmethod
+    def new_key(call: Call) -> Optional[str]:
+        return str(uuid.uuid4()) if call.mutation else None
+
+    def should_retry(self, response: httpx.Response, attempt: int) -> bool:
+        # Both are answered before the endpoint runs, so retrying never repeats a write
+        return response.status_code in (429, 503) and attempt < self.retries
+
+    @staticmethod
+    def error(response: httpx.Response) -> ApiError:
+        """ApiError for a read, non-2xx response"""
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        retry = response.headers.get("Retry-After")
+        return ApiError(response.status_code, detail, float(retry) if retry and retry.isdigit() else None)
+
+    def result(self, call: Call, response: httpx.Response):
+        if not response.is_success:
+            raise self.error(response)
+        return call.parse(response.json())
+
+    def _batch_size(self, capabilities: Capabilities, batch_size: Optional[int]) -> int:
+        size = capabilities.batch_max_operations
+        return min(size, batch_size) if batch_size else size
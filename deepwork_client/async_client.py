@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
+
+import httpx
+
+from . import _base
+from ._base import ApiError, Call, ClientBase
+from .models import Capabilities, HistoryStats, Operation, OperationResult, Session, SessionEvent, SessionHistory
+
+class AsyncClient(ClientBase):
+    """asyncio client over a pool of keep-alive connections, with the same calls and retries as Client"""
+
+    def __init__(
+        self,
+        base_url: str = _base.DEFAULT_BASE_URL,
+        *,
+        owner_id: int = 0,
+        timeout: float = 10.0,
+        max_connections: int = 10,
+        retries: int = 2,
+        http: Optional[httpx.AsyncClient] = None,
+    ):
+        super().__init__(owner_id, retries)
+        self._http = http or httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=self.limits(max_connections))
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def send(self, call: Call):
+        """Send a call, retrying where that cannot apply a mutation twice"""
+        key = self.new_key(call)
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._http.request(
+                    call.method, call.path, json=call.json, params=call.params, headers=self.headers(key),
+                )
+            except httpx.TransportError:
+                if attempt == self.retries or (call.mutation and not (await self.capabilities()).idempotency):
+                    raise
+                await asyncio.sleep(_base.backoff(attempt))
+                continue
+            if self.should_retry(response, attempt):
+                await asyncio.sleep(_base.retry_after(response, attempt))
+                continue
+            return self.result(call, response)
+
+    async def capabilities(self) -> Capabilities:
+        """What the server offers, fetched once"""
+        if self._capabilities is None:
+            try:
+                self._capabilities = await self.send(_base.capabilities())
+            except ApiError as error:
+                if error.status_code != 404:
+                    raise
+                self._capabilities = Capabilities()  # servers predating /capabilities
+        return self._capabilities
+
+    async def create_session(self, title: str, goal: str, scheduled_duration: float) -> Session:
+        return await self.send(_base.create_session(title, goal, scheduled_duration))
+
+    async def get_session(self, session_id: int, fields: Optional[Sequence[str]] = None, include: Optional[Sequence[str]] = None) -> Session:
+        return await self.send(_base.get_session(session_id, fields, include))
+
+    async def list_sessions(self, **filters) -> List[Session]:
+        """GET /sessions/ with the API's query parameters, e.g. status=["completed"], limit=50"""
+        return await self.send(_base.list_sessions(**filters))
+
+    async def history(self, **params) -> SessionHistory:
+        return await self.send(_base.history(**params))
+
+    async def stats(self) -> HistoryStats:
+        return await self.send(_base.stats())
+
+    async def events(self, session_id: int) -> List[SessionEvent]:
+        return await self.send(_base.events(session_id))
+
+    async def start(self, session_id: int) -> Session:
+        return await self.send(_base.transition("start", session_id))
+
+    async def pause(self, session_id: int, reason: str) -> Session:
+        return await self.send(_base.transition("pause", session_id, reason))
+
+    async def resume(self, session_id: int) -> Session:
+        return await self.send(_base.transition("resume", session_id))
+
+    async def complete(self, session_id: int) -> Session:
+        return await self.send(_base.transition("complete", session_id))
+
+    async def export(self, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """Stream exported sessions one JSON document at a time"""
+        call = _base.export(created_from, created_to)
+        async with self._http.stream(call.method, call.path, params=call.params, headers=self.headers()) as response:
+            if not response.is_success:
+                await response.aread()
+                raise self.error(response)
+            async for line in response.aiter_lines():
+                if line:
+                    yield call.parse(line)
+
+    async def _apply_one(self, op: Operation) -> OperationResult:
+        try:
+            return OperationResult(status_code=200, session=await self.send(_base.operation(op)))
+        except ApiError as error:
+            return _base.error_result(error)
+
+    async def _apply_batch(self, operations: Sequence[Operation]) -> List[OperationResult]:
+        try:
+            return await self.send(_base.batch(operations))
+        except ApiError as error:
+            return [_base.error_result(error)] * len(operations)
+
+    async def apply(self, operations: Sequence[Operation], concurrency: int = 8, batch_size: Optional[int] = None) -> List[OperationResult]:
+        """Apply creates and transitions with at most `concurrency` requests in flight; see Client.apply"""
+        results: List[Optional[OperationResult]] = [None] * len(operations)
+        size = self._batch_size(await self.capabilities(), batch_size)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run_batch(batch: List[int]):
+            async with slots:
+                applied = await self._apply_batch([operations[i] for i in batch])
+            for index, result in zip(batch, applied):
+                results[index] = result
+
+        async def run_lane(lane: List[int]):
+            async with slots:
+                for index in lane:
+                    results[index] = await self._apply_one(operations[index])
+
+        if size:
+            for batches in _base.rounds(operations, size):
+                await asyncio.gather(*(run_batch(batch) for batch in batches))
+        else:
+            await asyncio.gather(*(run_lane(lane) for lane in _base.lanes(operations)))
+        return results
@@ -0,0 +1,147 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Sequence
+
+import httpx
+
+from . import _base
+from ._base import ApiError, Call, ClientBase
+from .models import Capabilities, HistoryStats, Operation, OperationResult, Session, SessionEvent, SessionHistory
+
+class Client(ClientBase):
+    """Blocking client over a pool of keep-alive connections; safe to share between threads.
+
+    Mutations carry an Idempotency-Key, so they are retried after a dropped
+    connection when the server honors keys. 429 and 503 answers are retried
+    after their Retry-After on every call.
+    """
+
+    def __init__(
+        self,
+        base_url: str = _base.DEFAULT_BASE_URL,
+        *,
+        owner_id: int = 0,
+        timeout: float = 10.0,
+        max_connections: int = 10,
+        retries: int = 2,
+        http: Optional[httpx.Client] = None,
+    ):
+        super().__init__(owner_id, retries)
+        self._http = http or httpx.Client(base_url=base_url, timeout=timeout, limits=self.limits(max_connections))
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    def send(self, call: Call):
+        """Send a call, retrying where that cannot apply a mutation twice"""
+        key = self.new_key(call)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._http.request(
+                    call.method, call.path, json=call.json, params=call.params, headers=self.headers(key),
+                )
+            except httpx.TransportError:
+                if attempt == self.retries or (call.mutation and not self.capabilities().idempotency):
+                    raise
+                time.sleep(_base.backoff(attempt))
+                continue
+            if self.should_retry(response, attempt):
+                time.sleep(_base.retry_after(response, attempt))
+                continue
+            return self.result(call, response)
+
+    def capabilities(self) -> Capabilities:
+        """What the server offers, fetched once"""
+        if self._capabilities is None:
+            try:
+                self._capabilities = self.send(_base.capabilities())
+            except ApiError as error:
+                if error.status_code != 404:
+                    raise
+                self._capabilities = Capabilities()  # servers predating /capabilities
+        return self._capabilities
+
+    def create_session(self, title: str, goal: str, scheduled_duration: float) -> Session:
+        return self.send(_base.create_session(title, goal, scheduled_duration))
+
+    def get_session(self, session_id: int, fields: Optional[Sequence[str]] = None, include: Optional[Sequence[str]] = None) -> Session:
+        return self.send(_base.get_session(session_id, fields, include))
+
+    def list_sessions(self, **filters) -> List[Session]:
+        """GET /sessions/ with the API's query parameters, e.g. status=["completed"], limit=50"""
+        return self.send(_base.list_sessions(**filters))
+
+    def history(self, **params) -> SessionHistory:
+        return self.send(_base.history(**params))
+
+    def stats(self) -> HistoryStats:
+        return self.send(_base.stats())
+
+    def events(self, session_id: int) -> List[SessionEvent]:
+        return self.send(_base.events(session_id))
+
+    def start(self, session_id: int) -> Session:
+        return self.send(_base.transition("start", session_id))
+
+    def pause(self, session_id: int, reason: str) -> Session:
+        return self.send(_base.transition("pause", session_id, reason))
+
+    def resume(self, session_id: int) -> Session:
+        return self.send(_base.transition("resume", session_id))
+
+    def complete(self, session_id: int) -> Session:
+        return self.send(_base.transition("complete", session_id))
+
+    def export(self, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None) -> Iterator[dict]:
+        """Stream exported sessions one JSON document at a time"""
+        call = _base.export(created_from, created_to)
+        with self._http.stream(call.method, call.path, params=call.params, headers=self.headers()) as response:
+            if not response.is_success:
+                response.read()
+                raise self.error(response)
+            for line in response.iter_lines():
+                if line:
+                    yield call.parse(line)
+
+    def _apply_one(self, op: Operation) -> OperationResult:
+        try:
+            return OperationResult(status_code=200, session=self.send(_base.operation(op)))
+        except ApiError as error:
+            return _base.error_result(error)
+
+    def _apply_batch(self, operations: Sequence[Operation]) -> List[OperationResult]:
+        try:
+            return self.send(_base.batch(operations))
+        except ApiError as error:
+            return [_base.error_result(error)] * len(operations)
+
+    def apply(self, operations: Sequence[Operation], concurrency: int = 8, batch_size: Optional[int] = None) -> List[OperationResult]:
+        """Apply creates and transitions with at most `concurrency` requests in flight.
+
+        Operations on the same session run in the given order; different
+        sessions proceed in parallel. When the server advertises batches, they
+        are sent in batches of up to its limit (or batch_size), otherwise one
+        request per operation. Results come back in the order given.
+        """
+        results: List[Optional[OperationResult]] = [None] * len(operations)
+        size = self._batch_size(self.capabilities(), batch_size)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if size:
+                for batches in _base.rounds(operations, size):
+                    applied = pool.map(lambda batch: self._apply_batch([operations[i] for i in batch]), batches)
+                    for batch, batch_results in zip(batches, applied):
+                        for index, result in zip(batch, batch_results):
+                            results[index] = result
+            else:
+                def run_lane(lane: List[int]):
+                    for index in lane:
+                        results[index] = self._apply_one(operations[index])
+                list(pool.map(run_lane, _base.lanes(operations)))
+        return results
@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+class Interruption(BaseModel):
+    id: int
+    session_id: int
+    reason: str
+    pause_time: datetime
+
+class Session(BaseModel):
+    """A session as the API returns it; fields left out by ?fields= are None"""
+    id: int
+    owner_id: Optional[int] = None
+    title: Optional[str] = None
+    goal: Optional[str] = None
+    scheduled_duration: Optional[float] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    interruption_count: Optional[int] = None
+    last_pause_time: Optional[datetime] = None
+    actual_duration_minutes: Optional[float] = None
+    interruptions: List[Interruption] = []
+
+class HistoryStats(BaseModel):
+    total_sessions: int
+    completed_sessions: int
+    interrupted_sessions: int
+    overdue_sessions: int
+    abandoned_sessions: int
+    total_productive_time: float  # in minutes
+    total_interruptions: int
+
+class SessionHistory(HistoryStats):
+    sessions: List[Session]
+
+class SessionEvent(BaseModel):
+    id: int
+    session_id: int
+    event_type: str
+    occurred_at: datetime
+    reason: Optional[str] = None
+    payload: Optional[dict] = None
+
+class Capabilities(BaseModel):
+    """What the server offers; servers without /capabilities get the defaults"""
+    version: str = "unknown"
+    batch_max_operations: int = 0
+    idempotency: bool = False
+    group_commit: bool = False
+
+class NewSession(BaseModel):
+    title: str
+    goal: str
+    scheduled_duration: float
+
+class Operation(BaseModel):
+    """One create or transition, for Client.apply"""
+    action: Literal["create", "start", "pause", "resume", "complete"]
+    session_id: Optional[int] = None
+    reason: Optional[str] = None
+    session: Optional[NewSession] = None
+
+    @classmethod
+    def create(cls, title: str, goal: str, scheduled_duration: float) -> "Operation":
+        return cls(action="create", session=NewSession(title=title, goal=goal, scheduled_duration=scheduled_duration))
+
+    @classmethod
+    def start(cls, session_id: int) -> "Operation":
+        return cls(action="start", session_id=session_id)
+
+    @classmethod
+    def pause(cls, session_id: int, reason: str) -> "Operation":
+        return cls(action="pause", session_id=session_id, reason=reason)
+
+    @classmethod
+    def resume(cls, session_id: int) -> "Operation":
+        return cls(action="resume", session_id=session_id)
+
+    @classmethod
+    def complete(cls, session_id: int) -> "Operation":
+        return cls(action="complete", session_id=session_id)
+
+class OperationResult(BaseModel):
+    """Outcome of one operation: the session, or the status and detail of its error"""
+    status_code: int
+    session: Optional[Session] = None
+    detail: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code == 200
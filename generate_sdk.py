@@ -2,42 +2,22 @@
 """
 Script to generate Python SDK from FastAPI OpenAPI specification
 """
+import json
 import subprocess
 import sys
 import os
-import time
-import requests
 from pathlib import Path
 
-def check_backend_running():
-    """Check if the backend server is running"""
-    try:
-        response = requests.get("http://localhost:8000/health", timeout=5)
-        return response.status_code == 200
-    except:
-        return False
-
-def start_backend():
-    """Start the backend server in the background"""
-    print("Starting backend server...")
-    backend_process = subprocess.Popen([
-        sys.executable, "-m", "uvicorn", 
-        "backend.main:app", 
-        "--host", "0.0.0.0", 
-        "--port", "8000"
-    ])
-    return backend_process
+SPEC_PATH = "openapi.json"
 
-def wait_for_backend(max_wait=30):
-    """Wait for backend to be ready"""
-    print("Waiting for backend to start...")
-    for i in range(max_wait):
-        if check_backend_running():
-            print("Backend is ready!")
-            return True
-        time.sleep(1)
-        print(f"Waiting... ({i+1}/{max_wait})")
-    return False
+def write_openapi_spec(path=SPEC_PATH):
+    """Write the OpenAPI spec from the app factory; no server or database is needed"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from backend.main import create_app
+    
+    with open(path, "w") as f:
+        json.dump(create_app().openapi(), f, indent=2)
+    print(f"Wrote OpenAPI spec to {path}")
 
 def generate_sdk():
     """Generate Python SDK using OpenAPI Generator"""
@@ -53,7 +33,7 @@ def generate_sdk():
     # Generate SDK
     cmd = [
         "openapi-generator-cli", "generate",
-        "-i", "http://localhost:8000/openapi.json",
+        "-i", SPEC_PATH,
         "-g", "python",
         "-o", "deepwork_sdk",
         "--additional-properties=packageName=deepwork_sdk,projectName=deepwork-sdk"
@@ -67,22 +47,8 @@ def main():
     print("Deep Work Session Tracker - SDK Generator")
     print("=" * 50)
     
-    # Check if backend is already running
-    if not check_backend_running():
-        backend_process = start_backend()
-        try:
-            if not wait_for_backend():
-                print("Failed to start backend server")
-                return 1
-        except KeyboardInterrupt:
-            print("\nStopping backend server...")
-            backend_process.terminate()
-            return 1
-    else:
-        print("Backend is already running")
-        backend_process = None
-    
     try:
+        write_openapi_spec()
         generate_sdk()
         
         # Create example usage script
@@ -95,10 +61,6 @@ def main():
     except Exception as e:
         print(f"Error generating SDK: {e}")
         return 1
-    finally:
-        if backend_process:
-            print("\nStopping backend server...")
-            backend_process.terminate()
     
     return 0
 